@@ -43,6 +43,7 @@ except ImportError:
     FLASK_MIGRATE_AVAILABLE = False
 
 from models import db
+from utils.metrics import instrument_sessions
 
 # Import blueprints that don't depend on limiter - these go after limiter initialization
 from routes.api import api_bp
@@ -51,6 +52,7 @@ from routes.config_routes import config_bp
 
 # Import route blueprints
 from routes.main import main_bp
+from routes.metrics import metrics_bp
 from routes.templates import templates_bp
 from routes.upload import upload_bp
 
@@ -172,6 +174,7 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Initialize database
 db.init_app(app)
+instrument_sessions()
 
 # Initialize Flask-Migrate for database migrations (optional)
 if FLASK_MIGRATE_AVAILABLE:
@@ -236,6 +239,7 @@ app.register_blueprint(desktop_data_bp)
 # app.register_blueprint(admin_bp)     # Commented out due to circular import
 # app.register_blueprint(admin_pages_bp) # Commented out due to circular import
 app.register_blueprint(config_bp)
+app.register_blueprint(metrics_bp)
 # app.register_blueprint(usage_bp)     # Commented out due to circular import
 # app.register_blueprint(sharing_bp)   # Commented out due to circular import
 # app.register_blueprint(projects_bp)  # Commented out due to circular import
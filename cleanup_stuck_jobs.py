@@ -113,6 +113,10 @@ def main():
     restart_celery_workers()
 
     print("✅ Cleanup complete!")
+    print("\n💡 Submissions left in processing by a dead worker are requeued automatically")
+    print("   once their lease expires: the web server, grading workers and the desktop app")
+    print("   all run tasks.recover_stuck_submissions. Jobs in async or bulk mode hold no")
+    print("   lease and still need this script.")
     print("\n💡 To avoid this issue in the future:")
     print("   - Ensure all test files properly mock API calls")
     print("   - Don't run trigger_job.py or other scripts that queue real tasks during testing")
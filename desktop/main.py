@@ -471,7 +471,8 @@ def main() -> int:
             logger.info("Initializing scheduler jobs...")
             initialize_scheduler()
             logger.info(
-                "Scheduler jobs initialized (cleanup_old_files, cleanup_completed_batches)"
+                "Scheduler jobs initialized (cleanup_old_files, cleanup_completed_batches, "
+                "evict_llm_response_cache, purge_task_queue, recover_stuck_submissions)"
             )
 
             # T092: Start the scheduler
@@ -502,6 +503,16 @@ def main() -> int:
         elif is_test_env:
             logger.debug("Skipping background update check in test environment")
 
+        # Fetch provider model listings in the background so the first
+        # model picker does not wait on every provider API
+        if not is_test_env:
+            from services.model_catalog import ModelCatalogService
+
+            ModelCatalogService.prewarm(app)
+
+            # Resume tasks queued before the last shutdown
+            task_queue.start(app)
+
         # Get a free port
         port = get_free_port()
         host = "127.0.0.1"
@@ -9,7 +9,13 @@ import logging
 from datetime import datetime
 from pathlib import Path
 from apscheduler.schedulers.background import BackgroundScheduler
-from tasks import cleanup_old_files, cleanup_completed_batches
+from tasks import (
+    cleanup_old_files,
+    cleanup_completed_batches,
+    evict_llm_response_cache,
+    purge_task_queue,
+    recover_stuck_submissions,
+)
 from desktop.data_export import export_data
 from desktop.settings import Settings
 
@@ -27,6 +33,9 @@ def initialize_scheduler():
     Adds periodic jobs for maintenance tasks:
     - cleanup_old_files: Removes old uploaded files (24-hour interval)
     - cleanup_completed_batches: Archives old completed batches (6-hour interval)
+    - evict_llm_response_cache: Trims the LLM response cache (6-hour interval)
+    - purge_task_queue: Deletes finished queued tasks (6-hour interval)
+    - recover_stuck_submissions: Requeues submissions with expired leases (1-minute interval)
     """
     try:
         # Add periodic cleanup jobs
@@ -48,7 +57,34 @@ def initialize_scheduler():
             replace_existing=True
         )
 
-        logger.info("Scheduler initialized with 2 periodic jobs")
+        scheduler.add_job(
+            evict_llm_response_cache,
+            'interval',
+            hours=6,
+            id='evict_llm_response_cache',
+            name='Evict old LLM response cache entries',
+            replace_existing=True
+        )
+
+        scheduler.add_job(
+            purge_task_queue,
+            'interval',
+            hours=6,
+            id='purge_task_queue',
+            name='Delete finished queued tasks',
+            replace_existing=True
+        )
+
+        scheduler.add_job(
+            recover_stuck_submissions,
+            'interval',
+            minutes=1,
+            id='recover_stuck_submissions',
+            name='Requeue submissions whose grading stopped responding',
+            replace_existing=True
+        )
+
+        logger.info("Scheduler initialized with 5 periodic jobs")
 
     except Exception as e:
         logger.error(f"Failed to initialize scheduler: {e}")
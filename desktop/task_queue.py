@@ -3,21 +3,105 @@ Desktop Task Queue Module
 
 Provides a ThreadPoolExecutor-based task queue for async task processing
 in a single-user desktop application. Replaces Celery/Redis for desktop deployment.
+DurableTaskQueue, the application-wide instance, keeps queued tasks in the
+database so they survive restarts and can be consumed by several processes.
 
 This implementation follows the specification in specs/004-desktop-app/research.md
 section 2 (Async Task Processing Research).
 """
 
 import concurrent.futures
+import heapq
+import importlib
+import itertools
+import json
+import os
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
 from threading import Lock
 from typing import Callable, Any, Optional, Dict
 import time
 import logging
 import uuid
 
+from sqlalchemy import and_, insert, or_, select, update
+
+from models import QueuedTask, db
+from utils import metrics
+from utils.runtime import current_app_or_none, env_float
+
 logger = logging.getLogger(__name__)
 
 
+class TaskTimer:
+    """
+    Callbacks due at a later time, held in a heap and run by one dispatcher thread.
+
+    Delayed tasks and retry backoffs wait here rather than sleeping in a pool
+    thread, so every worker stays free for work that is due. Callbacks run on
+    the dispatcher thread and must only hand work off (e.g. to an executor).
+    """
+
+    def __init__(self, name: str = "task-queue-timer"):
+        self._name = name
+        self._heap = []  # [due (monotonic), sequence, callback or None when cancelled]
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def call_later(self, delay: float, callback: Callable[[], Any]) -> list:
+        """Run ``callback`` after ``delay`` seconds; returns a handle for cancel()."""
+        entry = [time.monotonic() + max(0.0, delay), next(self._sequence), callback]
+        with self._condition:
+            heapq.heappush(self._heap, entry)
+            if self._stopped or self._thread is None or not self._thread.is_alive():
+                # (Re)started lazily, e.g. in a forked worker process
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self._name)
+                self._thread.start()
+            self._condition.notify()
+        return entry
+
+    def cancel(self, entry: list) -> None:
+        with self._condition:
+            entry[2] = None
+
+    def pending(self) -> int:
+        with self._condition:
+            return sum(1 for entry in self._heap if entry[2] is not None)
+
+    def stop(self) -> None:
+        """Stop the dispatcher; callbacks not yet due are dropped."""
+        with self._condition:
+            self._stopped = True
+            self._heap.clear()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped:
+                        return
+                    if self._heap and self._heap[0][2] is None:
+                        heapq.heappop(self._heap)
+                        continue
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                callback = heapq.heappop(self._heap)[2]
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Timer callback failed: {e}")
+
+
 class DesktopTaskQueue:
     """
     A thread-based task queue manager for desktop applications.
@@ -27,6 +111,8 @@ class DesktopTaskQueue:
     - Task tracking and status monitoring
     - Automatic retry with exponential backoff
     - Delayed task execution (countdown)
+    - Delays and backoffs wait on a TaskTimer, never in a worker thread
+    - Due tasks start highest priority first, then in submission order
     - Thread-safe operations
     - Graceful shutdown
     """
@@ -43,9 +129,21 @@ class DesktopTaskQueue:
         self.task_metadata: Dict[str, Dict[str, Any]] = {}  # task_id -> metadata
         self.lock = Lock()
         self.next_task_id = 0
+        self.timer = TaskTimer()
+        self._timers: Dict[str, list] = {}  # task_id -> TaskTimer handle while it waits
+        self._ready = []  # heap of (-priority, sequence, call) waiting for a worker
+        self._sequence = itertools.count()
         logger.info(f"DesktopTaskQueue initialized with {max_workers} workers")
 
-    def submit(self, func: Callable, *args, countdown: int = 0, max_retries: int = 3, **kwargs) -> str:
+    def submit(
+        self,
+        func: Callable,
+        *args,
+        countdown: int = 0,
+        max_retries: int = 3,
+        priority: Optional[int] = None,
+        **kwargs,
+    ) -> str:
         """
         Submit a task to the queue.
 
@@ -54,6 +152,8 @@ class DesktopTaskQueue:
             *args: Positional arguments for the function
             countdown: Delay before execution in seconds (default: 0)
             max_retries: Maximum retry attempts on failure (default: 3)
+            priority: Higher runs first among due tasks (default: 5); equal
+                priorities run in submission order
             **kwargs: Keyword arguments for the function
 
         Returns:
@@ -75,57 +175,55 @@ class DesktopTaskQueue:
                 'submitted_at': time.time(),
                 'countdown': countdown,
                 'max_retries': max_retries,
+                'priority': priority if priority is not None else 5,
                 'args': str(args),  # Store string representation for debugging
                 'kwargs': str(kwargs)
             }
+            metrics.track_task_state(None, 'pending')
+            future = concurrent.futures.Future()
+            self.tasks[task_id] = future
 
-        # Create wrapper with retry logic
-        def task_wrapper():
-            if countdown > 0:
-                logger.debug(f"Task {task_id} waiting {countdown}s before execution")
-                time.sleep(countdown)
-
-            self._update_task_status(task_id, 'running', started_at=time.time())
-
-            for attempt in range(max_retries + 1):
-                try:
-                    logger.debug(f"Task {task_id} executing (attempt {attempt + 1}/{max_retries + 1})")
-                    result = func(*args, **kwargs)
-                    self._update_task_status(
-                        task_id,
-                        'completed',
-                        result=result,
-                        completed_at=time.time(),
-                        attempts=attempt + 1
+        def attempt(number):
+            if number == 0:
+                if not future.set_running_or_notify_cancel():
+                    return  # cancelled before it started
+                self._update_task_status(task_id, 'running', started_at=time.time())
+            try:
+                logger.debug(f"Task {task_id} executing (attempt {number + 1}/{max_retries + 1})")
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if number < max_retries:
+                    backoff = 2 ** number  # Exponential backoff: 1s, 2s, 4s, 8s, ...
+                    logger.warning(
+                        f"Task {task_id} attempt {number + 1} failed: {e}. "
+                        f"Retrying in {backoff}s"
                     )
-                    logger.info(f"Task {task_id} completed successfully after {attempt + 1} attempt(s)")
-                    return result
-                except Exception as e:
-                    if attempt < max_retries:
-                        backoff = 2 ** attempt  # Exponential backoff: 1s, 2s, 4s, 8s, ...
-                        logger.warning(
-                            f"Task {task_id} attempt {attempt + 1} failed: {e}. "
-                            f"Retrying in {backoff}s"
-                        )
-                        time.sleep(backoff)
-                    else:
-                        logger.error(
-                            f"Task {task_id} failed after {max_retries + 1} attempts: {e}"
-                        )
-                        self._update_task_status(
-                            task_id,
-                            'failed',
-                            error=str(e),
-                            failed_at=time.time(),
-                            attempts=attempt + 1
-                        )
-                        raise
-
-        # Submit to executor
-        future = self.executor.submit(task_wrapper)
-
-        with self.lock:
-            self.tasks[task_id] = future
+                    self._update_task_status(task_id, 'running', retry_at=time.time() + backoff)
+                    self._dispatch(task_id, future, lambda: attempt(number + 1), backoff)
+                    return
+                logger.error(f"Task {task_id} failed after {max_retries + 1} attempts: {e}")
+                self._update_task_status(
+                    task_id,
+                    'failed',
+                    error=str(e),
+                    failed_at=time.time(),
+                    attempts=number + 1
+                )
+                future.set_exception(e)
+                return
+            self._update_task_status(
+                task_id,
+                'completed',
+                result=result,
+                completed_at=time.time(),
+                attempts=number + 1
+            )
+            logger.info(f"Task {task_id} completed successfully after {number + 1} attempt(s)")
+            future.set_result(result)
+
+        if countdown > 0:
+            logger.debug(f"Task {task_id} waiting {countdown}s before execution")
+        self._dispatch(task_id, future, lambda: attempt(0), countdown)
 
         logger.info(
             f"Task {task_id} submitted: {func.__name__} "
@@ -133,6 +231,39 @@ class DesktopTaskQueue:
         )
         return task_id
 
+    def _dispatch(self, task_id: str, future: concurrent.futures.Future, call: Callable[[], None], delay: float):
+        """Hand ``call`` to the worker pool now, or to the timer when ``delay`` is positive."""
+        if delay > 0:
+            with self.lock:
+                self._timers[task_id] = self.timer.call_later(
+                    delay, lambda: self._dispatch(task_id, future, call, 0)
+                )
+            return
+        with self.lock:
+            self._timers.pop(task_id, None)
+        if future.cancelled():
+            return
+        with self.lock:
+            priority = self.task_metadata.get(task_id, {}).get('priority', 5)
+            entry = (-priority, next(self._sequence), call)
+            heapq.heappush(self._ready, entry)
+        try:
+            # Each pool slot runs whichever due call ranks first when it frees up
+            self.executor.submit(self._run_next)
+        except RuntimeError as e:  # the pool has been shut down
+            with self.lock:
+                self._ready.remove(entry)
+                heapq.heapify(self._ready)
+            self._update_task_status(task_id, 'failed', error=str(e), failed_at=time.time())
+            if not future.done():
+                future.set_exception(e)
+
+    def _run_next(self):
+        """Run the highest-priority due call."""
+        with self.lock:
+            _, _, call = heapq.heappop(self._ready)
+        call()
+
     def get_status(self, task_id: str) -> Dict[str, Any]:
         """
         Get the current status and result of a task.
@@ -197,6 +328,7 @@ class DesktopTaskQueue:
         """
         with self.lock:
             if task_id in self.task_metadata:
+                metrics.track_task_state(self.task_metadata[task_id]['status'], status)
                 self.task_metadata[task_id]['status'] = status
                 self.task_metadata[task_id].update(kwargs)
 
@@ -218,10 +350,8 @@ class DesktopTaskQueue:
             # Note: ThreadPoolExecutor.shutdown() doesn't support timeout parameter directly
             start_time = time.time()
 
-            # First, try to shutdown and wait for tasks
-            self.executor.shutdown(wait=False, cancel_futures=False)
-
-            # Wait for all futures to complete with timeout
+            # Wait for all futures to complete with timeout; the pool stays open
+            # meanwhile so delayed tasks and retries can still start
             try:
                 for task_id, future in list(self.tasks.items()):
                     remaining_time = timeout - (time.time() - start_time)
@@ -236,10 +366,24 @@ class DesktopTaskQueue:
                 logger.info("Task queue shut down successfully (all tasks completed)")
             except Exception as e:
                 logger.warning(f"Task queue shutdown encountered error: {e}")
+            self.executor.shutdown(wait=False, cancel_futures=False)
         else:
             self.executor.shutdown(wait=False, cancel_futures=False)
             logger.info("Task queue shut down (tasks may still be running)")
 
+        # Tasks still waiting for their countdown or next retry never run
+        self.timer.stop()
+        with self.lock:
+            waiting = list(self._timers)
+            self._timers.clear()
+        for task_id in waiting:
+            future = self.tasks[task_id]
+            if future.cancel():
+                self._update_task_status(task_id, 'cancelled', cancelled_at=time.time())
+            elif not future.done():
+                future.set_exception(RuntimeError("Task queue shut down before the retry"))
+                self._update_task_status(task_id, 'failed', error="Task queue shut down", failed_at=time.time())
+
     def get_all_tasks(self) -> Dict[str, Dict[str, Any]]:
         """
         Get status of all tasks.
@@ -281,10 +425,13 @@ class DesktopTaskQueue:
                 return False
 
             future = self.tasks[task_id]
+            handle = self._timers.get(task_id)
 
         cancelled = future.cancel()
 
         if cancelled:
+            if handle is not None:
+                self.timer.cancel(handle)
             self._update_task_status(task_id, 'cancelled', cancelled_at=time.time())
             logger.info(f"Task {task_id} cancelled successfully")
         else:
@@ -293,5 +440,441 @@ class DesktopTaskQueue:
         return cancelled
 
 
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _json_safe(value: Any) -> bool:
+    try:
+        json.dumps(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class DurableTaskQueue(DesktopTaskQueue):
+    """
+    Task queue persisted in the ``task_queue`` table.
+
+    Queued tasks are rows, so they survive restarts and any process running
+    consumers can take them. A consumer claims a due row with a conditional
+    UPDATE -- only one claimant's update can match -- and holds a lease that a
+    heartbeat thread extends while the task runs. If the process dies, the
+    lease lapses after TASK_QUEUE_VISIBILITY_TIMEOUT seconds and the task is
+    claimed again. A task that raises is rescheduled with exponential backoff
+    until ``max_retries`` is used up; ``countdown`` becomes the row's
+    ``scheduled_at``, and the TaskTimer wakes a consumer of this process as
+    soon as either falls due rather than at its next poll.
+
+    Tasks that cannot be stored -- functions not importable by name, arguments
+    that are not JSON, submissions made outside an application context, or
+    TASK_QUEUE_BACKEND=memory -- run on the in-memory queue as before.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        super().__init__(max_workers=max_workers)
+        self.max_workers = max_workers
+        self.worker_id = None
+        self._app = None
+        self._pid = None
+        self._threads = []
+        self._running = set()  # ids of stored tasks executing in this process
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._stopping = threading.Event()
+
+    @staticmethod
+    def enabled() -> bool:
+        return os.getenv("TASK_QUEUE_BACKEND", "database").lower() != "memory"
+
+    @staticmethod
+    def task_name(func: Callable) -> Optional[str]:
+        """Name under which another process can import ``func``, or None."""
+        module = getattr(func, "__module__", None)
+        qualname = getattr(func, "__qualname__", None)
+        if not module or not qualname or module == "__main__" or "<" in qualname:
+            return None
+        name = f"{module}:{qualname}"
+        try:
+            target = DurableTaskQueue._resolve(name)
+        except (ImportError, AttributeError):
+            return None
+        # Task wrappers (tasks.MockCeleryTask) keep the function as .func
+        if target is func or getattr(target, "func", None) is func:
+            return name
+        return None
+
+    @staticmethod
+    def _resolve(name: str) -> Callable:
+        module_name, _, qualname = name.partition(":")
+        target = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            target = getattr(target, part)
+        return target
+
+    @staticmethod
+    def _visibility_timeout() -> float:
+        return env_float("TASK_QUEUE_VISIBILITY_TIMEOUT", 300)
+
+    def submit(
+        self,
+        func: Callable,
+        *args,
+        countdown: int = 0,
+        max_retries: int = 3,
+        priority: Optional[int] = None,
+        **kwargs,
+    ) -> str:
+        """
+        Store a task for the consumers; see DesktopTaskQueue.submit().
+
+        Due tasks are claimed highest ``priority`` first, then longest due.
+        The row is written in a transaction of its own, so work staged in the
+        caller's session is neither committed nor rolled back.
+        """
+        name = self.task_name(func) if self.enabled() else None
+        app = current_app_or_none() if name else None
+        if app is None or not _json_safe([args, kwargs]):
+            if name:
+                reason = "no app context" if app is None else "arguments are not JSON-serializable"
+                logger.warning(f"Task {name} is queued in memory and will not survive a restart: {reason}")
+            return super().submit(
+                func, *args, countdown=countdown, max_retries=max_retries, priority=priority, **kwargs
+            )
+
+        task_id = str(uuid.uuid4())
+        priority = priority if priority is not None else 5
+        with db.engine.begin() as conn:
+            conn.execute(
+                insert(QueuedTask).values(
+                    id=task_id,
+                    task_name=name,
+                    args=list(args),
+                    kwargs=kwargs,
+                    max_retries=max_retries,
+                    priority=priority,
+                    scheduled_at=_utcnow() + timedelta(seconds=countdown),
+                )
+            )
+        metrics.track_task_state(None, 'pending')
+        logger.info(
+            f"Task {task_id} stored: {name} (countdown={countdown}s, max_retries={max_retries}, "
+            f"priority={priority})"
+        )
+
+        self.start(app)
+        self._notify()
+        if countdown > 0:
+            # Wake a consumer when it is due instead of at the next poll
+            self.timer.call_later(countdown, self._notify)
+        return task_id
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def start(self, app=None) -> bool:
+        """
+        Start this process's consumer threads (idempotent).
+
+        Call at startup so stored tasks are picked up without waiting for a
+        new submission. Consumers run TASK_QUEUE_CONSUMERS tasks at a time
+        (default: max_workers) and poll every TASK_QUEUE_POLL_INTERVAL seconds
+        (default 1) for tasks stored by other processes.
+        """
+        if not self.enabled():
+            return False
+        with self.lock:
+            if app is not None:
+                self._app = app
+            if self._app is None:
+                return False
+            if self._pid == os.getpid() and any(thread.is_alive() for thread in self._threads):
+                return True
+            # Identify the process that holds leases (recomputed after a fork)
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}"
+            self._stopping.clear()
+            consumers = max(1, int(env_float("TASK_QUEUE_CONSUMERS", self.max_workers)))
+            self._threads = [
+                threading.Thread(target=self._consume, daemon=True, name=f"task-queue-consumer-{i}")
+                for i in range(consumers)
+            ]
+            self._threads.append(
+                threading.Thread(target=self._heartbeat, daemon=True, name="task-queue-heartbeat")
+            )
+            for thread in self._threads:
+                thread.start()
+        logger.info(f"Task queue consumers started ({consumers} as {self.worker_id})")
+        return True
+
+    @staticmethod
+    def _claimable(now):
+        """Due pending tasks, and running tasks whose worker stopped renewing the lease."""
+        return or_(
+            and_(QueuedTask.status == 'pending', QueuedTask.scheduled_at <= now),
+            and_(QueuedTask.status == 'running', QueuedTask.lease_expires_at < now),
+        )
+
+    def _consume(self):
+        while not self._stopping.is_set():
+            try:
+                task = self._claim()
+            except Exception as e:
+                logger.debug(f"Task queue poll failed: {e}")
+                task = None
+            if task is None:
+                with self._wakeup:
+                    self._wakeup.wait(env_float("TASK_QUEUE_POLL_INTERVAL", 1.0))
+                continue
+            self._execute(task)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Take the highest-priority, longest-due claimable task, or return None when there is none."""
+        app = self._app
+        with app.app_context():
+            for _ in range(3):
+                now = _utcnow()
+                row = db.session.execute(
+                    select(QueuedTask.id, QueuedTask.status)
+                    .where(self._claimable(now))
+                    .order_by(QueuedTask.priority.desc(), QueuedTask.scheduled_at)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).first()
+                if row is None:
+                    db.session.rollback()
+                    return None
+                claimed = db.session.execute(
+                    update(QueuedTask)
+                    .where(QueuedTask.id == row.id, self._claimable(now))
+                    .values(
+                        status='running',
+                        worker_id=self.worker_id,
+                        attempts=QueuedTask.attempts + 1,
+                        started_at=now,
+                        lease_expires_at=now + timedelta(seconds=self._visibility_timeout()),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                if claimed.rowcount != 1:
+                    continue  # another consumer got there first
+                task = db.session.get(QueuedTask, row.id, populate_existing=True)
+                # A lapsed lease was counted as running by the process that died
+                metrics.track_task_state('pending' if row.status == 'pending' else None, 'running')
+                return {
+                    'app': app,
+                    'id': task.id,
+                    'task_name': task.task_name,
+                    'args': task.args or [],
+                    'kwargs': task.kwargs or {},
+                    'attempts': task.attempts,
+                    'max_retries': task.max_retries,
+                }
+        return None
+
+    def _execute(self, task: Dict[str, Any]):
+        task_id = task['id']
+        if task['attempts'] > task['max_retries'] + 1:
+            # Its workers kept dying mid-run; running it again is unlikely to help
+            self._finish(task, error=f"Lease expired {task['attempts'] - 1} times", retry=False)
+            return
+
+        with self.lock:
+            self._running.add(task_id)
+        try:
+            logger.debug(
+                f"Task {task_id} executing (attempt {task['attempts']}/{task['max_retries'] + 1})"
+            )
+            result = self._resolve(task['task_name'])(*task['args'], **task['kwargs'])
+        except Exception as e:
+            self._finish(task, error=str(e))
+        else:
+            self._finish(task, result=result)
+        finally:
+            with self.lock:
+                self._running.discard(task_id)
+
+    def _finish(self, task: Dict[str, Any], result: Any = None, error: Optional[str] = None, retry: bool = True):
+        task_id, attempts = task['id'], task['attempts']
+        now = _utcnow()
+        if error is None:
+            values = {'status': 'completed', 'result': result if _json_safe(result) else None, 'error': None}
+        elif retry and attempts <= task['max_retries']:
+            backoff = 2 ** (attempts - 1)  # Exponential backoff: 1s, 2s, 4s, 8s, ...
+            values = {'status': 'pending', 'error': error, 'worker_id': None,
+                      'scheduled_at': now + timedelta(seconds=backoff)}
+            logger.warning(f"Task {task_id} attempt {attempts} failed: {error}. Retrying in {backoff}s")
+            self.timer.call_later(backoff, self._notify)
+        else:
+            values = {'status': 'failed', 'error': error}
+        if values['status'] != 'pending':
+            values['finished_at'] = now
+        values['lease_expires_at'] = None
+
+        try:
+            with task['app'].app_context():
+                updated = db.session.execute(
+                    update(QueuedTask)
+                    .where(
+                        QueuedTask.id == task_id,
+                        QueuedTask.worker_id == self.worker_id,
+                        QueuedTask.status == 'running',
+                    )
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+        except Exception as e:
+            # The lease lapses and the task is claimed again
+            logger.error(f"Could not record outcome of task {task_id}: {e}")
+            return
+
+        if updated.rowcount != 1:
+            logger.warning(f"Task {task_id} finished after its lease was taken over")
+        else:
+            metrics.track_task_state('running', values['status'])
+            if values['status'] == 'completed':
+                logger.info(f"Task {task_id} completed successfully after {attempts} attempt(s)")
+            elif values['status'] == 'failed':
+                logger.error(f"Task {task_id} failed after {attempts} attempts: {error}")
+        with self._finished:
+            self._finished.notify_all()
+
+    def _heartbeat(self):
+        """Keep extending the leases of tasks running in this process."""
+        while not self._stopping.wait(self._visibility_timeout() / 3):
+            with self.lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self._app.app_context():
+                    db.session.execute(
+                        update(QueuedTask)
+                        .where(
+                            QueuedTask.id.in_(running),
+                            QueuedTask.worker_id == self.worker_id,
+                            QueuedTask.status == 'running',
+                        )
+                        .values(lease_expires_at=_utcnow() + timedelta(seconds=self._visibility_timeout()))
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.session.commit()
+            except Exception as e:
+                logger.warning(f"Could not extend task leases: {e}")
+
+    def _load(self, task_id: str) -> Optional[QueuedTask]:
+        app = current_app_or_none() or self._app
+        if app is None:
+            return None
+        with app.app_context():
+            return db.session.get(QueuedTask, task_id, populate_existing=True)
+
+    def _is_local(self, task_id: str) -> bool:
+        with self.lock:
+            return task_id in self.tasks
+
+    def get_status(self, task_id: str) -> Dict[str, Any]:
+        """Status of an in-memory or stored task; see DesktopTaskQueue.get_status()."""
+        if self._is_local(task_id):
+            return super().get_status(task_id)
+        task = self._load(task_id)
+        return task.to_dict() if task else {'status': 'not_found'}
+
+    def wait_for_task(self, task_id: str, timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Wait for a task, whichever process runs it; see DesktopTaskQueue.wait_for_task().
+
+        A stored task that failed or was cancelled raises RuntimeError.
+        """
+        if self._is_local(task_id):
+            return super().wait_for_task(task_id, timeout=timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            task = self._load(task_id)
+            if task is None:
+                raise KeyError(f"Task {task_id} not found")
+            if task.status == 'completed':
+                return task.result
+            if task.status in ('failed', 'cancelled'):
+                raise RuntimeError(f"Task {task_id} {task.status}: {task.error}")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise concurrent.futures.TimeoutError(f"Task {task_id} still {task.status}")
+            with self._finished:
+                self._finished.wait(0.5 if remaining is None else min(0.5, remaining))
+
+    def get_all_tasks(self) -> Dict[str, Dict[str, Any]]:
+        """In-memory tasks plus every pending or running stored task."""
+        tasks = super().get_all_tasks()
+        app = current_app_or_none() or self._app
+        if app is not None:
+            with app.app_context():
+                active = (
+                    QueuedTask.query.filter(QueuedTask.status.in_(('pending', 'running')))
+                    .order_by(QueuedTask.scheduled_at)
+                    .all()
+                )
+                tasks.update({task.id: task.to_dict() for task in active})
+        return tasks
+
+    def cancel_task(self, task_id: str) -> bool:
+        """Cancel an in-memory task, or a stored task no worker has claimed yet."""
+        if self._is_local(task_id):
+            return super().cancel_task(task_id)
+        app = current_app_or_none() or self._app
+        if app is None:
+            return False
+        with app.app_context():
+            cancelled = db.session.execute(
+                update(QueuedTask)
+                .where(QueuedTask.id == task_id, QueuedTask.status == 'pending')
+                .values(status='cancelled', finished_at=_utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        if cancelled.rowcount == 1:
+            metrics.track_task_state('pending', 'cancelled')
+            logger.info(f"Task {task_id} cancelled successfully")
+            return True
+        logger.warning(f"Task {task_id} could not be cancelled (not found, running or finished)")
+        return False
+
+    def purge(self, older_than_days: Optional[float] = None) -> int:
+        """
+        Delete finished stored tasks older than TASK_QUEUE_RETENTION_DAYS (default 7).
+
+        Must be called inside an application context. Returns the number deleted.
+        """
+        if older_than_days is None:
+            older_than_days = env_float("TASK_QUEUE_RETENTION_DAYS", 7)
+        cutoff = _utcnow() - timedelta(days=older_than_days)
+        deleted = QueuedTask.query.filter(
+            QueuedTask.status.in_(('completed', 'failed', 'cancelled')),
+            QueuedTask.finished_at < cutoff,
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def shutdown(self, wait: bool = True, timeout: int = 30):
+        """
+        Stop the consumers, then the in-memory queue; see DesktopTaskQueue.shutdown().
+
+        Stored tasks still running when ``timeout`` runs out stop having their
+        lease renewed, so another process picks them up once it lapses.
+        """
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        start_time = time.time()
+        if wait:
+            for thread in self._threads:
+                thread.join(max(0, timeout - (time.time() - start_time)))
+        super().shutdown(wait=wait, timeout=max(0, timeout - (time.time() - start_time)))
+
+
 # Global instance for application-wide use
-task_queue = DesktopTaskQueue(max_workers=4)
+task_queue = DurableTaskQueue(max_workers=4)
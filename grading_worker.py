@@ -0,0 +1,233 @@
+"""
+Standalone grading worker.
+
+Run ``python -m grading_worker`` on any machine that shares the database and
+upload folder. Each worker claims pending submissions of jobs running in
+"worker" execution mode (JOB_EXECUTION_MODE=worker, or a job's own
+execution_mode) and grades them, so grading throughput scales with the
+number of worker processes instead of competing with the web tier.
+
+Each claim splits the free slots between jobs with utils.fair_scheduler --
+highest priority first, then fairly across owners and batches, counting
+what every worker is already grading -- so an urgent job is picked up with
+the next free slot even while a large batch is running. Claims are a single
+UPDATE over rows picked with FOR UPDATE SKIP LOCKED (where the database
+supports it), so concurrent workers never grade the same submission. A
+claimed submission records the worker and a lease the worker renews until
+it is graded; every worker also requeues submissions whose lease expired
+because the process holding it died (both through
+services.submission_leases). Provider concurrency and rate limits are
+shared between workers through Redis when REDIS_URL is set; without it
+each process enforces them on its own.
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+
+from models import GradingJob, JobBatch, Submission, db
+from services.job_queue import JobQueueService
+from services.submission_leases import SubmissionLeaseService
+from utils.fair_scheduler import plan
+from utils.runtime import env_float
+
+logger = logging.getLogger(__name__)
+
+
+class GradingWorker:
+    """Claims and grades submissions until stopped."""
+
+    def __init__(self, app, concurrency=None, poll_interval=None):
+        self.app = app
+        self.concurrency = max(1, int(concurrency or env_float("GRADING_WORKER_CONCURRENCY", 4)))
+        self.poll_interval = (
+            poll_interval if poll_interval is not None else env_float("GRADING_WORKER_POLL_INTERVAL", 2)
+        )
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._keys_loaded_at = 0.0
+
+    def _worker_job_ids(self):
+        """Processing jobs whose submissions are left to the grading workers."""
+        from tasks import _get_execution_mode
+
+        jobs = GradingJob.query.filter(GradingJob.status == "processing").all()
+        return [job.id for job in jobs if _get_execution_mode(job) == "worker"]
+
+    def claim(self, limit):
+        """Atomically take up to ``limit`` pending submissions; returns their ids."""
+        if limit <= 0:
+            return []
+        claimed = []
+        with self.app.app_context():
+            job_ids = set(self._worker_job_ids())
+            # Re-plan when another worker took some of the chosen rows first
+            for _ in range(3):
+                candidates = self._candidates(job_ids, limit - len(claimed))
+                if not candidates:
+                    db.session.rollback()
+                    break
+                now = datetime.now(timezone.utc)
+                taken = (
+                    db.session.execute(
+                        update(Submission)
+                        .where(Submission.id.in_(candidates), Submission.status == "pending")
+                        .values(
+                            status="processing",
+                            claimed_by=self.worker_id,
+                            lease_expires_at=SubmissionLeaseService.expires_at(now),
+                            started_at=now,
+                            completed_at=None,
+                            updated_at=now,
+                        )
+                        .returning(Submission.id)
+                        .execution_options(synchronize_session=False)
+                    )
+                    .scalars()
+                    .all()
+                )
+                db.session.commit()
+                SubmissionLeaseService.track(taken, self.worker_id, self.app)
+                claimed += taken
+                if len(taken) == len(candidates) or len(claimed) >= limit:
+                    break
+        return claimed
+
+    def _candidates(self, job_ids, limit):
+        """Ids of the next ``limit`` pending submissions in fair-share order."""
+        if not job_ids or limit <= 0:
+            return []
+        shares, pending, running = JobQueueService.snapshot()
+        shares = {job_id: share for job_id, share in shares.items() if job_id in job_ids}
+        candidates = []
+        for job_id, count in Counter(plan(shares, pending, running, slots=limit)).items():
+            candidates += db.session.execute(
+                select(Submission.id)
+                .where(Submission.job_id == job_id, Submission.status == "pending")
+                .order_by(Submission.created_at)
+                .limit(count)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+        return candidates
+
+    def recover(self):
+        """Requeue submissions whose grading process stopped renewing its lease."""
+        from tasks import recover_stuck_submissions
+
+        recovered = recover_stuck_submissions()
+        if recovered["requeued"] or recovered["failed"]:
+            self._wakeup.set()
+        return recovered
+
+    def _load_api_keys(self):
+        """Pick up API keys saved on the config page, at most once a minute."""
+        if time.monotonic() - self._keys_loaded_at < 60:
+            return
+        from tasks import _load_stored_api_keys
+
+        with self.app.app_context():
+            _load_stored_api_keys()
+        self._keys_loaded_at = time.monotonic()
+
+    def grade(self, submission_id):
+        """Grade one claimed submission and roll up its batch when the job finishes."""
+        from tasks import process_submission_sync
+
+        try:
+            process_submission_sync(submission_id)
+            with self.app.app_context():
+                submission = db.session.get(Submission, submission_id)
+                job = submission.job if submission else None
+                if job is not None and job.batch_id and job.status != "processing":
+                    batch = db.session.get(JobBatch, job.batch_id)
+                    if batch:
+                        batch.update_progress()
+        except Exception as e:
+            logger.error(f"Unhandled exception grading submission {submission_id}: {e}")
+        finally:
+            SubmissionLeaseService.untrack([submission_id])
+            with self._lock:
+                self._in_flight.discard(submission_id)
+            self._wakeup.set()
+
+    def run(self, until_idle=False):
+        """
+        Claim and grade submissions until stop() is called.
+
+        With ``until_idle`` the worker returns once nothing is left to claim
+        and everything it claimed has been graded. In-flight submissions are
+        always finished before returning.
+        """
+        logger.info(f"Grading worker {self.worker_id} started ({self.concurrency} at a time)")
+        last_recovery = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="grading-worker") as executor:
+            while not self._stopping.is_set():
+                with self._lock:
+                    free = self.concurrency - len(self._in_flight)
+                try:
+                    claimed = self.claim(free)
+                except Exception as e:
+                    logger.warning(f"Could not claim submissions: {e}")
+                    claimed = []
+
+                if claimed:
+                    self._load_api_keys()
+                with self._lock:
+                    self._in_flight.update(claimed)
+                for submission_id in claimed:
+                    executor.submit(self.grade, submission_id)
+
+                if time.monotonic() - last_recovery >= SubmissionLeaseService.lease_seconds() / 3:
+                    self.recover()
+                    last_recovery = time.monotonic()
+
+                if len(claimed) < free or free <= 0:
+                    with self._lock:
+                        idle = not self._in_flight
+                    if until_idle and idle and not claimed:
+                        break
+                    # Nothing more to claim right now, or every slot is busy
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+        logger.info(f"Grading worker {self.worker_id} stopped")
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade submissions of worker-mode jobs.")
+    parser.add_argument("--concurrency", type=int, help="submissions graded at once (GRADING_WORKER_CONCURRENCY, default 4)")
+    parser.add_argument("--poll-interval", type=float, help="seconds between claims when idle (GRADING_WORKER_POLL_INTERVAL, default 2)")
+    parser.add_argument("--until-idle", action="store_true", help="exit once no claimable submissions are left")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    from tasks import create_app
+    from utils.llm_providers import _shared_redis_client
+
+    if _shared_redis_client() is None:
+        logger.warning("REDIS_URL is not set: provider limits apply per worker process, not across workers")
+
+    worker = GradingWorker(create_app(), concurrency=args.concurrency, poll_interval=args.poll_interval)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    worker.run(until_idle=args.until_idle)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,12 @@
 # Gunicorn Configuration for Document Grading App
 
+import os
+import shutil
+
+# Workers write Prometheus samples here so /metrics can merge them; must be
+# set before the app (and prometheus_client) is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/grading-app-metrics")
+
 # Server socket
 bind = "0.0.0.0:8000"
 backlog = 2048
@@ -38,3 +45,34 @@ tmp_upload_dir = None
 # SSL (uncomment and configure if using HTTPS)
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
+
+
+def post_worker_init(worker):
+    """
+    Start consuming stored tasks. The first worker to boot also pre-warms the
+    shared model catalog and queues the periodic recovery of abandoned submissions.
+    """
+    from desktop.task_queue import task_queue
+
+    task_queue.start(worker.wsgi)
+    if worker.age != 1:
+        return
+    from services.model_catalog import ModelCatalogService
+    from tasks import schedule_submission_recovery
+
+    ModelCatalogService.prewarm(worker.wsgi)
+    with worker.wsgi.app_context():
+        schedule_submission_recovery()
+
+
+def on_starting(server):
+    """Start with an empty metrics directory; samples from a previous run would be merged in."""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from utils.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
@@ -1,6 +1,8 @@
 """Authentication middleware for enforcing login based on deployment mode."""
 
+import hmac
 import logging
+import os
 from datetime import datetime, timezone
 from functools import wraps
 
@@ -114,6 +116,24 @@ def _validate_user_status():
     return True
 
 
+def _metrics_scrape_allowed():
+    """Check whether an anonymous request may read /metrics.
+
+    Scrapers send ``Authorization: Bearer <METRICS_TOKEN>``; METRICS_PUBLIC=true
+    opens the endpoint to everyone (off by default).
+
+    Returns:
+        bool: True if the scrape is allowed
+    """
+    if os.getenv("METRICS_PUBLIC", "").lower() in ("1", "true", "yes"):
+        return True
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        return False
+    supplied = request.headers.get("Authorization", "")
+    return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+
 def _is_api_request():
     """Check if the current request is an API request."""
     return request.path.startswith("/api/")
@@ -166,6 +186,13 @@ def init_auth_middleware(app):
 
         # In multi-user mode, user must be logged in
         if not current_user.is_authenticated:
+            # Prometheus scrapes authenticate with a bearer token instead
+            if request.endpoint == "metrics.metrics":
+                if _metrics_scrape_allowed():
+                    return
+                logger.warning(f"Unauthorized metrics scrape from {request.remote_addr}")
+                return jsonify({"error": "Unauthorized"}), 401
+
             # Allow some public routes without login
             public_routes = {
                 "auth.login",
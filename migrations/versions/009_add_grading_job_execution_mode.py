@@ -0,0 +1,28 @@
+"""Add execution_mode to grading_jobs
+
+Lets a job choose between the thread-pool runner and the asyncio runner.
+
+Revision ID: 009_add_grading_job_execution_mode
+Revises: 008_create_document_conversion_result_table
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009_add_grading_job_execution_mode'
+down_revision = '008_create_document_conversion_result_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('execution_mode', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.drop_column('execution_mode')
@@ -0,0 +1,46 @@
+"""Add LLM response cache table and per-job opt-in flag
+
+Revision ID: 010_add_llm_response_cache
+Revises: 009_add_grading_job_execution_mode
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010_add_llm_response_cache'
+down_revision = '009_add_grading_job_execution_mode'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'llm_response_cache',
+        sa.Column('cache_key', sa.String(64), primary_key=True, nullable=False),
+        sa.Column('provider', sa.String(50), nullable=False),
+        sa.Column('model', sa.String(100), nullable=True),
+        sa.Column('response', sa.JSON, nullable=False),
+        sa.Column('size_bytes', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('hit_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('last_accessed_at', sa.DateTime, nullable=False),
+    )
+    op.create_index('ix_llm_response_cache_created_at', 'llm_response_cache', ['created_at'])
+    op.create_index('ix_llm_response_cache_last_accessed_at', 'llm_response_cache', ['last_accessed_at'])
+
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column('use_response_cache', sa.Boolean(), nullable=False, server_default=sa.false())
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.drop_column('use_response_cache')
+
+    op.drop_index('ix_llm_response_cache_last_accessed_at', table_name='llm_response_cache')
+    op.drop_index('ix_llm_response_cache_created_at', table_name='llm_response_cache')
+    op.drop_table('llm_response_cache')
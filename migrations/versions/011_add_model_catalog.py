@@ -0,0 +1,32 @@
+"""Add shared model catalog table
+
+Revision ID: 011_add_model_catalog
+Revises: 010_add_llm_response_cache
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011_add_model_catalog'
+down_revision = '010_add_llm_response_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'model_catalog',
+        sa.Column('provider', sa.String(50), primary_key=True, nullable=False),
+        sa.Column('models', sa.JSON, nullable=True),
+        sa.Column('error', sa.Text, nullable=True),
+        sa.Column('fetched_at', sa.DateTime, nullable=True),
+        sa.Column('checked_at', sa.DateTime, nullable=False),
+        sa.Column('refreshing_until', sa.DateTime, nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('model_catalog')
@@ -0,0 +1,28 @@
+"""Add extra_api_keys to config
+
+Stores additional encrypted API keys per provider for the provider key pools.
+
+Revision ID: 012_add_config_extra_api_keys
+Revises: 011_add_model_catalog
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '012_add_config_extra_api_keys'
+down_revision = '011_add_model_catalog'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('config', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extra_api_keys', sa.Text, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('config', schema=None) as batch_op:
+        batch_op.drop_column('extra_api_keys')
@@ -0,0 +1,43 @@
+"""Add persistent task queue table
+
+Revision ID: 013_add_task_queue
+Revises: 012_add_config_extra_api_keys
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013_add_task_queue'
+down_revision = '012_add_config_extra_api_keys'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'task_queue',
+        sa.Column('id', sa.String(36), primary_key=True, nullable=False),
+        sa.Column('task_name', sa.String(200), nullable=False),
+        sa.Column('args', sa.JSON, nullable=True),
+        sa.Column('kwargs', sa.JSON, nullable=True),
+        sa.Column('status', sa.String(20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('max_retries', sa.Integer, nullable=False, server_default='3'),
+        sa.Column('scheduled_at', sa.DateTime, nullable=False),
+        sa.Column('lease_expires_at', sa.DateTime, nullable=True),
+        sa.Column('worker_id', sa.String(100), nullable=True),
+        sa.Column('result', sa.JSON, nullable=True),
+        sa.Column('error', sa.Text, nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+        sa.Column('started_at', sa.DateTime, nullable=True),
+        sa.Column('finished_at', sa.DateTime, nullable=True),
+    )
+    op.create_index('ix_task_queue_status_scheduled_at', 'task_queue', ['status', 'scheduled_at'])
+
+
+def downgrade():
+    op.drop_index('ix_task_queue_status_scheduled_at', table_name='task_queue')
+    op.drop_table('task_queue')
@@ -0,0 +1,30 @@
+"""Add grading worker claim columns to submissions
+
+Records which grading worker holds a submission and until when.
+
+Revision ID: 014_add_submission_claims
+Revises: 013_add_task_queue
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '014_add_submission_claims'
+down_revision = '013_add_task_queue'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('submissions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_by', sa.String(100), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('submissions', schema=None) as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('claimed_by')
@@ -0,0 +1,28 @@
+"""Add priority to the task queue
+
+Due tasks are claimed highest priority first.
+
+Revision ID: 015_add_task_queue_priority
+Revises: 014_add_submission_claims
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '015_add_task_queue_priority'
+down_revision = '014_add_submission_claims'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task_queue', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('priority', sa.Integer, nullable=False, server_default='5'))
+
+
+def downgrade():
+    with op.batch_alter_table('task_queue', schema=None) as batch_op:
+        batch_op.drop_column('priority')
@@ -0,0 +1,29 @@
+"""Add recovery count to submissions
+
+Counts how often a submission was requeued after its grading process died,
+separately from the user-facing retry_count.
+
+Revision ID: 016_add_submission_recovery_count
+Revises: 015_add_task_queue_priority
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '016_add_submission_recovery_count'
+down_revision = '015_add_task_queue_priority'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('submissions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('recovery_count', sa.Integer, nullable=True, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('submissions', schema=None) as batch_op:
+        batch_op.drop_column('recovery_count')
@@ -0,0 +1,31 @@
+"""Add the pending provider batch to grading_jobs
+
+Bulk jobs record the provider batch they wait on, so polling resumes after
+a restart.
+
+Revision ID: 017_add_grading_job_bulk_batch
+Revises: 016_add_submission_recovery_count
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '017_add_grading_job_bulk_batch'
+down_revision = '016_add_submission_recovery_count'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('bulk_batch_id', sa.String(length=200), nullable=True))
+        batch_op.add_column(sa.Column('bulk_submitted_at', sa.DateTime, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('grading_jobs', schema=None) as batch_op:
+        batch_op.drop_column('bulk_submitted_at')
+        batch_op.drop_column('bulk_batch_id')
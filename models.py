@@ -1,8 +1,14 @@
+import json
 import uuid
 from datetime import datetime, timezone
 from decimal import Decimal
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from utils import metrics
 
 # Prevent attribute expiration on commit to avoid DetachedInstanceError in tests and APIs
 db = SQLAlchemy(session_options={"expire_on_commit": False})
@@ -205,6 +211,17 @@ class GradingJob(db.Model):
     # Multi-model support
     models_to_compare = db.Column(db.JSON)  # List of models to use for comparison
 
+    # Submission runner: "threaded" (thread pool), "async" (asyncio event loop),
+    # "bulk" (provider batch API, Claude/OpenAI only) or "worker" (grading_worker processes);
+    # NULL falls back to the batch setting / JOB_EXECUTION_MODE
+    execution_mode = db.Column(db.String(20), nullable=True)
+    # Provider batch a bulk job is waiting on, polled by tasks.poll_bulk_batch
+    bulk_batch_id = db.Column(db.String(200), nullable=True)
+    bulk_submitted_at = db.Column(db.DateTime, nullable=True)
+
+    # Reuse cached provider responses for byte-identical grading requests
+    use_response_cache = db.Column(db.Boolean, default=False, nullable=False)
+
     # Marking scheme reference
     marking_scheme_id = db.Column(
         db.String(36), db.ForeignKey("marking_schemes.id"), nullable=True
@@ -294,6 +311,8 @@ class GradingJob(db.Model):
                 "models_to_compare": self.models_to_compare,
                 "temperature": self.temperature,
                 "max_tokens": self.max_tokens,
+                "execution_mode": self.execution_mode,
+                "use_response_cache": bool(self.use_response_cache),
                 "marking_scheme_id": self.marking_scheme_id,
                 "marking_scheme": marking_scheme_dict,
                 "saved_prompt_id": self.saved_prompt_id,
@@ -323,43 +342,62 @@ class GradingJob(db.Model):
             2,
         )
 
+    def get_hedge_stats(self):
+        """How often grading requests for this job were hedged, and which side won."""
+        rows = (
+            db.session.query(GradeResult.grade_metadata)
+            .join(Submission, GradeResult.submission_id == Submission.id)
+            .filter(Submission.job_id == self.id)
+            .all()
+        )
+        hedges = [(metadata or {}).get("hedge") for (metadata,) in rows]
+        hedged = [h for h in hedges if h]
+        fallback_wins = sum(1 for h in hedged if h.get("winner") == "fallback")
+        return {
+            "requests": len(rows),
+            "hedged": len(hedged),
+            "hedge_rate": round(len(hedged) / len(rows), 4) if rows else 0.0,
+            "primary_wins": sum(1 for h in hedged if h.get("winner") == "primary"),
+            "fallback_wins": fallback_wins,
+        }
+
+    # Recount a job's submissions after this many finished under incremental updates
+    PROGRESS_RECONCILE_EVERY = 100
+
     def update_progress(self):
-        """Update job progress based on submissions."""
-        # Compute counts via queries to avoid stale relationship caching
-        try:
-            from models import Submission  # local import to avoid circular issues
-        except Exception:
-            Submission = None
+        """
+        Recount the job's submissions and update its counters and status.
 
-        if Submission is not None:
-            actual_total = (
-                db.session.query(Submission)
-                .filter(Submission.job_id == self.id)
-                .count()
-            )
-            processed_count = (
-                db.session.query(Submission)
-                .filter(Submission.job_id == self.id, Submission.status == "completed")
-                .count()
+        The counts are taken inside the UPDATE itself, so increments from
+        add_progress() committed meanwhile are not overwritten.
+        """
+
+        def count(*conditions):
+            return (
+                select(func.count(Submission.id))
+                .where(Submission.job_id == GradingJob.id, *conditions)
+                .scalar_subquery()
             )
-            failed_count = (
-                db.session.query(Submission)
-                .filter(Submission.job_id == self.id, Submission.status == "failed")
-                .count()
+
+        row = db.session.execute(
+            update(GradingJob)
+            .where(GradingJob.id == self.id)
+            .values(
+                total_submissions=count(),
+                processed_submissions=count(Submission.status == "completed"),
+                failed_submissions=count(Submission.status == "failed"),
             )
-        else:
-            # Fallback to relationship if import failed
-            actual_total = len(self.submissions)
-            processed_count = sum(
-                1 for s in self.submissions if s.status == "completed"
+            .returning(
+                GradingJob.total_submissions,
+                GradingJob.processed_submissions,
+                GradingJob.failed_submissions,
             )
-            failed_count = sum(1 for s in self.submissions if s.status == "failed")
-
-        if self.total_submissions != actual_total:
-            self.total_submissions = actual_total
-
-        self.processed_submissions = processed_count
-        self.failed_submissions = failed_count
+            .execution_options(synchronize_session=False)
+        ).first()
+        if row is not None:
+            set_committed_value(self, "total_submissions", row.total_submissions)
+            set_committed_value(self, "processed_submissions", row.processed_submissions)
+            set_committed_value(self, "failed_submissions", row.failed_submissions)
 
         if (
             self.total_submissions > 0
@@ -375,6 +413,48 @@ class GradingJob(db.Model):
 
         db.session.commit()
 
+    @staticmethod
+    def add_progress(job_id, processed=0, failed=0):
+        """
+        Add to a job's processed/failed counters with one atomic UPDATE, then commit.
+
+        Used on every submission status change instead of recounting the
+        job's submissions. The job is recounted with update_progress() once
+        the counters say it has finished, every PROGRESS_RECONCILE_EVERY
+        finished submissions, and while its total is unknown.
+        """
+        row = db.session.execute(
+            update(GradingJob)
+            .where(GradingJob.id == job_id)
+            .values(
+                processed_submissions=func.coalesce(GradingJob.processed_submissions, 0) + processed,
+                failed_submissions=func.coalesce(GradingJob.failed_submissions, 0) + failed,
+            )
+            .returning(
+                GradingJob.total_submissions,
+                GradingJob.processed_submissions,
+                GradingJob.failed_submissions,
+            )
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+        if row is None:
+            return
+
+        # Keep an already loaded job in step with the row
+        job = db.session.identity_map.get(identity_key(GradingJob, job_id))
+        if job is not None:
+            set_committed_value(job, "processed_submissions", row.processed_submissions)
+            set_committed_value(job, "failed_submissions", row.failed_submissions)
+
+        finished = row.processed_submissions + row.failed_submissions
+        if (
+            not row.total_submissions
+            or finished >= row.total_submissions
+            or (processed + failed > 0 and finished % GradingJob.PROGRESS_RECONCILE_EVERY == 0)
+        ):
+            (job or db.session.get(GradingJob, job_id)).update_progress()
+
     def can_retry_failed_submissions(self, max_retries=3):
         """Check if any failed submissions can be retried."""
         return any(submission.can_retry(max_retries) for submission in self.submissions)
@@ -436,6 +516,112 @@ class GradeResult(db.Model):
         }
 
 
+class ModelCatalogEntry(db.Model):
+    """Last model listing fetched from a provider, shared by all workers."""
+
+    __tablename__ = "model_catalog"
+
+    provider = db.Column(db.String(50), primary_key=True)  # route key, e.g. "openrouter"
+    models = db.Column(db.JSON)  # list from get_available_models(); None until a fetch succeeds
+    error = db.Column(db.Text)  # error from the most recent fetch, if it failed
+    fetched_at = db.Column(db.DateTime)  # last successful fetch
+    checked_at = db.Column(db.DateTime, nullable=False)  # last fetch attempt
+    refreshing_until = db.Column(db.DateTime)  # background refresh claim
+
+    def to_dict(self):
+        """Convert catalog entry to dictionary (without the model list)."""
+        return {
+            "provider": self.provider,
+            "model_count": len(self.models) if self.models is not None else None,
+            "error": self.error,
+            "fetched_at": self.fetched_at.isoformat() if self.fetched_at else None,
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+        }
+
+
+class LLMResponseCache(db.Model):
+    """Content-addressed cache of successful LLM grading responses."""
+
+    __tablename__ = "llm_response_cache"
+
+    # sha256 of provider, model, prompts, marking scheme, document and parameters
+    cache_key = db.Column(db.String(64), primary_key=True)
+    provider = db.Column(db.String(50), nullable=False)
+    model = db.Column(db.String(100))
+    response = db.Column(db.JSON, nullable=False)  # grade, usage, model, provider
+    size_bytes = db.Column(db.Integer, nullable=False, default=0)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(
+        db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True
+    )
+    last_accessed_at = db.Column(
+        db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True
+    )
+
+    def to_dict(self):
+        """Convert cache entry to dictionary (without the cached response body)."""
+        return {
+            "cache_key": self.cache_key,
+            "provider": self.provider,
+            "model": self.model,
+            "size_bytes": self.size_bytes,
+            "hit_count": self.hit_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "last_accessed_at": self.last_accessed_at.isoformat()
+            if self.last_accessed_at
+            else None,
+        }
+
+
+class QueuedTask(db.Model):
+    """A background task in the persistent task queue (see desktop.task_queue)."""
+
+    __tablename__ = "task_queue"
+    __table_args__ = (db.Index("ix_task_queue_status_scheduled_at", "status", "scheduled_at"),)
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    task_name = db.Column(db.String(200), nullable=False)  # import path, e.g. "tasks:process_job"
+    args = db.Column(db.JSON)
+    kwargs = db.Column(db.JSON)
+    # pending, running, completed, failed, cancelled
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # times claimed by a worker
+    max_retries = db.Column(db.Integer, nullable=False, default=3)
+    priority = db.Column(db.Integer, nullable=False, default=5)  # due tasks are claimed highest first
+    scheduled_at = db.Column(db.DateTime, nullable=False)  # not claimed before this time
+    lease_expires_at = db.Column(db.DateTime)  # running task is reclaimed once this passes
+    worker_id = db.Column(db.String(100))
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert queued task to dictionary."""
+        return {
+            "id": self.id,
+            "task_name": self.task_name,
+            "function": self.task_name.rsplit(":", 1)[-1],
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_retries": self.max_retries,
+            "priority": self.priority,
+            "scheduled_at": self.scheduled_at.isoformat() if self.scheduled_at else None,
+            "lease_expires_at": self.lease_expires_at.isoformat()
+            if self.lease_expires_at
+            else None,
+            "worker_id": self.worker_id,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
 class Submission(db.Model):
     """Model for individual document submissions."""
 
@@ -461,9 +647,15 @@ class Submission(db.Model):
     )  # pending, processing, completed, failed
     error_message = db.Column(db.Text)
     retry_count = db.Column(db.Integer, default=0)  # Number of retry attempts
+    # Times requeued after its grading process died (see services.submission_leases)
+    recovery_count = db.Column(db.Integer, default=0)
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
 
+    # Grading worker holding this submission (see grading_worker.py)
+    claimed_by = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+
     # Extracted content
     extracted_text = db.Column(db.Text)
 
@@ -509,6 +701,7 @@ class Submission(db.Model):
                 "grade_results": grade_results_list,
                 "job_id": self.job_id,
                 "retry_count": self.retry_count,
+                "recovery_count": self.recovery_count,
                 "can_retry": can_retry_val,
                 "started_at": self.started_at.isoformat() if self.started_at else None,
                 "completed_at": (
@@ -523,17 +716,38 @@ class Submission(db.Model):
                 "error": f"Error serializing submission: {str(e)}",
             }
 
-    def set_status(self, status, error_message=None):
-        """Update submission status."""
+    def set_status(self, status, error_message=None, commit=True):
+        """Update submission status.
+
+        With ``commit=False`` the change is only staged in the session; the
+        caller commits (and refreshes job progress) for a whole batch at once.
+        """
+        if status in ("completed", "failed") and status != self.status:
+            metrics.SUBMISSIONS.labels(status).inc()
+        now = datetime.now(timezone.utc)
+        if status == "processing":
+            self.started_at = now
+            self.completed_at = None
+        elif status in ("completed", "failed"):
+            self.completed_at = now
+        previous = self.status
         self.status = status
         if error_message:
             self.error_message = error_message
-        self.updated_at = datetime.now(timezone.utc)
-        db.session.commit()
+        self.updated_at = now
+        if not commit:
+            return
+        if previous == status or self.job_id is None:
+            db.session.commit()
+            return
 
-        # Update job progress
-        if self.job:
-            self.job.update_progress()
+        # Move the job's counters in the same transaction as the status change
+        processed = (status == "completed") - (previous == "completed")
+        failed = (status == "failed") - (previous == "failed")
+        if processed or failed:
+            GradingJob.add_progress(self.job_id, processed=processed, failed=failed)
+        else:
+            db.session.commit()
 
     def can_retry(self, max_retries=3):
         """Check if submission can be retried."""
@@ -553,7 +767,10 @@ class Submission(db.Model):
         for grade_result in self.grade_results:
             db.session.delete(grade_result)
 
-        db.session.commit()
+        if self.job_id is not None:
+            GradingJob.add_progress(self.job_id, failed=-1)  # commits
+        else:
+            db.session.commit()
 
         # Update job status if it was failed
         if self.job and self.job.status == "failed":
@@ -570,6 +787,7 @@ class Submission(db.Model):
         status="completed",
         error_message=None,
         metadata=None,
+        commit=True,
     ):
         """Add a new grade result to this submission."""
         grade_result = GradeResult(
@@ -581,7 +799,8 @@ class Submission(db.Model):
             grade_metadata=metadata,
         )
         self.grade_results.append(grade_result)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return grade_result
 
 
@@ -906,16 +1125,20 @@ class JobBatch(db.Model):
         return round((completed / total) * 100, 2) if total > 0 else 0
 
     def update_progress(self):
-        """Update batch progress and status based on jobs."""
-        if not self.jobs:
+        """Update batch progress and status based on jobs (one grouped count)."""
+        statuses = dict(
+            db.session.query(GradingJob.status, func.count(GradingJob.id))
+            .filter(GradingJob.batch_id == self.id)
+            .group_by(GradingJob.status)
+            .all()
+        )
+        total = sum(statuses.values())
+        if not total:
             return
 
-        total = len(self.jobs)
-        completed = sum(1 for job in self.jobs if job.status == "completed")
-        failed = sum(
-            1 for job in self.jobs if job.status in ["failed", "completed_with_errors"]
-        )
-        processing = sum(1 for job in self.jobs if job.status == "processing")
+        completed = statuses.get("completed", 0)
+        failed = statuses.get("failed", 0) + statuses.get("completed_with_errors", 0)
+        processing = statuses.get("processing", 0)
 
         self.total_jobs = total
         self.completed_jobs = completed
@@ -989,16 +1212,15 @@ class JobBatch(db.Model):
             return False
 
         self.status = "processing"
+        db.session.commit()
 
         # Queue pending jobs for processing
         for job in self.jobs:
             if job.status == "pending":
-                from desktop.task_queue import task_queue
                 from tasks import process_job
 
                 process_job.delay(job.id)
 
-        db.session.commit()
         return True
 
     def cancel_batch(self):
@@ -1096,6 +1318,12 @@ class JobBatch(db.Model):
                 else self.max_tokens
             ),
             "priority": kwargs.get("priority", 5),
+            "execution_mode": kwargs.get("execution_mode"),
+            "use_response_cache": (
+                kwargs.get("use_response_cache")
+                if kwargs.get("use_response_cache") is not None
+                else (self.batch_settings or {}).get("use_response_cache")
+            ),
             "saved_prompt_id": kwargs.get("saved_prompt_id") or self.saved_prompt_id,
             "saved_marking_scheme_id": kwargs.get("saved_marking_scheme_id")
             or self.saved_marking_scheme_id,
@@ -1215,6 +1443,8 @@ class Config(db.Model):
     _nanogpt_api_key = db.Column("nanogpt_api_key", db.String(500))
     _chutes_api_key = db.Column("chutes_api_key", db.String(500))
     _zai_api_key = db.Column("zai_api_key", db.String(500))
+    # Additional keys per provider, spread across by the provider key pools
+    _extra_api_keys = db.Column("extra_api_keys", db.Text)
     zai_pricing_plan = db.Column(db.String(20), default="normal")
     lm_studio_url = db.Column(db.String(500))
     ollama_url = db.Column(db.String(500))
@@ -1391,6 +1621,47 @@ class Config(db.Model):
 
             self._zai_api_key = encrypt_value(value)
 
+    # Config provider keys -> LLM provider names, for the key pools
+    EXTRA_API_KEY_PROVIDERS = {
+        "openrouter": "OpenRouter",
+        "claude": "Claude",
+        "openai": "OpenAI",
+        "nanogpt": "NanoGPT",
+        "chutes": "Chutes",
+        "zai": "Z.AI",
+    }
+
+    @property
+    def extra_api_keys(self):
+        """Get decrypted additional API keys as {"openrouter": [...], ...}."""
+        if not self._extra_api_keys:
+            return {}
+        from utils.encryption import decrypt_value
+
+        try:
+            return json.loads(decrypt_value(self._extra_api_keys))
+        except Exception:
+            return {}
+
+    @extra_api_keys.setter
+    def extra_api_keys(self, value):
+        """Set additional API keys per provider (automatically encrypted)."""
+        value = {provider: list(keys) for provider, keys in (value or {}).items() if keys}
+        if not value:
+            self._extra_api_keys = None
+        else:
+            from utils.encryption import encrypt_value
+
+            self._extra_api_keys = encrypt_value(json.dumps(value))
+
+    def apply_extra_api_keys(self):
+        """Hand the stored additional keys to the LLM provider key pools."""
+        from utils.llm_providers import set_extra_api_keys
+
+        extra_api_keys = self.extra_api_keys
+        for provider, provider_name in self.EXTRA_API_KEY_PROVIDERS.items():
+            set_extra_api_keys(provider_name, extra_api_keys.get(provider))
+
     def to_dict(self):
         """Convert config to dictionary."""
         return {
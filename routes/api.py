@@ -5,7 +5,6 @@ Handles RESTful API endpoints for jobs, submissions, and saved configurations.
 
 import io
 import os
-import time
 import zipfile
 from datetime import datetime, timezone
 
@@ -24,79 +23,46 @@ from models import (
     Submission,
     db,
 )
+from services.job_queue import JobQueueService
+from services.model_catalog import ModelCatalogService
 from tasks import process_image_ocr
 from utils.file_utils import (
     ValidationError,
     generate_storage_path,
     validate_uploaded_image,
 )
-from utils.llm_providers import get_llm_provider
+from utils.fair_scheduler import submission_pool
+from utils.llm_providers import (
+    get_adaptive_concurrency_stats,
+    get_api_key_pool_stats,
+    get_circuit_breaker_stats,
+    get_local_endpoint_stats,
+    get_rate_limit_stats,
+    get_semaphore_stats,
+)
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
 
-# Cache for model lists to avoid excessive API calls
-_model_cache = {}
-_cache_timestamp = {}
-CACHE_TTL = 300  # 5 minutes in seconds
-
-
 def get_cached_models(provider_name):
-    """Get cached models for a provider, or fetch if cache is expired/empty."""
-    current_time = time.time()
-
-    # Check if we have cached data and it's not expired
-    if (
-        provider_name in _model_cache
-        and provider_name in _cache_timestamp
-        and current_time - _cache_timestamp[provider_name] < CACHE_TTL
-    ):
-        return _model_cache[provider_name]
-
-    # Cache is empty or expired, fetch fresh data
+    """Get models for a provider from the shared catalog, with popular/default structure."""
     try:
-        # Map lowercase provider names to capitalized names expected by get_llm_provider
-        provider_name_mapping = {
-            "openrouter": "OpenRouter",
-            "claude": "Claude",
-            "gemini": "Gemini",
-            "openai": "OpenAI",
-            "lm_studio": "LM Studio",
-            "ollama": "Ollama",
-            "nanogpt": "NanoGPT",
-            "chutes": "Chutes",
-            "zai": "Z.AI",
-            "zai_coding_plan": "Z.AI Coding Plan",
-        }
-
-        capitalized_name = provider_name_mapping.get(provider_name, provider_name)
-        provider = get_llm_provider(capitalized_name)
-        result = provider.get_available_models()
-
-        if result.get("success"):
-            # Convert raw models list to expected format with popular/default structure
-            models_list = result["models"]
-            provider_config = DEFAULT_MODELS.get(provider_name, {})
-
-            # Build the expected response format
-            formatted_models = {
-                "popular": (
-                    [model["id"] for model in models_list]
-                    if models_list
-                    else provider_config.get("popular", [])
-                ),
-                "default": provider_config.get(
-                    "default", models_list[0]["id"] if models_list else ""
-                ),
-            }
-
-            # Cache the successful result
-            _model_cache[provider_name] = formatted_models
-            _cache_timestamp[provider_name] = current_time
-            return formatted_models
-        else:
-            # Return fallback models if API fails
+        models_list = ModelCatalogService.get_models(provider_name)
+        if models_list is None:
+            # Return fallback models if the provider cannot be listed
             return get_fallback_models(provider_name)
+
+        provider_config = DEFAULT_MODELS.get(provider_name, {})
+        return {
+            "popular": (
+                [model["id"] for model in models_list]
+                if models_list
+                else provider_config.get("popular", [])
+            ),
+            "default": provider_config.get(
+                "default", models_list[0]["id"] if models_list else ""
+            ),
+        }
     except Exception as e:
         print(f"Error fetching models for {provider_name}: {e}")
         # Return None for unknown providers to trigger 400 error
@@ -245,6 +211,8 @@ def get_available_models():
         "zai",
         "zai_coding_plan",
     ]
+    # Fetch any missing listings concurrently before reading them one by one
+    ModelCatalogService.prefetch(providers)
     models = {}
 
     for provider in providers:
@@ -284,6 +252,7 @@ def get_all_models():
         "zai",
         "zai_coding_plan",
     ]
+    ModelCatalogService.prefetch(providers)
     all_models = {}
 
     for provider in providers:
@@ -294,6 +263,21 @@ def get_all_models():
     return jsonify(all_models)
 
 
+@api_bp.route("/providers/concurrency")
+def get_provider_concurrency():
+    """Adaptive (AIMD) limits, RPM/TPM buckets, semaphore waits, breakers, key pools and local servers."""
+    return jsonify(
+        {
+            **get_adaptive_concurrency_stats(),
+            "rate_limits": get_rate_limit_stats(),
+            "semaphores": get_semaphore_stats(),
+            "circuit_breakers": get_circuit_breaker_stats(),
+            "api_keys": get_api_key_pool_stats(),
+            "local_endpoints": get_local_endpoint_stats(),
+        }
+    )
+
+
 @api_bp.route("/jobs")
 def api_jobs():
     """API endpoint for all jobs."""
@@ -339,6 +323,29 @@ def api_job_detail(job_id):
     return jsonify(job.to_dict())
 
 
+@api_bp.route("/jobs/<job_id>/hedging")
+def api_job_hedging(job_id):
+    """Hedged-request rate and wins for a job's grading calls."""
+    job = GradingJob.query.get_or_404(job_id)
+    return jsonify(job.get_hedge_stats())
+
+
+@api_bp.route("/jobs/<job_id>/queue")
+def api_job_queue(job_id):
+    """Queue position and expected start time of a job's next submission."""
+    job = GradingJob.query.get_or_404(job_id)
+    estimate = JobQueueService.estimate(job.id)
+    if estimate is None:
+        return jsonify({"job_id": job.id, "queued": False, "status": job.status})
+    return jsonify({**estimate, "queued": True, "status": job.status})
+
+
+@api_bp.route("/queue")
+def api_queue():
+    """Every active job in scheduling order, plus the in-process submission pool."""
+    return jsonify({"jobs": JobQueueService.estimates(), "pool": submission_pool.get_stats()})
+
+
 @api_bp.route("/jobs/<job_id>/submissions")
 def api_job_submissions(job_id):
     """API endpoint for job submissions."""
@@ -1598,6 +1605,8 @@ def api_create_job_in_batch(batch_id):
             temperature=data.get("temperature"),
             max_tokens=data.get("max_tokens"),
             priority=data.get("priority"),
+            execution_mode=data.get("execution_mode"),
+            use_response_cache=data.get("use_response_cache"),
             saved_prompt_id=data.get("saved_prompt_id"),
             saved_marking_scheme_id=data.get("saved_marking_scheme_id"),
         )
@@ -190,6 +190,7 @@ def create_job():
             saved_marking_scheme_id=data.get("saved_marking_scheme_id"),
             scheme_id=data.get("scheme_id"),
             batch_id=data.get("batch_id"),
+            use_response_cache=bool(data.get("use_response_cache", False)),
         )
 
         # Increment usage counts for saved configurations
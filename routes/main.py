@@ -73,7 +73,7 @@ def config():
 def save_config():
     """Save configuration settings."""
     try:
-        from utils.llm_providers import validate_api_key_format
+        from utils.llm_providers import split_api_keys, validate_api_key_format
 
         # Get or create config record
         config = Config.get_or_create()
@@ -97,6 +97,19 @@ def save_config():
                 if not is_valid:
                     validation_errors.append(error)
 
+        # Additional keys (one per line) are only replaced when the form sends them
+        extra_api_keys = config.extra_api_keys
+        for provider in Config.EXTRA_API_KEY_PROVIDERS:
+            form_field = f"{provider}_extra_api_keys"
+            if form_field not in request.form:
+                continue
+            keys = split_api_keys(request.form[form_field])
+            for key in keys:
+                is_valid, error = validate_api_key_format(provider, key)
+                if not is_valid:
+                    validation_errors.append(f"Additional key: {error}")
+            extra_api_keys[provider] = keys
+
         # Return validation errors if any
         if validation_errors:
             return jsonify(
@@ -111,6 +124,7 @@ def save_config():
         config.nanogpt_api_key = request.form.get("nanogpt_api_key", "").strip() or None
         config.chutes_api_key = request.form.get("chutes_api_key", "").strip() or None
         config.zai_api_key = request.form.get("zai_api_key", "").strip() or None
+        config.extra_api_keys = extra_api_keys
         config.lm_studio_url = request.form.get("lm_studio_url", "http://localhost:1234/v1").strip()
         config.ollama_url = request.form.get("ollama_url", "http://localhost:11434").strip()
         config.default_prompt = request.form.get("default_prompt", "").strip() or None
@@ -129,6 +143,7 @@ def save_config():
 
         # Save to database
         db.session.commit()
+        config.apply_extra_api_keys()
 
         # Save to session for immediate use (backward compatibility)
         session["default_prompt"] = config.default_prompt
@@ -155,6 +170,10 @@ def load_config():
             "nanogpt_api_key": config.nanogpt_api_key or os.getenv("NANOGPT_API_KEY", ""),
             "chutes_api_key": config.chutes_api_key or os.getenv("CHUTES_API_KEY", ""),
             "zai_api_key": config.zai_api_key or os.getenv("ZAI_API_KEY", ""),
+            **{
+                f"{provider}_extra_api_keys": "\n".join(keys)
+                for provider, keys in config.extra_api_keys.items()
+            },
             "zai_pricing_plan": config.zai_pricing_plan or "normal",
             "lm_studio_url": config.lm_studio_url or os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1"),
             "ollama_url": config.ollama_url or os.getenv("OLLAMA_URL", "http://localhost:11434"),
@@ -226,6 +245,7 @@ def export_config():
             "nanogpt_api_key": config.nanogpt_api_key or "",
             "chutes_api_key": config.chutes_api_key or "",
             "zai_api_key": config.zai_api_key or "",
+            "extra_api_keys": config.extra_api_keys,
             # URLs
             "lm_studio_url": config.lm_studio_url or "http://localhost:1234/v1",
             "ollama_url": config.ollama_url or "http://localhost:11434",
@@ -297,6 +317,20 @@ def import_config():
                 if not is_valid:
                     validation_errors.append(error)
 
+        extra_api_keys = data.get("extra_api_keys")
+        if extra_api_keys is not None:
+            if not isinstance(extra_api_keys, dict):
+                validation_errors.append("extra_api_keys must be an object of provider key lists")
+                extra_api_keys = {}
+            for provider, keys in extra_api_keys.items():
+                if provider not in Config.EXTRA_API_KEY_PROVIDERS or not isinstance(keys, list):
+                    validation_errors.append(f"extra_api_keys: unsupported entry '{provider}'")
+                    continue
+                for key in keys:
+                    is_valid, error = validate_api_key_format(provider, key)
+                    if not is_valid:
+                        validation_errors.append(f"Additional key: {error}")
+
         # T064: URL format validation
         url_fields = ["lm_studio_url", "ollama_url"]
         for field in url_fields:
@@ -324,6 +358,9 @@ def import_config():
             if field in data:
                 setattr(config, field, data[field] or None)
                 fields_updated += 1
+        if extra_api_keys is not None:
+            config.extra_api_keys = extra_api_keys
+            fields_updated += 1
 
         # URLs
         if "lm_studio_url" in data:
@@ -360,6 +397,7 @@ def import_config():
 
         # Save to database
         db.session.commit()
+        config.apply_extra_api_keys()
 
         return jsonify({
             "success": True,
@@ -0,0 +1,21 @@
+"""Prometheus scrape endpoint."""
+
+import logging
+
+from flask import Blueprint, Response, jsonify
+
+from utils.metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Grading pipeline metrics in the Prometheus text exposition format."""
+    try:
+        body, content_type = render_metrics()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    return Response(body, mimetype=content_type)
@@ -522,6 +522,8 @@ def upload_bulk():
                 temperature=float(request.form.get("temperature", "0.3")),
                 max_tokens=int(request.form.get("max_tokens", "2000")),
                 scheme_id=request.form.get("scheme_id"),
+                execution_mode=request.form.get("execution_mode") or None,
+                use_response_cache=request.form.get("use_response_cache") in ("1", "true", "on"),
             )
             db.session.add(job)
             db.session.commit()
@@ -0,0 +1,164 @@
+"""Queue positions and expected start times of grading jobs."""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+from models import GradingJob, QueuedTask, Submission, db
+from utils.fair_scheduler import Share, iter_plan, submission_pool
+from utils.runtime import as_utc
+
+
+class JobQueueService:
+    """
+    Where each job stands in the shared grading queue.
+
+    Positions follow utils.fair_scheduler: the order in which submissions of
+    the jobs that are processing, or queued to start, would be handed out
+    given the submissions already running. Start times are estimates from the
+    recent average submission duration and the JOB_GLOBAL_MAX_PARALLEL
+    capacity.
+    """
+
+    DEFAULT_PRIORITY = 5
+
+    @staticmethod
+    def effective_priority(job):
+        """A job's own priority, raised to its batch's when that is higher."""
+        priority = job.priority or JobQueueService.DEFAULT_PRIORITY
+        if job.batch is not None and job.batch.priority:
+            priority = max(priority, job.batch.priority)
+        return priority
+
+    @staticmethod
+    def share(job):
+        created_at = as_utc(job.created_at)
+        return Share(
+            job_id=job.id,
+            owner=job.owner_id,
+            group=job.batch_id or job.id,
+            priority=JobQueueService.effective_priority(job),
+            created_at=created_at.timestamp() if created_at else 0.0,
+        )
+
+    @staticmethod
+    def queued_job_ids():
+        """Jobs whose process_job task is stored in the task queue and not finished."""
+        rows = QueuedTask.query.filter(
+            QueuedTask.task_name == "tasks:process_job",
+            QueuedTask.status.in_(("pending", "running")),
+        ).all()
+        return {task.args[0] for task in rows if task.args}
+
+    @staticmethod
+    def snapshot():
+        """Return ({job_id: Share}, {job_id: pending}, {job_id: running}) for active jobs."""
+        jobs = GradingJob.query.filter(
+            (GradingJob.status == "processing") | GradingJob.id.in_(JobQueueService.queued_job_ids())
+        ).all()
+        shares = {job.id: JobQueueService.share(job) for job in jobs}
+        pending, running = {}, {}
+        if shares:
+            counts = (
+                db.session.query(Submission.job_id, Submission.status, func.count(Submission.id))
+                .filter(
+                    Submission.job_id.in_(list(shares)),
+                    Submission.status.in_(("pending", "processing")),
+                )
+                .group_by(Submission.job_id, Submission.status)
+                .all()
+            )
+            for job_id, status, count in counts:
+                (pending if status == "pending" else running)[job_id] = count
+        return shares, pending, running
+
+    @staticmethod
+    def average_duration(sample=100):
+        """Mean seconds per submission over the most recent completions (JOB_QUEUE_DEFAULT_SECONDS without history)."""
+        try:
+            default = float(os.getenv("JOB_QUEUE_DEFAULT_SECONDS", "30"))
+        except ValueError:
+            default = 30.0
+        recent = (
+            db.session.query(Submission.started_at, Submission.completed_at)
+            .filter(
+                Submission.status == "completed",
+                Submission.started_at.isnot(None),
+                Submission.completed_at.isnot(None),
+            )
+            .order_by(Submission.completed_at.desc())
+            .limit(sample)
+            .all()
+        )
+        durations = [(completed - started).total_seconds() for started, completed in recent]
+        durations = [d for d in durations if d >= 0]
+        return sum(durations) / len(durations) if durations else default
+
+    @staticmethod
+    def estimates():
+        """
+        Queue state of every active job, in the order they would get their next slot.
+
+        Each entry has the job's priority, pending and running counts,
+        ``position`` (0 while the job has submissions running, else 1-based
+        among waiting jobs), ``submissions_ahead`` of its next start,
+        ``wait_seconds`` and ``expected_start``.
+        """
+        shares, pending, running = JobQueueService.snapshot()
+        in_flight = sum(running.values())
+        capacity = max(submission_pool.capacity, in_flight, 1)
+        free = capacity - in_flight
+        duration = JobQueueService.average_duration()
+        now = datetime.now(timezone.utc)
+
+        first_start = {}
+        waiting = {job_id for job_id, count in pending.items() if count > 0 and job_id in shares}
+        for index, job_id in enumerate(iter_plan(shares, pending, running)):
+            if job_id not in first_start:
+                first_start[job_id] = index
+                if len(first_start) == len(waiting):
+                    break
+
+        entries = []
+        for job_id, share in shares.items():
+            ahead = first_start.get(job_id)
+            if ahead is None:
+                wait = None
+            elif ahead < free:
+                wait = 0.0
+            else:
+                wait = ((ahead - free) // capacity + 1) * duration
+            entries.append(
+                {
+                    "job_id": job_id,
+                    "priority": share.priority,
+                    "owner_id": share.owner,
+                    "batch_id": share.group if share.group != job_id else None,
+                    "pending": pending.get(job_id, 0),
+                    "running": running.get(job_id, 0),
+                    "submissions_ahead": ahead,
+                    "wait_seconds": wait,
+                    "expected_start": (now + timedelta(seconds=wait)).isoformat() if wait is not None else None,
+                }
+            )
+
+        entries.sort(key=lambda e: (e["submissions_ahead"] is None, e["submissions_ahead"] or 0))
+        position = 0
+        for entry in entries:
+            if entry["running"]:
+                entry["position"] = 0
+            elif entry["submissions_ahead"] is not None:
+                position += 1
+                entry["position"] = position
+            else:
+                entry["position"] = None
+        return entries
+
+    @staticmethod
+    def estimate(job_id):
+        """The estimates() entry for one job, or None when it has nothing waiting or running."""
+        for entry in JobQueueService.estimates():
+            if entry["job_id"] == job_id:
+                return entry
+        return None
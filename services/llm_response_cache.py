@@ -0,0 +1,188 @@
+"""Content-addressed cache for LLM grading responses."""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from models import LLMResponseCache, db
+from utils.llm_providers import GRADER_SYSTEM_PROMPT, get_llm_provider
+from utils.runtime import as_utc
+
+logger = logging.getLogger(__name__)
+
+# Bump when the request shape changes so old entries stop matching
+CACHE_KEY_VERSION = "v1"
+
+
+class LLMResponseCacheService:
+    """Service for looking up, storing and evicting cached grading responses."""
+
+    @staticmethod
+    def max_age():
+        """Maximum entry age (LLM_CACHE_MAX_AGE_DAYS, default 30 days)."""
+        try:
+            days = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+        except ValueError:
+            days = 30.0
+        return timedelta(days=days)
+
+    @staticmethod
+    def max_bytes():
+        """Total size budget for cached responses (LLM_CACHE_MAX_MB, default 256 MB)."""
+        try:
+            megabytes = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+        except ValueError:
+            megabytes = 256.0
+        return int(megabytes * 1024 * 1024)
+
+    @staticmethod
+    def build_key(provider_name, grade_kwargs):
+        """
+        Hash everything that determines a provider's answer.
+
+        Args:
+            provider_name: str - Provider display name (e.g. "OpenRouter")
+            grade_kwargs: dict - Arguments passed to grade_document
+
+        Returns:
+            str: 64-character hex sha256 digest
+        """
+        model = grade_kwargs.get("model")
+        if not model:
+            try:
+                model = get_llm_provider(provider_name).default_model
+            except ValueError:
+                model = None
+
+        material = {
+            "version": CACHE_KEY_VERSION,
+            "provider": provider_name,
+            "model": model,
+            "system_prompt": GRADER_SYSTEM_PROMPT,
+            "prompt": grade_kwargs.get("prompt"),
+            "marking_scheme": grade_kwargs.get("marking_scheme_content"),
+            "text": grade_kwargs.get("text"),
+            "temperature": grade_kwargs.get("temperature"),
+            "max_tokens": grade_kwargs.get("max_tokens"),
+        }
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def lookup(cache_key):
+        """
+        Return the cached grading result for a key, or None.
+
+        A hit is marked with ``cache_hit: True``. Hit counters are bumped with a
+        single UPDATE statement and persist with the caller's next commit.
+        """
+        entry = db.session.get(LLMResponseCache, cache_key)
+        if entry is None:
+            return None
+
+        now = datetime.now(timezone.utc)
+        if as_utc(entry.created_at) < now - LLMResponseCacheService.max_age():
+            return None
+
+        db.session.execute(
+            update(LLMResponseCache)
+            .where(LLMResponseCache.cache_key == cache_key)
+            .values(hit_count=LLMResponseCache.hit_count + 1, last_accessed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+        result = dict(entry.response or {})
+        result["success"] = True
+        result["cache_hit"] = True
+        result["cache_key"] = cache_key
+        return result
+
+    @staticmethod
+    def store(cache_key, provider_name, result):
+        """
+        Cache a successful grading result and commit it.
+
+        Returns:
+            LLMResponseCache or None if the result was not cacheable or another
+            worker stored the same key first.
+        """
+        if not result.get("success") or result.get("cache_hit"):
+            return None
+        if db.session.get(LLMResponseCache, cache_key) is not None:
+            return None
+
+        response = {key: result.get(key) for key in ("grade", "model", "provider", "usage")}
+        entry = LLMResponseCache(
+            cache_key=cache_key,
+            provider=provider_name,
+            model=result.get("model"),
+            response=response,
+            size_bytes=len(json.dumps(response, default=str).encode("utf-8")),
+        )
+        db.session.add(entry)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker cached the same request first
+            db.session.rollback()
+            return None
+        return entry
+
+    @staticmethod
+    def evict(max_age=None, max_bytes=None):
+        """
+        Remove expired entries, then least recently used ones over the size budget.
+
+        Returns:
+            int: Number of entries removed
+        """
+        max_age = max_age if max_age is not None else LLMResponseCacheService.max_age()
+        max_bytes = max_bytes if max_bytes is not None else LLMResponseCacheService.max_bytes()
+
+        try:
+            cutoff = datetime.now(timezone.utc) - max_age
+            removed = LLMResponseCache.query.filter(LLMResponseCache.created_at < cutoff).delete(
+                synchronize_session=False
+            )
+
+            total = db.session.query(func.coalesce(func.sum(LLMResponseCache.size_bytes), 0)).scalar()
+            if total > max_bytes:
+                excess = total - max_bytes
+                victims = []
+                oldest_first = db.session.query(LLMResponseCache.cache_key, LLMResponseCache.size_bytes).order_by(
+                    LLMResponseCache.last_accessed_at.asc()
+                )
+                for cache_key, size_bytes in oldest_first:
+                    victims.append(cache_key)
+                    excess -= size_bytes or 0
+                    if excess <= 0:
+                        break
+                for start in range(0, len(victims), 500):
+                    LLMResponseCache.query.filter(
+                        LLMResponseCache.cache_key.in_(victims[start:start + 500])
+                    ).delete(synchronize_session=False)
+                removed += len(victims)
+
+            db.session.commit()
+            if removed:
+                logger.info(f"Evicted {removed} LLM response cache entries")
+            return removed
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error evicting LLM response cache: {e}")
+            return 0
+
+    @staticmethod
+    def get_stats():
+        """Return entry count, stored bytes and total hits."""
+        entries, total_bytes, hits = db.session.query(
+            func.count(LLMResponseCache.cache_key),
+            func.coalesce(func.sum(LLMResponseCache.size_bytes), 0),
+            func.coalesce(func.sum(LLMResponseCache.hit_count), 0),
+        ).one()
+        return {"entries": entries, "total_bytes": int(total_bytes), "total_hits": int(hits)}
@@ -0,0 +1,234 @@
+"""Shared, stale-while-revalidate catalog of provider model listings."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import ModelCatalogEntry, db
+from utils.llm_providers import get_llm_provider
+from utils.runtime import as_utc, current_app_or_none, env_float
+
+logger = logging.getLogger(__name__)
+
+# Route keys (as used by /api/models/<provider>) -> provider display names
+CATALOG_PROVIDERS = {
+    "openrouter": "OpenRouter",
+    "claude": "Claude",
+    "gemini": "Gemini",
+    "openai": "OpenAI",
+    "lm_studio": "LM Studio",
+    "ollama": "Ollama",
+    "nanogpt": "NanoGPT",
+    "chutes": "Chutes",
+    "zai": "Z.AI",
+    "zai_coding_plan": "Z.AI Coding Plan",
+}
+
+
+class ModelCatalogService:
+    """
+    Model listings stored in the database so every worker process shares them.
+
+    Entries younger than MODEL_CATALOG_TTL (default 300s; MODEL_CATALOG_ERROR_TTL,
+    default 60s, after a failed fetch) are served as-is. Older entries are still
+    served immediately while one background thread -- claimed through the
+    database, so only one worker does it -- fetches a fresh listing. Only a
+    provider with no usable listing, or one older than MODEL_CATALOG_MAX_STALE
+    (default 1 day), is fetched inline; several such providers are fetched
+    concurrently.
+    """
+
+    _refreshing = set()  # providers with a background refresh running in this process
+    _lock = threading.Lock()
+
+    @staticmethod
+    def display_name(provider):
+        return CATALOG_PROVIDERS.get(provider, provider)
+
+    @staticmethod
+    def fetch(provider):
+        """
+        Call the provider's get_available_models().
+
+        Returns:
+            tuple: (models list or None, error message or None)
+
+        Raises:
+            ValueError: for unknown providers
+        """
+        llm_provider = get_llm_provider(ModelCatalogService.display_name(provider))
+        try:
+            result = llm_provider.get_available_models()
+        except Exception as e:
+            return None, str(e)
+        if result.get("success"):
+            return result.get("models") or [], None
+        return None, result.get("error") or "Model listing failed"
+
+    @staticmethod
+    def store(provider, models, error):
+        """Record a fetch attempt; a failed fetch keeps the last good listing."""
+        now = datetime.now(timezone.utc)
+        entry = db.session.get(ModelCatalogEntry, provider)
+        if entry is None:
+            entry = ModelCatalogEntry(provider=provider, checked_at=now)
+            db.session.add(entry)
+        entry.checked_at = now
+        entry.error = error
+        entry.refreshing_until = None
+        if models is not None:
+            entry.models = models
+            entry.fetched_at = now
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker inserted the row first; its listing is as good as ours
+            db.session.rollback()
+            entry = db.session.get(ModelCatalogEntry, provider)
+        return entry
+
+    @staticmethod
+    def _ttl(entry):
+        """Freshness window for an entry: shorter after a failed fetch."""
+        if entry.error:
+            return env_float("MODEL_CATALOG_ERROR_TTL", 60)
+        return env_float("MODEL_CATALOG_TTL", 300)
+
+    @staticmethod
+    def _state(entry, now):
+        """"fresh", "stale" (serve, refresh in the background) or "missing" (fetch inline)."""
+        if entry is None:
+            return "missing"
+        expired = as_utc(entry.checked_at) < now - timedelta(seconds=ModelCatalogService._ttl(entry))
+        max_stale = timedelta(seconds=env_float("MODEL_CATALOG_MAX_STALE", 86400))
+        if entry.models is not None and as_utc(entry.fetched_at) >= now - max_stale:
+            return "stale" if expired else "fresh"
+        # Nothing usable: fetch inline, but not more often than the TTL allows
+        return "missing" if expired else "fresh"
+
+    @staticmethod
+    def get_models(provider):
+        """
+        Return the model list for a provider, or None when it cannot be listed.
+
+        Raises:
+            ValueError: for unknown providers
+        """
+        ModelCatalogService.prefetch([provider], strict=True)
+        entry = db.session.get(ModelCatalogEntry, provider)
+        return entry.models if entry is not None else None
+
+    @staticmethod
+    def prefetch(providers, strict=False):
+        """
+        Make sure each provider has a usable listing stored.
+
+        Missing listings are fetched concurrently and stored before returning;
+        stale ones are handed to background refreshes. Unknown providers are
+        skipped, or raise ValueError when ``strict``.
+        """
+        now = datetime.now(timezone.utc)
+        to_fetch = []
+        for provider in providers:
+            entry = db.session.get(ModelCatalogEntry, provider)
+            state = ModelCatalogService._state(entry, now)
+            if state == "missing":
+                to_fetch.append(provider)
+            elif state == "stale":
+                ModelCatalogService.refresh_in_background(provider)
+
+        if not to_fetch:
+            return
+        if len(to_fetch) == 1:
+            fetched = {to_fetch[0]: ModelCatalogService._fetch_or_error(to_fetch[0])}
+        else:
+            with ThreadPoolExecutor(max_workers=len(to_fetch)) as executor:
+                fetched = dict(zip(to_fetch, executor.map(ModelCatalogService._fetch_or_error, to_fetch)))
+        for provider, outcome in fetched.items():
+            if isinstance(outcome, ValueError):
+                if strict:
+                    raise outcome
+                continue
+            ModelCatalogService.store(provider, *outcome)
+
+    @staticmethod
+    def _fetch_or_error(provider):
+        try:
+            return ModelCatalogService.fetch(provider)
+        except ValueError as e:
+            return e
+
+    @staticmethod
+    def _claim(provider):
+        """Claim the background refresh of a provider across processes."""
+        now = datetime.now(timezone.utc)
+        result = db.session.execute(
+            update(ModelCatalogEntry)
+            .where(ModelCatalogEntry.provider == provider)
+            .where(
+                or_(ModelCatalogEntry.refreshing_until.is_(None), ModelCatalogEntry.refreshing_until < now)
+            )
+            .values(refreshing_until=now + timedelta(seconds=120))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def refresh_in_background(provider, app=None):
+        """Refresh one provider on a daemon thread unless a refresh is already running."""
+        with ModelCatalogService._lock:
+            if provider in ModelCatalogService._refreshing:
+                return False
+            ModelCatalogService._refreshing.add(provider)
+        try:
+            app = app or current_app_or_none()
+            if not ModelCatalogService._claim(provider):
+                with ModelCatalogService._lock:
+                    ModelCatalogService._refreshing.discard(provider)
+                return False
+        except Exception as e:
+            with ModelCatalogService._lock:
+                ModelCatalogService._refreshing.discard(provider)
+            logger.warning(f"Could not schedule model catalog refresh for {provider}: {e}")
+            return False
+
+        thread = threading.Thread(
+            target=ModelCatalogService._refresh_worker,
+            args=(app, provider),
+            daemon=True,
+            name=f"ModelCatalogRefresh-{provider}",
+        )
+        thread.start()
+        return True
+
+    @staticmethod
+    def _refresh_worker(app, provider):
+        try:
+            with app.app_context():
+                ModelCatalogService.store(provider, *ModelCatalogService.fetch(provider))
+        except Exception as e:
+            logger.warning(f"Model catalog refresh for {provider} failed: {e}")
+        finally:
+            with ModelCatalogService._lock:
+                ModelCatalogService._refreshing.discard(provider)
+
+    @staticmethod
+    def prewarm(app):
+        """Fill the catalog for every provider on a background thread (call at startup)."""
+
+        def run():
+            try:
+                with app.app_context():
+                    ModelCatalogService.prefetch(list(CATALOG_PROVIDERS))
+                logger.info("Model catalog pre-warmed")
+            except Exception as e:
+                logger.warning(f"Model catalog pre-warm failed: {e}")
+
+        thread = threading.Thread(target=run, daemon=True, name="ModelCatalogPrewarm")
+        thread.start()
+        return thread
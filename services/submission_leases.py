@@ -0,0 +1,251 @@
+"""Heartbeat leases on submissions being graded, and recovery of abandoned ones."""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import case, func, select, update
+
+from models import GradingJob, Submission, db
+from utils import metrics
+from utils.runtime import env_float
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class SubmissionLeaseService:
+    """
+    Leases on the submissions a process is grading.
+
+    While a submission is graded -- or claimed by a grading worker and
+    waiting for a free slot -- Submission.lease_expires_at is kept in the
+    future by one heartbeat thread per process that renews every lease the
+    process tracks each third of SUBMISSION_LEASE_SECONDS (default 300). If
+    the process dies or hangs -- a crash, a deploy, an OOM kill -- its leases
+    lapse and reap() puts those submissions back to pending so they are
+    graded again. Recoveries are counted in Submission.recovery_count, apart
+    from the user's retries; a submission abandoned SUBMISSION_MAX_RECOVERIES
+    times (default 3) is failed instead of being requeued forever.
+
+    Submissions in processing without a lease are never reaped: the async and
+    bulk runners stage their status changes and commit them in batches.
+    """
+
+    _lock = threading.Lock()
+    _held = {}  # submission id -> claimed_by of the lease this process renews
+    _pid = None
+    _worker_id = None
+    _app = None
+    _heartbeat = None
+
+    @staticmethod
+    def lease_seconds():
+        return env_float("SUBMISSION_LEASE_SECONDS", 300)
+
+    @classmethod
+    def worker_id(cls):
+        """Identifies this process on the leases it takes (recomputed after a fork)."""
+        with cls._lock:
+            cls._check_pid()
+            return cls._worker_id
+
+    @classmethod
+    def _check_pid(cls):
+        if cls._pid != os.getpid():
+            cls._pid = os.getpid()
+            cls._worker_id = f"{socket.gethostname()}:{cls._pid}:{uuid.uuid4().hex[:8]}"
+            cls._held = {}
+            cls._heartbeat = None
+
+    @classmethod
+    def expires_at(cls, now=None):
+        """When a lease taken or renewed now runs out."""
+        return (now or _utcnow()) + timedelta(seconds=cls.lease_seconds())
+
+    @classmethod
+    def track(cls, submission_ids, owner, app=None):
+        """
+        Have the heartbeat renew the leases ``owner`` holds on ``submission_ids``.
+
+        Returns the ids that were not tracked yet.
+        """
+        with cls._lock:
+            cls._check_pid()
+            added = [sid for sid in submission_ids if sid not in cls._held]
+            for sid in added:
+                cls._held[sid] = owner
+            cls._app = app or current_app._get_current_object()
+            if cls._heartbeat is None or not cls._heartbeat.is_alive():
+                cls._heartbeat = threading.Thread(
+                    target=cls._renew_forever, daemon=True, name="submission-lease-heartbeat"
+                )
+                cls._heartbeat.start()
+        return added
+
+    @classmethod
+    def untrack(cls, submission_ids):
+        """Stop renewing the leases on ``submission_ids``."""
+        with cls._lock:
+            for sid in submission_ids:
+                cls._held.pop(sid, None)
+
+    @classmethod
+    @contextmanager
+    def hold(cls, submission_id):
+        """
+        Lease ``submission_id`` to this process while the block runs.
+
+        A live claim -- a grading worker's -- is kept; otherwise the
+        submission is claimed for this process. The lease is dropped on exit
+        once the submission has left processing, and left to lapse if it has
+        not. Commits the current session.
+        """
+        owner = cls.worker_id()
+        now = _utcnow()
+        claimed_by = db.session.execute(
+            update(Submission)
+            .where(Submission.id == submission_id)
+            .values(
+                claimed_by=case(
+                    (Submission.lease_expires_at > now, Submission.claimed_by), else_=owner
+                ),
+                lease_expires_at=cls.expires_at(now),
+            )
+            .returning(Submission.claimed_by)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        db.session.commit()
+        if claimed_by is None:
+            yield
+            return
+
+        # A worker's claim is already tracked and stays so until the worker is done
+        added = cls.track([submission_id], claimed_by)
+        try:
+            yield
+        finally:
+            cls.untrack(added)
+            try:
+                db.session.execute(
+                    update(Submission)
+                    .where(
+                        Submission.id == submission_id,
+                        Submission.claimed_by == claimed_by,
+                        Submission.status != "processing",
+                    )
+                    .values(lease_expires_at=None)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Could not release lease on submission {submission_id}: {e}")
+
+    @classmethod
+    def _renew_forever(cls):
+        while True:
+            time.sleep(cls.lease_seconds() / 3)
+            try:
+                cls.renew()
+            except Exception as e:
+                logger.warning(f"Could not renew submission leases: {e}")
+
+    @classmethod
+    def renew(cls):
+        """Extend every lease this process holds; returns how many were extended."""
+        with cls._lock:
+            held = dict(cls._held)
+            app = cls._app
+        if not held or app is None:
+            return 0
+        by_owner = {}
+        for submission_id, owner in held.items():
+            by_owner.setdefault(owner, []).append(submission_id)
+        renewed = 0
+        with app.app_context():
+            expires_at = cls.expires_at()
+            for owner, submission_ids in by_owner.items():
+                # A submission reaped and claimed elsewhere meanwhile has another owner
+                renewed += db.session.execute(
+                    update(Submission)
+                    .where(
+                        Submission.id.in_(submission_ids),
+                        Submission.claimed_by == owner,
+                        Submission.status == "processing",
+                    )
+                    .values(lease_expires_at=expires_at)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            db.session.commit()
+        return renewed
+
+    @staticmethod
+    def reap(max_recoveries=None):
+        """
+        Requeue submissions whose lease expired, or fail those out of recoveries.
+
+        Each row is taken over with a conditional UPDATE, so a lease renewed
+        in the meantime -- or another reaper -- wins. Returns
+        ``{"requeued": [job ids], "failed": count}``; callers restart the
+        requeued jobs that no grading worker will pick up.
+        """
+        if max_recoveries is None:
+            max_recoveries = int(env_float("SUBMISSION_MAX_RECOVERIES", 3))
+        now = _utcnow()
+        expired = Submission.status == "processing", Submission.lease_expires_at < now
+        rows = db.session.execute(
+            select(Submission.id, Submission.job_id, Submission.recovery_count, Submission.claimed_by)
+            .where(*expired)
+        ).all()
+
+        requeued, failed = set(), 0
+        for row in rows:
+            give_up = (row.recovery_count or 0) >= max_recoveries
+            values = {"claimed_by": None, "lease_expires_at": None, "updated_at": now}
+            if give_up:
+                values.update(
+                    status="failed",
+                    completed_at=now,
+                    error_message=(
+                        f"Grading stopped responding {max_recoveries + 1} times "
+                        f"(last held by {row.claimed_by})"
+                    ),
+                )
+            else:
+                values.update(
+                    status="pending",
+                    started_at=None,
+                    recovery_count=func.coalesce(Submission.recovery_count, 0) + 1,
+                )
+            taken = db.session.execute(
+                update(Submission)
+                .where(Submission.id == row.id, *expired)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if taken != 1:
+                continue
+
+            if give_up:
+                GradingJob.add_progress(row.job_id, failed=1)  # commits
+                metrics.SUBMISSIONS.labels("failed").inc()
+                failed += 1
+            else:
+                db.session.commit()
+                requeued.add(row.job_id)
+            logger.warning(
+                f"Lease on submission {row.id} held by {row.claimed_by} expired; "
+                f"{'failed' if give_up else 'requeued'}"
+            )
+            metrics.SUBMISSION_RECOVERIES.labels("failed" if give_up else "requeued").inc()
+        return {"requeued": sorted(requeued), "failed": failed}
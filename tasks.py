@@ -1,32 +1,53 @@
+import asyncio
 import glob
+import json
 import os
+import threading
 import uuid
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock
 
 from dotenv import load_dotenv
+from sqlalchemy import update
 
-from desktop.task_queue import task_queue
+from desktop.task_queue import DurableTaskQueue, task_queue
 from models import (
+    Config,
     ExtractedContent,
     GradingJob,
     ImageQualityMetrics,
     ImageSubmission,
     JobBatch,
     MarkingScheme,
+    QueuedTask,
     SavedMarkingScheme,
     Submission,
     DocumentUploadLog,
     DocumentConversionResult,
     db,
 )
+from services.job_queue import JobQueueService
+from services.llm_response_cache import LLMResponseCacheService
+from services.submission_leases import SubmissionLeaseService
+from utils import metrics
+from utils.batch_apis import BatchAPIError, get_batch_client, supports_batch_api
+from utils.fair_scheduler import global_capacity, submission_pool
 from utils.file_utils import cleanup_file
+from utils.long_documents import combine_results, plan_sections, reduce_kwargs
+from utils.runtime import as_utc
 from utils.llm_providers import (
+    agrade_with_retries,
     extract_text_from_image_azure,
+    get_connection_pool,
     get_llm_provider,
-    provider_semaphore,
+    grade_with_retries,
+    hold_local_model,
+    latency_quantile,
+    release_local_model,
 )
+from utils.single_flight import SingleFlight
 from utils.text_extraction import extract_text_by_file_type
 
 
@@ -105,57 +126,87 @@ def process_job(job_id):
             job = db.session.get(GradingJob, job_id)
             if not job:
                 raise ValueError(f"Job {job_id} not found")
+            return _run_job(app, job)
 
-            print(f"Starting to process job: {job.job_name} (ID: {job_id})")
+        except ValueError as e:
+            print(f"Validation error processing job {job_id}: {str(e)}")
+            return False
+        except Exception as e:
+            print(f"Error processing job {job_id}: {str(e)}")
+            job = db.session.get(GradingJob, job_id)
+            if job:
+                job.status = "failed"
+                db.session.commit()
+            return False
 
-            # Update job status when processing begins
-            job.status = "processing"
-            db.session.commit()
 
-            # Process each submission sequentially
-            pending_submissions = [s for s in job.submissions if s.status == "pending"]
+def _run_job(app, job):
+    """Grade a job's pending submissions with its execution mode (inside an app context)."""
+    print(f"Starting to process job: {job.job_name} (ID: {job.id})")
 
-            if not pending_submissions:
-                job.update_progress()
-                return True
+    # Update job status when processing begins
+    job.status = "processing"
+    db.session.commit()
+
+    pending_submissions = [s for s in job.submissions if s.status == "pending"]
+
+    if not pending_submissions:
+        # No pending submissions, check if job should be completed
+        job.update_progress()
+        return True
 
-            # Determine number of worker threads to use
+    execution_mode = _get_execution_mode(job)
+    if execution_mode == "worker":
+        print(f"Leaving {len(pending_submissions)} submissions to the grading workers")
+        return True
+
+    _load_stored_api_keys()
+    with _local_models_warm(job):
+        if execution_mode == "async":
+            print(f"Processing {len(pending_submissions)} submissions on the asyncio runner")
+            _process_submissions_async(app, job, pending_submissions)
+        elif execution_mode == "bulk":
+            print(f"Processing {len(pending_submissions)} submissions through the provider batch API")
+            if _process_submissions_bulk(app, job, pending_submissions):
+                # poll_bulk_batch stores the results and finishes the job
+                return True
+        else:
+            # Cap on this job's share of the submission pool
             max_workers = _get_max_workers(job)
             workers = max(1, min(max_workers, len(pending_submissions)))
             print(
-                f"Processing {len(pending_submissions)} submissions using {workers} worker(s)"
+                f"Processing {len(pending_submissions)} submissions on the submission pool "
+                f"(up to {workers} at a time)"
             )
 
-            _process_submissions_parallel(pending_submissions, workers)
+            _process_submissions_parallel(
+                pending_submissions, workers, share=JobQueueService.share(job)
+            )
 
-            job.update_progress()
+    # Update job progress after all submissions are processed
+    job.update_progress()
 
-            if job.batch_id:
-                batch = db.session.get(JobBatch, job.batch_id)
-                if batch:
-                    batch.update_progress()
+    # Update batch progress if job belongs to a batch
+    if job.batch_id:
+        batch = db.session.get(JobBatch, job.batch_id)
+        if batch:
+            batch.update_progress()
 
-            print(f"Completed processing job: {job.job_name} (ID: {job_id})")
-            return True
-
-        except ValueError as e:
-            print(f"Validation error processing job {job_id}: {str(e)}")
-            return False
-        except Exception as e:
-            print(f"Error processing job {job_id}: {str(e)}")
-            job = db.session.get(GradingJob, job_id)
-            if job:
-                job.status = "failed"
-                db.session.commit()
-            return False
+    print(f"Completed processing job: {job.job_name} (ID: {job.id})")
+    return True
 
 
 def _get_max_workers(job):
-    """Get maximum number of workers for a job."""
+    """
+    Most submissions of a job graded at once on the submission pool.
+
+    JOB_MAX_PARALLEL, or the batch setting "job_parallelism", caps a single
+    job; by default a job may use the whole pool (JOB_GLOBAL_MAX_PARALLEL).
+    """
     try:
-        max_workers = int(os.getenv("JOB_MAX_PARALLEL", "4"))
+        max_workers = int(os.getenv("JOB_MAX_PARALLEL") or global_capacity())
     except ValueError:
-        max_workers = 4
+        max_workers = global_capacity()
 
     # Allow batch-level override if provided
     if job.batch and getattr(job.batch, "batch_settings", None):
@@ -166,35 +217,497 @@ def _get_max_workers(job):
     return max_workers
 
 
-def _process_submissions_parallel(pending_submissions, workers):
-    """Process submissions in parallel using ThreadPoolExecutor."""
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        future_map = {
-            executor.submit(process_submission_sync, s.id): s
-            for s in pending_submissions
-        }
-        for fut in as_completed(future_map):
-            submission_obj = future_map[fut]
-            try:
-                result = fut.result()
-                if not result:
-                    failure_reason = (
-                        submission_obj.error_message
-                        if hasattr(submission_obj, "error_message")
-                        else None
+EXECUTION_MODES = ("threaded", "async", "bulk", "worker")
+
+
+def _get_execution_mode(job):
+    """
+    Decide how a job's submissions are run: "threaded", "async", "bulk" or "worker".
+
+    Resolution order: the job's own execution_mode, the batch setting
+    "execution_mode", then JOB_EXECUTION_MODE (default "threaded"). "bulk"
+    falls back to "threaded" for providers without a batch API. "worker" jobs
+    are graded by separate grading_worker processes.
+    """
+    mode = getattr(job, "execution_mode", None)
+    if not mode and job.batch and getattr(job.batch, "batch_settings", None):
+        bs = job.batch.batch_settings
+        if isinstance(bs, dict):
+            mode = bs.get("execution_mode")
+    if not mode:
+        mode = os.getenv("JOB_EXECUTION_MODE", "threaded")
+
+    mode = str(mode).strip().lower()
+    if mode == "bulk" and not supports_batch_api(_resolve_provider_name(job.provider or "")):
+        return "threaded"
+    return mode if mode in EXECUTION_MODES else "threaded"
+
+
+def _get_async_settings():
+    """Return (max in-flight submissions, results per DB commit) for the async runner."""
+    try:
+        max_in_flight = int(os.getenv("JOB_ASYNC_MAX_IN_FLIGHT", "200"))
+    except ValueError:
+        max_in_flight = 200
+    try:
+        commit_batch = int(os.getenv("JOB_ASYNC_COMMIT_BATCH", "25"))
+    except ValueError:
+        commit_batch = 25
+    return max(1, max_in_flight), max(1, commit_batch)
+
+
+def _get_bulk_settings():
+    """Return (seconds between polls, maximum seconds to wait) for the bulk runner."""
+    try:
+        poll_interval = float(os.getenv("JOB_BULK_POLL_INTERVAL", "60"))
+    except ValueError:
+        poll_interval = 60.0
+    try:
+        max_wait = float(os.getenv("JOB_BULK_MAX_WAIT_HOURS", "24")) * 3600
+    except ValueError:
+        max_wait = 24 * 3600.0
+    return max(0.0, poll_interval), max(0.0, max_wait)
+
+
+def _load_stored_api_keys():
+    """
+    Give the provider key pools the additional API keys saved in the app config.
+
+    Done per job so workers in other processes pick up keys saved since they
+    started.
+    """
+    try:
+        config = Config.query.first()
+    except Exception as e:
+        print(f"Could not load stored API keys: {e}")
+        return
+    if config is not None:
+        config.apply_extra_api_keys()
+
+
+_LOCAL_PROVIDERS = ("ollama", "lm_studio")
+_local_warmups = {}  # (provider name, model) -> warm_up() result of the first job holding it
+
+
+@contextmanager
+def _local_models_warm(job):
+    """
+    Keep a local (Ollama / LM Studio) job's models loaded while it runs.
+
+    Before the first submission each model is loaded and checked to be
+    resident; grading requests then renew a LOCAL_MODEL_KEEP_ALIVE keep-alive
+    so the server does not evict the model between submissions. When the job
+    ends the last job holding a model releases it -- unloading it only if it
+    was not resident before the warm-up. Disabled with JOB_WARM_LOCAL_MODELS=false.
+    """
+    provider = (job.provider or "").lower()
+    enabled = os.getenv("JOB_WARM_LOCAL_MODELS", "true").lower() in ("1", "true", "yes")
+    if provider not in _LOCAL_PROVIDERS or not enabled:
+        yield
+        return
+
+    provider_name = _resolve_provider_name(provider)
+    llm_provider = get_llm_provider(provider_name)
+    held = []
+    for model in _get_models_to_grade(job):
+        # LM Studio grades with its default model id whatever the job's model
+        if provider not in _MODEL_SELECTING_PROVIDERS or not model:
+            model = llm_provider.default_model
+        if model in held:
+            continue
+        held.append(model)
+        if not hold_local_model(provider_name, model):
+            continue  # another running job already warmed it
+        status = llm_provider.warm_up(model)
+        _local_warmups[(provider_name, model)] = status
+        if not status.get("success"):
+            print(f"Could not warm up {provider_name} model {model}: {status.get('error')}")
+        elif status.get("resident") is False:
+            print(f"{provider_name} model {model} is not resident after warm-up")
+        else:
+            print(f"Warmed up {provider_name} model {model} in {status.get('load_seconds')}s")
+
+    try:
+        yield
+    finally:
+        for model in held:
+            if release_local_model(provider_name, model):
+                status = _local_warmups.pop((provider_name, model), {})
+                llm_provider.release(model, unload=status.get("was_resident") is False)
+
+
+def _process_submissions_parallel(pending_submissions, workers, share):
+    """
+    Grade submissions on the process-wide submission_pool.
+
+    Every job feeds the same JOB_GLOBAL_MAX_PARALLEL threads, which take
+    submissions by priority and fair share (see utils.fair_scheduler);
+    ``workers`` only caps how many of this job's submissions run at once.
+    """
+    future_map = {
+        submission_pool.submit(share, process_submission_sync, s.id, limit=workers): s
+        for s in pending_submissions
+    }
+    for fut in as_completed(future_map):
+        submission_obj = future_map[fut]
+        try:
+            result = fut.result()
+            if not result:
+                failure_reason = (
+                    submission_obj.error_message
+                    if hasattr(submission_obj, "error_message")
+                    else None
+                )
+                if failure_reason:
+                    print(
+                        f"Failed to process submission: {submission_obj.original_filename} | Reason: {failure_reason}"
                     )
-                    if failure_reason:
-                        print(
-                            f"Failed to process submission: {submission_obj.original_filename} | Reason: {failure_reason}"
-                        )
-                    else:
-                        print(
-                            f"Failed to process submission: {submission_obj.original_filename}"
-                        )
-            except Exception as e:
-                print(
-                    f"Unhandled exception processing submission {submission_obj.original_filename}: {e}"
+                else:
+                    print(
+                        f"Failed to process submission: {submission_obj.original_filename}"
+                    )
+        except Exception as e:
+            print(
+                f"Unhandled exception processing submission {submission_obj.original_filename}: {e}"
+            )
+
+
+class _BatchedCommitter:
+    """
+    Commit the async runner's results in batches instead of once per row.
+
+    Finished submissions are staged in the session and committed together every
+    ``batch_size`` submissions, followed by a single job progress refresh.
+    Uploaded files are only removed once their results have been committed; a
+    batch that cannot be committed has its submissions marked failed so they
+    can be retried.
+    """
+
+    def __init__(self, job, batch_size):
+        self.job = job
+        self.batch_size = max(1, int(batch_size))
+        self.pending = 0
+        self.commits = 0
+        self._submission_ids = []
+        self._cleanup_paths = []
+        self._cache_entries = []
+
+    def add_cache_entry(self, cache_key, provider_name, result):
+        """Queue a response cache write for after the next batch commit."""
+        self._cache_entries.append((cache_key, provider_name, result))
+
+    def record(self, submission_id, cleanup_path=None):
+        """Note one finished submission and commit when the batch is full."""
+        self.pending += 1
+        self._submission_ids.append(submission_id)
+        if cleanup_path:
+            self._cleanup_paths.append(cleanup_path)
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Commit everything staged so far."""
+        if not self.pending:
+            return
+        submission_ids, cleanup_paths, cache_entries = (
+            self._submission_ids,
+            self._cleanup_paths,
+            self._cache_entries,
+        )
+        self._submission_ids, self._cleanup_paths, self._cache_entries = [], [], []
+        self.pending = 0
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(
+                f"Error committing {len(submission_ids)} graded submissions, their results are lost: {e}"
+            )
+            self._fail(submission_ids, f"Could not save grading results: {e}")
+            return
+
+        self.commits += 1
+        for path in cleanup_paths:
+            cleanup_file(path)
+        # Written one by one so a key stored concurrently elsewhere cannot
+        # fail the batch itself
+        for cache_key, provider_name, result in cache_entries:
+            LLMResponseCacheService.store(cache_key, provider_name, result)
+        self.job.update_progress()
+
+    def _fail(self, submission_ids, error_message):
+        """Mark submissions whose results were rolled back as failed."""
+        now = datetime.now(timezone.utc)
+        try:
+            failed = db.session.execute(
+                update(Submission)
+                .where(Submission.id.in_(submission_ids), Submission.status != "completed")
+                .values(status="failed", error_message=error_message, completed_at=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Could not mark submissions {submission_ids} failed: {e}")
+            return
+        metrics.SUBMISSIONS.labels("failed").inc(failed)
+        print(f"Marked submissions {submission_ids} failed; they can be retried")
+        self.job.update_progress()
+
+
+def _process_submissions_async(app, job, pending_submissions):
+    """Process submissions concurrently on a single asyncio event loop."""
+    submission_ids = [s.id for s in pending_submissions]
+    return asyncio.run(_grade_submissions_async(app, job, submission_ids))
+
+
+async def _grade_submissions_async(app, job, submission_ids):
+    """
+    Grade many submissions at once on the running event loop.
+
+    Up to JOB_ASYNC_MAX_IN_FLIGHT submissions are in progress together; provider
+    calls still queue on async_provider_semaphore, so the per-provider limits
+    hold exactly as in the thread-pool runner.
+    """
+    max_in_flight, commit_batch = _get_async_settings()
+    in_flight = asyncio.Semaphore(max_in_flight)
+    committer = _BatchedCommitter(job, commit_batch)
+    models_to_grade = _get_models_to_grade(job)
+    marking_scheme_content = _get_marking_scheme_content(job)
+
+    async def run(submission_id):
+        async with in_flight:
+            try:
+                return await _agrade_submission(
+                    app, submission_id, job, models_to_grade, marking_scheme_content, committer
                 )
+            except Exception as e:
+                print(f"Unhandled exception processing submission {submission_id}: {e}")
+                return False
+
+    try:
+        return await asyncio.gather(*(run(sid) for sid in submission_ids))
+    finally:
+        committer.flush()
+        await get_connection_pool().aclose_loop()
+
+
+async def _agrade_submission(
+    app, submission_id, job, models_to_grade, marking_scheme_content, committer
+):
+    """Async counterpart of process_submission_sync; commits go through ``committer``."""
+    submission = db.session.get(Submission, submission_id)
+    if not submission:
+        return False
+
+    cleanup_path = None
+    try:
+        submission.set_status("processing", commit=False)
+
+        if not _is_provider_supported(job.provider):
+            error_msg = (
+                f"Unsupported provider: {job.provider}. "
+                f"Supported providers are: {', '.join(_get_supported_providers())}"
+            )
+            submission.set_status("failed", error_msg, commit=False)
+            return False
+
+        file_path = _get_submission_file_path(app, submission)
+        if not file_path:
+            submission.set_status("failed", "File not found on disk", commit=False)
+            return False
+
+        # Text extraction is CPU/disk bound; keep it off the event loop
+        text = await asyncio.to_thread(
+            extract_text_by_file_type, file_path, submission.file_type
+        )
+        if text.startswith("Error reading"):
+            submission.set_status("failed", text, commit=False)
+            return False
+
+        submission.extracted_text = text
+        successful_results = await _agrade_models_parallel(
+            submission, job, text, models_to_grade, marking_scheme_content, committer
+        )
+
+        if successful_results:
+            _store_legacy_results(submission, job, successful_results, models_to_grade)
+            submission.set_status("completed", commit=False)
+            cleanup_path = file_path
+            return True
+
+        submission.set_status("failed", _get_last_error_message(), commit=False)
+        return False
+
+    except Exception as e:
+        submission.set_status("failed", str(e), commit=False)
+        return False
+    finally:
+        committer.record(submission_id, cleanup_path)
+
+
+def _process_submissions_bulk(app, job, pending_submissions):
+    """
+    Grade submissions offline through the provider's batch API.
+
+    Every (submission, model) request is packaged into one provider batch and
+    submitted once. The batch id is saved on the job and poll_bulk_batch
+    checks it every JOB_BULK_POLL_INTERVAL seconds from the task queue, so no
+    thread waits on the batch and polling resumes after a restart; results are
+    then stored exactly as the interactive runners store them. Response-cache
+    hits skip the batch.
+
+    Returns True while a provider batch is pending, False when every result
+    has been stored or the submission failed.
+    """
+    models_to_grade = _get_models_to_grade(job)
+    marking_scheme_content = _get_marking_scheme_content(job)
+    provider_name = _resolve_provider_name(job.provider)
+
+    staged = []
+    batch_requests = []
+    try:
+        client = get_batch_client(provider_name)
+        for submission in pending_submissions:
+            submission.set_status("processing", commit=False)
+            file_path = _get_submission_file_path(app, submission)
+            if not file_path:
+                submission.set_status("failed", "File not found on disk", commit=False)
+                continue
+            text = extract_text_by_file_type(file_path, submission.file_type)
+            if text.startswith("Error reading"):
+                submission.set_status("failed", text, commit=False)
+                continue
+            submission.extracted_text = text
+            staged.append(submission)
+
+            requests_by_index = [
+                _grade_kwargs(job, text, model, marking_scheme_content) for model in models_to_grade
+            ]
+            results, _ = _lookup_cached_results(job, requests_by_index)
+            for index, grade_kwargs in enumerate(requests_by_index):
+                if results[index] is None:
+                    batch_requests.append(
+                        client.build_request(f"{submission.id}--{index}", grade_kwargs)
+                    )
+        db.session.commit()
+
+        if not batch_requests:
+            _store_bulk_results(app, job, {})
+            return False
+        batch_id = client.submit(batch_requests)
+    except (BatchAPIError, ValueError) as e:
+        print(f"Bulk grading failed for job {job.id}: {e}")
+        for submission in staged:
+            submission.set_status("failed", f"Batch grading error: {e}", commit=False)
+        db.session.commit()
+        return False
+
+    job.bulk_batch_id = batch_id
+    job.bulk_submitted_at = datetime.now(timezone.utc)
+    db.session.commit()
+    print(f"Submitted {len(batch_requests)} requests as {provider_name} batch {batch_id}")
+    poll_interval, _ = _get_bulk_settings()
+    poll_bulk_batch.delay(job.id, countdown=poll_interval)
+    return True
+
+
+def poll_bulk_batch(job_id):
+    """
+    Check a bulk job's provider batch once; store its results when it has ended.
+
+    Queues the next check JOB_BULK_POLL_INTERVAL seconds later while the batch
+    is in progress, and fails the job's waiting submissions once it has failed
+    or run past JOB_BULK_MAX_WAIT_HOURS. Returns the batch status, or None
+    when the job is not waiting on a batch.
+    """
+    app = create_app()
+    with app.app_context():
+        job = db.session.get(GradingJob, job_id)
+        if job is None or not job.bulk_batch_id:
+            return None
+        batch_id = job.bulk_batch_id
+        poll_interval, max_wait = _get_bulk_settings()
+        try:
+            client = get_batch_client(_resolve_provider_name(job.provider))
+            status = client.poll(batch_id)
+            if status == "ended":
+                _store_bulk_results(app, job, client.results(batch_id))
+            elif status == "failed":
+                raise BatchAPIError(f"Batch {batch_id} failed at the provider")
+            elif datetime.now(timezone.utc) - as_utc(job.bulk_submitted_at) >= timedelta(seconds=max_wait):
+                raise BatchAPIError(f"Batch {batch_id} did not finish within {max_wait / 3600:g} hours")
+            else:
+                poll_bulk_batch.delay(job_id, countdown=poll_interval)
+                return status
+        except (BatchAPIError, ValueError) as e:
+            print(f"Bulk grading failed for job {job_id}: {e}")
+            for submission in job.submissions:
+                if submission.status == "processing":
+                    submission.set_status("failed", f"Batch grading error: {e}", commit=False)
+            status = "failed"
+
+        job.bulk_batch_id = None
+        job.bulk_submitted_at = None
+        db.session.commit()
+        job.update_progress()
+        if job.batch_id:
+            batch = db.session.get(JobBatch, job.batch_id)
+            if batch:
+                batch.update_progress()
+        return status
+
+
+def _store_bulk_results(app, job, fetched):
+    """
+    Store the results of a bulk job's waiting submissions.
+
+    ``fetched`` maps "<submission id>--<model index>" to the batch API's
+    results; requests that never went into the batch were response-cache hits
+    and are looked up again.
+    """
+    _, commit_batch = _get_async_settings()
+    committer = _BatchedCommitter(job, commit_batch)
+    models_to_grade = _get_models_to_grade(job)
+    marking_scheme_content = _get_marking_scheme_content(job)
+    provider_name = _resolve_provider_name(job.provider)
+
+    for submission in [s for s in job.submissions if s.status == "processing"]:
+        cleanup_path = None
+        try:
+            requests_by_index = [
+                _grade_kwargs(job, submission.extracted_text or "", model, marking_scheme_content)
+                for model in models_to_grade
+            ]
+            results = [None] * len(models_to_grade)
+            for index, grade_kwargs in enumerate(requests_by_index):
+                custom_id = f"{submission.id}--{index}"
+                if custom_id in fetched:
+                    results[index] = fetched[custom_id]
+                    if job.use_response_cache and results[index]["success"]:
+                        cache_key = LLMResponseCacheService.build_key(provider_name, grade_kwargs)
+                        committer.add_cache_entry(cache_key, provider_name, results[index])
+                else:
+                    results[index] = _lookup_cached_results(job, [grade_kwargs])[0][0] or {
+                        "success": False,
+                        "error": "No result returned by the batch API",
+                    }
+            for index, model in enumerate(models_to_grade):
+                _store_model_result(submission, job, results[index], model, commit=False)
+
+            successful_results = [r for r in results if r["success"]]
+            if successful_results:
+                _store_legacy_results(submission, job, successful_results, models_to_grade)
+                submission.set_status("completed", commit=False)
+                cleanup_path = _get_submission_file_path(app, submission)
+            else:
+                submission.set_status("failed", _get_last_error_message(), commit=False)
+        except Exception as e:
+            submission.set_status("failed", str(e), commit=False)
+        finally:
+            committer.record(submission.id, cleanup_path)
+
+    committer.flush()
 
 
 def retry_submission_task(submission_id):
@@ -225,72 +738,7 @@ def process_job_sync(job_id):
             job = db.session.get(GradingJob, job_id)
             if not job:
                 return False
-
-            print(f"Starting to process job: {job.job_name} (ID: {job_id})")
-
-            # Update job status
-            job.status = "processing"
-            db.session.commit()
-
-            # Process each submission sequentially
-            pending_submissions = [s for s in job.submissions if s.status == "pending"]
-
-            if not pending_submissions:
-                # No pending submissions, check if job should be completed
-                job.update_progress()
-                return True
-
-            # Process submissions in parallel
-            max_workers = _get_max_workers(job)
-            workers = max(1, min(max_workers, len(pending_submissions)))
-            print(
-                f"Processing {len(pending_submissions)} submissions "
-                f"using {workers} worker(s)"
-            )
-
-            with ThreadPoolExecutor(max_workers=workers) as executor:
-                future_map = {
-                    executor.submit(process_submission_sync, s.id): s
-                    for s in pending_submissions
-                }
-                for fut in as_completed(future_map):
-                    submission_obj = future_map[fut]
-                    try:
-                        result = fut.result()
-                        if not result:
-                            failure_reason = (
-                                submission_obj.error_message
-                                if hasattr(submission_obj, "error_message")
-                                else None
-                            )
-                            if failure_reason:
-                                print(
-                                    f"Failed to process submission: "
-                                    f"{submission_obj.original_filename} | "
-                                    f"Reason: {failure_reason}"
-                                )
-                            else:
-                                print(
-                                    f"Failed to process submission: "
-                                    f"{submission_obj.original_filename}"
-                                )
-                    except Exception as e:
-                        print(
-                            f"Unhandled exception processing submission "
-                            f"{submission_obj.original_filename}: {e}"
-                        )
-
-            # Update job progress after all submissions are processed
-            job.update_progress()
-
-            # Update batch progress if job belongs to a batch
-            if job.batch_id:
-                batch = db.session.get(JobBatch, job.batch_id)
-                if batch:
-                    batch.update_progress()
-
-            print(f"Completed processing job: {job.job_name} (ID: {job_id})")
-            return True
+            return _run_job(app, job)
 
         except ValueError as e:
             print(f"Validation error processing job {job_id}: {str(e)}")
@@ -305,9 +753,14 @@ def process_job_sync(job_id):
 
 
 def process_submission_sync(submission_id):
-    """Process a single submission synchronously (without Celery)."""
+    """
+    Process a single submission synchronously (without Celery).
+
+    The submission is leased to this process while it is graded, so it is
+    requeued by recover_stuck_submissions if the process dies midway.
+    """
     app = create_app()
-    with app.app_context():
+    with app.app_context(), SubmissionLeaseService.hold(submission_id):
         try:
             # Get submission from database
             submission = db.session.get(Submission, submission_id)
@@ -346,21 +799,14 @@ def process_submission_sync(submission_id):
 
             # Determine which models to use
             models_to_grade = _get_models_to_grade(job)
-            successful_results = []
 
             # Get marking scheme content if available
             marking_scheme_content = _get_marking_scheme_content(job)
 
-            # Grade with each model
-            for model in models_to_grade:
-                result = _grade_with_model(
-                    submission, job, model, marking_scheme_content
-                )
-                if result["success"]:
-                    _store_successful_grade(submission, job, result, model)
-                    successful_results.append(result)
-                else:
-                    _store_failed_grade(submission, job, result, model)
+            # Grade with every model concurrently, storing each result as it arrives
+            successful_results = _grade_models_parallel(
+                submission, job, models_to_grade, marking_scheme_content
+            )
 
             # Store legacy results for backward compatibility
             if successful_results:
@@ -464,63 +910,438 @@ def _get_marking_scheme_content(job):
     return None
 
 
+_PROVIDER_NAME_MAPPING = {
+    "openrouter": "OpenRouter",
+    "claude": "Claude",
+    "lm_studio": "LM Studio",
+    "ollama": "Ollama",
+    "gemini": "Gemini",
+    "openai": "OpenAI",
+    "chutes": "Chutes",
+    "z.ai": "Z.AI",
+    "nanogpt": "NanoGPT",
+    "z.ai_coding_plan": "Z.AI Coding Plan",
+}
+
+# Providers that receive the job's model explicitly; the rest use their default
+_MODEL_SELECTING_PROVIDERS = {
+    "openrouter",
+    "ollama",
+    "gemini",
+    "openai",
+    "chutes",
+    "z.ai",
+    "nanogpt",
+    "z.ai_coding_plan",
+}
+
+
+def _resolve_provider_name(provider):
+    """Map a stored provider key (e.g. "lm_studio") to its display name."""
+    return _PROVIDER_NAME_MAPPING.get(provider.lower(), provider)
+
+
+def _grade_kwargs(job, text, model, marking_scheme_content):
+    """Keyword arguments for grade_document/agrade_document."""
+    kwargs = {
+        "text": text,
+        "prompt": job.prompt,
+        "marking_scheme_content": marking_scheme_content,
+        "temperature": job.temperature,
+        "max_tokens": job.max_tokens,
+    }
+    if job.provider.lower() in _MODEL_SELECTING_PROVIDERS:
+        kwargs["model"] = model
+    return kwargs
+
+
+# Identical grading requests in flight share one upstream call
+_grading_flights = SingleFlight("grading")
+
+
 def _grade_with_model(submission, job, model, marking_scheme_content):
     """Grade submission with a specific model."""
+    return _grade_with_kwargs(
+        job.provider,
+        _grade_kwargs(job, submission.extracted_text, model, marking_scheme_content),
+    )
+
+
+def _single_flight_key(provider_name, grade_kwargs):
+    """Key identical grading requests share, or None when de-duplication is off."""
+    if os.getenv("JOB_SINGLE_FLIGHT", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return LLMResponseCacheService.build_key(provider_name, grade_kwargs)
+
+
+def _grade_once(provider, grade_kwargs, cancelled=None):
+    """
+    Call the provider under its semaphore, with retries; safe to run from a worker thread.
+
+    Identical requests already in flight (in any thread, or in any worker when
+    Redis is configured) are joined rather than sent again.
+    """
     try:
-        provider_mapping = {
-            "openrouter": "OpenRouter",
-            "claude": "Claude",
-            "lm_studio": "LM Studio",
-            "ollama": "Ollama",
-            "gemini": "Gemini",
-            "openai": "OpenAI",
-            "chutes": "Chutes",
-            "z.ai": "Z.AI",
-            "nanogpt": "NanoGPT",
-            "z.ai_coding_plan": "Z.AI Coding Plan",
+        provider_name = _resolve_provider_name(provider)
+        llm_provider = get_llm_provider(provider_name)
+
+        def call():
+            return grade_with_retries(llm_provider, provider_name, grade_kwargs, cancelled=cancelled)
+
+        key = _single_flight_key(provider_name, grade_kwargs)
+        return call() if key is None else _grading_flights.do(key, call)
+    except TimeoutError as te:
+        return {"success": False, "error": f"Grading timeout: {str(te)}"}
+    except ValueError as e:
+        return {
+            "success": False,
+            "error": f"Unsupported provider: {provider}. Error: {str(e)}",
         }
-        provider_name = provider_mapping.get(job.provider.lower(), job.provider)
+    except Exception as e:
+        return {"success": False, "error": f"Grading error: {str(e)}"}
+
+
+def _hedge_plan(provider, grade_kwargs):
+    """
+    Return (delay, fallback provider, fallback kwargs) for a hedged request, or None.
+
+    Hedging is configured with JOB_HEDGE_FALLBACKS, a JSON object mapping
+    "<provider>:<model>" or "<provider>" to the "<provider>[:<model>]" to fire
+    a duplicate at, e.g. {"openrouter:openai/gpt-4o": "openai:gpt-4o"}. The
+    duplicate goes out once the request has run longer than the observed
+    JOB_HEDGE_QUANTILE (default 0.95) latency for its provider/model, which
+    needs JOB_HEDGE_MIN_SAMPLES (default 20) successes to be trusted, and never
+    sooner than JOB_HEDGE_MIN_DELAY seconds (default 2).
+    """
+    raw = os.getenv("JOB_HEDGE_FALLBACKS")
+    if not raw:
+        return None
+    try:
+        mapping = json.loads(raw)
+        quantile = float(os.getenv("JOB_HEDGE_QUANTILE", "0.95"))
+        min_samples = int(os.getenv("JOB_HEDGE_MIN_SAMPLES", "20"))
+        min_delay = float(os.getenv("JOB_HEDGE_MIN_DELAY", "2"))
+    except ValueError:
+        return None
+
+    model = grade_kwargs.get("model")
+    target = (mapping.get(f"{provider}:{model}") if model else None) or mapping.get(provider)
+    if not target:
+        return None
+    delay = latency_quantile(_resolve_provider_name(provider), model, quantile, min_samples)
+    if delay is None:
+        return None
+
+    fallback_provider, _, fallback_model = str(target).partition(":")
+    fallback_kwargs = {k: v for k, v in grade_kwargs.items() if k != "model"}
+    if fallback_provider.lower() in _MODEL_SELECTING_PROVIDERS and fallback_model:
+        fallback_kwargs["model"] = fallback_model
+    return max(min_delay, delay), fallback_provider, fallback_kwargs
+
+
+def _mark_hedged(result, winner, delay, fallback_provider, fallback_kwargs):
+    """Record on a result dict that a hedge fired and which request won ("primary", "fallback" or None)."""
+    fallback = fallback_provider
+    if fallback_kwargs.get("model"):
+        fallback = f"{fallback_provider}:{fallback_kwargs['model']}"
+    result["hedge"] = {"winner": winner, "fallback": fallback, "delay": round(delay, 3)}
+    return result
+
+
+def _grade_hedged(provider, grade_kwargs):
+    """
+    Grade one request, hedging it when it runs past its provider/model p95 latency.
+
+    The first successful response wins. The losing thread is told to stop via
+    an Event, which prevents further attempts and backoff; a blocking HTTP call
+    it already has in flight cannot be interrupted and is simply discarded.
+    Both requests take slots of the shared submission_pool; when none is free
+    the request is not hedged.
+    """
+    plan = _hedge_plan(provider, grade_kwargs)
+    if plan is None:
+        return _grade_once(provider, grade_kwargs)
+    delay, fallback_provider, fallback_kwargs = plan
+
+    primary_cancel, fallback_cancel = threading.Event(), threading.Event()
+    primary = submission_pool.try_fan_out(_grade_once, provider, grade_kwargs, primary_cancel)
+    if primary is None:
+        # Every grading slot is taken: grade without a hedge rather than wait
+        return _grade_once(provider, grade_kwargs)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    fallback = submission_pool.try_fan_out(_grade_once, fallback_provider, fallback_kwargs, fallback_cancel)
+    if fallback is None:
+        return primary.result()
+    pending = {primary, fallback}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            result = fut.result()
+            if result["success"]:
+                (fallback_cancel if fut is primary else primary_cancel).set()
+                winner = "primary" if fut is primary else "fallback"
+                return _mark_hedged(result, winner, delay, fallback_provider, fallback_kwargs)
+    return _mark_hedged(primary.result(), None, delay, fallback_provider, fallback_kwargs)
+
+
+def _grade_with_kwargs(provider, grade_kwargs):
+    """
+    Grade one request; documents too long for the model's context are map-reduced.
+
+    Sections are graded concurrently (each one hedged and retried like any
+    request) and then combined by a final request. Per-section results are
+    returned under "chunks".
+    """
+    try:
+        sections = plan_sections(_resolve_provider_name(provider), grade_kwargs)
+    except ValueError as e:
+        return {"success": False, "error": f"Grading error: {str(e)}"}
+    if not sections:
+        return _grade_hedged(provider, grade_kwargs)
+
+    section_results = submission_pool.fan_out(
+        lambda kwargs: _grade_hedged(provider, kwargs), sections, limit=_get_max_chunk_parallel()
+    )
+    failure = _section_failure(sections, section_results)
+    if failure:
+        return failure
+    final = _grade_hedged(provider, reduce_kwargs(grade_kwargs, section_results))
+    return combine_results(final, sections, section_results)
+
+
+def _get_max_chunk_parallel():
+    """How many sections of one long document are graded at once (JOB_CHUNK_MAX_PARALLEL)."""
+    try:
+        return max(1, int(os.getenv("JOB_CHUNK_MAX_PARALLEL", "4")))
+    except ValueError:
+        return 4
+
+
+def _section_failure(sections, section_results):
+    """Failure result when any section could not be assessed, else None."""
+    for index, result in enumerate(section_results):
+        if not result["success"]:
+            failure = {
+                "success": False,
+                "error": f"Section {index + 1} of {len(sections)} failed: {result.get('error')}",
+                "provider": result.get("provider"),
+            }
+            return combine_results(failure, sections, section_results)
+    return None
+
+
+async def _agrade_with_model(job, text, model, marking_scheme_content):
+    """Async counterpart of _grade_with_model."""
+    return await _agrade_with_kwargs(
+        job.provider, _grade_kwargs(job, text, model, marking_scheme_content)
+    )
+
+
+async def _agrade_once(provider, grade_kwargs):
+    """Async counterpart of _grade_once."""
+    try:
+        provider_name = _resolve_provider_name(provider)
         llm_provider = get_llm_provider(provider_name)
 
-        with provider_semaphore(provider_name):
-            if job.provider.lower() in [
-                "openrouter",
-                "ollama",
-                "gemini",
-                "openai",
-                "chutes",
-                "z.ai",
-                "nanogpt",
-                "z.ai_coding_plan",
-            ]:
-                return llm_provider.grade_document(
-                    text=submission.extracted_text,
-                    prompt=job.prompt,
-                    model=model,
-                    marking_scheme_content=marking_scheme_content,
-                    temperature=job.temperature,
-                    max_tokens=job.max_tokens,
-                )
-            else:
-                return llm_provider.grade_document(
-                    text=submission.extracted_text,
-                    prompt=job.prompt,
-                    marking_scheme_content=marking_scheme_content,
-                    temperature=job.temperature,
-                    max_tokens=job.max_tokens,
-                )
+        def call():
+            return agrade_with_retries(llm_provider, provider_name, grade_kwargs)
+
+        key = _single_flight_key(provider_name, grade_kwargs)
+        return await (call() if key is None else _grading_flights.ado(key, call))
     except TimeoutError as te:
         return {"success": False, "error": f"Grading timeout: {str(te)}"}
     except ValueError as e:
         return {
             "success": False,
-            "error": f"Unsupported provider: {job.provider}. Error: {str(e)}",
+            "error": f"Unsupported provider: {provider}. Error: {str(e)}",
         }
     except Exception as e:
         return {"success": False, "error": f"Grading error: {str(e)}"}
 
 
-def _store_successful_grade(submission, job, result, model):
+async def _agrade_hedged(provider, grade_kwargs):
+    """Async counterpart of _grade_hedged; the losing request's task is cancelled."""
+    plan = _hedge_plan(provider, grade_kwargs)
+    if plan is None:
+        return await _agrade_once(provider, grade_kwargs)
+    delay, fallback_provider, fallback_kwargs = plan
+
+    primary = asyncio.ensure_future(_agrade_once(provider, grade_kwargs))
+    fallback = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        fallback = asyncio.ensure_future(_agrade_once(fallback_provider, fallback_kwargs))
+        pending = {primary, fallback}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result["success"]:
+                    winner = "primary" if task is primary else "fallback"
+                    return _mark_hedged(result, winner, delay, fallback_provider, fallback_kwargs)
+        return _mark_hedged(primary.result(), None, delay, fallback_provider, fallback_kwargs)
+    finally:
+        for task in (primary, fallback):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _agrade_with_kwargs(provider, grade_kwargs):
+    """Async counterpart of _grade_with_kwargs."""
+    try:
+        sections = plan_sections(_resolve_provider_name(provider), grade_kwargs)
+    except ValueError as e:
+        return {"success": False, "error": f"Grading error: {str(e)}"}
+    if not sections:
+        return await _agrade_hedged(provider, grade_kwargs)
+
+    gate = asyncio.Semaphore(_get_max_chunk_parallel())
+
+    async def grade_section(kwargs):
+        async with gate:
+            return await _agrade_hedged(provider, kwargs)
+
+    section_results = await asyncio.gather(*(grade_section(kwargs) for kwargs in sections))
+    failure = _section_failure(sections, section_results)
+    if failure:
+        return failure
+    final = await _agrade_hedged(provider, reduce_kwargs(grade_kwargs, section_results))
+    return combine_results(final, sections, section_results)
+
+
+def _cacheable(result):
+    """Successful results answer their cache key, unless a hedge fallback produced them."""
+    return result["success"] and (result.get("hedge") or {}).get("winner") != "fallback"
+
+
+def _store_model_result(submission, job, result, model, commit=True):
+    """Store one model's GradeResult; returns True when the model succeeded."""
+    if result["success"]:
+        _store_successful_grade(submission, job, result, model, commit=commit)
+        return True
+    _store_failed_grade(submission, job, result, model, commit=commit)
+    return False
+
+
+def _lookup_cached_results(job, requests_by_index):
+    """
+    Look up each grading request in the response cache when the job opts in.
+
+    Returns (results, cache_keys): cached results are filled in (others None)
+    and cache_keys holds the key for every request that still needs a call.
+    """
+    results = [None] * len(requests_by_index)
+    cache_keys = [None] * len(requests_by_index)
+    if not getattr(job, "use_response_cache", False):
+        return results, cache_keys
+
+    provider_name = _resolve_provider_name(job.provider)
+    for index, grade_kwargs in enumerate(requests_by_index):
+        cache_key = LLMResponseCacheService.build_key(provider_name, grade_kwargs)
+        cached = LLMResponseCacheService.lookup(cache_key)
+        if cached:
+            results[index] = cached
+        else:
+            cache_keys[index] = cache_key
+    return results, cache_keys
+
+
+def _grade_models_parallel(submission, job, models_to_grade, marking_scheme_content):
+    """
+    Grade one submission with all comparison models at once.
+
+    Each model takes a free slot of the shared submission_pool (still bounded
+    by provider_semaphore), or runs on this thread when none is free, and its
+    GradeResult is stored on this thread as soon as it returns. Successful
+    results come back in models_to_grade order, so the legacy grade picked from
+    them does not depend on which model finished first.
+    """
+    # Build request arguments here: worker threads have no app context
+    requests_by_index = [
+        _grade_kwargs(job, submission.extracted_text, model, marking_scheme_content)
+        for model in models_to_grade
+    ]
+    results, cache_keys = _lookup_cached_results(job, requests_by_index)
+    provider_name = _resolve_provider_name(job.provider)
+
+    def finish(index, result):
+        results[index] = result
+        _store_model_result(submission, job, result, models_to_grade[index])
+        if cache_keys[index] and _cacheable(result):
+            LLMResponseCacheService.store(cache_keys[index], provider_name, result)
+
+    for index, result in enumerate(results):
+        if result is not None:
+            _store_model_result(submission, job, result, models_to_grade[index])
+
+    to_grade = [index for index, result in enumerate(results) if result is None]
+    if len(to_grade) <= 1:
+        for index in to_grade:
+            finish(index, _grade_with_kwargs(job.provider, requests_by_index[index]))
+    else:
+        future_map, on_this_thread = {}, []
+        for index in to_grade:
+            fut = submission_pool.try_fan_out(_grade_with_kwargs, job.provider, requests_by_index[index])
+            if fut is None:
+                on_this_thread.append(index)  # every grading slot is taken
+            else:
+                future_map[fut] = index
+        for index in on_this_thread:
+            try:
+                result = _grade_with_kwargs(job.provider, requests_by_index[index])
+            except Exception as e:
+                result = {"success": False, "error": f"Grading error: {str(e)}"}
+            finish(index, result)
+        for fut in as_completed(future_map):
+            try:
+                result = fut.result()
+            except Exception as e:
+                result = {"success": False, "error": f"Grading error: {str(e)}"}
+            finish(future_map[fut], result)
+
+    return [r for r in results if r and r["success"]]
+
+
+async def _agrade_models_parallel(
+    submission, job, text, models_to_grade, marking_scheme_content, committer
+):
+    """
+    Async counterpart of _grade_models_parallel.
+
+    Results are staged without committing; new cache entries are handed to
+    ``committer`` so they are written after the batch they belong to.
+    """
+    requests_by_index = [
+        _grade_kwargs(job, text, model, marking_scheme_content) for model in models_to_grade
+    ]
+    results, cache_keys = _lookup_cached_results(job, requests_by_index)
+    provider_name = _resolve_provider_name(job.provider)
+
+    for index, result in enumerate(results):
+        if result is not None:
+            _store_model_result(submission, job, result, models_to_grade[index], commit=False)
+
+    async def grade(index):
+        return index, await _agrade_with_kwargs(job.provider, requests_by_index[index])
+
+    to_grade = [index for index, result in enumerate(results) if result is None]
+    for next_done in asyncio.as_completed([grade(index) for index in to_grade]):
+        index, result = await next_done
+        results[index] = result
+        _store_model_result(submission, job, result, models_to_grade[index], commit=False)
+        if cache_keys[index] and _cacheable(result):
+            committer.add_cache_entry(cache_keys[index], provider_name, result)
+
+    return [r for r in results if r and r["success"]]
+
+
+def _store_successful_grade(submission, job, result, model, commit=True):
     """Store successful grade result."""
     result_model = result.get("model", model)
     if result_model is None:
@@ -535,11 +1356,15 @@ def _store_successful_grade(submission, job, result, model):
             "provider": result.get("provider", job.provider or "OpenRouter"),
             "model": result_model,
             "usage": result.get("usage"),
+            "cache_hit": bool(result.get("cache_hit")),
+            **({"hedge": result["hedge"]} if result.get("hedge") else {}),
+            **({"chunks": result["chunks"]} if result.get("chunks") else {}),
         },
+        commit=commit,
     )
 
 
-def _store_failed_grade(submission, job, result, model):
+def _store_failed_grade(submission, job, result, model, commit=True):
     """Store failed grade result."""
     result_model = result.get("model", model)
     if result_model is None:
@@ -551,12 +1376,21 @@ def _store_failed_grade(submission, job, result, model):
         model=result_model,
         status="failed",
         error_message=result["error"],
-        metadata={"error": result["error"]},
+        metadata={
+            "error": result["error"],
+            **({"hedge": result["hedge"]} if result.get("hedge") else {}),
+            **({"chunks": result["chunks"]} if result.get("chunks") else {}),
+        },
+        commit=commit,
     )
 
 
 def _store_legacy_results(submission, job, successful_results, models_to_grade):
-    """Store legacy results for backward compatibility."""
+    """Store legacy results for backward compatibility.
+
+    ``successful_results`` is in models_to_grade order, so the primary grade is
+    always the first configured model that succeeded.
+    """
     primary_result = successful_results[0]
     submission.grade = primary_result["grade"]
     submission.grade_metadata = {
@@ -567,6 +1401,10 @@ def _store_legacy_results(submission, job, successful_results, models_to_grade):
         "usage": primary_result.get("usage"),
         "total_models": len(models_to_grade),
         "successful_models": len(successful_results),
+        "cache_hit": bool(primary_result.get("cache_hit")),
+        "cache_hits": sum(1 for r in successful_results if r.get("cache_hit")),
+        "hedged": sum(1 for r in successful_results if r.get("hedge")),
+        "hedge_wins": sum(1 for r in successful_results if (r.get("hedge") or {}).get("winner") == "fallback"),
     }
 
 
@@ -604,16 +1442,16 @@ def process_batch(batch_id):
                 return True
 
             # Sort jobs by priority (higher priority first)
-            pending_jobs.sort(key=lambda x: x.priority, reverse=True)
+            pending_jobs.sort(key=JobQueueService.effective_priority, reverse=True)
 
             print(f"Queuing {len(pending_jobs)} jobs for processing")
 
-            # Queue jobs for processing with staggered delays
-            for i, job in enumerate(pending_jobs):
-                # Add small delay between job starts
-                delay = i * 5  # 5 second intervals
-                process_job.delay(job.id, countdown=delay)
-                print(f"Queued job {job.job_name} with {delay}s delay")
+            # Queue every job at once: the task queue starts the highest
+            # priority first and the submission gate shares grading slots
+            for job in pending_jobs:
+                priority = JobQueueService.effective_priority(job)
+                process_job.delay(job.id, priority=priority)
+                print(f"Queued job {job.job_name} with priority {priority}")
 
             return True
 
@@ -1024,6 +1862,80 @@ def cleanup_completed_batches():
             return 0
 
 
+def evict_llm_response_cache():
+    """Evict expired and over-budget LLM response cache entries."""
+    app = create_app()
+    with app.app_context():
+        return LLMResponseCacheService.evict()
+
+
+def purge_task_queue():
+    """Delete finished tasks from the persistent task queue."""
+    app = create_app()
+    with app.app_context():
+        return task_queue.purge()
+
+
+def recover_stuck_submissions():
+    """
+    Requeue submissions whose grading process stopped renewing its lease.
+
+    Grading workers pick requeued submissions up by themselves; other jobs
+    that are still processing get a new process_job task, unless one is
+    already queued.
+    """
+    app = create_app()
+    with app.app_context():
+        try:
+            recovered = SubmissionLeaseService.reap()
+            queued = JobQueueService.queued_job_ids()
+            for job_id in recovered["requeued"]:
+                job = db.session.get(GradingJob, job_id)
+                if (
+                    job is not None
+                    and job.status == "processing"
+                    and _get_execution_mode(job) != "worker"
+                    and job_id not in queued
+                ):
+                    process_job.delay(job_id)
+            return recovered
+
+        except Exception as e:
+            print(f"Error recovering stuck submissions: {str(e)}")
+            return {"requeued": [], "failed": 0}
+
+
+def recover_stuck_submissions_periodically():
+    """Run recover_stuck_submissions, then queue the next run."""
+    try:
+        return recover_stuck_submissions()
+    finally:
+        with create_app().app_context():
+            schedule_submission_recovery()
+
+
+def schedule_submission_recovery():
+    """
+    Queue recover_stuck_submissions_periodically unless a run is already waiting.
+
+    Web servers call this at startup (gunicorn.conf.py), so submissions are
+    recovered without the desktop scheduler or a grading worker; each run
+    queues the next one SUBMISSION_RECOVERY_INTERVAL seconds (default 60)
+    later. Must be called inside an application context.
+    """
+    waiting = QueuedTask.query.filter(
+        QueuedTask.task_name == DurableTaskQueue.task_name(recover_stuck_submissions_periodically),
+        QueuedTask.status == "pending",
+    ).first()
+    if waiting is not None:
+        return waiting.id
+    try:
+        interval = max(1, int(float(os.getenv("SUBMISSION_RECOVERY_INTERVAL", "60"))))
+    except ValueError:
+        interval = 60
+    return task_queue.submit(recover_stuck_submissions_periodically, countdown=interval, max_retries=0)
+
+
 def cleanup_old_files():
     """Clean up old uploaded files."""
     app = create_app()
@@ -1186,9 +2098,9 @@ def process_document_rubric(upload_id, file_path, document_type):
 class MockCeleryTask:
     """Mock Celery task interface for desktop task queue compatibility."""
 
-    def __init__(self, func):
+    def __init__(self, func, priority=None):
         self.func = func
-        self.delay = MockDelay(func)
+        self.delay = MockDelay(func, priority)
 
     def __call__(self, *args, **kwargs):
         """Make the MockCeleryTask instance callable and return the original function."""
@@ -1211,11 +2123,15 @@ class MockCeleryTask:
 class MockDelay:
     """Mock delay method for Celery task compatibility."""
 
-    def __init__(self, func):
+    def __init__(self, func, priority=None):
         self.func = func
+        # Called with the task's positional arguments when no priority is given
+        self.priority = priority
 
     def __call__(self, *args, **kwargs):
         """Submit task to desktop task queue and return mock result."""
+        if self.priority is not None and kwargs.get("priority") is None:
+            kwargs["priority"] = self.priority(*args)
         task_id = task_queue.submit(self.func, *args, **kwargs)
         mock_result = Mock()
         mock_result.id = task_id
@@ -1232,8 +2148,19 @@ def process_submission_task_func(submission_id):
 # Export as Celery-style task for tests
 process_submission_task = MockCeleryTask(process_submission_task_func)
 
+
+def _job_priority(job_id):
+    """Queue priority of a job's process_job task (None when it cannot be looked up)."""
+    try:
+        job = db.session.get(GradingJob, job_id)
+    except Exception:
+        return None
+    return JobQueueService.effective_priority(job) if job else None
+
+
 # Wrap high-level tasks with MockCeleryTask for compatibility
-process_job = MockCeleryTask(process_job)
+process_job = MockCeleryTask(process_job, priority=_job_priority)
+poll_bulk_batch = MockCeleryTask(poll_bulk_batch)
 process_batch = MockCeleryTask(process_batch)
 retry_batch_failed_jobs = MockCeleryTask(retry_batch_failed_jobs)
 pause_batch_processing = MockCeleryTask(pause_batch_processing)
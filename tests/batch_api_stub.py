@@ -0,0 +1,216 @@
+"""
+Local stub of the Anthropic Message Batches and OpenAI Batch APIs.
+
+Used by the bulk-mode tests and handy for trying bulk jobs offline:
+
+    python -m tests.batch_api_stub --port 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ...
+
+Batches report "in progress" for ``polls_until_done`` status checks, then end
+with one canned grade per request. Requests whose custom_id is listed in
+``fail_ids`` come back as errors.
+"""
+
+import argparse
+import json
+import threading
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BatchAPIStub:
+    """In-memory batch service served over HTTP on a background thread."""
+
+    def __init__(self, host="127.0.0.1", port=0, polls_until_done=1):
+        self.polls_until_done = polls_until_done
+        self.fail_ids = set()
+        self.batches = {}
+        self.files = {}
+        self.submitted = []  # request lines received, in order
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Canned results
+
+    def _grade_for(self, custom_id, model):
+        return f"Stub grade from {model}"
+
+    def _anthropic_result(self, line):
+        custom_id = line["custom_id"]
+        if custom_id in self.fail_ids:
+            return {
+                "custom_id": custom_id,
+                "result": {"type": "errored", "error": {"type": "error", "error": {"message": "stub failure"}}},
+            }
+        model = line["params"]["model"]
+        return {
+            "custom_id": custom_id,
+            "result": {
+                "type": "succeeded",
+                "message": {
+                    "model": model,
+                    "content": [{"type": "text", "text": self._grade_for(custom_id, model)}],
+                    "usage": {"input_tokens": 10, "output_tokens": 5, "cache_read_input_tokens": 0},
+                },
+            },
+        }
+
+    def _openai_result(self, line):
+        custom_id = line["custom_id"]
+        if custom_id in self.fail_ids:
+            return {
+                "custom_id": custom_id,
+                "response": {"status_code": 500, "body": {"error": {"message": "stub failure"}}},
+                "error": None,
+            }
+        model = line["body"]["model"]
+        return {
+            "custom_id": custom_id,
+            "response": {
+                "status_code": 200,
+                "body": {
+                    "model": model,
+                    "choices": [{"message": {"content": self._grade_for(custom_id, model)}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                },
+            },
+            "error": None,
+        }
+
+    def _advance(self, batch):
+        """Count a status check and finish the batch once enough have happened."""
+        batch["polls"] += 1
+        if batch["polls"] >= self.polls_until_done and not batch["done"]:
+            batch["done"] = True
+            if batch["kind"] == "anthropic":
+                batch["results"] = [self._anthropic_result(line) for line in batch["requests"]]
+            else:
+                output_id = f"file-{uuid.uuid4().hex}"
+                self.files[output_id] = "\n".join(
+                    json.dumps(self._openai_result(line)) for line in batch["requests"]
+                )
+                batch["output_file_id"] = output_id
+
+    # HTTP plumbing
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                payload = body if isinstance(body, str) else json.dumps(body)
+                data = payload.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length)
+
+            def do_POST(self):
+                with stub._lock:
+                    if self.path == "/v1/messages/batches":
+                        requests = json.loads(self._body())["requests"]
+                        return self._send(200, stub._create_batch("anthropic", requests))
+                    if self.path == "/v1/files":
+                        return self._send(200, stub._upload_file(self.headers, self._body()))
+                    if self.path == "/v1/batches":
+                        input_file_id = json.loads(self._body())["input_file_id"]
+                        requests = [json.loads(line) for line in stub.files[input_file_id].splitlines() if line]
+                        return self._send(200, stub._create_batch("openai", requests))
+                self._send(404, {"error": {"message": f"No route for POST {self.path}"}})
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                with stub._lock:
+                    if parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+                        return self._send(200, stub._anthropic_status(parts[3]))
+                    if parts[:3] == ["v1", "messages", "batches"] and parts[4:] == ["results"]:
+                        lines = stub.batches[parts[3]]["results"]
+                        return self._send(200, "\n".join(json.dumps(line) for line in lines), "application/jsonl")
+                    if parts[:2] == ["v1", "batches"] and len(parts) == 3:
+                        return self._send(200, stub._openai_status(parts[2]))
+                    if parts[:2] == ["v1", "files"] and parts[3:] == ["content"]:
+                        return self._send(200, stub.files[parts[2]], "application/jsonl")
+                self._send(404, {"error": {"message": f"No route for GET {self.path}"}})
+
+        return Handler
+
+    def _create_batch(self, kind, requests):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        self.submitted.extend(requests)
+        self.batches[batch_id] = {"kind": kind, "requests": requests, "polls": 0, "done": False}
+        if kind == "anthropic":
+            return {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+        return {"id": batch_id, "object": "batch", "status": "validating"}
+
+    def _upload_file(self, headers, body):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+        )
+        for part in message.iter_parts():
+            if part.get_filename():
+                file_id = f"file-{uuid.uuid4().hex}"
+                self.files[file_id] = part.get_payload(decode=True).decode("utf-8")
+                return {"id": file_id, "object": "file", "purpose": "batch"}
+        return {"error": {"message": "No file uploaded"}}
+
+    def _anthropic_status(self, batch_id):
+        batch = self.batches[batch_id]
+        self._advance(batch)
+        status = {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+        if batch["done"]:
+            status.update(processing_status="ended", results_url=f"{self.url}/v1/messages/batches/{batch_id}/results")
+        return status
+
+    def _openai_status(self, batch_id):
+        batch = self.batches[batch_id]
+        self._advance(batch)
+        status = {"id": batch_id, "object": "batch", "status": "in_progress"}
+        if batch["done"]:
+            status.update(status="completed", output_file_id=batch["output_file_id"], error_file_id=None)
+        return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stub of provider batch APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--polls", type=int, default=1, help="status checks before a batch ends")
+    args = parser.parse_args()
+
+    stub = BatchAPIStub(args.host, args.port, polls_until_done=args.polls)
+    print(f"Batch API stub listening on {stub.url}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
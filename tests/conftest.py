@@ -411,6 +411,18 @@ def cleanup_scheduler():
         pass
 
 
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    """Stop provider failures in one test from opening breakers or benching API keys for the next."""
+    yield
+    from utils import llm_providers
+
+    llm_providers._circuit_breakers.clear()
+    llm_providers._api_key_pools.clear()
+    llm_providers._extra_api_keys.clear()
+    llm_providers._local_endpoint_pools.clear()
+
+
 @pytest.fixture(autouse=True)
 def cleanup_environment():
     """Clean up test-specific environment variables after each test."""
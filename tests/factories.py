@@ -1,14 +1,18 @@
 """Test data factories for creating realistic test objects."""
 
+import os
 import random
 import string
 from datetime import datetime, timezone
 from typing import Optional
 
+from flask import current_app
+
 from models import (
     AIProviderQuota,
     GradingJob,
     ProjectShare,
+    Submission,
     User,
     UsageRecord,
     db,
@@ -127,6 +131,75 @@ class ProjectFactory:
         return [ProjectFactory.create(**kwargs) for _ in range(count)]
 
 
+class GradingJobFactory:
+    """Factory for creating grading jobs with their submissions."""
+
+    @staticmethod
+    def create(submissions: int = 0, text: Optional[str] = None, **fields) -> GradingJob:
+        """
+        Create a grading job and its pending submissions.
+
+        Args:
+            submissions: Number of submissions to add
+            text: Contents written to each submission's file in the upload
+                folder, with ``{i}`` replaced by its index (no files when None)
+            **fields: GradingJob columns overriding the defaults
+
+        Returns:
+            GradingJob: Created job
+        """
+        fields.setdefault("job_name", "Test Job")
+        fields.setdefault("provider", "openrouter")
+        fields.setdefault("prompt", "Grade it.")
+        job = GradingJob(**fields)
+        db.session.add(job)
+        db.session.commit()
+
+        for i in range(submissions):
+            SubmissionFactory.create(job.id, f"{job.id}_{i}.txt", None if text is None else text.format(i=i))
+        job.total_submissions = submissions
+        db.session.commit()
+
+        return job
+
+
+class SubmissionFactory:
+    """Factory for creating test submissions."""
+
+    @staticmethod
+    def create(job_id: str, filename: Optional[str] = None, text: Optional[str] = None, **fields) -> Submission:
+        """
+        Create a pending submission of a job.
+
+        Args:
+            job_id: Owning job ID
+            filename: Stored and original file name (auto-generated if not provided)
+            text: Contents written to the file in the upload folder (no file when None)
+            **fields: Submission columns overriding the defaults
+
+        Returns:
+            Submission: Created submission
+        """
+        if filename is None:
+            random_str = "".join(random.choices(string.ascii_lowercase, k=8))
+            filename = f"{job_id}_{random_str}.txt"
+
+        if text is not None:
+            upload_folder = current_app.config["UPLOAD_FOLDER"]
+            os.makedirs(upload_folder, exist_ok=True)
+            with open(os.path.join(upload_folder, filename), "w") as f:
+                f.write(text)
+
+        fields.setdefault("status", "pending")
+        submission = Submission(
+            job_id=job_id, filename=filename, original_filename=filename, file_type="txt", **fields
+        )
+        db.session.add(submission)
+        db.session.commit()
+
+        return submission
+
+
 class UsageRecordFactory:
     """Factory for creating test usage records."""
 
@@ -0,0 +1,158 @@
+"""
+Tests for adaptive (AIMD) per-provider/model concurrency control.
+"""
+
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from utils import llm_providers
+from utils.llm_providers import (
+    AdaptiveConcurrencyLimiter,
+    classify_error,
+    get_adaptive_concurrency_stats,
+    get_adaptive_limiter,
+    provider_semaphore,
+)
+
+OK = {"success": True, "grade": "A"}
+RATE_LIMITED = {"success": False, "error": "OpenRouter API error: 429 - Too Many Requests"}
+
+
+@pytest.fixture
+def adaptive_env():
+    env = {"PROVIDER_ADAPTIVE_CONCURRENCY": "true", "PROVIDER_MAX_ADAPTIVETEST": "2"}
+    with patch.dict(os.environ, env), patch.dict(llm_providers._adaptive_limiters, clear=True), patch.dict(
+        llm_providers._provider_semaphores, clear=True
+    ):
+        yield
+
+
+class TestClassifyError:
+    @pytest.mark.parametrize(
+        "message, expected",
+        [
+            ("OpenRouter API error: 429 - slow down", "rate_limit"),
+            ("Claude API rate limit exceeded. Please try again later.", "rate_limit"),
+            ("OpenAI API authentication failed. Please check your API key.", "authentication"),
+            ("Claude API request timed out. Please try again.", "timeout"),
+            ("Grading timeout: Timeout acquiring local semaphore", "timeout"),
+            ("LM Studio API error: 503 - unavailable", "server_error"),
+            ("Overloaded", "server_error"),
+            ("Could not connect to LM Studio", "network"),
+            ("Model produced an empty answer", "unknown"),
+        ],
+    )
+    def test_classification(self, message, expected):
+        assert classify_error(message) == expected
+
+
+class TestAdaptiveConcurrencyLimiter:
+    def test_additive_increase_up_to_ceiling(self):
+        limiter = AdaptiveConcurrencyLimiter("P", "m", initial=2, floor=1, ceiling=4)
+        for _ in range(100):
+            limiter.record(OK, 0.1)
+        assert limiter.current_limit == 4
+
+        # Roughly one extra slot per window of healthy successes
+        limiter = AdaptiveConcurrencyLimiter("P", "m", initial=2, floor=1, ceiling=10)
+        for _ in range(2):
+            limiter.record(OK, 0.1)
+        assert limiter.current_limit == 2
+        limiter.record(OK, 0.1)
+        assert limiter.current_limit == 3
+
+    def test_multiplicative_decrease_once_per_round_trip(self):
+        limiter = AdaptiveConcurrencyLimiter("P", "m", initial=8, floor=2, ceiling=8)
+        limiter.record(OK, 10.0)
+        limiter.record(RATE_LIMITED, 10.0)
+        limiter.record(RATE_LIMITED, 10.0)
+        # The second 429 lands within one round trip of the first cut
+        assert limiter.current_limit == 4
+        assert limiter.throttled == 2
+
+        limiter._last_decrease -= 60
+        limiter.record(RATE_LIMITED, 10.0)
+        limiter._last_decrease -= 60
+        limiter.record(RATE_LIMITED, 10.0)
+        assert limiter.current_limit == 2  # floor
+
+    def test_slow_success_holds_and_auth_errors_are_neutral(self):
+        limiter = AdaptiveConcurrencyLimiter("P", "m", initial=3, floor=1, ceiling=10)
+        limiter.record(OK, 0.1)
+        assert limiter.current_limit == 3
+        before = limiter.limit
+        limiter.record(OK, 5.0)  # latency spike well past tolerance
+        assert limiter.limit == before
+        limiter.record({"success": False, "error": "authentication failed"}, 0.1)
+        assert limiter.limit == before
+        assert limiter.failures == 1
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AdaptiveConcurrencyLimiter("P", "m", initial=1, floor=1, ceiling=2)
+        assert limiter.acquire(timeout=0.1)
+        assert not limiter.acquire(timeout=0.05)
+
+        threading.Timer(0.05, limiter.release).start()
+        assert limiter.acquire(timeout=1)
+
+
+class TestProviderSemaphoreIntegration:
+    def test_limit_is_per_provider_and_model(self, adaptive_env):
+        with provider_semaphore("AdaptiveTest", "model-a") as slot:
+            slot.record(RATE_LIMITED)
+        with provider_semaphore("AdaptiveTest", "model-b") as slot:
+            slot.record(OK)
+
+        stats = {s["model"]: s for s in get_adaptive_concurrency_stats()["limiters"]}
+        assert stats["model-a"]["limit"] == 1
+        assert stats["model-a"]["throttled"] == 1
+        assert stats["model-b"]["limit"] == 2
+        assert stats["model-b"]["ceiling"] == 8  # 4x the static limit by default
+        assert stats["model-b"]["in_flight"] == 0
+
+    def test_concurrency_follows_the_adaptive_limit(self, adaptive_env):
+        limiter = get_adaptive_limiter("AdaptiveTest", "m")
+        limiter.limit = 1.0
+        lock = threading.Lock()
+        active = {"now": 0, "peak": 0}
+
+        def worker():
+            with provider_semaphore("AdaptiveTest", "m"):
+                with lock:
+                    active["now"] += 1
+                    active["peak"] = max(active["peak"], active["now"])
+                time.sleep(0.02)
+                with lock:
+                    active["now"] -= 1
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert active["peak"] == 1
+
+    def test_disabled_by_default(self):
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("PROVIDER_ADAPTIVE_CONCURRENCY", None)
+            with patch.dict(llm_providers._adaptive_limiters, clear=True):
+                with provider_semaphore("AdaptiveOff", "m") as slot:
+                    slot.record(OK)
+                assert get_adaptive_concurrency_stats() == {"enabled": False, "limiters": []}
+
+
+def test_concurrency_endpoint(client, adaptive_env):
+    with provider_semaphore("AdaptiveTest", "model-a") as slot:
+        slot.record(OK)
+
+    response = client.get("/api/providers/concurrency")
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["enabled"] is True
+    assert data["limiters"][0]["provider"] == "AdaptiveTest"
@@ -208,7 +208,7 @@ class TestUploadSuccessPaths:
             }
             return fake
 
-        with patch("utils.llm_providers.requests.post", side_effect=fake_post):
+        with patch("utils.llm_providers.requests.Session.post", side_effect=fake_post):
             data = {
                 "file": (io.BytesIO(file_content), "essay.txt"),
                 "marking_scheme": (io.BytesIO(scheme_content), "rubric.txt"),
@@ -0,0 +1,169 @@
+"""
+Tests for spreading requests over several API keys per provider.
+"""
+
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from models import Config, db
+from utils import llm_providers
+from utils.encryption import generate_encryption_key
+from utils.llm_providers import (
+    ApiKeyPool,
+    OpenRouterLLMProvider,
+    acquire_api_key,
+    configured_api_keys,
+    get_api_key_pool_stats,
+    release_api_key,
+    set_extra_api_keys,
+)
+
+KEY_A = "sk-or-v1-" + "a" * 64
+KEY_B = "sk-or-v1-" + "b" * 64
+KEY_C = "sk-or-v1-" + "c" * 64
+
+
+def _pool(*keys):
+    pool = ApiKeyPool("OpenRouter")
+    pool.sync(keys)
+    return pool
+
+
+class TestApiKeyPool:
+    def test_least_outstanding_key_is_chosen(self):
+        pool = _pool("a", "b", "c")
+        held = [pool.acquire() for _ in range(3)]
+        assert sorted(held) == ["a", "b", "c"]
+
+        pool.release("b", {"success": True})
+        assert pool.acquire() == "b"
+
+    def test_ties_rotate(self):
+        pool = _pool("a", "b")
+        picks = []
+        for _ in range(4):
+            key = pool.acquire()
+            picks.append(key)
+            pool.release(key, {"success": True})
+        assert picks == ["a", "b", "a", "b"]
+
+    def test_authentication_failure_removes_key_but_never_the_last(self):
+        pool = _pool("a", "b")
+        pool.release(pool.acquire(), {"success": False, "error": "OpenRouter API error: 401 - invalid key"})
+        assert [pool.acquire() for _ in range(3)] == ["b", "b", "b"]
+
+        for _ in range(3):
+            pool.release("b", {"success": False, "error": "Claude API authentication failed."})
+        assert pool.acquire() == "b"  # the last key keeps surfacing the provider's own error
+
+    def test_quota_and_rate_limit_errors_cool_a_key_down(self):
+        pool = _pool("a", "b")
+        pool.release(pool.acquire(), {"success": False, "error": "OpenRouter API error: 402 - Insufficient credits"})
+        pool.release(pool.acquire(), {"success": False, "error": "429 Too Many Requests", "retry_after": 0.05})
+
+        stats = {entry["reason"]: entry for entry in pool.get_stats()["keys"]}
+        assert stats["quota"]["status"] == "cooling_down"
+        assert stats["quota"]["cooldown_seconds"] > 3000
+        # Both are cooling down, so the key due back first is used
+        assert pool.acquire() == "b"
+
+    def test_other_errors_leave_key_in_rotation(self):
+        pool = _pool("a", "b")
+        pool.release(pool.acquire(), {"success": False, "error": "OpenRouter API error: 500 - upstream"})
+        assert all(entry["status"] == "active" for entry in pool.get_stats()["keys"])
+
+    def test_sync_keeps_state_of_retained_keys(self):
+        pool = _pool("a", "b")
+        pool.acquire()
+        pool.sync(["a", "c"])
+        keys = pool.get_stats()["keys"]
+        assert [entry["outstanding"] for entry in keys] == [1, 0]
+
+
+def test_keys_come_from_env_list_and_stored_config():
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "a", "OPENROUTER_API_KEYS": "b, c\na"}):
+        set_extra_api_keys("OpenRouter", ["d", "b"])
+        assert configured_api_keys("OpenRouter") == ["a", "b", "c", "d"]
+    assert configured_api_keys("Gemini") == []
+    assert acquire_api_key("LM Studio") is None
+
+
+def test_stats_never_expose_keys():
+    with patch.dict(os.environ, {"CLAUDE_API_KEY": KEY_A}):
+        key = acquire_api_key("Claude")
+        release_api_key("Claude", key, {"success": True})
+    assert KEY_A not in json.dumps(get_api_key_pool_stats())
+
+
+def _http_response(status_code, payload):
+    response = MagicMock(status_code=status_code, headers={})
+    response.json.return_value = payload
+    return response
+
+
+def test_openrouter_spreads_requests_and_drops_exhausted_key():
+    used = []
+
+    def post(provider_name, url, api_key=None, **kwargs):
+        used.append(api_key)
+        if api_key == KEY_A:
+            return _http_response(402, {"error": {"message": "Insufficient credits"}})
+        return _http_response(200, {"choices": [{"message": {"content": "A"}}], "usage": {}})
+
+    env = {"OPENROUTER_API_KEY": KEY_A, "OPENROUTER_API_KEYS": KEY_B}
+    with patch.dict(os.environ, env), patch("utils.llm_providers._http_post", side_effect=post):
+        results = [OpenRouterLLMProvider().grade_document("essay", "grade", model="m") for _ in range(4)]
+
+    assert used == [KEY_A, KEY_B, KEY_B, KEY_B]
+    assert [r["success"] for r in results] == [False, True, True, True]
+    keys = llm_providers.get_api_key_pool("OpenRouter").get_stats()["keys"]
+    assert [entry["outstanding"] for entry in keys] == [0, 0]
+
+
+class TestStoredKeys:
+    @pytest.fixture(autouse=True)
+    def encryption_key(self):
+        with patch.dict(os.environ, {"DB_ENCRYPTION_KEY": generate_encryption_key()}):
+            yield
+
+    def test_extra_keys_are_encrypted(self, app):
+        with app.app_context():
+            config = Config()
+            config.extra_api_keys = {"openrouter": [KEY_B, KEY_C], "claude": []}
+            assert KEY_B not in config._extra_api_keys
+            assert config.extra_api_keys == {"openrouter": [KEY_B, KEY_C]}
+
+            config.extra_api_keys = {}
+            assert config._extra_api_keys is None
+
+    def test_save_config_stores_and_applies_extra_keys(self, client, app):
+        response = client.post(
+            "/save_config",
+            data={"openrouter_api_key": KEY_A, "openrouter_extra_api_keys": f"{KEY_B}\n{KEY_C}\n"},
+        )
+        assert response.get_json()["success"] is True
+
+        with app.app_context():
+            assert Config.query.first().extra_api_keys == {"openrouter": [KEY_B, KEY_C]}
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": KEY_A}):
+            assert configured_api_keys("OpenRouter") == [KEY_A, KEY_B, KEY_C]
+        assert client.get("/load_config").get_json()["openrouter_extra_api_keys"] == f"{KEY_B}\n{KEY_C}"
+
+    def test_save_config_rejects_malformed_extra_keys(self, client, app):
+        response = client.post("/save_config", data={"openrouter_extra_api_keys": "not-a-key"})
+        assert response.get_json()["success"] is False
+        assert "Additional key" in response.get_json()["message"]
+
+    def test_jobs_pick_up_keys_saved_by_other_processes(self, app):
+        import tasks
+
+        with app.app_context():
+            config = Config.get_or_create()
+            config.extra_api_keys = {"claude": ["sk-ant-extra"]}
+            db.session.commit()
+
+            tasks._load_stored_api_keys()
+        assert configured_api_keys("Claude")[-1] == "sk-ant-extra"
@@ -39,7 +39,7 @@ class TestSchedulerInitialization:
     def test_initialize_scheduler_adds_jobs(
         self, mock_cleanup_batches, mock_cleanup_files, mock_scheduler
     ):
-        """Test that initialize_scheduler adds both periodic jobs."""
+        """Test that initialize_scheduler adds all periodic jobs."""
         from desktop.scheduler import initialize_scheduler
 
         # Reset mock to clear any previous calls
@@ -48,8 +48,8 @@ class TestSchedulerInitialization:
         # Call initialization
         initialize_scheduler()
 
-        # Verify add_job was called twice
-        assert mock_scheduler.add_job.call_count == 2
+        # Verify add_job was called once per periodic job
+        assert mock_scheduler.add_job.call_count == 5
 
         # Verify cleanup_old_files job configuration
         calls = mock_scheduler.add_job.call_args_list
@@ -476,7 +476,7 @@ class TestSchedulerIntegration:
 
         # Initialize scheduler
         scheduler_module.initialize_scheduler()
-        assert mock_scheduler_instance.add_job.call_count == 2
+        assert mock_scheduler_instance.add_job.call_count == 5
 
         # Start scheduler
         mock_scheduler_instance.running = False
@@ -499,7 +499,7 @@ class TestSchedulerIntegration:
 
     @patch("desktop.scheduler.scheduler")
     def test_job_count(self, mock_scheduler):
-        """Test that exactly 2 jobs are registered."""
+        """Test that exactly 5 jobs are registered."""
         from desktop.scheduler import initialize_scheduler
 
         # Reset mock
@@ -508,5 +508,11 @@ class TestSchedulerIntegration:
         # Initialize
         initialize_scheduler()
 
-        # Verify exactly 2 jobs were added
-        assert mock_scheduler.add_job.call_count == 2
+        # Verify exactly 5 jobs were added
+        assert [call.kwargs["id"] for call in mock_scheduler.add_job.call_args_list] == [
+            "cleanup_old_files",
+            "cleanup_completed_batches",
+            "evict_llm_response_cache",
+            "purge_task_queue",
+            "recover_stuck_submissions",
+        ]
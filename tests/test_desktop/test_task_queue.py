@@ -343,6 +343,28 @@ class TestDesktopTaskQueue:
         finally:
             small_queue.shutdown(wait=True, timeout=5)
 
+    def test_due_tasks_start_by_priority(self):
+        """A busy pool starts the highest-priority waiting task next, FIFO within a priority."""
+        from desktop.task_queue import DesktopTaskQueue
+        small_queue = DesktopTaskQueue(max_workers=1)
+        release = threading.Event()
+        order = []
+
+        try:
+            blocker = small_queue.submit(release.wait, max_retries=0)
+            time.sleep(0.1)  # let the blocker take the only worker
+            task_ids = [
+                small_queue.submit(order.append, name, priority=priority, max_retries=0)
+                for name, priority in (("low", 1), ("default-1", None), ("urgent", 9), ("default-2", 5))
+            ]
+            release.set()
+            for task_id in [blocker] + task_ids:
+                small_queue.wait_for_task(task_id, timeout=5)
+        finally:
+            small_queue.shutdown(wait=True, timeout=5)
+
+        assert order == ["urgent", "default-1", "default-2", "low"]
+
     def test_cancel_nonexistent_task(self, queue):
         """Test cancelling a non-existent task."""
         result = queue.cancel_task("nonexistent_task_id")
@@ -518,3 +540,77 @@ class TestDesktopTaskQueueIntegration:
 
         finally:
             queue.shutdown(wait=True, timeout=10)
+
+
+class TestDelayedExecution:
+    """Countdowns and retry backoffs wait on the timer, not in worker threads."""
+
+    def test_timer_runs_callbacks_in_due_order(self):
+        from desktop.task_queue import TaskTimer
+
+        timer = TaskTimer()
+        fired = []
+        done = threading.Event()
+        timer.call_later(0.2, lambda: (fired.append("late"), done.set()))
+        timer.call_later(0.05, lambda: fired.append("early"))
+        skipped = timer.call_later(0.1, lambda: fired.append("cancelled"))
+        timer.cancel(skipped)
+
+        assert done.wait(2)
+        assert fired == ["early", "late"]
+        assert timer.pending() == 0
+        timer.stop()
+
+    def test_workers_stay_busy_under_staggered_batches(self):
+        """Jobs queued with staggered countdowns must not hold workers while they wait."""
+        from desktop.task_queue import DesktopTaskQueue
+        queue = DesktopTaskQueue(max_workers=4)
+        busy = []
+        lock = threading.Lock()
+
+        def work(duration):
+            started = time.monotonic()
+            time.sleep(duration)
+            with lock:
+                busy.append(time.monotonic() - started)
+
+        try:
+            # A batch of 20 jobs staggered 5s apart, as process_batch used to queue them
+            delayed = [queue.submit(work, 0.1, countdown=5 * (i + 1)) for i in range(20)]
+            start = time.monotonic()
+            ready = [queue.submit(work, 0.25) for _ in range(16)]
+            for task_id in ready:
+                queue.wait_for_task(task_id, timeout=10)
+            elapsed = time.monotonic() - start
+
+            # 16 x 0.25s on 4 workers is 1s of wall time at full utilization
+            utilization = sum(busy) / (4 * elapsed)
+            assert utilization > 0.8
+            assert queue.timer.pending() == 20
+            assert {queue.get_status(t)['status'] for t in delayed} == {'pending'}
+
+            # Waiting tasks can be cancelled and never run
+            assert queue.cancel_task(delayed[0]) is True
+            assert queue.get_status(delayed[0])['status'] == 'cancelled'
+            assert queue.timer.pending() == 19
+        finally:
+            queue.shutdown(wait=False)
+        assert {queue.get_status(t)['status'] for t in delayed} == {'cancelled'}
+
+    def test_backoff_frees_the_worker(self):
+        """A task waiting to retry leaves its worker to other tasks."""
+        from desktop.task_queue import DesktopTaskQueue
+        queue = DesktopTaskQueue(max_workers=1)
+        try:
+            retrying = queue.submit(failing_task, max_retries=1)
+            time.sleep(0.1)  # first attempt failed; the retry is 1s away
+            start = time.monotonic()
+            quick = queue.submit(successful_task, 21)
+            assert queue.wait_for_task(quick, timeout=5) == 42
+            assert time.monotonic() - start < 0.5
+
+            with pytest.raises(ValueError):
+                queue.wait_for_task(retrying, timeout=5)
+            assert queue.get_status(retrying)['attempts'] == 2
+        finally:
+            queue.shutdown(wait=True, timeout=5)
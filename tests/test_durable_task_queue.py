@@ -0,0 +1,188 @@
+"""
+Tests for the database-backed task queue.
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+
+from desktop.task_queue import DurableTaskQueue
+from models import GradingJob, QueuedTask, db
+
+CALLS = []
+
+
+def record(value, suffix=""):
+    CALLS.append(value)
+    return f"{value}{suffix}"
+
+
+def fail_once(key):
+    CALLS.append(key)
+    if CALLS.count(key) == 1:
+        raise RuntimeError("transient")
+    return "ok"
+
+
+def always_fail():
+    raise ValueError("broken")
+
+
+@pytest.fixture(autouse=True)
+def fast_polling():
+    CALLS.clear()
+    with patch.dict(os.environ, {"TASK_QUEUE_POLL_INTERVAL": "0.05", "TASK_QUEUE_BACKEND": "database"}):
+        yield
+
+
+@pytest.fixture
+def queue():
+    queue = DurableTaskQueue(max_workers=2)
+    yield queue
+    queue.shutdown(wait=True, timeout=5)
+
+
+def _stored(**values):
+    values.setdefault("scheduled_at", datetime.now(timezone.utc))
+    task = QueuedTask(**values)
+    db.session.add(task)
+    db.session.commit()
+    return task.id
+
+
+def test_stored_task_runs_and_records_result(app, queue):
+    task_id = queue.submit(record, "essay", suffix="!")
+
+    assert task_id not in queue.tasks  # not an in-memory task
+    assert queue.wait_for_task(task_id, timeout=5) == "essay!"
+    status = queue.get_status(task_id)
+    assert status["status"] == "completed"
+    assert status["function"] == "record"
+    assert status["attempts"] == 1
+    assert db.session.get(QueuedTask, task_id).task_name == "tests.test_durable_task_queue:record"
+
+
+def test_tasks_left_by_a_previous_process_are_resumed(app, queue):
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    pending_id = _stored(task_name="tests.test_durable_task_queue:record", args=["pending"], kwargs={})
+    orphan_id = _stored(
+        task_name="tests.test_durable_task_queue:record",
+        args=["orphan"],
+        kwargs={},
+        status="running",
+        attempts=1,
+        worker_id="dead-worker",
+        lease_expires_at=expired,
+    )
+
+    queue.start(app)
+    assert queue.wait_for_task(pending_id, timeout=5) == "pending"
+    assert queue.wait_for_task(orphan_id, timeout=5) == "orphan"
+    assert queue.get_status(orphan_id)["attempts"] == 2
+    assert sorted(CALLS) == ["orphan", "pending"]
+
+
+def test_live_lease_is_not_reclaimed_and_claims_are_exclusive(app):
+    future = datetime.now(timezone.utc) + timedelta(minutes=5)
+    _stored(task_name="tests.test_durable_task_queue:record", status="running", lease_expires_at=future)
+    task_id = _stored(task_name="tests.test_durable_task_queue:record", args=["x"], kwargs={})
+
+    first, second = DurableTaskQueue(), DurableTaskQueue()
+    claims = []
+    for worker_id, worker in (("a", first), ("b", second)):
+        worker._app, worker.worker_id = app, worker_id
+    threads = [threading.Thread(target=lambda w=w: claims.append(w._claim())) for w in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [claim for claim in claims if claim]
+    assert [claim["id"] for claim in claimed] == [task_id]
+    assert db.session.get(QueuedTask, task_id, populate_existing=True).lease_expires_at is not None
+
+
+def test_failures_are_retried_then_recorded(app, queue):
+    retried = queue.submit(fail_once, "a", max_retries=1)
+    assert queue.wait_for_task(retried, timeout=5) == "ok"
+    assert queue.get_status(retried)["attempts"] == 2
+
+    failed = queue.submit(always_fail, max_retries=0)
+    with pytest.raises(RuntimeError, match="broken"):
+        queue.wait_for_task(failed, timeout=5)
+    assert queue.get_status(failed)["status"] == "failed"
+
+
+def test_task_whose_workers_keep_dying_is_failed_without_running(app, queue):
+    expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+    task_id = _stored(
+        task_name="tests.test_durable_task_queue:record",
+        args=["never"],
+        kwargs={},
+        status="running",
+        attempts=2,
+        max_retries=1,
+        lease_expires_at=expired,
+    )
+    queue.start(app)
+    with pytest.raises(RuntimeError, match="Lease expired"):
+        queue.wait_for_task(task_id, timeout=5)
+    assert CALLS == []
+
+
+def test_countdown_and_cancel(app, queue):
+    task_id = queue.submit(record, "later", countdown=60)
+    assert queue.get_status(task_id)["status"] == "pending"
+    assert task_id in queue.get_all_tasks()
+
+    assert queue.cancel_task(task_id) is True
+    assert queue.get_status(task_id)["status"] == "cancelled"
+    assert queue.cancel_task(task_id) is False
+
+
+def test_unstorable_tasks_run_in_memory(app, queue, caplog):
+    in_memory = queue.submit(lambda: "lambda")
+    assert in_memory in queue.tasks
+    assert queue.wait_for_task(in_memory, timeout=5) == "lambda"
+
+    with caplog.at_level("WARNING", logger="desktop.task_queue"):
+        assert queue.submit(record, object()) in queue.tasks  # argument is not JSON
+    assert "will not survive a restart: arguments are not JSON-serializable" in caplog.text
+    assert QueuedTask.query.count() == 0
+
+
+def test_submit_leaves_the_callers_session_alone(app, queue):
+    job = GradingJob(job_name="Staged", provider="openrouter", prompt="p")
+    db.session.add(job)
+
+    with patch.object(queue, "start"):
+        task_id = queue.submit(record, "essay")
+    db.session.rollback()
+
+    assert GradingJob.query.filter_by(job_name="Staged").count() == 0
+    assert db.session.get(QueuedTask, task_id).status == "pending"
+
+
+def test_delay_stores_the_task(app):
+    import tasks
+
+    queue = DurableTaskQueue()
+    with patch.object(tasks, "task_queue", queue), patch.object(queue, "start"):
+        result = tasks.process_job.delay("job-1")
+
+    task = db.session.get(QueuedTask, result.id)
+    assert (task.task_name, task.args, task.status) == ("tasks:process_job", ["job-1"], "pending")
+    assert DurableTaskQueue._resolve(task.task_name) is tasks.process_job
+
+
+def test_purge_keeps_recent_and_unfinished_tasks(app, queue):
+    old = datetime.now(timezone.utc) - timedelta(days=30)
+    _stored(task_name="tasks:process_job", status="completed", finished_at=old)
+    _stored(task_name="tasks:process_job", status="completed", finished_at=datetime.now(timezone.utc))
+    _stored(task_name="tasks:process_job", status="pending", scheduled_at=old)
+
+    assert queue.purge() == 1
+    assert QueuedTask.query.count() == 2
@@ -0,0 +1,198 @@
+"""
+Tests for priority and fair-share scheduling of grading work.
+"""
+
+import threading
+import time
+from collections import Counter
+from unittest.mock import patch
+
+from desktop.task_queue import DurableTaskQueue
+from grading_worker import GradingWorker
+from models import JobBatch, QueuedTask, Submission, db
+from services.job_queue import JobQueueService
+from tests.factories import GradingJobFactory
+from utils.fair_scheduler import FairSharePool, Share, plan
+
+
+def _share(job_id, owner="alice", group=None, priority=5, created_at=0.0):
+    return Share(job_id, owner, group or job_id, priority, created_at)
+
+
+def test_plan_serves_priority_first_then_shares_fairly():
+    shares = {
+        "big": _share("big", owner="alice", priority=3, created_at=1.0),
+        "other": _share("other", owner="bob", priority=3, created_at=2.0),
+        "urgent": _share("urgent", owner="alice", priority=9, created_at=3.0),
+    }
+    order = plan(shares, {"big": 100, "other": 100, "urgent": 2}, slots=6)
+    assert order[:2] == ["urgent", "urgent"]
+    # Alice's urgent work counts against her share, so bob goes next
+    assert order[2:] == ["other", "other", "big", "other"]
+
+    # Two batches of one owner alternate, whatever their size
+    shares = {
+        "a1": _share("a1", group="batch-a"),
+        "a2": _share("a2", group="batch-a"),
+        "b1": _share("b1", group="batch-b", created_at=1.0),
+    }
+    order = plan(shares, {"a1": 10, "a2": 10, "b1": 10}, running={"a1": 1, "a2": 1}, slots=4)
+    assert Counter(order) == {"b1": 3, "a1": 1} or Counter(order) == {"b1": 3, "a2": 1}
+
+
+def test_pool_gives_the_next_free_thread_to_an_urgent_job():
+    pool = FairSharePool(capacity=1)
+    low, urgent = _share("low", priority=1), _share("urgent", priority=9)
+    release = threading.Event()
+    order = []
+
+    blocker = pool.submit(low, release.wait)
+    while not blocker.running():
+        time.sleep(0.01)
+    queued = [pool.submit(low, order.append, "low") for _ in range(3)]
+    queued.append(pool.submit(urgent, order.append, "urgent"))
+    assert pool.get_stats()["jobs"] == {"low": {"running": 1, "waiting": 3}, "urgent": {"running": 0, "waiting": 1}}
+
+    release.set()
+    for future in [blocker] + queued:
+        future.result(timeout=5)
+    assert order == ["urgent", "low", "low", "low"]
+    assert pool.get_stats() == {"capacity": 1, "threads": 1, "running": 0, "waiting": 0, "jobs": {}}
+
+
+def test_pool_bounds_in_flight_work_across_jobs():
+    pool = FairSharePool(capacity=4)
+    lock = threading.Lock()
+    in_flight = Counter()
+    peaks = {"total": 0, "capped": 0}
+
+    def grade(job_id, duration):
+        with lock:
+            in_flight[job_id] += 1
+            peaks["total"] = max(peaks["total"], sum(in_flight.values()))
+            peaks["capped"] = max(peaks["capped"], in_flight["capped"])
+        time.sleep(duration)
+        with lock:
+            in_flight[job_id] -= 1
+
+    futures = []
+    for job_id in ("a", "b", "c"):
+        futures += [pool.submit(_share(job_id), grade, job_id, 0.02) for _ in range(10)]
+    futures += [pool.submit(_share("capped"), grade, "capped", 0.02, limit=1) for _ in range(5)]
+    for future in futures:
+        future.result(timeout=10)
+
+    # Four jobs never run more than the pool's four threads, and a job's limit holds
+    assert peaks["total"] == 4
+    assert peaks["capped"] == 1
+    assert pool.get_stats()["threads"] == 4
+
+    # A job that finishes early leaves its threads to the others
+    release = threading.Event()
+    short = pool.submit(_share("short"), time.sleep, 0.01)
+    long = [pool.submit(_share("long"), release.wait) for _ in range(4)]
+    short.result(timeout=5)
+    deadline = time.monotonic() + 5
+    while pool.get_stats()["jobs"].get("long", {}).get("running") != 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pool.get_stats()["jobs"]["long"] == {"running": 4, "waiting": 0}
+    release.set()
+    for future in long:
+        future.result(timeout=5)
+
+
+def test_fan_outs_share_the_pool_capacity_without_deadlock():
+    pool = FairSharePool(capacity=3)
+    lock = threading.Lock()
+    peak = [0]
+
+    def section(value):
+        with lock:
+            peak[0] = max(peak[0], pool.get_stats()["running"])
+        time.sleep(0.01)
+        return value * 2
+
+    def model(index):
+        # Every model fans out again, as a long document's sections do
+        return sum(pool.fan_out(section, range(index, index + 3), limit=2))
+
+    def submission():
+        return pool.fan_out(model, range(4))
+
+    futures = [pool.submit(_share("job"), submission) for _ in range(2)]
+    assert [future.result(timeout=10) for future in futures] == [[6, 12, 18, 24]] * 2
+    # Submissions and their fan-outs together never hold more than the capacity
+    assert peak[0] <= 3
+    assert pool.get_stats()["running"] == 0
+
+    release = threading.Event()
+    busy = [pool.try_fan_out(release.wait) for _ in range(3)]
+    assert pool.try_fan_out(time.sleep, 0) is None
+    # With every slot taken by fan-outs, a submission waits for one to free up
+    waiting = pool.submit(_share("job"), threading.get_ident)
+    time.sleep(0.05)
+    assert not waiting.done()
+    release.set()
+    for future in busy + [waiting]:
+        future.result(timeout=5)
+
+
+def test_worker_claims_split_slots_by_priority(app):
+    big = GradingJobFactory.create(20, priority=2, status="processing", execution_mode="worker")
+    urgent = GradingJobFactory.create(2, priority=9, status="processing", execution_mode="worker")
+    worker = GradingWorker(app)
+
+    claimed = worker.claim(4)
+    jobs = Counter(db.session.get(Submission, sid).job_id for sid in claimed)
+    assert jobs == {urgent.id: 2, big.id: 2}
+    assert all(db.session.get(Submission, sid).started_at is not None for sid in claimed)
+
+
+def test_task_queue_claims_higher_priority_first(app):
+    queue = DurableTaskQueue()
+    queue._app, queue.worker_id = app, "consumer"
+    with patch.object(queue, "start"), patch.dict("os.environ", {"TASK_QUEUE_BACKEND": "database"}):
+        import tasks
+
+        low = GradingJobFactory.create(1, priority=1)
+        urgent = GradingJobFactory.create(1, priority=2)
+        batch = JobBatch(batch_name="Urgent batch", priority=10)
+        db.session.add(batch)
+        db.session.commit()
+        urgent.batch_id = batch.id
+        db.session.commit()
+
+        with patch.object(tasks, "task_queue", queue):
+            tasks.process_job.delay(low.id)
+            tasks.process_job.delay(urgent.id)
+
+    assert {t.args[0]: t.priority for t in QueuedTask.query.all()} == {low.id: 1, urgent.id: 10}
+    assert queue._claim()["args"] == [urgent.id]
+    assert queue._claim()["args"] == [low.id]
+
+
+def test_queue_endpoint_reports_position_and_expected_start(app, client):
+    running = GradingJobFactory.create(3, priority=5, status="processing", execution_mode="worker")
+    waiting = GradingJobFactory.create(2, priority=5, status="processing", execution_mode="worker")
+    idle = GradingJobFactory.create(0, status="completed")
+    for submission in running.submissions:
+        submission.set_status("processing")
+
+    with patch.dict("os.environ", {"JOB_GLOBAL_MAX_PARALLEL": "3", "JOB_QUEUE_DEFAULT_SECONDS": "10"}):
+        estimate = client.get(f"/api/jobs/{waiting.id}/queue").get_json()
+        everything = client.get("/api/queue").get_json()
+
+    assert estimate["queued"] is True
+    assert (estimate["position"], estimate["submissions_ahead"], estimate["wait_seconds"]) == (1, 0, 10.0)
+    assert estimate["expected_start"] is not None
+    assert [entry["job_id"] for entry in everything["jobs"]] == [waiting.id, running.id]
+    assert everything["jobs"][1]["position"] == 0
+    assert everything["pool"]["capacity"] == 3
+
+    assert client.get(f"/api/jobs/{idle.id}/queue").get_json() == {
+        "job_id": idle.id,
+        "queued": False,
+        "status": "completed",
+    }
+    assert client.get("/api/jobs/missing/queue").status_code == 404
+    assert JobQueueService.effective_priority(waiting) == 5
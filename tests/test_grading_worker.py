@@ -0,0 +1,86 @@
+"""
+Tests for the standalone grading worker and its atomic submission claims.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import tasks
+from grading_worker import GradingWorker
+from models import GradingJob, JobBatch, Submission, db
+from services.submission_leases import SubmissionLeaseService
+from tests.factories import GradingJobFactory
+
+
+def _grade_ok(submission_id):
+    with tasks.create_app().app_context():
+        db.session.get(Submission, submission_id).set_status("completed")
+    return True
+
+
+def test_concurrent_claims_never_overlap(app):
+    job = GradingJobFactory.create(5, status="processing", execution_mode="worker")
+    GradingJobFactory.create(3, status="processing", execution_mode="threaded")  # graded in-process, never claimed
+    workers = [GradingWorker(app), GradingWorker(app)]
+    claims = {}
+    threads = [
+        threading.Thread(target=lambda w=w: claims.setdefault(w.worker_id, w.claim(3))) for w in workers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed = [sid for ids in claims.values() for sid in ids]
+    assert sorted(claimed) == sorted(s.id for s in job.submissions)
+    for worker in workers:
+        for sid in claims[worker.worker_id]:
+            submission = db.session.get(Submission, sid, populate_existing=True)
+            assert (submission.status, submission.claimed_by) == ("processing", worker.worker_id)
+            assert submission.lease_expires_at is not None
+    assert workers[0].claim(3) == []
+
+
+def test_worker_grades_until_idle_and_rolls_up_the_batch(app):
+    batch = JobBatch(batch_name="Worker Batch", status="processing")
+    db.session.add(batch)
+    db.session.commit()
+    job = GradingJobFactory.create(4, batch_id=batch.id, status="processing", execution_mode="worker")
+
+    worker = GradingWorker(app, concurrency=2, poll_interval=0.01)
+    with patch("tasks.process_submission_sync", side_effect=_grade_ok) as grade:
+        worker.run(until_idle=True)
+
+    assert grade.call_count == 4
+    assert db.session.get(GradingJob, job.id, populate_existing=True).status == "completed"
+    assert db.session.get(JobBatch, batch.id, populate_existing=True).completed_jobs == 1
+
+
+def test_process_job_leaves_worker_jobs_to_the_workers(app):
+    job = GradingJobFactory.create(2, status="pending", execution_mode="worker")
+    with patch("tasks.process_submission_sync") as grade:
+        assert tasks.process_job(job.id) is True
+    grade.assert_not_called()
+    job = db.session.get(GradingJob, job.id, populate_existing=True)
+    assert job.status == "processing"
+    assert {s.status for s in job.submissions} == {"pending"}
+
+
+def test_claimed_leases_are_renewed_by_the_shared_heartbeat(app):
+    GradingJobFactory.create(1, status="processing", execution_mode="worker")
+    worker = GradingWorker(app)
+    [sid] = worker.claim(1)
+    before = db.session.get(Submission, sid).lease_expires_at
+
+    later = datetime.now(timezone.utc) + timedelta(minutes=5)
+    with patch("services.submission_leases._utcnow", return_value=later):
+        SubmissionLeaseService.renew()
+    renewed = db.session.get(Submission, sid, populate_existing=True).lease_expires_at
+    assert renewed > before
+
+    # Once graded, the worker stops renewing
+    SubmissionLeaseService.untrack([sid])
+    with patch("services.submission_leases._utcnow", return_value=later + timedelta(minutes=5)):
+        SubmissionLeaseService.renew()
+    assert db.session.get(Submission, sid, populate_existing=True).lease_expires_at == renewed
@@ -0,0 +1,202 @@
+"""
+Tests for latency-based request hedging to fallback models.
+"""
+
+import asyncio
+import json
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+import tasks
+from models import GradeResult, GradingJob, Submission, db
+from utils import llm_providers
+from utils.llm_providers import LatencyWindow, latency_quantile, provider_semaphore, record_latency
+
+
+class SlowProvider:
+    """Provider double that answers after a fixed delay."""
+
+    def __init__(self, name, delay, success=True):
+        self.name = name
+        self.delay = delay
+        self.success = success
+        self.calls = 0
+        self.cancelled = False
+
+    def _result(self, model):
+        if not self.success:
+            return {"success": False, "error": "Model produced an empty answer", "provider": self.name}
+        return {"success": True, "grade": f"grade from {self.name}", "model": model, "provider": self.name}
+
+    def grade_document(self, text, prompt, model=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self._result(model)
+
+    async def agrade_document(self, text, prompt, model=None, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self._result(model)
+
+
+@pytest.fixture
+def hedging():
+    env = {
+        "JOB_HEDGE_FALLBACKS": json.dumps({"openrouter:slow-model": "openai:fast-model"}),
+        "JOB_HEDGE_MIN_SAMPLES": "5",
+        "JOB_HEDGE_MIN_DELAY": "0",
+    }
+    with patch.dict(os.environ, env), patch.dict(llm_providers._latency_windows, clear=True):
+        for _ in range(10):
+            record_latency("OpenRouter", "slow-model", 0.05)
+        yield
+
+
+def _providers(primary, fallback):
+    return {"OpenRouter": primary, "OpenAI": fallback}
+
+
+KWARGS = {"text": "essay", "prompt": "grade", "model": "slow-model"}
+
+
+class TestLatencyWindow:
+    def test_quantile_and_sample_threshold(self):
+        window = LatencyWindow(size=100)
+        for i in range(1, 101):
+            window.add(i / 100)
+        assert window.quantile(0.95) == pytest.approx(0.96)
+        assert LatencyWindow().quantile(0.5) is None
+
+        with patch.dict(llm_providers._latency_windows, clear=True):
+            record_latency("P", "m", 1.0)
+            assert latency_quantile("P", "m", min_samples=2) is None
+            assert latency_quantile("P", "m") == 1.0
+
+    def test_successful_slots_are_recorded(self):
+        with patch.dict(llm_providers._latency_windows, clear=True):
+            with provider_semaphore("LatencyTest", "m") as slot:
+                slot.record({"success": True})
+            with provider_semaphore("LatencyTest", "m") as slot:
+                slot.record({"success": False, "error": "boom"})
+            assert len(llm_providers._latency_windows[("LatencyTest", "m")]) == 1
+
+
+class TestHedgePlan:
+    def test_needs_fallback_and_enough_samples(self, hedging):
+        delay, provider, kwargs = tasks._hedge_plan("openrouter", KWARGS)
+        assert delay == pytest.approx(0.05)
+        assert provider == "openai"
+        assert kwargs["model"] == "fast-model"
+
+        assert tasks._hedge_plan("openrouter", {**KWARGS, "model": "other"}) is None
+        with patch.dict(llm_providers._latency_windows, clear=True):
+            assert tasks._hedge_plan("openrouter", KWARGS) is None
+
+    def test_fallback_without_model_selection_drops_model(self, hedging):
+        with patch.dict(os.environ, {"JOB_HEDGE_FALLBACKS": json.dumps({"openrouter": "claude"})}):
+            _, provider, kwargs = tasks._hedge_plan("openrouter", KWARGS)
+        assert provider == "claude"
+        assert "model" not in kwargs
+
+
+class TestThreadedHedging:
+    def test_fast_primary_is_not_hedged(self, hedging):
+        primary, fallback = SlowProvider("OpenRouter", 0), SlowProvider("OpenAI", 0)
+        with patch("tasks.get_llm_provider", side_effect=_providers(primary, fallback).get):
+            result = tasks._grade_with_kwargs("openrouter", dict(KWARGS))
+        assert result["grade"] == "grade from OpenRouter"
+        assert "hedge" not in result
+        assert fallback.calls == 0
+
+    def test_slow_primary_loses_to_fallback(self, hedging):
+        primary, fallback = SlowProvider("OpenRouter", 0.5), SlowProvider("OpenAI", 0)
+        with patch("tasks.get_llm_provider", side_effect=_providers(primary, fallback).get):
+            started = time.monotonic()
+            result = tasks._grade_with_kwargs("openrouter", dict(KWARGS))
+            elapsed = time.monotonic() - started
+
+        assert elapsed < 0.4
+        assert result["grade"] == "grade from OpenAI"
+        assert result["model"] == "fast-model"
+        assert result["hedge"] == {"winner": "fallback", "fallback": "openai:fast-model", "delay": 0.05}
+        assert not tasks._cacheable(result)
+
+    def test_failed_fallback_waits_for_primary(self, hedging):
+        primary, fallback = SlowProvider("OpenRouter", 0.2), SlowProvider("OpenAI", 0, success=False)
+        with patch("tasks.get_llm_provider", side_effect=_providers(primary, fallback).get):
+            result = tasks._grade_with_kwargs("openrouter", dict(KWARGS))
+        assert result["grade"] == "grade from OpenRouter"
+        assert result["hedge"]["winner"] == "primary"
+        assert tasks._cacheable(result)
+
+
+def test_async_hedge_cancels_the_loser(hedging):
+    primary, fallback = SlowProvider("OpenRouter", 5), SlowProvider("OpenAI", 0)
+
+    async def run():
+        result = await tasks._agrade_with_kwargs("openrouter", dict(KWARGS))
+        await asyncio.sleep(0)  # let the cancellation land
+        return result
+
+    with patch("tasks.get_llm_provider", side_effect=_providers(primary, fallback).get):
+        result = asyncio.run(run())
+
+    assert result["hedge"]["winner"] == "fallback"
+    assert primary.cancelled is True
+
+
+def test_cancelled_async_hedge_releases_the_half_open_probe(hedging):
+    primary, fallback = SlowProvider("OpenRouter", 5), SlowProvider("OpenAI", 0)
+    overloaded = {"success": False, "error": "OpenRouter API error: 503 - unavailable"}
+
+    async def run():
+        result = await tasks._agrade_with_kwargs("openrouter", dict(KWARGS))
+        await asyncio.sleep(0)  # let the cancellation land
+        return result
+
+    with patch.dict(llm_providers._circuit_breakers, clear=True):
+        breaker = llm_providers.get_circuit_breaker("OpenRouter", "slow-model")
+        for _ in range(breaker.threshold):
+            breaker.record(overloaded)
+        breaker._open_until = 0  # the primary request becomes the half-open probe
+
+        with patch("tasks.get_llm_provider", side_effect=_providers(primary, fallback).get):
+            result = asyncio.run(run())
+
+        assert result["hedge"]["winner"] == "fallback"
+        assert primary.cancelled is True
+        assert breaker.admit() == (0.0, True)
+
+
+def test_job_hedge_stats_and_endpoint(app, client):
+    with app.app_context():
+        job = GradingJob(job_name="Hedge Job", provider="openrouter", prompt="p")
+        db.session.add(job)
+        db.session.commit()
+        submission = Submission(job_id=job.id, filename="a.txt", original_filename="a.txt", file_type="txt")
+        db.session.add(submission)
+        db.session.commit()
+        for metadata in (
+            {"hedge": {"winner": "fallback"}},
+            {"hedge": {"winner": "primary"}},
+            {},
+            {},
+        ):
+            db.session.add(
+                GradeResult(
+                    grade="g", provider="OpenRouter", model="m", submission_id=submission.id, grade_metadata=metadata
+                )
+            )
+        db.session.commit()
+        job_id = job.id
+
+    data = client.get(f"/api/jobs/{job_id}/hedging").get_json()
+
+    assert data == {"requests": 4, "hedged": 2, "hedge_rate": 0.5, "primary_wins": 1, "fallback_wins": 1}
@@ -0,0 +1,110 @@
+"""
+Tests for incremental job progress counters and batch roll-ups.
+"""
+
+import threading
+
+from sqlalchemy import event
+
+import tasks
+from models import GradingJob, JobBatch, Submission, db
+from tests.factories import GradingJobFactory
+
+
+class _Statements:
+    """Counts SQL statements this thread sends to the database."""
+
+    def __enter__(self):
+        self.count = 0
+        # Background pollers (task queue, lease heartbeat) share the engine
+        self._thread = threading.get_ident()
+        event.listen(db.engine, "before_cursor_execute", self._seen)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, "before_cursor_execute", self._seen)
+
+    def _seen(self, *args):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+
+
+def _grade(submissions, status="completed"):
+    """SQL statements sent per graded submission."""
+    with _Statements() as statements:
+        for submission in submissions:
+            submission.set_status("processing")
+            submission.set_status(status)
+    return statements.count / len(submissions)
+
+
+def test_per_submission_overhead_does_not_grow_with_the_job(app):
+    small = GradingJobFactory.create(20, status="processing")
+    large = GradingJobFactory.create(400, status="processing")
+
+    small_statements = _grade(small.submissions[:10])
+    large_statements = _grade(large.submissions[:10])
+
+    # One status UPDATE per transition plus one counter UPDATE when it finishes;
+    # recounting with three COUNT(*) queries per transition took 9
+    assert small_statements == large_statements == 3
+
+
+def test_counters_follow_status_changes_and_finish_the_job(app):
+    job = GradingJobFactory.create(3, status="processing")
+    first, second, third = job.submissions
+
+    first.set_status("completed")
+    second.set_status("failed", "unreadable")
+    assert (job.processed_submissions, job.failed_submissions, job.status) == (1, 1, "processing")
+
+    assert second.retry() is True
+    assert job.failed_submissions == 0
+    second.set_status("completed")
+    third.set_status("failed", "empty")
+
+    job = db.session.get(GradingJob, job.id, populate_existing=True)
+    assert (job.processed_submissions, job.failed_submissions) == (2, 1)
+    assert job.status == "completed_with_errors"
+
+
+def test_concurrent_completions_are_not_lost(app):
+    job = GradingJobFactory.create(24, status="processing")
+    ids = [s.id for s in job.submissions]
+
+    def grade(chunk):
+        with tasks.create_app().app_context():
+            for submission_id in chunk:
+                db.session.get(Submission, submission_id).set_status("completed")
+
+    threads = [threading.Thread(target=grade, args=(ids[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    job = db.session.get(GradingJob, job.id, populate_existing=True)
+    assert (job.processed_submissions, job.failed_submissions, job.status) == (24, 0, "completed")
+
+
+def test_reconciliation_repairs_drifted_counters(app):
+    job = GradingJobFactory.create(2, status="processing")
+    job.processed_submissions = 7  # e.g. rows changed behind the counters' back
+    db.session.commit()
+
+    job.update_progress()
+    assert (job.total_submissions, job.processed_submissions, job.failed_submissions) == (2, 0, 0)
+
+
+def test_batch_rolls_up_job_statuses(app):
+    batch = JobBatch(batch_name="Progress Batch", status="processing")
+    db.session.add(batch)
+    db.session.commit()
+    done, broken = GradingJobFactory.create(1, batch_id=batch.id, status="completed"), GradingJobFactory.create(
+        1, batch_id=batch.id, status="failed"
+    )
+
+    batch.update_progress()
+    assert (batch.total_jobs, batch.completed_jobs, batch.failed_jobs) == (2, 1, 1)
+    assert batch.status == "completed_with_errors"
+    assert {done.batch_id, broken.batch_id} == {batch.id}
@@ -0,0 +1,95 @@
+"""
+Tests for the pooled HTTP transport shared by the LLM providers.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+from utils.llm_providers import (
+    OpenRouterLLMProvider,
+    ProviderConnectionPool,
+    get_connection_pool,
+)
+
+
+class TestProviderConnectionPool:
+    def test_same_endpoint_and_key_share_a_session(self):
+        pool = ProviderConnectionPool()
+        first = pool.get_session("OpenRouter", "https://openrouter.ai/api/v1/chat/completions", "key-a")
+        second = pool.get_session("OpenRouter", "https://openrouter.ai/api/v1/models", "key-a")
+
+        assert first is second
+        stats = pool.get_stats()
+        assert stats["sessions_created"] == 1
+        assert stats["session_reuses"] == 1
+
+    def test_different_keys_or_hosts_get_separate_sessions(self):
+        pool = ProviderConnectionPool()
+        a = pool.get_session("OpenRouter", "https://openrouter.ai/api/v1/models", "key-a")
+        b = pool.get_session("OpenRouter", "https://openrouter.ai/api/v1/models", "key-b")
+        c = pool.get_session("LM Studio", "http://localhost:1234/v1/models")
+        d = pool.get_session("LM Studio", "http://otherhost:1234/v1/models")
+
+        assert len({id(a), id(b), id(c), id(d)}) == 4
+
+    def test_session_adapter_uses_configured_pool_size(self):
+        pool = ProviderConnectionPool(pool_size=32)
+        session = pool.get_session("Chutes", "https://api.chutes.ai/v1/models", "k")
+
+        assert session.get_adapter("https://api.chutes.ai")._pool_maxsize == 32
+
+    def test_sdk_clients_are_cached_per_class_and_key(self):
+        pool = ProviderConnectionPool()
+        client_cls = MagicMock(side_effect=lambda **kw: MagicMock())
+
+        first = pool.get_client("Claude", client_cls, api_key="k1")
+        again = pool.get_client("Claude", client_cls, api_key="k1")
+        other = pool.get_client("Claude", client_cls, api_key="k2")
+
+        assert first is again
+        assert other is not first
+        assert client_cls.call_count == 2
+        client_cls.assert_any_call(api_key="k1")
+        assert pool.get_stats()["client_reuses"] == 1
+
+    def test_idle_entries_are_evicted_and_closed(self):
+        pool = ProviderConnectionPool(idle_timeout=10)
+        session = pool.get_session("Ollama", "http://localhost:11434/api/generate")
+        session.close = MagicMock()
+
+        with patch("utils.llm_providers.time.time", return_value=pool._last_eviction + 3600):
+            fresh = pool.get_session("Ollama", "http://localhost:11434/api/generate")
+
+        session.close.assert_called_once()
+        assert fresh is not session
+        assert pool.get_stats()["evictions"] == 1
+
+    def test_close_all_empties_pool(self):
+        pool = ProviderConnectionPool()
+        pool.get_session("Z.AI", "https://api.z.ai/api/paas/v4/chat/completions", "k")
+        pool.get_client("OpenAI", MagicMock(), api_key="k")
+
+        pool.close_all()
+
+        stats = pool.get_stats()
+        assert stats["active_sessions"] == 0
+        assert stats["active_clients"] == 0
+
+
+class TestProvidersUsePool:
+    def test_repeated_grades_reuse_one_session(self):
+        get_connection_pool().close_all()
+        fake_resp = MagicMock(status_code=200)
+        fake_resp.json.return_value = {"choices": [{"message": {"content": "A"}}], "usage": {}}
+
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "pool-test-key"}), patch(
+            "utils.llm_providers.requests.Session.post", return_value=fake_resp
+        ) as mock_post:
+            provider = OpenRouterLLMProvider()
+            provider.grade_document("doc", "prompt", model="m")
+            provider.grade_document("doc", "prompt", model="m")
+
+        assert mock_post.call_count == 2
+        stats = get_connection_pool().get_stats()
+        assert stats["sessions_created"] >= 1
+        assert stats["session_reuses"] >= 1
@@ -0,0 +1,78 @@
+"""
+Tests for provider-side prompt-prefix caching: stable grading prefixes,
+Anthropic cache_control hints and cached-token usage reporting.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+from utils.llm_providers import (
+    ClaudeLLMProvider,
+    OpenRouterLLMProvider,
+    _build_grading_prompt,
+    _grading_prefix,
+    _with_cached_tokens,
+    get_connection_pool,
+)
+
+
+def _openrouter_response(usage):
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {"choices": [{"message": {"content": "A"}}], "usage": usage}
+    return resp
+
+
+class TestGradingPrefix:
+    def test_prefix_is_shared_and_document_comes_last(self):
+        first = _build_grading_prompt("essay one", "Grade it.", "Rubric")
+        second = _build_grading_prompt("essay two", "Grade it.", "Rubric")
+        prefix = _grading_prefix("Grade it.", "Rubric")
+
+        assert first == prefix + "essay one"
+        assert second.startswith(prefix)
+        assert "Rubric" in prefix
+
+    def test_prefix_without_marking_scheme(self):
+        assert _build_grading_prompt("doc", "Grade it.") == "Grade it.\n\nDocument to grade:\ndoc"
+
+
+class TestCachedTokens:
+    def test_reads_openai_and_anthropic_fields(self):
+        assert _with_cached_tokens({"prompt_tokens_details": {"cached_tokens": 900}})["cached_tokens"] == 900
+        assert _with_cached_tokens({"cache_read_input_tokens": 1200})["cached_tokens"] == 1200
+        assert _with_cached_tokens({"prompt_tokens": 5})["cached_tokens"] == 0
+        assert _with_cached_tokens(None) is None
+
+
+class TestProviderCacheHints:
+    def test_claude_marks_job_prefix_as_cacheable(self):
+        usage = MagicMock()
+        usage.model_dump.return_value = {"input_tokens": 40, "cache_read_input_tokens": 1500}
+        client = MagicMock()
+        client.messages.create.return_value = MagicMock(content=[MagicMock(text="B")], usage=usage)
+        get_connection_pool().close_all()
+
+        with patch.dict(os.environ, {"CLAUDE_API_KEY": "k"}), patch(
+            "utils.llm_providers.Anthropic", return_value=client
+        ):
+            result = ClaudeLLMProvider().grade_document("the essay", "Grade it.", marking_scheme_content="Rubric")
+
+        content = client.messages.create.call_args.kwargs["messages"][0]["content"]
+        assert content[0]["text"] == _grading_prefix("Grade it.", "Rubric")
+        assert content[0]["cache_control"] == {"type": "ephemeral"}
+        assert content[1] == {"type": "text", "text": "the essay"}
+        assert result["usage"]["cached_tokens"] == 1500
+
+    def test_openrouter_hints_only_anthropic_models(self):
+        usage = {"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 800}}
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+            "utils.llm_providers.requests.Session.post", return_value=_openrouter_response(usage)
+        ) as mock_post:
+            provider = OpenRouterLLMProvider()
+            result = provider.grade_document("doc", "Grade it.", model="anthropic/claude-sonnet-4")
+            provider.grade_document("doc", "Grade it.", model="openai/gpt-4o")
+
+        anthropic_user, openai_user = (call.kwargs["json"]["messages"][1] for call in mock_post.call_args_list)
+        assert anthropic_user["content"][0]["cache_control"] == {"type": "ephemeral"}
+        assert openai_user["content"] == _build_grading_prompt("doc", "Grade it.")
+        assert result["usage"]["cached_tokens"] == 800
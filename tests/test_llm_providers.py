@@ -194,7 +194,7 @@ class TestOpenRouterErrorHandling:
     """T073: Integration test for OpenRouterLLMProvider error handling"""
 
     @patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'})
-    @patch('utils.llm_providers.requests.post')
+    @patch('utils.llm_providers.requests.Session.post')
     def test_openrouter_auth_failure(self, mock_post):
         """Test OpenRouter authentication error handling"""
         import requests
@@ -206,7 +206,7 @@ class TestOpenRouterErrorHandling:
             provider.test_connection()
 
     @patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'})
-    @patch('utils.llm_providers.requests.post')
+    @patch('utils.llm_providers.requests.Session.post')
     def test_openrouter_rate_limit(self, mock_post):
         """Test OpenRouter rate limit error handling"""
         import requests
@@ -218,7 +218,7 @@ class TestOpenRouterErrorHandling:
             provider.test_connection()
 
     @patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'})
-    @patch('utils.llm_providers.requests.post')
+    @patch('utils.llm_providers.requests.Session.post')
     def test_openrouter_timeout(self, mock_post):
         """Test OpenRouter timeout error handling"""
         import requests
@@ -230,7 +230,7 @@ class TestOpenRouterErrorHandling:
             provider.test_connection()
 
     @patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'})
-    @patch('utils.llm_providers.requests.post')
+    @patch('utils.llm_providers.requests.Session.post')
     def test_openrouter_server_error(self, mock_post):
         """Test OpenRouter server error handling"""
         import requests
@@ -292,7 +292,7 @@ class TestConsistentErrorFormat:
         assert len(error_dict['remediation']) > 0
 
     @patch.dict(os.environ, {'OPENROUTER_API_KEY': 'test_key'})
-    @patch('utils.llm_providers.requests.post')
+    @patch('utils.llm_providers.requests.Session.post')
     def test_consistent_format_openrouter(self, mock_post):
         """Test error format consistency for OpenRouter"""
         import requests
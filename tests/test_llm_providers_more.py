@@ -37,7 +37,7 @@ class TestOpenRouterProvider:
     def test_generic_exception(self):
         """Test OpenRouter provider handles generic exceptions."""
         with patch.dict(os.environ, {"OPENROUTER_API_KEY": "x"}), patch(
-            "utils.llm_providers.requests.post", side_effect=Exception("boom")
+            "utils.llm_providers.requests.Session.post", side_effect=Exception("boom")
         ):
             provider = lp.OpenRouterLLMProvider()
             res = provider.grade_document("t", "p")
@@ -77,7 +77,7 @@ class TestLMStudioProvider:
     def test_connection_error(self):
         """Test LM Studio provider handles connection errors."""
         with patch(
-            "utils.llm_providers.requests.post",
+            "utils.llm_providers.requests.Session.post",
             side_effect=lp.requests.exceptions.ConnectionError(),
         ):
             provider = lp.LMStudioLLMProvider()
@@ -87,7 +87,7 @@ class TestLMStudioProvider:
     def test_non_200_code(self):
         """Test LM Studio provider handles non-200 HTTP status codes."""
         fake_resp = MagicMock(status_code=404, text="not found")
-        with patch("utils.llm_providers.requests.post", return_value=fake_resp):
+        with patch("utils.llm_providers.requests.Session.post", return_value=fake_resp):
             provider = lp.LMStudioLLMProvider()
             res = provider.grade_document("t", "p")
             assert res["success"] is False and "endpoint not found" in res["error"].lower()
@@ -95,7 +95,7 @@ class TestLMStudioProvider:
     def test_lm_studio_timeout_error(self):
         """Test LM Studio provider handles timeout errors"""
         with patch(
-            "utils.llm_providers.requests.post",
+            "utils.llm_providers.requests.Session.post",
             side_effect=lp.requests.exceptions.Timeout,
         ):
             provider = lp.LMStudioLLMProvider()
@@ -105,7 +105,7 @@ class TestLMStudioProvider:
     def test_lm_studio_connection_refused(self):
         """Test LM Studio provider handles connection refused errors"""
         with patch(
-            "utils.llm_providers.requests.post",
+            "utils.llm_providers.requests.Session.post",
             side_effect=lp.requests.exceptions.ConnectionError,
         ):
             provider = lp.LMStudioLLMProvider()
@@ -119,7 +119,7 @@ class TestOllamaProvider:
     def test_timeout(self):
         """Test Ollama provider handles timeout errors."""
         with patch(
-            "utils.llm_providers.requests.post",
+            "utils.llm_providers.requests.Session.post",
             side_effect=lp.requests.exceptions.Timeout(),
         ):
             provider = lp.OllamaLLMProvider()
@@ -131,7 +131,7 @@ class TestOllamaProvider:
         fake_json = {"response": "Grade: A", "prompt_eval_count": 10, "eval_count": 20}
         fake_resp = MagicMock(status_code=200)
         fake_resp.json.return_value = fake_json
-        with patch("utils.llm_providers.requests.post", return_value=fake_resp):
+        with patch("utils.llm_providers.requests.Session.post", return_value=fake_resp):
             provider = lp.OllamaLLMProvider()
             res = provider.grade_document("t", "p", model="llama2")
             assert res["success"] is True and res["grade"] == "Grade: A"
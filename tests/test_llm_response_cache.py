@@ -0,0 +1,162 @@
+"""
+Tests for the content-addressed LLM response cache.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from models import LLMResponseCache, Submission, db
+from services.llm_response_cache import LLMResponseCacheService
+from tasks import process_job_sync, process_submission_sync
+from tests.factories import GradingJobFactory
+
+ESSAY = "An essay worth caching."
+GRADE_KWARGS = {
+    "text": "An essay.",
+    "prompt": "Grade it.",
+    "model": "model-a",
+    "marking_scheme_content": None,
+    "temperature": 0.3,
+    "max_tokens": 2000,
+}
+
+
+def _fake_response():
+    resp = MagicMock(status_code=200, text="")
+    resp.json.return_value = {
+        "choices": [{"message": {"content": "B+"}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+    }
+    return resp
+
+
+def test_build_key_covers_every_request_field():
+    base = LLMResponseCacheService.build_key("OpenRouter", GRADE_KWARGS)
+    assert base == LLMResponseCacheService.build_key("OpenRouter", dict(GRADE_KWARGS))
+    assert len(base) == 64
+
+    for field, value in [
+        ("text", "Another essay."),
+        ("prompt", "Be strict."),
+        ("model", "model-b"),
+        ("marking_scheme_content", "Rubric"),
+        ("temperature", 0.7),
+        ("max_tokens", 500),
+    ]:
+        assert LLMResponseCacheService.build_key("OpenRouter", {**GRADE_KWARGS, field: value}) != base
+    assert LLMResponseCacheService.build_key("Claude", GRADE_KWARGS) != base
+
+
+def test_store_and_lookup_round_trip(app):
+    with app.app_context():
+        key = LLMResponseCacheService.build_key("OpenRouter", GRADE_KWARGS)
+        assert LLMResponseCacheService.lookup(key) is None
+
+        result = {"success": True, "grade": "A", "model": "model-a", "provider": "OpenRouter", "usage": {}}
+        assert LLMResponseCacheService.store(key, "OpenRouter", result) is not None
+        # A second store of the same key is a no-op
+        assert LLMResponseCacheService.store(key, "OpenRouter", result) is None
+
+        cached = LLMResponseCacheService.lookup(key)
+        db.session.commit()
+        assert cached["grade"] == "A"
+        assert cached["cache_hit"] is True
+        db.session.expire_all()
+        assert db.session.get(LLMResponseCache, key).hit_count == 1
+
+        # Failures and cache hits are never stored
+        assert LLMResponseCacheService.store("f" * 64, "OpenRouter", {"success": False, "error": "x"}) is None
+        assert LLMResponseCacheService.store("e" * 64, "OpenRouter", cached) is None
+
+
+def test_evict_removes_expired_then_least_recently_used(app):
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+        for index, (age_days, idle_hours) in enumerate([(40, 1), (1, 5), (1, 3), (1, 0)]):
+            db.session.add(
+                LLMResponseCache(
+                    cache_key=str(index) * 64,
+                    provider="OpenRouter",
+                    response={"grade": "A"},
+                    size_bytes=100,
+                    created_at=now - timedelta(days=age_days),
+                    last_accessed_at=now - timedelta(hours=idle_hours),
+                )
+            )
+        db.session.commit()
+
+        removed = LLMResponseCacheService.evict(max_age=timedelta(days=30), max_bytes=150)
+
+        assert removed == 3
+        assert [e.cache_key for e in LLMResponseCache.query.all()] == ["3" * 64]
+        assert LLMResponseCacheService.get_stats()["total_bytes"] == 100
+
+
+def test_retry_is_served_from_cache_when_job_opts_in(app):
+    with app.app_context():
+        first = GradingJobFactory.create(1, text=ESSAY, use_response_cache=True).submissions[0].id
+        second = GradingJobFactory.create(1, text=ESSAY, use_response_cache=True).submissions[0].id
+
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+        "utils.llm_providers.requests.Session.post", return_value=_fake_response()
+    ) as post:
+        assert process_submission_sync(first) is True
+        assert process_submission_sync(second) is True
+
+    assert post.call_count == 1
+    with app.app_context():
+        graded = db.session.get(Submission, first)
+        cached = db.session.get(Submission, second)
+        assert graded.grade_metadata["cache_hit"] is False
+        assert cached.grade == "B+"
+        assert cached.grade_metadata["cache_hit"] is True
+        assert cached.grade_results[0].grade_metadata["cache_hit"] is True
+        assert LLMResponseCacheService.get_stats()["total_hits"] == 1
+
+
+def test_cache_is_opt_in(app):
+    with app.app_context():
+        first = GradingJobFactory.create(1, text=ESSAY).submissions[0].id
+        second = GradingJobFactory.create(1, text=ESSAY).submissions[0].id
+
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+        "utils.llm_providers.requests.Session.post", return_value=_fake_response()
+    ) as post:
+        assert process_submission_sync(first) is True
+        assert process_submission_sync(second) is True
+
+    assert post.call_count == 2
+    with app.app_context():
+        assert LLMResponseCache.query.count() == 0
+
+
+def test_async_runner_uses_cache(app):
+    with app.app_context():
+        job = GradingJobFactory.create(1, text=ESSAY, use_response_cache=True, execution_mode="async")
+        job_id, first = job.id, job.submissions[0].id
+
+    calls = []
+
+    async def fake_post(self, url, **kwargs):
+        calls.append(url)
+        return _fake_response()
+
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+        "utils.llm_providers.httpx.AsyncClient.post", new=fake_post
+    ):
+        assert process_job_sync(job_id) is True
+        with app.app_context():
+            submission = db.session.get(Submission, first)
+            submission.status = "pending"
+            db.session.commit()
+            # The graded upload is cleaned up, so put it back for the re-run
+            with open(os.path.join(app.config["UPLOAD_FOLDER"], submission.filename), "w") as f:
+                f.write("An essay worth caching.")
+        assert process_job_sync(job_id) is True
+
+    assert len(calls) == 1
+    with app.app_context():
+        submission = db.session.get(Submission, first)
+        assert submission.status == "completed"
+        assert submission.grade_metadata["cache_hit"] is True
@@ -0,0 +1,136 @@
+"""
+Tests for load balancing local (Ollama / LM Studio) requests over several servers.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+
+from utils.llm_providers import (
+    LocalEndpointPool,
+    OllamaLLMProvider,
+    _get_provider_limit,
+    get_local_endpoint_pool,
+    local_endpoints,
+)
+
+SERVERS = "http://pc1:11434,http://pc2:11434"
+
+
+@pytest.fixture(autouse=True)
+def no_health_thread():
+    with patch.dict(os.environ, {"LOCAL_ENDPOINT_HEALTH_INTERVAL": "0"}):
+        yield
+
+
+def _response(status_code=200, payload=None):
+    response = MagicMock(status_code=status_code, text="", headers={})
+    response.json.return_value = payload or {}
+    return response
+
+
+def _pool(*urls):
+    pool = LocalEndpointPool("Ollama")
+    pool.sync(urls)
+    return pool
+
+
+def test_url_lists_and_limits():
+    with patch.dict(os.environ, {"OLLAMA_URL": "http://pc1:11434, http://pc2:11434,,http://pc1:11434"}):
+        assert local_endpoints("Ollama") == ["http://pc1:11434", "http://pc2:11434"]
+        with patch.dict(os.environ, {"PROVIDER_MAX_PARALLEL": '{"http://pc2:11434": 3}'}):
+            assert _get_provider_limit("Ollama", "http://pc1:11434") == 1
+            assert _get_provider_limit("Ollama", "http://pc2:11434") == 3
+            assert _get_provider_limit("Ollama") == 4  # the servers' limits combined
+        with patch.dict(os.environ, {"PROVIDER_ENDPOINT_MAX_OLLAMA": "2", "PROVIDER_MAX_OLLAMA": "3"}):
+            assert _get_provider_limit("Ollama", "http://pc1:11434") == 2
+            assert _get_provider_limit("Ollama") == 3  # an explicit overall cap wins
+    assert local_endpoints("LM Studio") == [os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")]
+
+
+def test_requests_go_to_the_least_loaded_server():
+    with patch.dict(os.environ, {"PROVIDER_MAX_PARALLEL": '{"http://big": 3}'}):
+        pool = _pool("http://small", "http://big")
+    picks = [pool.acquire() for _ in range(4)]
+    assert sorted(picks) == ["http://big", "http://big", "http://big", "http://small"]
+
+    pool.release("http://small", {"success": True})
+    assert pool.acquire() == "http://small"
+
+
+def test_failing_server_is_drained_and_health_check_restores_it():
+    pool = _pool("http://pc1", "http://pc2")
+    for _ in range(3):
+        pool.acquire()
+        pool.release("http://pc1", {"success": False, "error": "Could not connect to Ollama at http://pc1."})
+        pool.release("http://pc2", {"success": True})
+    assert {e["url"]: e["status"] for e in pool.get_stats()["endpoints"]}["http://pc1"] == "drained"
+    assert {pool.acquire() for _ in range(4)} == {"http://pc2"}
+
+    with patch("utils.llm_providers._http_get", return_value=_response(200)):
+        pool.check_health()
+    assert all(e["status"] == "active" for e in pool.get_stats()["endpoints"])
+
+
+def test_request_errors_do_not_drain_and_last_server_stays():
+    pool = _pool("http://pc1", "http://pc2")
+    for _ in range(5):
+        pool.release(pool.acquire(), {"success": False, "error": "Ollama API error: 400 - model not found"})
+    assert all(e["status"] == "active" for e in pool.get_stats()["endpoints"])
+
+    with patch("utils.llm_providers._http_get", side_effect=requests.exceptions.ConnectionError()):
+        pool.check_health()
+    assert [e["status"] for e in pool.get_stats()["endpoints"]].count("active") == 1
+
+
+def test_grading_spreads_over_servers_and_skips_a_dead_one():
+    hits = []
+
+    def post(provider_name, url, api_key=None, **kwargs):
+        hits.append(url)
+        if url.startswith("http://pc1"):
+            raise requests.exceptions.ConnectionError()
+        return _response(200, {"response": "Grade: A"})
+
+    with patch.dict(os.environ, {"OLLAMA_URL": SERVERS}), patch("utils.llm_providers._http_post", side_effect=post):
+        results = [OllamaLLMProvider().grade_document("essay", "grade", model="llama3") for _ in range(8)]
+        stats = get_local_endpoint_pool("Ollama").get_stats()["endpoints"]
+
+    assert hits[:6].count("http://pc1:11434/api/generate") == 3
+    assert all(url.startswith("http://pc2") for url in hits[6:])
+    assert sum(r["success"] for r in results) == 5
+    assert [(e["status"], e["in_flight"]) for e in stats] == [("drained", 0), ("active", 0)]
+
+
+def test_warm_up_and_release_reach_every_server():
+    def ps(provider_name, url, **kwargs):
+        loaded = [{"name": "llama3:latest"}] if url.startswith("http://pc2") else []
+        return _response(200, {"models": loaded})
+
+    with patch.dict(os.environ, {"OLLAMA_URL": SERVERS}), patch(
+        "utils.llm_providers._http_get", side_effect=ps
+    ), patch("utils.llm_providers._http_post", return_value=_response()) as post:
+        status = OllamaLLMProvider().warm_up("llama3")
+        assert status["success"] is True
+        assert status["resident"] is False  # pc1 still reports nothing loaded
+        assert status["was_resident"] is True  # pc2 had it, so never unload it
+        assert set(status["endpoints"]) == set(SERVERS.split(","))
+
+        assert OllamaLLMProvider().release("llama3", unload=True)["unloaded"] is True
+    assert {call.args[1] for call in post.call_args_list} == {
+        "http://pc1:11434/api/generate",
+        "http://pc2:11434/api/generate",
+    }
+
+
+def test_model_listing_falls_back_to_the_next_server():
+    def tags(provider_name, url, **kwargs):
+        if url.startswith("http://pc1"):
+            raise requests.exceptions.ConnectionError("down")
+        return _response(200, {"models": [{"name": "llama3"}]})
+
+    with patch.dict(os.environ, {"OLLAMA_URL": SERVERS}), patch("utils.llm_providers._http_get", side_effect=tags):
+        result = OllamaLLMProvider().get_available_models()
+    assert [m["id"] for m in result["models"]] == ["llama3"]
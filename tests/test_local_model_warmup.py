@@ -0,0 +1,155 @@
+"""
+Tests for warming up and releasing local Ollama / LM Studio models around a job.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import tasks
+from utils import llm_providers
+from utils.llm_providers import (
+    LMStudioLLMProvider,
+    OllamaLLMProvider,
+    hold_local_model,
+    local_keep_alive,
+    release_local_model,
+)
+
+
+def _response(status_code=200, payload=None):
+    response = MagicMock(status_code=status_code, text="", headers={})
+    response.json.return_value = payload or {}
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_holds():
+    with patch.dict(llm_providers._local_model_holds, clear=True), patch.dict(tasks._local_warmups, clear=True):
+        yield
+
+
+def test_holds_are_reference_counted():
+    assert local_keep_alive("Ollama", "llama3") is None
+    assert hold_local_model("Ollama", "llama3") is True
+    assert hold_local_model("Ollama", "llama3") is False
+    with patch.dict(os.environ, {"LOCAL_MODEL_KEEP_ALIVE": "600"}):
+        assert local_keep_alive("Ollama", "llama3") == 600
+
+    assert release_local_model("Ollama", "llama3") is False
+    assert release_local_model("Ollama", "llama3") is True
+    assert local_keep_alive("Ollama", "llama3") is None
+
+
+class TestOllama:
+    def test_warm_up_loads_and_checks_residency(self):
+        ps_before = _response(payload={"models": []})
+        ps_after = _response(payload={"models": [{"name": "llama3:latest", "model": "llama3:latest"}]})
+        with patch("utils.llm_providers._http_get", side_effect=[ps_before, ps_after]), patch(
+            "utils.llm_providers._http_post", return_value=_response()
+        ) as post:
+            status = OllamaLLMProvider().warm_up("llama3", keep_alive=900)
+
+        assert status["success"] is True
+        assert status["was_resident"] is False
+        assert status["resident"] is True
+        assert post.call_args.kwargs["json"] == {"model": "llama3", "prompt": "", "stream": False, "keep_alive": 900}
+
+    def test_grading_requests_renew_keep_alive_only_while_held(self):
+        provider = OllamaLLMProvider()
+        request = provider._build_request("essay", "grade", "llama3", None, 0.3, 100)
+        assert "keep_alive" not in request["json"]
+
+        hold_local_model("Ollama", "llama3")
+        request = provider._build_request("essay", "grade", "llama3", None, 0.3, 100)
+        assert request["json"]["keep_alive"] == 1800
+
+    def test_release_unloads_or_restores_idle_timer(self):
+        with patch("utils.llm_providers._http_post", return_value=_response()) as post:
+            assert OllamaLLMProvider().release("llama3", unload=True) == {"success": True, "unloaded": True}
+            assert post.call_args.kwargs["json"]["keep_alive"] == 0
+
+            OllamaLLMProvider().release("llama3")
+            assert "keep_alive" not in post.call_args.kwargs["json"]
+
+    def test_warm_up_connection_error(self):
+        import requests
+
+        with patch("utils.llm_providers._http_get", return_value=_response(500)), patch(
+            "utils.llm_providers._http_post", side_effect=requests.exceptions.ConnectionError()
+        ):
+            status = OllamaLLMProvider().warm_up("llama3")
+        assert status["success"] is False
+        assert "Could not connect to Ollama" in status["error"]
+
+
+class TestLMStudio:
+    def test_warm_up_sends_ttl_and_reads_rest_state(self):
+        models = _response(payload={"data": [{"id": "qwen", "state": "loaded"}]})
+        with patch.dict(os.environ, {"LM_STUDIO_URL": "http://localhost:1234/v1"}), patch(
+            "utils.llm_providers._http_get", return_value=models
+        ) as get, patch("utils.llm_providers._http_post", return_value=_response()) as post:
+            status = LMStudioLLMProvider().warm_up(keep_alive=60)
+
+        assert status["resident"] is True  # "local-model" means any loaded model
+        assert get.call_args.args[1] == "http://localhost:1234/api/v0/models"
+        assert post.call_args.kwargs["json"]["ttl"] == 60
+        assert post.call_args.kwargs["json"]["max_tokens"] == 1
+
+    def test_residency_unknown_on_older_servers(self):
+        with patch("utils.llm_providers._http_get", return_value=_response(404)):
+            assert LMStudioLLMProvider()._is_resident("http://localhost:1234/v1", "qwen") is None
+
+
+class FakeLocalProvider:
+    default_model = "local-model"
+
+    def __init__(self, was_resident=False):
+        self.was_resident = was_resident
+        self.warmed = []
+        self.released = []
+
+    def warm_up(self, model=None, keep_alive=None):
+        self.warmed.append(model)
+        return {"success": True, "warmed": True, "resident": True, "was_resident": self.was_resident, "load_seconds": 1}
+
+    def release(self, model=None, unload=False):
+        self.released.append((model, unload))
+        return {"success": True, "unloaded": unload}
+
+
+def _job(provider, models):
+    return MagicMock(provider=provider, models_to_compare=models, model=None)
+
+
+class TestJobWarmUp:
+    def test_local_job_warms_holds_and_releases(self):
+        provider = FakeLocalProvider()
+        with patch("tasks.get_llm_provider", return_value=provider):
+            with tasks._local_models_warm(_job("ollama", ["llama3", "mistral", "llama3"])):
+                assert provider.warmed == ["llama3", "mistral"]
+                assert local_keep_alive("Ollama", "mistral") == 1800
+
+        assert provider.released == [("llama3", True), ("mistral", True)]
+        assert local_keep_alive("Ollama", "llama3") is None
+
+    def test_overlapping_jobs_warm_once_and_release_last(self):
+        provider = FakeLocalProvider(was_resident=True)
+        with patch("tasks.get_llm_provider", return_value=provider):
+            with tasks._local_models_warm(_job("lm_studio", ["anything"])):
+                with tasks._local_models_warm(_job("lm_studio", ["anything"])):
+                    pass
+                assert provider.released == []
+
+        assert provider.warmed == ["local-model"]
+        assert provider.released == [("local-model", False)]  # it was already loaded
+
+    def test_hosted_providers_and_opt_out_are_skipped(self):
+        with patch("tasks.get_llm_provider") as get_provider:
+            with tasks._local_models_warm(_job("openrouter", ["m"])):
+                pass
+            with patch.dict(os.environ, {"JOB_WARM_LOCAL_MODELS": "false"}):
+                with tasks._local_models_warm(_job("ollama", ["m"])):
+                    pass
+        get_provider.assert_not_called()
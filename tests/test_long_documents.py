@@ -0,0 +1,159 @@
+"""
+Tests for map-reduce grading of documents longer than the model's context window.
+"""
+
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import tasks
+from utils import long_documents
+from utils.long_documents import (
+    combine_results,
+    estimate_tokens,
+    get_context_length,
+    plan_sections,
+    reduce_kwargs,
+    split_text,
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_catalog():
+    with patch.dict(long_documents._catalog, clear=True):
+        yield
+
+
+def _paragraphs(count, words=200):
+    return "\n\n".join(f"Paragraph {i}. " + "word " * words for i in range(count))
+
+
+class TestSplitText:
+    def test_packs_paragraphs_under_the_budget(self):
+        text = _paragraphs(10)  # ~1000 chars / 250 tokens each
+        sections = split_text(text, 600)
+        assert len(sections) == 5
+        assert all(estimate_tokens(s) <= 600 for s in sections)
+        assert sections[0].startswith("Paragraph 0.")
+        assert "Paragraph 9." in sections[-1]
+
+    def test_oversized_paragraphs_split_by_sentence_then_length(self):
+        text = "One sentence here. " * 100 + "\n\n" + "x" * 5000
+        sections = split_text(text, 100)
+        assert all(len(s) <= 400 for s in sections)
+        assert "".join(s for s in sections if s.startswith("x")) == "x" * 5000
+
+
+class TestContextLength:
+    def test_override_then_catalog(self):
+        with patch.dict(os.environ, {"JOB_CONTEXT_LENGTH_OPENROUTER": "32000"}):
+            assert get_context_length("OpenRouter", "any") == 32000
+
+        provider = MagicMock(default_model="m1")
+        provider.get_available_models.return_value = {
+            "success": True,
+            "models": [{"id": "m1", "context_length": 8192}, {"id": "m2", "context_length": 0}],
+        }
+        with patch("utils.long_documents.get_llm_provider", return_value=provider):
+            assert get_context_length("OpenRouter") == 8192
+            assert get_context_length("OpenRouter", "m2") is None
+            assert get_context_length("OpenRouter", "m1") == 8192
+        provider.get_available_models.assert_called_once()  # cached
+
+
+class TestPlanSections:
+    KWARGS = {"prompt": "Grade this thesis.", "max_tokens": 1000, "model": "m"}
+
+    def test_short_documents_are_not_split(self):
+        with patch("utils.long_documents.get_context_length") as lookup:
+            assert plan_sections("OpenRouter", {**self.KWARGS, "text": "short essay"}) is None
+        lookup.assert_not_called()
+
+        with patch.dict(os.environ, {"JOB_CONTEXT_LENGTH": "1000000"}):
+            assert plan_sections("OpenRouter", {**self.KWARGS, "text": _paragraphs(200)}) is None
+
+    def test_long_documents_become_sections_that_fit(self):
+        text = _paragraphs(200)  # ~50k tokens
+        with patch.dict(os.environ, {"JOB_CONTEXT_LENGTH": "16000"}):
+            sections = plan_sections("OpenRouter", {**self.KWARGS, "text": text})
+
+        assert len(sections) > 3
+        assert sections[0]["text"].startswith(f"[Section 1 of {len(sections)}]")
+        assert all(s["prompt"] == sections[0]["prompt"] for s in sections)  # shared, cacheable prefix
+        assert all(estimate_tokens(s["text"]) + s["max_tokens"] < 16000 for s in sections)
+        # Every section answer fits in the reduce request together
+        assert sum(s["max_tokens"] for s in sections) + 1000 < 16000 * 0.85
+
+    def test_prompt_too_big_for_context(self):
+        with patch.dict(os.environ, {"JOB_CONTEXT_LENGTH": "1500"}):
+            with pytest.raises(ValueError):
+                plan_sections("OpenRouter", {**self.KWARGS, "text": _paragraphs(200)})
+
+
+def test_reduce_and_combine():
+    sections = [{"text": "a" * 400}, {"text": "b" * 800}]
+    section_results = [
+        {"success": True, "grade": "Strong opening", "usage": {"prompt_tokens": 100, "completion_tokens": 10}},
+        {"success": True, "grade": "Weak ending", "usage": {"prompt_tokens": 200, "completion_tokens": 20}},
+    ]
+    kwargs = reduce_kwargs({"prompt": "Grade.", "text": "original"}, section_results)
+    assert "## Section 2 of 2\n\nWeak ending" in kwargs["text"]
+    assert kwargs["prompt"].startswith("Grade.")
+
+    final = combine_results(
+        {"success": True, "grade": "B+", "usage": {"prompt_tokens": 50, "completion_tokens": 5}},
+        sections,
+        section_results,
+    )
+    assert final["grade"] == "B+"
+    assert final["usage"] == {"prompt_tokens": 350, "completion_tokens": 35}
+    assert [c["estimated_tokens"] for c in final["chunks"]] == [100, 200]
+    assert final["chunks"][0]["grade"] == "Strong opening"
+
+
+class RecordingProvider:
+    def __init__(self, fail_section=None):
+        self.texts = []
+        self.fail_section = fail_section
+
+    def grade_document(self, text, prompt, **kwargs):
+        self.texts.append(text)
+        if self.fail_section and text.startswith(f"[Section {self.fail_section} of"):
+            return {"success": False, "error": "Model produced an empty answer", "provider": "OpenRouter"}
+        grade = "FINAL" if text.startswith("## Section") else f"notes on {text[:14]}"
+        return {"success": True, "grade": grade, "model": "m", "provider": "OpenRouter", "usage": {"total_tokens": 1}}
+
+    async def agrade_document(self, text, prompt, **kwargs):
+        return self.grade_document(text, prompt, **kwargs)
+
+
+@pytest.fixture
+def long_kwargs():
+    with patch.dict(os.environ, {"JOB_CONTEXT_LENGTH": "16000", "PROVIDER_RETRY_ATTEMPTS": "1"}):
+        yield {"text": _paragraphs(200), "prompt": "Grade.", "max_tokens": 1000, "model": "m"}
+
+
+def test_threaded_map_reduce(long_kwargs):
+    provider = RecordingProvider()
+    with patch("tasks.get_llm_provider", return_value=provider):
+        result = tasks._grade_with_kwargs("openrouter", long_kwargs)
+
+    assert result["success"] is True
+    assert result["grade"] == "FINAL"
+    sections = len(result["chunks"])
+    assert len(provider.texts) == sections + 1
+    assert result["usage"] == {"total_tokens": sections + 1}
+    assert all(c["success"] for c in result["chunks"])
+
+
+def test_async_map_reduce_fails_when_a_section_fails(long_kwargs):
+    provider = RecordingProvider(fail_section=2)
+    with patch("tasks.get_llm_provider", return_value=provider):
+        result = asyncio.run(tasks._agrade_with_kwargs("openrouter", long_kwargs))
+
+    assert result["success"] is False
+    assert result["error"].startswith("Section 2 of")
+    assert result["chunks"][1]["success"] is False
+    assert not any(t.startswith("## Section") for t in provider.texts)  # no reduce request
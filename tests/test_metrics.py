@@ -0,0 +1,134 @@
+"""
+Tests for the Prometheus metrics and the /metrics endpoint.
+"""
+
+import os
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+from desktop.task_queue import DesktopTaskQueue
+from models import GradingJob, Submission, db
+from utils import metrics
+from utils.llm_providers import provider_semaphore
+from utils.text_extraction import extract_text_by_file_type
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_provider_requests_record_latency_and_tokens():
+    labels = {"provider": "MetricsTest", "model": "m"}
+    before = _sample("grading_provider_request_seconds_count", outcome="success", **labels)
+
+    with provider_semaphore("MetricsTest", "m") as slot:
+        slot.record({"success": True, "usage": {"prompt_tokens": 120, "completion_tokens": 30}})
+    with provider_semaphore("MetricsTest", "m") as slot:
+        slot.record({"success": True, "usage": {"input_tokens": 10, "output_tokens": 5}})
+    with provider_semaphore("MetricsTest", "m") as slot:
+        slot.record({"success": False, "error": "boom"})
+
+    assert _sample("grading_provider_request_seconds_count", outcome="success", **labels) == before + 2
+    assert _sample("grading_provider_request_seconds_count", outcome="error", **labels) >= 1
+    assert _sample("grading_provider_tokens_total", direction="input", **labels) >= 130
+    assert _sample("grading_provider_tokens_total", direction="output", **labels) >= 35
+    assert _sample("grading_provider_semaphore_wait_seconds_count", provider="MetricsTest") >= 3
+
+
+def test_text_extraction_is_timed_by_file_type(tmp_path):
+    path = tmp_path / "essay.txt"
+    path.write_text("An essay.")
+    before = _sample("grading_text_extraction_seconds_count", file_type="txt")
+
+    assert extract_text_by_file_type(str(path), "txt") == "An essay."
+
+    assert _sample("grading_text_extraction_seconds_count", file_type="txt") == before + 1
+
+
+def test_task_queue_depth_follows_task_state():
+    queue = DesktopTaskQueue(max_workers=1)
+    try:
+        pending_before = _sample("grading_task_queue_depth", state="pending")
+        running_before = _sample("grading_task_queue_depth", state="running")
+        task_id = queue.submit(lambda: "done", countdown=0, max_retries=0)
+        assert queue.wait_for_task(task_id, timeout=5) == "done"
+    finally:
+        queue.shutdown(wait=True, timeout=5)
+
+    assert _sample("grading_task_queue_depth", state="pending") == pending_before
+    assert _sample("grading_task_queue_depth", state="running") == running_before
+
+
+def test_submission_outcomes_and_commits_are_counted(app):
+    with app.app_context():
+        job = GradingJob(job_name="Metrics Job", provider="openrouter", prompt="p")
+        db.session.add(job)
+        db.session.commit()
+        submission = Submission(job_id=job.id, filename="a.txt", original_filename="a.txt", file_type="txt")
+        db.session.add(submission)
+        db.session.commit()
+
+        failed = _sample("grading_submissions_total", status="failed")
+        commits = _sample("grading_db_commit_seconds_count")
+
+        submission.set_status("failed", "bad file")
+        submission.set_status("failed", "still bad")  # no change, not counted again
+
+        assert _sample("grading_submissions_total", status="failed") == failed + 1
+        assert _sample("grading_db_commit_seconds_count") >= commits + 2
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"grading_provider_request_seconds" in response.data
+
+
+def test_metrics_are_merged_across_processes(client, tmp_path):
+    key = mmap_key("grading_submissions", "grading_submissions_total", ["status"], ["completed"], "")
+    for pid, count in ((101, 3), (102, 4)):  # two workers' sample files
+        samples = MmapedDict(str(tmp_path / f"counter_{pid}.db"))
+        samples.write_value(key, count, 0)
+        samples.close()
+
+    with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}):
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert b'grading_submissions_total{status="completed"} 7.0' in response.data
+
+
+def test_endpoint_without_prometheus_client(client):
+    with patch.object(metrics, "PROMETHEUS_AVAILABLE", False):
+        response = client.get("/metrics")
+    assert response.status_code == 501
+
+
+def test_metrics_need_a_token_in_multi_user_mode(client, monkeypatch):
+    from services.deployment_service import DeploymentService
+
+    monkeypatch.setattr(DeploymentService, "is_single_user_mode", lambda: False)
+    monkeypatch.delenv("METRICS_PUBLIC", raising=False)
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+
+    monkeypatch.delenv("METRICS_TOKEN")
+    assert client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 401
+
+
+def test_metrics_public_flag_opens_the_endpoint(client, monkeypatch):
+    from services.deployment_service import DeploymentService
+
+    monkeypatch.setattr(DeploymentService, "is_single_user_mode", lambda: False)
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    monkeypatch.setenv("METRICS_PUBLIC", "true")
+
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,146 @@
+"""
+Tests for the shared, stale-while-revalidate model catalog.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from models import ModelCatalogEntry, db
+from services.model_catalog import ModelCatalogService
+
+
+class ListingProvider:
+    """Provider double whose model listing can be made slow or failing."""
+
+    def __init__(self, models=None, delay=0, error=None):
+        self.models = models if models is not None else [{"id": "m1"}, {"id": "m2"}]
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def get_available_models(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            return {"success": False, "error": self.error}
+        return {"success": True, "models": self.models}
+
+
+def _age(provider, seconds):
+    entry = db.session.get(ModelCatalogEntry, provider)
+    past = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+    entry.checked_at = past
+    entry.fetched_at = past
+    db.session.commit()
+
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        yield
+    ModelCatalogService._refreshing.clear()
+
+
+def test_missing_listing_is_fetched_once_then_served_from_the_catalog(catalog):
+    provider = ListingProvider()
+    with patch("services.model_catalog.get_llm_provider", return_value=provider):
+        assert ModelCatalogService.get_models("openai") == [{"id": "m1"}, {"id": "m2"}]
+        assert ModelCatalogService.get_models("openai") == [{"id": "m1"}, {"id": "m2"}]
+    assert provider.calls == 1
+
+
+def test_unknown_provider_raises(catalog):
+    with pytest.raises(ValueError):
+        ModelCatalogService.get_models("not-a-provider")
+    ModelCatalogService.prefetch(["not-a-provider"])  # skipped when not strict
+
+
+def test_stale_listing_is_served_while_refreshing_in_background(app, catalog):
+    with patch("services.model_catalog.get_llm_provider", return_value=ListingProvider()):
+        ModelCatalogService.get_models("claude")
+    _age("claude", 600)
+
+    slow = ListingProvider(models=[{"id": "new"}], delay=0.3)
+    with patch("services.model_catalog.get_llm_provider", return_value=slow):
+        started = time.monotonic()
+        assert ModelCatalogService.get_models("claude") == [{"id": "m1"}, {"id": "m2"}]
+        assert time.monotonic() - started < 0.25
+        # A second stale read does not start another refresh
+        ModelCatalogService.get_models("claude")
+
+        deadline = time.monotonic() + 5
+        while ModelCatalogService._refreshing and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    assert slow.calls == 1
+    db.session.expire_all()
+    assert ModelCatalogService.get_models("claude") == [{"id": "new"}]
+
+
+def test_failed_refresh_keeps_last_good_listing(catalog):
+    with patch("services.model_catalog.get_llm_provider", return_value=ListingProvider()):
+        ModelCatalogService.get_models("gemini")
+
+    with patch("services.model_catalog.get_llm_provider", return_value=ListingProvider(error="503")):
+        ModelCatalogService.store("gemini", *ModelCatalogService.fetch("gemini"))
+
+    entry = db.session.get(ModelCatalogEntry, "gemini")
+    assert entry.error == "503"
+    assert entry.models == [{"id": "m1"}, {"id": "m2"}]
+
+
+def test_unlistable_provider_is_retried_after_the_error_ttl(catalog):
+    failing = ListingProvider(error="Connection refused")
+    with patch("services.model_catalog.get_llm_provider", return_value=failing):
+        assert ModelCatalogService.get_models("ollama") is None
+        assert ModelCatalogService.get_models("ollama") is None
+        assert failing.calls == 1
+
+        _age("ollama", 120)
+        ModelCatalogService.get_models("ollama")
+        assert failing.calls == 2
+
+
+def test_background_refresh_is_claimed_by_one_worker(catalog):
+    with patch("services.model_catalog.get_llm_provider", return_value=ListingProvider()):
+        ModelCatalogService.get_models("openrouter")
+
+    assert ModelCatalogService._claim("openrouter") is True
+    assert ModelCatalogService._claim("openrouter") is False  # another worker holds it
+
+
+def test_prefetch_fetches_missing_providers_concurrently(catalog):
+    calls = []
+    barrier = threading.Barrier(3, timeout=2)
+
+    def provider_for(name):
+        provider = MagicMock()
+
+        def listing():
+            calls.append(name)
+            barrier.wait()  # only passes if all three fetch at once
+            return {"success": True, "models": [{"id": name}]}
+
+        provider.get_available_models.side_effect = listing
+        return provider
+
+    with patch("services.model_catalog.get_llm_provider", side_effect=provider_for):
+        ModelCatalogService.prefetch(["openai", "claude", "chutes"])
+
+    assert sorted(calls) == ["Chutes", "Claude", "OpenAI"]
+    assert ModelCatalogService.get_models("chutes") == [{"id": "Chutes"}]
+
+
+def test_models_endpoint_uses_the_catalog(client, app):
+    provider = ListingProvider(models=[{"id": "gpt-x"}])
+    with patch("services.model_catalog.get_llm_provider", return_value=provider):
+        first = client.get("/api/models/openai").get_json()
+        second = client.get("/api/models/openai").get_json()
+
+    assert first == second
+    assert first["popular"] == ["gpt-x"]
+    assert provider.calls == 1
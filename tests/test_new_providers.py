@@ -39,7 +39,7 @@ class TestNewProviders:
             assert "glm-4.5" in model_ids
             assert "glm-4.5-air" in model_ids
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_zai_coding_plan_provider_grade_success(self, mock_requests_post, app):
         """Test successful grading with Z.AI Coding Plan provider."""
         mock_response = MagicMock()
@@ -79,7 +79,7 @@ class TestNewProviders:
                 assert "authentication" in result["error"].lower()
                 assert "coding plan" in result["error"].lower()
 
-    @patch("utils.llm_providers.requests.get")
+    @patch("utils.llm_providers.requests.Session.get")
     def test_chutes_provider_get_available_models_success(self, mock_requests_get, app):
         """Test successful models fetch from Chutes provider."""
         mock_response = MagicMock()
@@ -106,7 +106,7 @@ class TestNewProviders:
                 assert len(result["models"]) == 1
                 assert result["models"][0]["id"] == "microsoft/DialoGPT-medium"
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_chutes_provider_grade_success(self, mock_requests_post, app):
         """Test successful grading with Chutes provider."""
         mock_response = MagicMock()
@@ -157,7 +157,7 @@ class TestNewProviders:
             assert "glm-4.6" in model_ids
             assert "glm-4.5" in model_ids
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_zai_provider_grade_success(self, mock_requests_post, app):
         """Test successful grading with Z.AI provider."""
         mock_response = MagicMock()
@@ -196,7 +196,7 @@ class TestNewProviders:
                 assert "error" in result
                 assert "authentication" in result["error"].lower()
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_zai_coding_plan_provider_auth_error(self, mock_requests_post, app):
         """Test Z.AI Coding Plan provider authentication error."""
         mock_response = MagicMock()
@@ -214,7 +214,7 @@ class TestNewProviders:
                 assert "401" in result["error"]
                 assert "Z.AI Coding Plan" in result["provider"]
 
-    @patch("utils.llm_providers.requests.get")
+    @patch("utils.llm_providers.requests.Session.get")
     def test_nanogpt_provider_get_available_models_success(self, mock_requests_get, app):
         """Test successful models fetch from NanoGPT provider."""
         mock_response = MagicMock()
@@ -241,7 +241,7 @@ class TestNewProviders:
                 assert len(result["models"]) == 1
                 assert result["models"][0]["id"] == "chatgpt-4o-latest"
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_nanogpt_provider_grade_success(self, mock_requests_post, app):
         """Test successful grading with NanoGPT provider."""
         mock_response = MagicMock()
@@ -0,0 +1,246 @@
+"""
+Tests for provider call retries, Retry-After handling and circuit breakers.
+"""
+
+import asyncio
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from utils.llm_providers import (
+    CircuitBreaker,
+    RetryPolicy,
+    _attach_retry_after,
+    agrade_with_retries,
+    get_circuit_breaker,
+    get_circuit_breaker_stats,
+    grade_with_retries,
+    parse_retry_after,
+)
+
+OK = {"success": True, "grade": "A"}
+RATE_LIMITED = {"success": False, "error": "OpenRouter API error: 429 - Too Many Requests"}
+OVERLOADED = {"success": False, "error": "LM Studio API error: 503 - unavailable"}
+AUTH = {"success": False, "error": "Claude API authentication failed. Please check your API key."}
+
+
+def _provider(*results):
+    provider = MagicMock()
+    provider.grade_document.side_effect = [dict(r) for r in results]
+    provider.agrade_document = AsyncMock(side_effect=[dict(r) for r in results])
+    return provider
+
+
+class TestRetryAfter:
+    def test_parse_seconds_and_http_dates(self):
+        assert parse_retry_after("7") == 7.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # in the past
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+
+    def test_attached_to_failures_only(self):
+        headers = {"retry-after": "3"}
+        assert _attach_retry_after(dict(RATE_LIMITED), headers)["retry_after"] == 3.0
+        assert _attach_retry_after({"success": False, "error": "x"}, {"retry-after-ms": "250"})["retry_after"] == 0.25
+        assert "retry_after" not in _attach_retry_after(dict(OK), headers)
+        assert "retry_after" not in _attach_retry_after(dict(RATE_LIMITED), None)
+
+    def test_http_provider_reads_response_header(self):
+        from utils.llm_providers import OpenRouterLLMProvider
+
+        response = MagicMock(status_code=429, text="slow down", headers={"retry-after": "12"})
+        response.json.return_value = {"error": "slow down"}
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "sk-or-test"}), patch(
+            "utils.llm_providers._http_post", return_value=response
+        ):
+            result = OpenRouterLLMProvider().grade_document("essay", "grade it", model="m")
+
+        assert result["success"] is False
+        assert result["retry_after"] == 12.0
+
+
+class TestRetryPolicy:
+    def test_only_transient_errors_are_retried(self):
+        policy = RetryPolicy(attempts=3)
+        assert policy.should_retry(RATE_LIMITED, 1)
+        assert policy.should_retry(OVERLOADED, 2)
+        assert not policy.should_retry(OVERLOADED, 3)
+        assert not policy.should_retry(AUTH, 1)
+        assert not policy.should_retry(OK, 1)
+
+    def test_full_jitter_backoff_and_retry_after(self):
+        policy = RetryPolicy(attempts=5, base_delay=2, max_delay=5)
+        with patch("utils.llm_providers.random.uniform", side_effect=lambda lo, hi: hi):
+            assert policy.delay(RATE_LIMITED, 1) == 2
+            assert policy.delay(RATE_LIMITED, 3) == 5  # capped
+            assert policy.delay({**RATE_LIMITED, "retry_after": 4}, 1) == 4.5
+            assert policy.delay({**RATE_LIMITED, "retry_after": 600}, 1) == 5.5
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures_then_probes(self):
+        breaker = CircuitBreaker("P", "m", threshold=2, cooldown=30)
+        breaker.record(OVERLOADED)
+        breaker.record(AUTH)  # not a provider-health signal
+        assert breaker.state == "closed"
+        breaker.record(OVERLOADED)
+        assert breaker.state == "open"
+        assert 29 < breaker.wait_time() <= 30
+
+        breaker._open_until = 0
+        assert breaker.wait_time() == 0  # this caller is the half-open probe
+        assert breaker.state == "half_open"
+        assert breaker.wait_time() > 0  # others wait for the probe
+
+        breaker.record(OVERLOADED)
+        assert breaker.state == "open"
+        assert breaker.opened == 2
+
+        breaker._open_until = 0
+        assert breaker.wait_time() == 0
+        breaker.record(OK)
+        assert breaker.state == "closed"
+        assert breaker.consecutive_failures == 0
+
+    def test_retry_after_extends_the_cooldown(self):
+        breaker = CircuitBreaker("P", threshold=1, cooldown=1)
+        breaker.record(RATE_LIMITED, retry_after=120)
+        assert breaker.wait_time() > 100
+
+    def test_threshold_zero_disables(self):
+        with patch.dict(os.environ, {"PROVIDER_BREAKER_THRESHOLD_NOBREAKER": "0"}):
+            assert get_circuit_breaker("NoBreaker") is None
+
+
+@pytest.fixture
+def fast_retries():
+    env = {"PROVIDER_RETRY_BASE_DELAY": "0", "PROVIDER_BREAKER_THRESHOLD": "3", "PROVIDER_BREAKER_COOLDOWN": "0.05"}
+    with patch.dict(os.environ, env):
+        yield
+
+
+class TestGradeWithRetries:
+    def test_retries_transient_failures_until_success(self, fast_retries):
+        provider = _provider(RATE_LIMITED, OVERLOADED, OK)
+
+        result = grade_with_retries(provider, "RetryTest", {"text": "t", "prompt": "p", "model": "m"})
+
+        assert result["success"] is True
+        assert result["attempts"] == 3
+        assert provider.grade_document.call_count == 3
+
+    def test_gives_up_after_attempts_and_fails_fast_on_auth(self, fast_retries):
+        provider = _provider(OVERLOADED, OVERLOADED)
+        with patch.dict(os.environ, {"PROVIDER_RETRY_ATTEMPTS": "2"}):
+            result = grade_with_retries(provider, "RetryGiveUp", {"text": "t", "prompt": "p"})
+        assert result["success"] is False
+        assert result["attempts"] == 2
+
+        provider = _provider(AUTH)
+        result = grade_with_retries(provider, "RetryAuth", {"text": "t", "prompt": "p"})
+        assert provider.grade_document.call_count == 1
+        assert "attempts" not in result
+
+    def test_sleeps_for_retry_after(self, fast_retries):
+        provider = _provider({**RATE_LIMITED, "retry_after": 7}, OK)
+        sleeps = []
+        with patch("utils.llm_providers.time.sleep", side_effect=sleeps.append):
+            grade_with_retries(provider, "RetryAfterTest", {"text": "t", "prompt": "p"})
+        assert 7 <= sleeps[-1] < 7.5
+
+    def test_open_breaker_holds_work_until_cooldown(self, fast_retries):
+        breaker = get_circuit_breaker("BreakerTest", "m")
+        for _ in range(3):
+            breaker.record(OVERLOADED)
+        assert breaker.state == "open"
+
+        provider = _provider(OK)
+        result = grade_with_retries(provider, "BreakerTest", {"text": "t", "prompt": "p", "model": "m"})
+
+        assert result["success"] is True
+        assert breaker.state == "closed"
+        stats = {(s["provider"], s["model"]): s for s in get_circuit_breaker_stats()}
+        assert stats[("BreakerTest", "m")]["opened"] == 1
+
+    def test_open_breaker_past_deadline_fails_without_calling(self, fast_retries):
+        breaker = get_circuit_breaker("BreakerDeadline")
+        breaker.record(RATE_LIMITED)
+        breaker.record(RATE_LIMITED)
+        breaker.record(RATE_LIMITED, retry_after=3600)
+        provider = _provider(OK)
+
+        with patch.dict(os.environ, {"PROVIDER_SEMAPHORE_TIMEOUT": "1"}):
+            result = grade_with_retries(provider, "BreakerDeadline", {"text": "t", "prompt": "p"})
+
+        assert result["success"] is False
+        assert "Circuit breaker open" in result["error"]
+        provider.grade_document.assert_not_called()
+
+    def test_async_retries(self, fast_retries):
+        provider = _provider(RATE_LIMITED, OK)
+
+        result = asyncio.run(agrade_with_retries(provider, "AsyncRetryTest", {"text": "t", "prompt": "p"}))
+
+        assert result["success"] is True
+        assert result["attempts"] == 2
+
+
+class TestHalfOpenProbeRelease:
+    """A probe that leaves without a result must let the next caller probe."""
+
+    @staticmethod
+    def _half_open(name):
+        breaker = get_circuit_breaker(name)
+        for _ in range(3):
+            breaker.record(OVERLOADED)
+        breaker._open_until = 0
+        return breaker
+
+    def test_probe_that_raises_is_released(self, fast_retries):
+        breaker = self._half_open("ProbeRaises")
+        provider = MagicMock()
+        provider.grade_document.side_effect = RuntimeError("connection reset")
+
+        with pytest.raises(RuntimeError):
+            grade_with_retries(provider, "ProbeRaises", {"text": "t", "prompt": "p"})
+
+        assert breaker.state == "half_open"
+        assert breaker.admit() == (0.0, True)
+
+    def test_cancelled_caller_never_takes_the_probe(self, fast_retries):
+        import threading
+
+        breaker = self._half_open("ProbeCancelled")
+        cancelled = threading.Event()
+        cancelled.set()
+        provider = _provider(OK)
+
+        result = grade_with_retries(provider, "ProbeCancelled", {"text": "t", "prompt": "p"}, cancelled)
+
+        assert result["cancelled"] is True
+        provider.grade_document.assert_not_called()
+        assert breaker.admit() == (0.0, True)
+
+    def test_cancelled_async_probe_is_released(self, fast_retries):
+        breaker = self._half_open("ProbeAsyncCancelled")
+        provider = MagicMock()
+
+        async def hang(**kwargs):
+            await asyncio.sleep(60)
+
+        provider.agrade_document = hang
+
+        async def run():
+            task = asyncio.create_task(
+                agrade_with_retries(provider, "ProbeAsyncCancelled", {"text": "t", "prompt": "p"})
+            )
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+
+        assert breaker.state == "half_open"
+        assert breaker.admit() == (0.0, True)
@@ -0,0 +1,163 @@
+"""
+Tests for RPM/TPM token-bucket pacing of provider requests.
+"""
+
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from utils import llm_providers
+from utils.llm_providers import (
+    ProviderRateLimiter,
+    RedisTokenBucket,
+    TokenBucket,
+    async_provider_semaphore,
+    estimate_request_tokens,
+    get_rate_limit_stats,
+    get_rate_limiter,
+    provider_semaphore,
+)
+
+
+@pytest.fixture
+def clean_limiters():
+    with patch.dict(llm_providers._rate_limiters, clear=True), patch(
+        "utils.llm_providers._shared_redis_client", return_value=None
+    ):
+        yield
+
+
+class TestTokenBucket:
+    def test_takes_tokens_then_reports_wait(self):
+        bucket = TokenBucket("t", per_minute=60)  # one token per second
+        assert bucket.try_acquire(60) == 0
+        wait = bucket.try_acquire(2)
+        assert 1.5 < wait <= 2.0
+
+    def test_oversized_request_is_capped_at_capacity(self):
+        bucket = TokenBucket("t", per_minute=100)
+        assert bucket.try_acquire(1000) == 0
+        assert bucket.available() < 1
+
+    def test_adjust_refunds_and_charges(self):
+        bucket = TokenBucket("t", per_minute=100)
+        bucket.try_acquire(80)
+        bucket.adjust(-50)
+        assert 69 < bucket.available() <= 71
+        bucket.adjust(200)
+        assert bucket.available() < 0  # in debt until refilled
+        bucket.adjust(-1000)
+        assert bucket.available() == 100  # never above capacity
+
+
+class TestProviderRateLimiter:
+    def test_rpm_paces_requests(self):
+        limiter = ProviderRateLimiter("P", rpm=60)
+        sleeps = []
+        with patch("utils.llm_providers.time.sleep", side_effect=sleeps.append), patch.object(
+            limiter.requests, "try_acquire", side_effect=[0.7, 0.0]
+        ):
+            limiter.acquire(0)
+        assert sleeps == [0.7]
+        assert limiter.waited_seconds == pytest.approx(0.7)
+
+    def test_tpm_wait_hands_back_request_slot(self):
+        limiter = ProviderRateLimiter("P", rpm=10, tpm=100)
+        limiter.tokens.try_acquire(100)
+        before = limiter.requests.available()
+        assert limiter._try_acquire(50) > 0
+        assert limiter.requests.available() == pytest.approx(before, abs=0.01)
+
+    def test_reconcile_against_usage(self):
+        limiter = ProviderRateLimiter("P", tpm=10000)
+        limiter.acquire(3000)
+        limiter.reconcile(3000, {"success": True, "usage": {"input_tokens": 800, "output_tokens": 200}})
+        assert limiter.tokens.available() == pytest.approx(9000, abs=5)
+
+        limiter.acquire(3000)
+        limiter.reconcile(3000, {"success": False, "error": "429"})
+        assert limiter.tokens.available() == pytest.approx(9000, abs=5)
+
+    def test_timeout_when_wait_exceeds_deadline(self):
+        limiter = ProviderRateLimiter("P", tpm=60)
+        limiter.acquire(60)
+        with pytest.raises(TimeoutError):
+            limiter.acquire(60, timeout=1)
+
+    def test_async_acquire_sleeps_on_the_loop(self):
+        limiter = ProviderRateLimiter("P", rpm=600)
+        limiter.requests.tokens = 0.0
+        limiter.requests._updated = llm_providers.time.monotonic()
+
+        asyncio.run(limiter.aacquire(0, timeout=5))
+
+        assert 0 < limiter.waited_seconds <= 0.1
+
+
+class TestRedisTokenBucket:
+    def test_uses_atomic_scripts(self):
+        acquire_script = MagicMock(return_value="1.5")
+        adjust_script = MagicMock(return_value="42")
+        client = MagicMock()
+        client.register_script.side_effect = [acquire_script, adjust_script]
+
+        bucket = RedisTokenBucket(client, "Claude:tpm", 600)
+
+        assert bucket.try_acquire(20) == 1.5
+        acquire_script.assert_called_once_with(keys=["ratelimit:Claude:tpm"], args=[600.0, 10.0, 20.0])
+        bucket.adjust(-5)
+        adjust_script.assert_called_with(keys=["ratelimit:Claude:tpm"], args=[600.0, 10.0, -5.0])
+        assert bucket.available() == 42
+
+    def test_redis_errors_admit_requests(self):
+        client = MagicMock()
+        client.register_script.return_value = MagicMock(side_effect=ConnectionError("down"))
+        bucket = RedisTokenBucket(client, "x", 10)
+        assert bucket.try_acquire(5) == 0.0
+
+
+class TestSemaphoreIntegration:
+    def test_unconfigured_providers_have_no_limiter(self, clean_limiters):
+        assert get_rate_limiter("RateTestNone") is None
+
+    def test_semaphore_charges_and_reconciles(self, clean_limiters):
+        with patch.dict(os.environ, {"PROVIDER_TPM_RATETEST": "50000", "PROVIDER_RPM_RATETEST": "100"}):
+            with provider_semaphore("RateTest", "m", estimated_tokens=4000) as slot:
+                slot.record({"success": True, "usage": {"total_tokens": 1000}})
+
+            async def run():
+                async with async_provider_semaphore("RateTest", "m", estimated_tokens=2000) as slot:
+                    slot.record({"success": True, "usage": {"prompt_tokens": 400, "completion_tokens": 100}})
+
+            asyncio.run(run())
+
+        stats = get_rate_limit_stats()
+        assert stats[0]["tpm"] == 50000
+        assert stats[0]["tokens_available"] == pytest.approx(48500, abs=50)
+        assert stats[0]["requests_available"] == pytest.approx(98, abs=0.1)
+
+    def test_timed_out_slot_refunds_the_charge(self, clean_limiters):
+        busy = MagicMock()
+        busy.acquire.return_value = False
+        with patch.dict(os.environ, {"PROVIDER_TPM_RATETEST": "50000", "PROVIDER_RPM_RATETEST": "100"}), patch(
+            "utils.llm_providers._get_or_create_semaphore", return_value=busy
+        ):
+            with pytest.raises(TimeoutError):
+                with provider_semaphore("RateTest", "m", estimated_tokens=4000):
+                    pass
+
+            async def run():
+                async with async_provider_semaphore("RateTest", "m", estimated_tokens=2000):
+                    pass
+
+            with pytest.raises(TimeoutError):
+                asyncio.run(run())
+
+        assert get_rate_limit_stats()[0]["tokens_available"] == pytest.approx(50000, abs=50)
+
+
+def test_estimate_includes_completion_budget():
+    estimate = estimate_request_tokens({"prompt": "p" * 400, "text": "t" * 4000, "max_tokens": 2000})
+    assert 3100 <= estimate <= 3200
@@ -0,0 +1,140 @@
+"""
+Tests for the lease-based Redis semaphore and semaphore wait-time stats.
+"""
+
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from utils import llm_providers
+from utils.llm_providers import (
+    RedisSemaphore,
+    WaitTimeHistogram,
+    get_semaphore_stats,
+    provider_semaphore,
+)
+
+
+_real_heartbeat_loop = RedisSemaphore._heartbeat_loop.__func__
+
+
+def _semaphore(acquire_results, release_result=1, renew_result=1, lease_seconds=30):
+    acquire_script = MagicMock(side_effect=list(acquire_results))
+    release_script = MagicMock(return_value=release_result)
+    renew_script = MagicMock(return_value=renew_result)
+    client = MagicMock()
+    client.register_script.side_effect = [acquire_script, release_script, renew_script]
+    sem = RedisSemaphore(client, "Claude", 2, lease_seconds=lease_seconds)
+    return sem, client, acquire_script, release_script, renew_script
+
+
+@pytest.fixture(autouse=True)
+def no_heartbeat_thread():
+    with patch.object(RedisSemaphore, "_heartbeat_loop"), patch.dict(RedisSemaphore._heartbeat_leases, clear=True):
+        yield
+
+
+class TestRedisSemaphore:
+    def test_free_slot_returns_a_tracked_lease(self):
+        sem, client, acquire_script, _, _ = _semaphore([-1])
+
+        lease = sem.acquire(timeout=1)
+
+        assert lease
+        acquire_script.assert_called_once_with(keys=["semaphore:Claude:holders"], args=[2, lease, 30000])
+        assert RedisSemaphore._heartbeat_leases[lease] is sem
+        client.blpop.assert_not_called()
+
+    def test_waits_on_wake_list_until_a_slot_frees(self):
+        # Full with the oldest lease 200ms from expiry, then a release wakes us
+        sem, client, _, _, _ = _semaphore([200, -1])
+
+        assert sem.acquire(timeout=5)
+
+        client.blpop.assert_called_once()
+        keys = client.blpop.call_args.args[0]
+        assert keys == ["semaphore:Claude:wake"]
+        assert client.blpop.call_args.kwargs["timeout"] == pytest.approx(0.2)
+
+    def test_timeout_and_redis_errors_return_none(self):
+        sem, client, _, _, _ = _semaphore([60000] * 10)
+        client.blpop.side_effect = lambda keys, timeout: None
+        assert sem.acquire(timeout=0) is None
+
+        sem, client, acquire_script, _, _ = _semaphore([])
+        acquire_script.side_effect = ConnectionError("down")
+        assert sem.acquire(timeout=1) is None
+
+    def test_release_drops_lease_and_wakes_a_waiter(self):
+        sem, _, _, release_script, _ = _semaphore([-1])
+        lease = sem.acquire(timeout=1)
+
+        assert sem.release(lease) is True
+
+        release_script.assert_called_once_with(
+            keys=["semaphore:Claude:holders", "semaphore:Claude:wake"], args=[lease, 2, 30000]
+        )
+        assert lease not in RedisSemaphore._heartbeat_leases
+
+    def test_renew_reports_lapsed_leases(self):
+        sem, _, _, _, renew_script = _semaphore([], renew_result=0)
+        assert sem.renew("gone") is False
+        renew_script.assert_called_once_with(keys=["semaphore:Claude:holders"], args=["gone", 30000])
+
+
+class TestHeartbeat:
+    def test_loop_renews_held_leases_then_exits(self):
+        sem, _, _, _, renew_script = _semaphore([], lease_seconds=3)
+        RedisSemaphore._heartbeat_leases["lease-1"] = sem
+        sleeps = []
+        # Renewing the lease "finishes" the work so the loop winds down
+        renew_script.side_effect = lambda **kw: RedisSemaphore._heartbeat_leases.clear() or 1
+
+        with patch("utils.llm_providers.time.sleep", side_effect=sleeps.append):
+            _real_heartbeat_loop(RedisSemaphore)
+
+        assert sleeps == [pytest.approx(1.0)]  # a third of the lease
+        renew_script.assert_called_once_with(keys=["semaphore:Claude:holders"], args=["lease-1", 3000])
+        assert RedisSemaphore._heartbeat_thread is None
+
+
+class TestWaitTimeStats:
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = WaitTimeHistogram()
+        histogram.observe(0.0005)
+        histogram.observe(0.2)
+        histogram.observe(500, timed_out=True)
+
+        snapshot = histogram.snapshot()
+
+        assert snapshot["buckets"]["0.001"] == 1
+        assert snapshot["buckets"]["0.5"] == 2
+        assert snapshot["buckets"]["+Inf"] == 3
+        assert snapshot["count"] == 3
+        assert snapshot["timeouts"] == 1
+
+    def test_provider_semaphore_releases_its_redis_lease(self):
+        sem, _, _, release_script, _ = _semaphore([-1])
+        with patch.dict(llm_providers._provider_semaphores, {"LeaseTest": sem}), patch.dict(
+            llm_providers._provider_limits, {"LeaseTest": 2}
+        ), patch.dict(llm_providers._semaphore_wait_histograms, clear=True), patch.dict(
+            os.environ, {"PROVIDER_ADAPTIVE_CONCURRENCY": "false"}
+        ):
+            with provider_semaphore("LeaseTest"):
+                lease = next(iter(RedisSemaphore._heartbeat_leases))
+
+            stats = {s["provider"]: s for s in get_semaphore_stats()}
+
+        assert release_script.call_args.kwargs["args"][0] == lease
+        assert stats["LeaseTest"]["backend"] == "redis"
+        assert stats["LeaseTest"]["wait_seconds"]["count"] == 1
+
+
+def test_concurrency_endpoint_includes_semaphores(client):
+    with provider_semaphore("EndpointSemTest"):
+        pass
+
+    data = client.get("/api/providers/concurrency").get_json()
+
+    assert "EndpointSemTest" in {s["provider"] for s in data["semaphores"]}
@@ -0,0 +1,217 @@
+"""
+Tests for single-flight de-duplication of identical concurrent grading requests.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+import tasks
+from utils.single_flight import RedisFlights, SingleFlight
+
+
+class FakeRedis:
+    """Just enough of redis-py (decode_responses=True) for RedisFlights."""
+
+    def __init__(self):
+        self.data = {}
+        self.lists = {}
+        self.lock = threading.Condition()
+
+    def register_script(self, script):
+        def compare_and_delete(keys, args):
+            with self.lock:
+                if self.data.get(keys[0]) == args[0]:
+                    del self.data[keys[0]]
+                    return 1
+                return 0
+
+        return compare_and_delete
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value
+            return True
+
+    def get(self, key):
+        with self.lock:
+            return self.data.get(key)
+
+    def rpush(self, key, value):
+        with self.lock:
+            self.lists.setdefault(key, []).append(value)
+            self.lock.notify_all()
+
+    def pexpire(self, key, ms):
+        pass
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                for key in keys:
+                    if self.lists.get(key):
+                        return key, self.lists[key].pop(0)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.lock.wait(remaining)
+
+
+def _slow_call(calls, delay=0.2, result=None):
+    def call():
+        calls.append(1)
+        time.sleep(delay)
+        return dict(result or {"success": True, "grade": "A"})
+
+    return call
+
+
+def _local():
+    return SingleFlight("test", redis_client_factory=None)
+
+
+class TestInProcess:
+    def test_concurrent_identical_calls_share_one_execution(self):
+        flights, calls = _local(), []
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: flights.do("k", _slow_call(calls)), range(5)))
+
+        assert len(calls) == 1
+        assert all(r["grade"] == "A" for r in results)
+        assert sum(1 for r in results if r.get("coalesced")) == 4
+
+    def test_different_keys_and_sequential_calls_are_not_shared(self):
+        flights, calls = _local(), []
+        flights.do("a", _slow_call(calls, 0))
+        flights.do("a", _slow_call(calls, 0))
+        flights.do("b", _slow_call(calls, 0))
+        assert len(calls) == 3
+
+    def test_followers_retry_when_the_leader_raises(self):
+        flights, calls = _local(), []
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("boom")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(flights.do, "k", failing)
+            started.wait()
+            follower = executor.submit(flights.do, "k", _slow_call(calls, 0))
+            with pytest.raises(RuntimeError):
+                leader.result()
+            assert follower.result()["success"] is True
+        assert len(calls) == 1
+
+    def test_async_and_threaded_callers_share_a_flight(self):
+        flights, calls = _local(), []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return {"success": True, "grade": "B"}
+
+        async def run():
+            thread_result = asyncio.to_thread(flights.do, "k", _slow_call(calls, 0))
+            first = asyncio.ensure_future(flights.ado("k", slow))
+            await asyncio.sleep(0.05)
+            return await asyncio.gather(first, flights.ado("k", slow), thread_result)
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert [r["grade"] for r in results] == ["B", "B", "B"]
+
+    def test_cancelled_async_leader_hands_over(self):
+        flights, calls = _local(), []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.2)
+            return {"success": True, "grade": "C"}
+
+        async def run():
+            leader = asyncio.ensure_future(flights.ado("k", slow))
+            await asyncio.sleep(0.05)
+            follower = asyncio.ensure_future(flights.ado("k", slow))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await follower
+
+        result = asyncio.run(run())
+        assert result["grade"] == "C"
+        assert "coalesced" not in result  # the follower became the leader
+        assert len(calls) == 2
+
+
+class TestAcrossWorkers:
+    def test_second_worker_waits_for_the_first_workers_result(self):
+        redis = FakeRedis()
+        worker_a = SingleFlight("test", redis_client_factory=lambda: redis)
+        worker_b = SingleFlight("test", redis_client_factory=lambda: redis)
+        calls = []
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(worker_a.do, "k", _slow_call(calls, 0.3))
+            time.sleep(0.05)
+            second = executor.submit(worker_b.do, "k", _slow_call(calls, 0.3))
+            results = [first.result(), second.result()]
+
+        assert len(calls) == 1
+        assert results[1]["coalesced"] is True
+        assert results[1]["grade"] == "A"
+        assert not any(key.endswith(":lock") for key in redis.data)
+
+    def test_lapsed_leader_is_replaced(self):
+        redis = FakeRedis()
+        redis.data["singleflight:test:k:lock"] = "dead-worker"
+        flights = RedisFlights(redis, "test")
+        assert flights.try_lead("k") == ("dead-worker", False)
+
+        del redis.data["singleflight:test:k:lock"]  # lease expired
+        assert flights.wait("k", "dead-worker", time.monotonic() + 5) is None
+        token, leading = flights.try_lead("k")
+        assert leading is True
+
+    def test_redis_errors_fall_back_to_running_locally(self):
+        class BrokenRedis(FakeRedis):
+            def set(self, *args, **kwargs):
+                raise ConnectionError("redis down")
+
+        flights, calls = SingleFlight("test", redis_client_factory=BrokenRedis), []
+        assert flights.do("k", _slow_call(calls, 0))["grade"] == "A"
+        assert len(calls) == 1
+
+
+class CountingProvider:
+    def __init__(self):
+        self.calls = 0
+
+    def grade_document(self, text, prompt, **kwargs):
+        self.calls += 1
+        time.sleep(0.2)
+        return {"success": True, "grade": "A", "provider": "OpenRouter", "model": kwargs.get("model")}
+
+
+def test_identical_submissions_are_graded_once():
+    provider = CountingProvider()
+    kwargs = {"text": "same essay", "prompt": "grade", "model": "m", "temperature": 0.3, "max_tokens": 100}
+    with patch("tasks.get_llm_provider", return_value=provider):
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(lambda _: tasks._grade_once("openrouter", dict(kwargs)), range(3)))
+        assert provider.calls == 1
+
+        with patch.dict("os.environ", {"JOB_SINGLE_FLIGHT": "false"}):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: tasks._grade_once("openrouter", dict(kwargs)), range(2)))
+        assert provider.calls == 3
+
+    assert all(r["grade"] == "A" for r in results)
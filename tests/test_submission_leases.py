@@ -0,0 +1,121 @@
+"""
+Tests for submission lease heartbeats and recovery of abandoned submissions.
+"""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import tasks
+from models import GradingJob, QueuedTask, Submission, db
+from services.submission_leases import SubmissionLeaseService
+from tests.factories import GradingJobFactory
+
+THREADED = {"status": "processing", "execution_mode": "threaded"}
+
+
+def _abandon(submission, recovery_count=0, expired=True):
+    """Leave a submission in processing as a dead process would."""
+    submission.status = "processing"
+    submission.claimed_by = "dead-host:1:abc"
+    submission.recovery_count = recovery_count
+    offset = timedelta(minutes=-1 if expired else 5)
+    submission.lease_expires_at = datetime.now(timezone.utc) + offset
+    db.session.commit()
+
+
+def _reload(submission):
+    return db.session.get(Submission, submission.id, populate_existing=True)
+
+
+def test_hold_leases_and_releases_the_submission(app):
+    submission = GradingJobFactory.create(1, **THREADED).submissions[0]
+
+    with SubmissionLeaseService.hold(submission.id):
+        held = _reload(submission)
+        assert held.claimed_by == SubmissionLeaseService.worker_id()
+        assert held.lease_expires_at is not None
+        held.set_status("completed")
+
+    assert _reload(submission).lease_expires_at is None
+
+
+def test_hold_keeps_a_live_worker_claim(app):
+    submission = GradingJobFactory.create(1, **THREADED).submissions[0]
+    _abandon(submission, expired=False)
+
+    with SubmissionLeaseService.hold(submission.id):
+        assert _reload(submission).claimed_by == "dead-host:1:abc"
+        assert SubmissionLeaseService.renew() == 1
+
+
+def test_expired_leases_are_requeued_and_live_ones_left_alone(app):
+    expired, live, unleased = GradingJobFactory.create(3, **THREADED).submissions
+    _abandon(expired)
+    _abandon(live, expired=False)
+    unleased.set_status("processing")  # async/bulk runners hold no lease
+
+    recovered = SubmissionLeaseService.reap()
+
+    assert recovered == {"requeued": [expired.job_id], "failed": 0}
+    expired = _reload(expired)
+    assert (expired.status, expired.claimed_by, expired.recovery_count) == ("pending", None, 1)
+    assert expired.retry_count == 0  # the user's retries are untouched
+    assert _reload(live).status == "processing"
+    assert _reload(unleased).status == "processing"
+
+
+def test_submissions_out_of_recoveries_fail_the_job(app):
+    job = GradingJobFactory.create(1, **THREADED)
+    _abandon(job.submissions[0], recovery_count=3)
+
+    assert SubmissionLeaseService.reap(max_recoveries=3) == {"requeued": [], "failed": 1}
+    assert _reload(job.submissions[0]).status == "failed"
+    job = db.session.get(GradingJob, job.id, populate_existing=True)
+    assert (job.failed_submissions, job.status) == (1, "failed")
+
+
+def test_recovery_restarts_threaded_jobs_but_not_worker_jobs(app):
+    threaded = GradingJobFactory.create(1, **THREADED)
+    worker = GradingJobFactory.create(1, status="processing", execution_mode="worker")
+    _abandon(threaded.submissions[0])
+    _abandon(worker.submissions[0])
+
+    with patch.object(tasks.process_job, "delay") as delay:
+        recovered = tasks.recover_stuck_submissions()
+
+    assert sorted(recovered["requeued"]) == sorted([threaded.id, worker.id])
+    delay.assert_called_once_with(threaded.id)
+
+
+def test_user_retries_do_not_use_up_recoveries(app):
+    submission = GradingJobFactory.create(1, **THREADED).submissions[0]
+    submission.retry_count = 3
+    _abandon(submission)
+
+    assert SubmissionLeaseService.reap(max_recoveries=3)["failed"] == 0
+    assert _reload(submission).status == "pending"
+
+
+def test_server_recovery_keeps_one_run_queued(app):
+    with patch.object(tasks.task_queue, "submit", return_value="task-1") as submit:
+        assert tasks.schedule_submission_recovery() == "task-1"
+    submit.assert_called_once_with(tasks.recover_stuck_submissions_periodically, countdown=60, max_retries=0)
+
+    db.session.add(
+        QueuedTask(
+            task_name="tasks:recover_stuck_submissions_periodically",
+            status="pending",
+            scheduled_at=datetime.now(timezone.utc),
+        )
+    )
+    db.session.commit()
+    with patch.object(tasks.task_queue, "submit") as submit:
+        tasks.schedule_submission_recovery()
+    submit.assert_not_called()
+
+    with patch("tasks.recover_stuck_submissions", return_value={"requeued": [], "failed": 0}) as recover, patch(
+        "tasks.schedule_submission_recovery"
+    ) as schedule:
+        tasks.recover_stuck_submissions_periodically()
+    recover.assert_called_once()
+    schedule.assert_called_once()
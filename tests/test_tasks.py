@@ -18,7 +18,7 @@ from utils.llm_providers import get_llm_provider
 class TestGradingFunctions:
     """Test cases for grading functions."""
 
-    @patch("utils.llm_providers.requests.post")
+    @patch("utils.llm_providers.requests.Session.post")
     def test_openrouter_provider_success(self, mock_requests_post, app):
         """Test successful grading with OpenRouter provider."""
         mock_response = MagicMock()
@@ -0,0 +1,237 @@
+"""
+Tests for the asyncio grading path: provider agrade_document coroutines,
+async_provider_semaphore and the async job runner in tasks.py.
+"""
+
+import asyncio
+import os
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from models import GradeResult, GradingJob, JobBatch, Submission, db
+from tasks import _get_execution_mode, process_job_sync
+from utils.llm_providers import (
+    ClaudeLLMProvider,
+    LMStudioLLMProvider,
+    OpenRouterLLMProvider,
+    async_provider_semaphore,
+    get_connection_pool,
+)
+
+
+def _fake_response(content="Grade: A"):
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {
+        "choices": [{"message": {"content": content}}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 3},
+    }
+    return resp
+
+
+async def _grade_and_release(provider, *args, **kwargs):
+    try:
+        return await provider.agrade_document(*args, **kwargs)
+    finally:
+        await get_connection_pool().aclose_loop()
+
+
+class TestProviderCoroutines:
+    def test_openrouter_agrade_document_uses_async_client(self):
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "async-key"}), patch(
+            "utils.llm_providers.httpx.AsyncClient.post",
+            new_callable=AsyncMock,
+            return_value=_fake_response("Async grade"),
+        ) as mock_post:
+            result = asyncio.run(_grade_and_release(OpenRouterLLMProvider(), "doc", "prompt", model="m"))
+
+        assert result["success"] is True
+        assert result["grade"] == "Async grade"
+        assert result["model"] == "m"
+        payload = mock_post.call_args.kwargs["json"]
+        assert payload["model"] == "m"
+        assert payload["messages"][1]["content"].endswith("doc")
+
+    def test_httpx_connection_errors_map_to_provider_messages(self):
+        with patch(
+            "utils.llm_providers.httpx.AsyncClient.post",
+            new_callable=AsyncMock,
+            side_effect=httpx.ConnectError("refused"),
+        ):
+            result = asyncio.run(_grade_and_release(LMStudioLLMProvider(), "doc", "prompt"))
+
+        assert result["success"] is False
+        assert "Could not connect to LM Studio" in result["error"]
+
+    def test_claude_agrade_document_uses_async_sdk_client(self):
+        fake_msg = MagicMock()
+        fake_msg.content = [MagicMock(text="Claude async grade")]
+        fake_msg.usage = None
+        client = MagicMock()
+        client.messages.create = AsyncMock(return_value=fake_msg)
+
+        with patch.dict(os.environ, {"CLAUDE_API_KEY": "k"}), patch(
+            "utils.llm_providers.AsyncAnthropic", return_value=client
+        ):
+            result = asyncio.run(_grade_and_release(ClaudeLLMProvider(), "doc", "prompt"))
+
+        assert result["success"] is True
+        assert result["grade"] == "Claude async grade"
+        assert client.messages.create.call_args.kwargs["model"] == ClaudeLLMProvider.default_model
+
+
+class TestAsyncProviderSemaphore:
+    def test_limits_concurrent_holders(self):
+        active = 0
+        peak = 0
+
+        async def worker():
+            nonlocal active, peak
+            async with async_provider_semaphore("AsyncSemTest"):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        async def main():
+            await asyncio.gather(*(worker() for _ in range(10)))
+
+        with patch.dict(os.environ, {"PROVIDER_MAX_ASYNCSEMTEST": "3"}):
+            asyncio.run(main())
+
+        assert peak == 3
+
+
+class TestExecutionMode:
+    def test_resolution_order(self, app):
+        with app.app_context():
+            batch = JobBatch(batch_name="B", batch_settings={"execution_mode": "async"})
+            db.session.add(batch)
+            db.session.commit()
+            job = GradingJob(job_name="J", provider="openrouter", prompt="p", batch_id=batch.id)
+            db.session.add(job)
+            db.session.commit()
+
+            assert _get_execution_mode(job) == "async"
+            job.execution_mode = "threaded"
+            assert _get_execution_mode(job) == "threaded"
+
+            job.execution_mode = None
+            job.batch_id = None
+            db.session.commit()
+            db.session.refresh(job)
+            with patch.dict(os.environ, {"JOB_EXECUTION_MODE": "async"}):
+                assert _get_execution_mode(job) == "async"
+            with patch.dict(os.environ, {"JOB_EXECUTION_MODE": "bogus"}):
+                assert _get_execution_mode(job) == "threaded"
+
+
+class TestAsyncJobRunner:
+    def _make_job(self, app, count, **job_kwargs):
+        job = GradingJob(job_name="Async Job", provider="openrouter", prompt="Grade it.", **job_kwargs)
+        db.session.add(job)
+        db.session.commit()
+
+        upload_folder = app.config["UPLOAD_FOLDER"]
+        os.makedirs(upload_folder, exist_ok=True)
+        for i in range(count):
+            name = f"async_{job.id}_{i}.txt"
+            with open(os.path.join(upload_folder, name), "w") as f:
+                f.write(f"Essay number {i}")
+            db.session.add(
+                Submission(job_id=job.id, filename=name, original_filename=name, file_type="txt", status="pending")
+            )
+        db.session.commit()
+        return job.id
+
+    def test_async_job_grades_all_submissions_with_batched_commits(self, app):
+        with app.app_context():
+            job_id = self._make_job(app, 5, execution_mode="async", models_to_compare=["m1", "m2"])
+
+        commit_sizes = []
+        from tasks import _BatchedCommitter
+
+        original_flush = _BatchedCommitter.flush
+
+        def tracking_flush(self):
+            if self.pending:
+                commit_sizes.append(self.pending)
+            return original_flush(self)
+
+        env = {"OPENROUTER_API_KEY": "k", "JOB_ASYNC_COMMIT_BATCH": "2"}
+        with patch.dict(os.environ, env), patch(
+            "utils.llm_providers.httpx.AsyncClient.post",
+            new_callable=AsyncMock,
+            return_value=_fake_response(),
+        ) as mock_post, patch("tasks._process_submissions_parallel") as threaded, patch.object(
+            _BatchedCommitter, "flush", tracking_flush
+        ):
+            assert process_job_sync(job_id) is True
+
+        threaded.assert_not_called()
+        assert mock_post.await_count == 10
+        assert commit_sizes == [2, 2, 1]
+
+        with app.app_context():
+            job = db.session.get(GradingJob, job_id)
+            assert job.processed_submissions == 5
+            assert job.status == "completed"
+            for submission in job.submissions:
+                assert submission.status == "completed"
+                assert submission.grade == "Grade: A"
+                assert submission.grade_metadata["successful_models"] == 2
+            assert GradeResult.query.join(Submission).filter(Submission.job_id == job_id).count() == 10
+
+    def test_batch_that_fails_to_commit_marks_its_submissions_failed(self, app):
+        with app.app_context():
+            job_id = self._make_job(app, 3, execution_mode="async")
+
+        from tasks import _BatchedCommitter
+
+        original_flush, original_commit = _BatchedCommitter.flush, db.session.commit
+        failing = {"flushes": 0, "armed": False}
+
+        def flush(self):
+            failing["flushes"] += 1
+            failing["armed"] = failing["flushes"] == 1 and self.pending > 0
+            return original_flush(self)
+
+        def commit_failing_first_batch():
+            if failing.pop("armed", False):
+                raise RuntimeError("database is locked")
+            return original_commit()
+
+        env = {"OPENROUTER_API_KEY": "k", "JOB_ASYNC_COMMIT_BATCH": "2"}
+        with patch.dict(os.environ, env), patch(
+            "utils.llm_providers.httpx.AsyncClient.post",
+            new_callable=AsyncMock,
+            return_value=_fake_response(),
+        ), patch.object(_BatchedCommitter, "flush", flush), patch.object(
+            db.session, "commit", side_effect=commit_failing_first_batch
+        ):
+            assert process_job_sync(job_id) is True
+
+        with app.app_context():
+            job = db.session.get(GradingJob, job_id)
+            statuses = sorted(s.status for s in job.submissions)
+            assert statuses == ["completed", "failed", "failed"]
+            failed = [s for s in job.submissions if s.status == "failed"]
+            assert all("Could not save grading results" in s.error_message for s in failed)
+            assert (job.processed_submissions, job.failed_submissions) == (1, 2)
+
+    def test_async_job_records_failures(self, app):
+        with app.app_context():
+            job_id = self._make_job(app, 2, execution_mode="async")
+
+        with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+            "utils.llm_providers.httpx.AsyncClient.post",
+            new_callable=AsyncMock,
+            side_effect=httpx.ReadTimeout("slow"),
+        ):
+            assert process_job_sync(job_id) is True
+
+        with app.app_context():
+            job = db.session.get(GradingJob, job_id)
+            assert job.failed_submissions == 2
+            results = GradeResult.query.join(Submission).filter(Submission.job_id == job_id).all()
+            assert all(r.status == "failed" for r in results)
@@ -0,0 +1,146 @@
+"""
+Tests for the bulk execution mode, run against the local batch API stub.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+import tasks
+from models import GradeResult, GradingJob, JobBatch, Submission, db
+from tasks import _get_execution_mode, poll_bulk_batch, process_job_sync
+from tests.batch_api_stub import BatchAPIStub
+from tests.factories import GradingJobFactory
+
+ESSAY = "Essay number {i}."
+
+
+@pytest.fixture
+def stub():
+    with BatchAPIStub(polls_until_done=2) as server:
+        env = {
+            "ANTHROPIC_BASE_URL": server.url,
+            "OPENAI_BASE_URL": f"{server.url}/v1",
+            "CLAUDE_API_KEY": "claude-key",
+            "OPENAI_API_KEY": "openai-key",
+            "JOB_BULK_POLL_INTERVAL": "0",
+        }
+        with patch.dict(os.environ, env):
+            yield server
+
+
+@pytest.fixture
+def polls():
+    """Capture the scheduled batch checks instead of queueing them."""
+    with patch.object(tasks.poll_bulk_batch, "delay") as delay:
+        yield delay
+
+
+def _grade(job_id, polls):
+    """Submit the job's batch, then run the scheduled checks until none is left."""
+    assert process_job_sync(job_id) is True
+    statuses = []
+    while polls.call_count > len(statuses):
+        assert polls.call_args_list[len(statuses)].args == (job_id,)
+        statuses.append(poll_bulk_batch(job_id))
+    return statuses
+
+
+def test_bulk_mode_falls_back_for_providers_without_batch_api(app):
+    with app.app_context():
+        job = GradingJob(job_name="J", provider="openrouter", prompt="p", execution_mode="bulk")
+        assert _get_execution_mode(job) == "threaded"
+        job.provider = "claude"
+        assert _get_execution_mode(job) == "bulk"
+
+        batch = JobBatch(batch_name="B", batch_settings={"execution_mode": "bulk"})
+        db.session.add(batch)
+        db.session.commit()
+        job = GradingJob(job_name="J2", provider="openai", prompt="p", batch_id=batch.id)
+        db.session.add(job)
+        db.session.commit()
+        assert _get_execution_mode(job) == "bulk"
+
+
+def test_claude_job_is_graded_in_one_message_batch(app, stub, polls):
+    with app.app_context():
+        job_id = GradingJobFactory.create(3, text=ESSAY, provider="claude", execution_mode="bulk").id
+
+    # Submitting the batch leaves progress and the batch roll-up to poll_bulk_batch
+    with patch.object(GradingJob, "update_progress") as update_progress:
+        assert process_job_sync(job_id) is True
+    update_progress.assert_not_called()
+    with app.app_context():
+        job = db.session.get(GradingJob, job_id)
+        assert job.bulk_batch_id == next(iter(stub.batches))
+        assert all(s.status == "processing" for s in job.submissions)
+    polls.assert_called_once_with(job_id, countdown=0)
+
+    assert [poll_bulk_batch(job_id) for _ in range(3)] == ["in_progress", "ended", None]
+    assert polls.call_count == 2  # no check is queued once the batch has ended
+    assert len(stub.batches) == 1
+    assert len(stub.submitted) == 3
+    assert stub.submitted[0]["params"]["messages"][0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    with app.app_context():
+        job = db.session.get(GradingJob, job_id)
+        assert job.status == "completed"
+        for submission in job.submissions:
+            assert submission.status == "completed"
+            assert submission.grade.startswith("Stub grade from claude")
+        assert GradeResult.query.count() == 3
+
+
+def test_openai_job_compares_models_and_records_failures(app, stub, polls):
+    with app.app_context():
+        job_id = GradingJobFactory.create(
+            2, text=ESSAY, provider="openai", execution_mode="bulk", models_to_compare=["gpt-a", "gpt-b"]
+        ).id
+        first = GradingJob.query.get(job_id).submissions[0].id
+    stub.fail_ids = {f"{first}--0"}
+
+    assert _grade(job_id, polls)[-1] == "ended"
+
+    assert len(stub.batches) == 1
+    assert {line["body"]["model"] for line in stub.submitted} == {"gpt-a", "gpt-b"}
+    with app.app_context():
+        submission = db.session.get(Submission, first)
+        assert submission.status == "completed"
+        # gpt-a failed in the batch, so the legacy grade comes from gpt-b
+        assert submission.grade == "Stub grade from gpt-b"
+        statuses = {r.model: r.status for r in submission.grade_results}
+        assert statuses == {"gpt-a": "failed", "gpt-b": "completed"}
+
+
+def test_batch_that_never_finishes_fails_submissions(app, stub, polls):
+    stub.polls_until_done = 10**6
+    with app.app_context():
+        job_id = GradingJobFactory.create(2, text=ESSAY, provider="claude", execution_mode="bulk").id
+
+    with patch.dict(os.environ, {"JOB_BULK_MAX_WAIT_HOURS": "0"}):
+        assert _grade(job_id, polls) == ["failed"]
+
+    with app.app_context():
+        job = db.session.get(GradingJob, job_id)
+        assert job.status == "failed"
+        assert job.bulk_batch_id is None
+        assert all(s.status == "failed" for s in job.submissions)
+        assert "did not finish" in job.submissions[0].error_message
+
+
+def test_polling_resumes_from_the_saved_batch_after_a_restart(app, stub, polls):
+    with app.app_context():
+        job_id = GradingJobFactory.create(2, text=ESSAY, provider="claude", execution_mode="bulk").id
+    assert process_job_sync(job_id) is True
+
+    # A new process only has the job row; the pending check is picked up again
+    with app.app_context():
+        db.session.remove()
+    assert _grade(job_id, polls)[-1] == "ended"
+    assert poll_bulk_batch(job_id) is None
+
+    assert len(stub.batches) == 1
+    with app.app_context():
+        job = db.session.get(GradingJob, job_id)
+        assert job.status == "completed"
+        assert all(s.status == "completed" for s in job.submissions)
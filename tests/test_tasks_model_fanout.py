@@ -0,0 +1,112 @@
+"""
+Tests for concurrent multi-model grading of a single submission.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from models import GradeResult, Submission, db
+from tasks import process_job_sync, process_submission_sync
+from tests.factories import GradingJobFactory
+
+MODELS = ["model-a", "model-b", "model-c", "model-d"]
+ESSAY = "An essay to compare across models."
+# model-a finishes last so completion order differs from configured order
+DELAYS = {"model-a": 0.15, "model-b": 0.05, "model-c": 0.01, "model-d": 0.08}
+
+
+def _response_for(model, fail=False):
+    resp = MagicMock(status_code=500 if fail else 200, text="boom")
+    resp.json.return_value = {
+        "choices": [{"message": {"content": f"Grade from {model}"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1},
+    }
+    return resp
+
+
+def test_models_are_graded_concurrently_within_provider_limit(app):
+    with app.app_context():
+        sid = GradingJobFactory.create(1, text=ESSAY, models_to_compare=MODELS).submissions[0].id
+
+    lock = threading.Lock()
+    active = {"now": 0, "peak": 0}
+
+    def fake_post(url, **kwargs):
+        model = kwargs["json"]["model"]
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(DELAYS[model])
+        with lock:
+            active["now"] -= 1
+        return _response_for(model)
+
+    semaphores = {"OpenRouter": threading.BoundedSemaphore(3)}
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch.dict(
+        "utils.llm_providers._provider_semaphores", semaphores
+    ), patch("utils.llm_providers.requests.Session.post", side_effect=fake_post):
+        assert process_submission_sync(sid) is True
+
+    assert active["peak"] == 3
+
+    with app.app_context():
+        submission = db.session.get(Submission, sid)
+        assert submission.status == "completed"
+        assert {r.model for r in submission.grade_results} == set(MODELS)
+        # Legacy grade is the first configured model, not the first to finish
+        assert submission.grade == "Grade from model-a"
+        assert submission.grade_metadata["successful_models"] == 4
+
+
+def test_legacy_grade_skips_failed_models_deterministically(app):
+    with app.app_context():
+        sid = GradingJobFactory.create(1, text=ESSAY, models_to_compare=MODELS).submissions[0].id
+
+    def fake_post(url, **kwargs):
+        model = kwargs["json"]["model"]
+        time.sleep(DELAYS[model])
+        return _response_for(model, fail=model == "model-a")
+
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+        "utils.llm_providers.requests.Session.post", side_effect=fake_post
+    ):
+        assert process_submission_sync(sid) is True
+
+    with app.app_context():
+        submission = db.session.get(Submission, sid)
+        assert submission.grade == "Grade from model-b"
+        statuses = {r.model: r.status for r in submission.grade_results}
+        assert statuses["model-a"] == "failed"
+        assert submission.grade_metadata["successful_models"] == 3
+
+
+def test_async_runner_fans_out_models(app):
+    with app.app_context():
+        job = GradingJobFactory.create(1, text=ESSAY, models_to_compare=MODELS, execution_mode="async")
+        job_id, sid = job.id, job.submissions[0].id
+
+    active = {"now": 0, "peak": 0}
+
+    async def fake_post(self, url, **kwargs):
+        model = kwargs["json"]["model"]
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(DELAYS[model])
+        active["now"] -= 1
+        return _response_for(model)
+
+    with patch.dict(os.environ, {"OPENROUTER_API_KEY": "k"}), patch(
+        "utils.llm_providers.httpx.AsyncClient.post", new=fake_post
+    ):
+        assert process_job_sync(job_id) is True
+
+    assert active["peak"] > 1
+
+    with app.app_context():
+        submission = db.session.get(Submission, sid)
+        assert submission.status == "completed"
+        assert submission.grade == "Grade from model-a"
+        assert GradeResult.query.filter_by(submission_id=sid).count() == 4
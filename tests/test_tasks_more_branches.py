@@ -66,7 +66,7 @@ def test_process_submission_sync_all_models_fail(app, tmp_path):
 
     # Make LM Studio return non-200 so result['success'] is False
     fake_resp = MagicMock(status_code=500, text="err")
-    with patch("utils.llm_providers.requests.post", return_value=fake_resp):
+    with patch("utils.llm_providers.requests.Session.post", return_value=fake_resp):
         assert process_submission_sync(sid) is False
 
 
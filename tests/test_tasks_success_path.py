@@ -44,7 +44,7 @@ def test_process_submission_sync_success(app, tmp_path):
         "usage": {"prompt_tokens": 10, "completion_tokens": 20},
     }
 
-    with patch("utils.llm_providers.requests.post", return_value=fake_resp):
+    with patch("utils.llm_providers.requests.Session.post", return_value=fake_resp):
         result = process_submission_sync(sid)
         assert result is True
 
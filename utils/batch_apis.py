@@ -0,0 +1,267 @@
+"""
+Clients for provider batch APIs used by the "bulk" job execution mode.
+
+Anthropic Message Batches and the OpenAI Batch API accept many grading
+requests at once, process them offline (typically within 24 hours, at a
+discount) and return one JSONL result per request. Requests are matched back
+to submissions by ``custom_id``.
+
+Base URLs follow the provider SDK environment variables (ANTHROPIC_BASE_URL,
+OPENAI_BASE_URL) so the stub in tests/batch_api_stub.py can stand in offline.
+"""
+
+import json
+import os
+from abc import ABC, abstractmethod
+
+from utils.llm_providers import (
+    ClaudeLLMProvider,
+    OpenAILLMProvider,
+    _http_get,
+    _http_post,
+    _with_cached_tokens,
+)
+
+
+class BatchAPIError(Exception):
+    """Raised when a provider batch API call fails."""
+
+
+def _check(response, action):
+    """Return the decoded JSON body, raising BatchAPIError on a non-2xx status."""
+    if response.status_code >= 300:
+        raise BatchAPIError(f"{action} failed: {response.status_code} - {response.text}")
+    return response.json()
+
+
+def _jsonl(text):
+    """Parse a JSONL document into a list of objects, skipping blank lines."""
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class BatchAPIClient(ABC):
+    """One provider's batch endpoint: submit, poll and fetch results."""
+
+    provider_name = None
+
+    @abstractmethod
+    def build_request(self, custom_id, grade_kwargs):
+        """Turn grade_document keyword arguments into one batch request line."""
+
+    @abstractmethod
+    def submit(self, batch_requests):
+        """Submit request lines; returns the provider batch id."""
+
+    @abstractmethod
+    def poll(self, batch_id):
+        """Return "in_progress", "ended" or "failed" for a batch."""
+
+    @abstractmethod
+    def results(self, batch_id):
+        """Return {custom_id: grading result dict} for an ended batch."""
+
+
+class AnthropicBatchClient(BatchAPIClient):
+    """Anthropic Message Batches API (/v1/messages/batches)."""
+
+    provider_name = "Claude"
+
+    def __init__(self):
+        self.api_key = os.getenv("CLAUDE_API_KEY")
+        if not self.api_key:
+            raise BatchAPIError("Claude API key not configured")
+        self.base_url = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com").rstrip("/")
+        self.provider = ClaudeLLMProvider()
+
+    @property
+    def _headers(self):
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json",
+        }
+
+    def build_request(self, custom_id, grade_kwargs):
+        params = self.provider._message_kwargs(
+            grade_kwargs["text"],
+            grade_kwargs["prompt"],
+            grade_kwargs.get("model") or self.provider.default_model,
+            grade_kwargs.get("marking_scheme_content"),
+            grade_kwargs.get("temperature", 0.3),
+            grade_kwargs.get("max_tokens", 2000),
+        )
+        return {"custom_id": custom_id, "params": params}
+
+    def submit(self, batch_requests):
+        url = f"{self.base_url}/v1/messages/batches"
+        body = _check(
+            _http_post(
+                "Claude", url, self.api_key, headers=self._headers, json={"requests": batch_requests}, timeout=300
+            ),
+            "Creating Claude message batch",
+        )
+        return body["id"]
+
+    def _get_batch(self, batch_id):
+        url = f"{self.base_url}/v1/messages/batches/{batch_id}"
+        return _check(
+            _http_get("Claude", url, self.api_key, headers=self._headers, timeout=60),
+            "Fetching Claude message batch",
+        )
+
+    def poll(self, batch_id):
+        return "ended" if self._get_batch(batch_id).get("processing_status") == "ended" else "in_progress"
+
+    def results(self, batch_id):
+        results_url = self._get_batch(batch_id).get("results_url")
+        if not results_url:
+            raise BatchAPIError(f"Claude message batch {batch_id} has no results")
+        response = _http_get("Claude", results_url, self.api_key, headers=self._headers, timeout=300)
+        if response.status_code >= 300:
+            raise BatchAPIError(f"Downloading Claude batch results failed: {response.status_code}")
+
+        results = {}
+        for line in _jsonl(response.text):
+            outcome = line.get("result") or {}
+            if outcome.get("type") == "succeeded":
+                message = outcome["message"]
+                results[line["custom_id"]] = {
+                    "success": True,
+                    "grade": "".join(block.get("text", "") for block in message.get("content", [])),
+                    "model": message.get("model"),
+                    "provider": "Claude",
+                    "usage": _with_cached_tokens(message.get("usage")),
+                }
+            else:
+                error = (outcome.get("error") or {}).get("error") or outcome.get("error") or {}
+                reason = error.get("message") or outcome.get("type", "unknown")
+                results[line["custom_id"]] = self.provider._failure(f"Claude batch request {reason}")
+        return results
+
+
+class OpenAIBatchClient(BatchAPIClient):
+    """OpenAI Batch API (/v1/files + /v1/batches) over chat completions."""
+
+    provider_name = "OpenAI"
+
+    _FAILED_STATUSES = {"failed", "expired", "cancelled"}
+
+    def __init__(self):
+        self.api_key = os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise BatchAPIError("OpenAI API key not configured")
+        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+        self.provider = OpenAILLMProvider()
+
+    @property
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    def build_request(self, custom_id, grade_kwargs):
+        body = self.provider._completion_kwargs(
+            grade_kwargs["text"],
+            grade_kwargs["prompt"],
+            grade_kwargs.get("model") or self.provider.default_model,
+            grade_kwargs.get("marking_scheme_content"),
+            grade_kwargs.get("temperature", 0.3),
+            grade_kwargs.get("max_tokens", 2000),
+        )
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+    def submit(self, batch_requests):
+        jsonl = "\n".join(json.dumps(line) for line in batch_requests) + "\n"
+        uploaded = _check(
+            _http_post(
+                "OpenAI",
+                f"{self.base_url}/files",
+                self.api_key,
+                headers=self._headers,
+                data={"purpose": "batch"},
+                files={"file": ("grading_batch.jsonl", jsonl.encode("utf-8"), "application/jsonl")},
+                timeout=300,
+            ),
+            "Uploading OpenAI batch file",
+        )
+        batch = _check(
+            _http_post(
+                "OpenAI",
+                f"{self.base_url}/batches",
+                self.api_key,
+                headers=self._headers,
+                json={
+                    "input_file_id": uploaded["id"],
+                    "endpoint": "/v1/chat/completions",
+                    "completion_window": "24h",
+                },
+                timeout=60,
+            ),
+            "Creating OpenAI batch",
+        )
+        return batch["id"]
+
+    def _get_batch(self, batch_id):
+        return _check(
+            _http_get("OpenAI", f"{self.base_url}/batches/{batch_id}", self.api_key, headers=self._headers, timeout=60),
+            "Fetching OpenAI batch",
+        )
+
+    def poll(self, batch_id):
+        status = self._get_batch(batch_id).get("status")
+        if status == "completed":
+            return "ended"
+        return "failed" if status in self._FAILED_STATUSES else "in_progress"
+
+    def _file_lines(self, file_id):
+        if not file_id:
+            return []
+        response = _http_get(
+            "OpenAI", f"{self.base_url}/files/{file_id}/content", self.api_key, headers=self._headers, timeout=300
+        )
+        if response.status_code >= 300:
+            raise BatchAPIError(f"Downloading OpenAI batch file failed: {response.status_code}")
+        return _jsonl(response.text)
+
+    def results(self, batch_id):
+        batch = self._get_batch(batch_id)
+        results = {}
+        for line in self._file_lines(batch.get("output_file_id")) + self._file_lines(batch.get("error_file_id")):
+            response = line.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200 and body.get("choices"):
+                usage = body.get("usage") or {}
+                results[line["custom_id"]] = {
+                    "success": True,
+                    "grade": body["choices"][0]["message"]["content"],
+                    "model": body.get("model"),
+                    "provider": "OpenAI",
+                    "usage": {
+                        "prompt_tokens": usage.get("prompt_tokens"),
+                        "completion_tokens": usage.get("completion_tokens"),
+                        "total_tokens": usage.get("total_tokens"),
+                        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+                    },
+                }
+            else:
+                error = line.get("error") or body.get("error") or {}
+                reason = error.get("message") or f"status {response.get('status_code')}"
+                results[line["custom_id"]] = self.provider._failure(f"OpenAI batch request failed: {reason}")
+        return results
+
+
+BATCH_API_CLIENTS = {
+    "Claude": AnthropicBatchClient,
+    "OpenAI": OpenAIBatchClient,
+}
+
+
+def supports_batch_api(provider_name):
+    """Whether a provider (display name) has a batch API client."""
+    return provider_name in BATCH_API_CLIENTS
+
+
+def get_batch_client(provider_name):
+    """Instantiate the batch client for a provider display name."""
+    try:
+        return BATCH_API_CLIENTS[provider_name]()
+    except KeyError:
+        raise ValueError(f"Provider {provider_name} has no batch API support")
@@ -0,0 +1,264 @@
+"""
+Priority and fair-share ordering of grading work.
+
+Work is handed out one submission at a time. The highest priority always
+goes first; among equal priorities the owner with the least work running
+goes next, then -- within that owner -- the batch (or stand-alone job) with
+the least running, then the job with the least running, then the oldest.
+Because every grant covers a single submission, an urgent job that arrives
+while a large low-priority batch is mid-way through takes the very next
+free slot instead of waiting for the batch to finish.
+"""
+
+import itertools
+import os
+import threading
+from collections import Counter, deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+# What the scheduler knows about a job. ``group`` is the batch id, or the
+# job's own id for stand-alone jobs; ``created_at`` is a POSIX timestamp.
+Share = namedtuple("Share", ["job_id", "owner", "group", "priority", "created_at"])
+
+
+def global_capacity():
+    """Submissions graded at once by this process's threaded runner (JOB_GLOBAL_MAX_PARALLEL)."""
+    try:
+        return max(1, int(os.getenv("JOB_GLOBAL_MAX_PARALLEL", "16")))
+    except ValueError:
+        return 16
+
+
+class _Running:
+    """Running submissions counted per owner, group and job."""
+
+    def __init__(self):
+        self.owners = Counter()
+        self.groups = Counter()
+        self.jobs = Counter()
+
+    def add(self, share, count=1):
+        for counter, key in (
+            (self.owners, share.owner),
+            (self.groups, (share.owner, share.group)),
+            (self.jobs, share.job_id),
+        ):
+            counter[key] += count
+            if not counter[key]:
+                del counter[key]
+
+    def key(self, share):
+        """Sort key: the smallest is served next."""
+        return (
+            -(share.priority or 0),
+            self.owners[share.owner],
+            self.groups[(share.owner, share.group)],
+            self.jobs[share.job_id],
+            share.created_at or 0.0,
+        )
+
+
+def iter_plan(shares, pending, running=None):
+    """
+    Yield the job id of each submission start, in scheduling order.
+
+    Args:
+        shares: {job_id: Share}
+        pending: {job_id: submissions waiting to start}
+        running: {job_id: submissions already running}
+    """
+    state = _Running()
+    for job_id, count in (running or {}).items():
+        if job_id in shares:
+            state.add(shares[job_id], count)
+    left = {job_id: count for job_id, count in pending.items() if count > 0 and job_id in shares}
+    while left:
+        job_id = min(left, key=lambda j: state.key(shares[j]))
+        yield job_id
+        state.add(shares[job_id])
+        left[job_id] -= 1
+        if not left[job_id]:
+            del left[job_id]
+
+
+def plan(shares, pending, running=None, slots=None):
+    """The first ``slots`` entries of iter_plan() (all of them when None)."""
+    return list(itertools.islice(iter_plan(shares, pending, running), slots))
+
+
+class FairSharePool:
+    """
+    One bounded pool of grading threads shared by every job in the process.
+
+    Jobs submit their submissions instead of running thread pools of their
+    own. Whenever a thread is free it takes the submission that iter_plan()
+    would start next, from whichever job that is, so total in-flight grading
+    never exceeds the capacity however many jobs run, and a job that
+    finishes early leaves its threads to the others. Threads are started on
+    demand up to the capacity -- global_capacity() unless given, read on
+    every decision -- and then kept for later jobs.
+
+    The requests a running submission fans out into (comparison models,
+    sections of a long document, hedges) take free slots of the same
+    capacity through try_fan_out()/fan_out(), so one number bounds all
+    grading in the process. A fan-out that finds every slot taken runs on
+    the submission's own thread, inside the slot that submission already
+    holds, instead of waiting: nested fan-outs can never deadlock.
+    """
+
+    def __init__(self, capacity=None, name="grading-pool"):
+        self._capacity = capacity
+        self._name = name
+        self._condition = threading.Condition()
+        self._running = _Running()
+        self._in_use = 0
+        self._queues = {}  # job_id -> deque of (share, arrival, future, fn, args)
+        self._limits = {}  # job_id -> most submissions of that job running at once
+        self._arrivals = itertools.count()
+        self._threads = 0
+        self._idle = 0  # threads waiting for work and not yet woken
+        self._fanout = None  # executor for fan-out requests, built on first use
+        self._fanout_size = 0
+        self._fanout_running = 0
+
+    @property
+    def capacity(self):
+        return self._capacity or global_capacity()
+
+    def submit(self, share, fn, *args, limit=None):
+        """
+        Queue ``fn(*args)`` as one submission of ``share``'s job; returns a Future.
+
+        ``limit`` caps how many of the job's submissions run at once.
+        """
+        future = Future()
+        with self._condition:
+            self._queues.setdefault(share.job_id, deque()).append(
+                (share, next(self._arrivals), future, fn, args)
+            )
+            if limit:
+                self._limits[share.job_id] = limit
+            if self._idle:
+                self._idle -= 1
+                self._condition.notify()
+            elif self._threads < self.capacity:
+                self._threads += 1
+                threading.Thread(target=self._work, daemon=True, name=f"{self._name}-{self._threads}").start()
+        return future
+
+    def _next(self):
+        """Take the next submission to start, or None (caller holds the lock)."""
+        heads = [
+            queue[0]
+            for job_id, queue in self._queues.items()
+            if self._running.jobs[job_id] < self._limits.get(job_id, float("inf"))
+        ]
+        if not heads:
+            return None
+        item = min(heads, key=lambda head: self._running.key(head[0]) + (head[1],))
+        job_id = item[0].job_id
+        self._queues[job_id].popleft()
+        if not self._queues[job_id]:
+            del self._queues[job_id]
+            self._limits.pop(job_id, None)
+        return item
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._threads > self.capacity:
+                        self._threads -= 1  # capacity was lowered
+                        return
+                    # Slots taken by fan-out requests are not free for submissions
+                    item = self._next() if self._in_use < self.capacity else None
+                    if item is not None:
+                        break
+                    self._idle += 1
+                    self._condition.wait()
+                share = item[0]
+                self._running.add(share)
+                self._in_use += 1
+
+            future, fn, args = item[2:]
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+
+            with self._condition:
+                self._running.add(share, -1)
+                self._in_use -= 1
+                if self._idle and self._queues:
+                    # A job held back by its limit may be able to start another
+                    self._idle -= 1
+                    self._condition.notify()
+
+    def try_fan_out(self, fn, *args):
+        """
+        Start ``fn(*args)`` on a free slot; returns its Future, or None when none is free.
+
+        The fan-out executor is sized to the capacity when first used; fan-outs
+        never take more slots than it has threads.
+        """
+        with self._condition:
+            if self._fanout is None:
+                self._fanout_size = self.capacity
+                self._fanout = ThreadPoolExecutor(
+                    max_workers=self._fanout_size, thread_name_prefix=f"{self._name}-fanout"
+                )
+            if self._in_use >= self.capacity or self._fanout_running >= self._fanout_size:
+                return None
+            self._in_use += 1
+            self._fanout_running += 1
+        future = self._fanout.submit(fn, *args)
+        future.add_done_callback(self._fan_out_done)
+        return future
+
+    def _fan_out_done(self, _future):
+        with self._condition:
+            self._in_use -= 1
+            self._fanout_running -= 1
+            if self._idle and self._queues:
+                self._idle -= 1
+                self._condition.notify()
+
+    def fan_out(self, fn, items, limit=None):
+        """
+        ``fn(item)`` for every item, at most ``limit`` at once; results in order.
+
+        Items that find no free slot are run on this thread.
+        """
+        futures, running = [], set()
+        for item in items:
+            if limit and len(running) >= limit:
+                _, running = wait(running, return_when=FIRST_COMPLETED)
+            future = self.try_fan_out(fn, item)
+            if future is None:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                try:
+                    future.set_result(fn(item))
+                except BaseException as e:
+                    future.set_exception(e)
+            futures.append(future)
+            running.add(future)
+        return [future.result() for future in futures]
+
+    def get_stats(self):
+        with self._condition:
+            jobs = {job_id: {"running": count, "waiting": 0} for job_id, count in self._running.jobs.items()}
+            for job_id, queue in self._queues.items():
+                jobs.setdefault(job_id, {"running": 0, "waiting": 0})["waiting"] = len(queue)
+            return {
+                "capacity": self.capacity,
+                "threads": self._threads,
+                "running": self._in_use,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "jobs": jobs,
+            }
+
+
+# Shared by every job the threaded runner grades in this process
+submission_pool = FairSharePool()
@@ -3,19 +3,36 @@ LLM Provider utilities for grading documents.
 This module consolidates all LLM provider logic to eliminate redundancy.
 """
 
+import asyncio
+import hashlib
+import inspect
 import json
+import logging
 import os
+import random
 import re
 import threading
 import time
+import uuid
+import weakref
 from abc import ABC, abstractmethod
-from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 
 import google.generativeai as genai
+import httpx
 import openai
 import requests
-from anthropic import Anthropic
-from openai import OpenAI
+from anthropic import Anthropic, AsyncAnthropic
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
 
 # Optional Redis import for distributed semaphore
 _redis_available = False
@@ -153,16 +170,39 @@ _provider_semaphores = {}
 _provider_limits = {}
 
 
-def _get_provider_limit(provider_name):
+def _get_provider_limit(provider_name, endpoint=None):
     """
-    Determine concurrency limit for a provider.
+    Determine concurrency limit for a provider, or for one of a local provider's servers.
 
     Resolution order:
     1. Environment variable PROVIDER_MAX_<PROVIDER_NAME_UPPER> (spaces -> _)
        e.g. PROVIDER_MAX_CLAUDE=6
     2. JSON mapping in PROVIDER_MAX_PARALLEL (env), e.g. {"Claude": 6, "LM Studio": 1}
     3. Defaults based on provider type (proprietary/local)
+
+    With ``endpoint`` (one URL from LM_STUDIO_URL / OLLAMA_URL) the limit is
+    for that server: PROVIDER_MAX_PARALLEL may name the URL itself, e.g.
+    {"http://gpu1:11434": 2}; otherwise PROVIDER_ENDPOINT_MAX[_<PROVIDER>]
+    applies, then DEFAULT_LOCAL_CONCURRENCY. A local provider's default
+    overall limit is the sum of its servers' limits.
     """
+    mapping = os.getenv("PROVIDER_MAX_PARALLEL")
+    try:
+        parsed = json.loads(mapping) if mapping else {}
+    except Exception:
+        # Ignore parse errors and fall through to defaults
+        parsed = {}
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    if endpoint is not None:
+        try:
+            if endpoint in parsed:
+                return max(1, int(parsed[endpoint]))
+        except Exception:
+            pass
+        return max(1, _provider_setting("PROVIDER_ENDPOINT_MAX", provider_name, _DEFAULT_LOCAL_CONCURRENCY, int))
+
     # Per-provider env var override
     env_key = f"PROVIDER_MAX_{provider_name.upper().replace(' ', '_')}"
     if env_key in os.environ:
@@ -172,67 +212,622 @@ def _get_provider_limit(provider_name):
             pass
 
     # JSON mapping override
-    mapping = os.getenv("PROVIDER_MAX_PARALLEL")
-    if mapping:
-        try:
-            parsed = json.loads(mapping)
-            if provider_name in parsed:
-                return int(parsed[provider_name])
-            # Support lower-case keys as well
-            if provider_name.lower() in parsed:
-                return int(parsed[provider_name.lower()])
-        except Exception:
-            # Ignore parse errors and fall through to defaults
-            pass
+    try:
+        if provider_name in parsed:
+            return int(parsed[provider_name])
+        # Support lower-case keys as well
+        if provider_name.lower() in parsed:
+            return int(parsed[provider_name.lower()])
+    except Exception:
+        # Ignore parse errors and fall through to defaults
+        pass
 
     # Defaults
     if provider_name in _PROPRIETARY_PROVIDERS:
         return _DEFAULT_PROPRIETARY_CONCURRENCY
     if provider_name in _LOCAL_PROVIDERS:
-        return _DEFAULT_LOCAL_CONCURRENCY
+        return sum(_get_provider_limit(provider_name, url) for url in local_endpoints(provider_name))
     # Fallback to proprietary default for unknown providers
     return _DEFAULT_PROPRIETARY_CONCURRENCY
 
 
-def _get_or_create_semaphore(provider_name):
-    """Lazily create a bounded semaphore for a provider with the configured limit.
-    Chooses Redis-backed semaphore if configured, otherwise falls back to in-process semaphore.
+# ============================================================================
+# ADAPTIVE (AIMD) CONCURRENCY
+# ============================================================================
+
+# Checked in order; the first match decides the error type
+_ERROR_PATTERNS = (
+    ("rate_limit", re.compile(r"\b429\b|rate.?limit|too many requests|quota", re.I)),
+    ("authentication", re.compile(r"\b40[13]\b|authenticat|api.?key|unauthori[sz]ed|forbidden", re.I)),
+    ("timeout", re.compile(r"timed? ?out|timeout|deadline", re.I)),
+    (
+        "server_error",
+        re.compile(r"error:? 5\d\d\b|\b5\d\d -|overload|internal server error|unavailable|bad gateway", re.I),
+    ),
+    ("network", re.compile(r"connect|network", re.I)),
+)
+
+# Error types that mean the provider is saturated and we should back off
+_OVERLOAD_ERRORS = {"rate_limit", "server_error", "timeout"}
+
+
+def classify_error(error):
     """
-    if provider_name in _provider_semaphores:
-        return _provider_semaphores[provider_name]
+    Map a provider error message to one of LLMProviderError.ERROR_TYPES' values.
 
-    limit = _get_provider_limit(provider_name)
+    Providers report failures as {"success": False, "error": "..."} dicts, so
+    the message text is all there is to go on.
+    """
+    text = str(error or "")
+    for error_type, pattern in _ERROR_PATTERNS:
+        if pattern.search(text):
+            return error_type
+    return "unknown"
 
-    # If Redis is requested/available, create a RedisSemaphore
+
+def _adaptive_enabled():
+    """Whether PROVIDER_ADAPTIVE_CONCURRENCY turns on AIMD limits."""
+    return os.getenv("PROVIDER_ADAPTIVE_CONCURRENCY", "").lower() in ("1", "true", "yes")
+
+
+def _provider_setting(name, provider_name, default, cast=float):
+    """Read <NAME>_<PROVIDER_NAME_UPPER>, then <NAME>, then fall back to default."""
+    for key in (f"{name}_{provider_name.upper().replace(' ', '_')}", name):
+        if key in os.environ:
+            try:
+                return cast(os.environ[key])
+            except ValueError:
+                pass
+    return default
+
+
+def _adaptive_bounds(provider_name):
+    """
+    Return (floor, initial, ceiling) in-flight limits for adaptive control.
+
+    The static limit from _get_provider_limit is the starting point;
+    PROVIDER_ADAPTIVE_MIN[_<PROVIDER>] (default 1) and
+    PROVIDER_ADAPTIVE_MAX[_<PROVIDER>] (default 4x the static limit) bound it.
+    """
+    initial = max(1, _get_provider_limit(provider_name))
+    floor = max(1, _provider_setting("PROVIDER_ADAPTIVE_MIN", provider_name, 1, int))
+    ceiling = max(floor, _provider_setting("PROVIDER_ADAPTIVE_MAX", provider_name, initial * 4, int))
+    return floor, initial, ceiling
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Additive-increase/multiplicative-decrease in-flight limit for one (provider, model).
+
+    Each healthy success raises the limit by ``increase / limit``, i.e. about
+    ``increase`` per window of requests. A rate limit, 5xx or timeout multiplies
+    it by ``decrease``, at most once per smoothed round trip so one burst of
+    failures counts as a single congestion event. Successes slower than
+    ``latency_tolerance`` times the best smoothed latency hold the limit steady.
+    """
+
+    def __init__(
+        self,
+        provider_name,
+        model,
+        initial,
+        floor=1,
+        ceiling=None,
+        increase=1.0,
+        decrease=0.5,
+        latency_tolerance=2.0,
+    ):
+        self.provider_name = provider_name
+        self.model = model
+        self.floor = max(1, int(floor))
+        self.ceiling = max(self.floor, int(ceiling if ceiling is not None else initial))
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max(initial, self.floor), self.ceiling))
+        self.in_flight = 0
+        self.latency_ewma = None
+        self.best_latency = None
+        self.successes = 0
+        self.failures = 0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def current_limit(self):
+        """Whole number of requests currently allowed in flight."""
+        return max(self.floor, int(self.limit))
+
+    def acquire(self, blocking=True, timeout=None):
+        """Take an in-flight slot; returns False if none freed up within timeout."""
+        with self._cond:
+            if blocking:
+                acquired = self._cond.wait_for(lambda: self.in_flight < self.current_limit, timeout)
+            else:
+                acquired = self.in_flight < self.current_limit
+            if acquired:
+                self.in_flight += 1
+            return acquired
+
+    def release(self):
+        """Give back an in-flight slot."""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._cond.notify()
+
+    def record(self, result, latency):
+        """Adjust the limit from one finished request's result dict and latency in seconds."""
+        error_type = None if result.get("success") else classify_error(result.get("error"))
+        now = time.monotonic()
+        with self._cond:
+            if error_type in _OVERLOAD_ERRORS:
+                self.throttled += 1
+                if now - self._last_decrease >= (self.latency_ewma or latency):
+                    self.limit = max(float(self.floor), self.limit * self.decrease)
+                    self._last_decrease = now
+                return
+            if error_type:
+                # Auth and malformed-request errors say nothing about capacity
+                self.failures += 1
+                return
+
+            self.successes += 1
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+            if self.best_latency is None or self.latency_ewma < self.best_latency:
+                self.best_latency = self.latency_ewma
+            if self.latency_ewma <= self.best_latency * self.latency_tolerance:
+                before = self.current_limit
+                self.limit = min(float(self.ceiling), self.limit + self.increase / self.limit)
+                if self.current_limit > before:
+                    self._cond.notify_all()
+
+    def get_stats(self):
+        """Snapshot of the limiter for monitoring."""
+        with self._cond:
+            return {
+                "provider": self.provider_name,
+                "model": self.model,
+                "limit": self.current_limit,
+                "limit_exact": round(self.limit, 3),
+                "floor": self.floor,
+                "ceiling": self.ceiling,
+                "in_flight": self.in_flight,
+                "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "failures": self.failures,
+            }
+
+
+_adaptive_limiters = {}  # (provider_name, model) -> AdaptiveConcurrencyLimiter
+_adaptive_lock = threading.Lock()
+
+
+def get_adaptive_limiter(provider_name, model=None):
+    """Return the shared AIMD limiter for a (provider, model), creating it on first use."""
+    key = (provider_name, model or "")
+    with _adaptive_lock:
+        limiter = _adaptive_limiters.get(key)
+        if limiter is None:
+            floor, initial, ceiling = _adaptive_bounds(provider_name)
+            limiter = _adaptive_limiters[key] = AdaptiveConcurrencyLimiter(
+                provider_name,
+                model,
+                initial,
+                floor=floor,
+                ceiling=ceiling,
+                increase=_provider_setting("PROVIDER_ADAPTIVE_INCREASE", provider_name, 1.0),
+                decrease=_provider_setting("PROVIDER_ADAPTIVE_DECREASE", provider_name, 0.5),
+                latency_tolerance=_provider_setting("PROVIDER_ADAPTIVE_LATENCY_TOLERANCE", provider_name, 2.0),
+            )
+        return limiter
+
+
+def get_adaptive_concurrency_stats():
+    """Current AIMD limits for every (provider, model) seen so far."""
+    with _adaptive_lock:
+        limiters = list(_adaptive_limiters.values())
+    return {
+        "enabled": _adaptive_enabled(),
+        "limiters": [limiter.get_stats() for limiter in limiters],
+    }
+
+
+class LatencyWindow:
+    """Rolling window of recent successful request latencies for one provider/model."""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q):
+        """Nearest-rank quantile of the window, or None when it is empty."""
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+_latency_windows = {}  # (provider_name, model) -> LatencyWindow
+_latency_windows_lock = threading.Lock()
+
+
+def record_latency(provider_name, model, seconds):
+    """Add a successful request's latency to the provider/model window."""
+    key = (provider_name, model or "")
+    with _latency_windows_lock:
+        window = _latency_windows.get(key)
+        if window is None:
+            window = _latency_windows[key] = LatencyWindow()
+    window.add(seconds)
+
+
+def latency_quantile(provider_name, model=None, q=0.95, min_samples=1):
+    """Observed latency quantile for a provider/model, or None with fewer than min_samples."""
+    window = _latency_windows.get((provider_name, model or ""))
+    if window is None or len(window) < max(1, min_samples):
+        return None
+    return window.quantile(q)
+
+
+class _ProviderSlot:
+    """Yielded by provider_semaphore; callers report how the request went via record()."""
+
+    def __init__(self, limiter, rate_limiter=None, estimated_tokens=0, provider_name=None, model=None):
+        self.limiter = limiter
+        self.rate_limiter = rate_limiter
+        self.estimated_tokens = estimated_tokens
+        self.provider_name = provider_name
+        self.model = model
+        self.started = time.monotonic()
+
+    def record(self, result):
+        """Feed a grading result dict back to the latency window and the adaptive and rate limiters."""
+        latency = time.monotonic() - self.started
+        if self.provider_name is not None:
+            metrics.observe_provider_request(self.provider_name, self.model, latency, result)
+            if result.get("success"):
+                record_latency(self.provider_name, self.model, latency)
+        if self.limiter is not None:
+            self.limiter.record(result, latency)
+        if self.rate_limiter is not None:
+            self.rate_limiter.reconcile(self.estimated_tokens, result)
+
+
+def _shared_redis_client():
+    """
+    Return the Redis client shared by cross-process limits, or None.
+
+    Redis is used when USE_REDIS_SEMAPHORE is set or REDIS_URL is configured
+    and redis-py is installed; callers fall back to in-process state otherwise.
+    """
     use_redis = False
     if os.getenv("USE_REDIS_SEMAPHORE", "").lower() in ("1", "true", "yes"):
         use_redis = True
     if os.getenv("REDIS_URL"):
         use_redis = True
+    if not (use_redis and _redis_available):
+        return None
+
+    # Initialize global redis client lazily
+    global _redis_client
+    if _redis_client is None:
+        try:
+            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+            _redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+        except Exception:
+            _redis_client = None
+    return _redis_client
+
+
+# ============================================================================
+# RPM / TPM TOKEN BUCKETS
+# ============================================================================
+
+
+def estimate_request_tokens(grade_kwargs):
+    """
+    Upper-bound token estimate for a grading request before it is sent.
+
+    Prompt tokens are approximated at four characters per token; max_tokens is
+    added because providers count the completion budget against TPM up front.
+    """
+    characters = len(GRADER_SYSTEM_PROMPT)
+    for key in ("prompt", "marking_scheme_content", "text"):
+        characters += len(grade_kwargs.get(key) or "")
+    return characters // 4 + int(grade_kwargs.get("max_tokens") or 0)
+
+
+def _usage_total_tokens(usage):
+    """Total tokens from an OpenAI- or Anthropic-style usage dict, or None."""
+    if not isinstance(usage, dict):
+        return None
+    if usage.get("total_tokens") is not None:
+        return int(usage["total_tokens"])
+    counts = [
+        usage.get(key)
+        for key in (
+            "prompt_tokens",
+            "completion_tokens",
+            "input_tokens",
+            "output_tokens",
+            "cache_creation_input_tokens",
+            "cache_read_input_tokens",
+        )
+    ]
+    counts = [int(c) for c in counts if isinstance(c, (int, float))]
+    return sum(counts) if counts else None
+
+
+class TokenBucket:
+    """
+    In-process token bucket holding up to ``per_minute`` tokens, refilled continuously.
+
+    try_acquire() either takes the tokens or says how long to wait, so callers
+    sleep exactly as long as needed instead of polling. adjust() settles the
+    difference once the real cost is known; the balance may go negative.
+    """
+
+    def __init__(self, name, per_minute):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount):
+        """Take ``amount`` tokens; returns 0 on success or seconds until they are available."""
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) tokens after the fact."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - float(delta))
+
+    def available(self):
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared by every worker through Redis.
+
+    Refill and charge happen atomically in Lua against the Redis server clock,
+    so workers on different hosts agree on the balance. Redis errors admit the
+    request: pacing is best-effort and must not stall grading.
+    """
+
+    _ACQUIRE_LUA = (
+        "local capacity = tonumber(ARGV[1])\n"
+        "local rate = tonumber(ARGV[2])\n"
+        "local amount = tonumber(ARGV[3])\n"
+        "local t = redis.call('time')\n"
+        "local now = tonumber(t[1]) + tonumber(t[2]) / 1000000\n"
+        "local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')\n"
+        "local tokens = tonumber(state[1]) or capacity\n"
+        "local updated = tonumber(state[2]) or now\n"
+        "tokens = math.min(capacity, tokens + (now - updated) * rate)\n"
+        "local wait = 0\n"
+        "if tokens >= amount then\n"
+        "    tokens = tokens - amount\n"
+        "else\n"
+        "    wait = (amount - tokens) / rate\n"
+        "end\n"
+        "redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))\n"
+        "redis.call('expire', KEYS[1], 3600)\n"
+        "return tostring(wait)"
+    )
+
+    _ADJUST_LUA = (
+        "local capacity = tonumber(ARGV[1])\n"
+        "local rate = tonumber(ARGV[2])\n"
+        "local t = redis.call('time')\n"
+        "local now = tonumber(t[1]) + tonumber(t[2]) / 1000000\n"
+        "local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')\n"
+        "local tokens = tonumber(state[1]) or capacity\n"
+        "local updated = tonumber(state[2]) or now\n"
+        "tokens = math.min(capacity, tokens + (now - updated) * rate - tonumber(ARGV[3]))\n"
+        "redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))\n"
+        "redis.call('expire', KEYS[1], 3600)\n"
+        "return tostring(tokens)"
+    )
+
+    def __init__(self, client, name, per_minute):
+        self.client = client
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.key = f"ratelimit:{name}"
+        self._acquire_script = client.register_script(self._ACQUIRE_LUA)
+        self._adjust_script = client.register_script(self._ADJUST_LUA)
+
+    def try_acquire(self, amount):
+        amount = min(float(amount), self.capacity)
+        try:
+            return float(self._acquire_script(keys=[self.key], args=[self.capacity, self.rate, amount]))
+        except Exception:
+            return 0.0
+
+    def adjust(self, delta):
+        try:
+            self._adjust_script(keys=[self.key], args=[self.capacity, self.rate, float(delta)])
+        except Exception:
+            pass
+
+    def available(self):
+        try:
+            return float(self._adjust_script(keys=[self.key], args=[self.capacity, self.rate, 0]))
+        except Exception:
+            return None
 
-    if use_redis and _redis_available:
-        # Initialize global redis client lazily
-        global _redis_client
-        if _redis_client is None:
-            try:
-                redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-                _redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
-            except Exception:
-                _redis_client = None
 
-        if _redis_client:
-            sem = RedisSemaphore(
-                _redis_client,
+class ProviderRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one provider.
+
+    Limits come from PROVIDER_RPM[_<PROVIDER>] and PROVIDER_TPM[_<PROVIDER>];
+    an unset or zero limit is not enforced. Requests pre-charge their estimated
+    tokens and reconcile() trues the TPM bucket up against reported usage.
+    """
+
+    def __init__(self, provider_name, rpm=0, tpm=0, redis_client=None):
+        self.provider_name = provider_name
+
+        def bucket(kind, per_minute):
+            if not per_minute or per_minute <= 0:
+                return None
+            name = f"{provider_name}:{kind}"
+            if redis_client is not None:
+                try:
+                    return RedisTokenBucket(redis_client, name, per_minute)
+                except Exception:
+                    # Fall back to per-process pacing if scripts cannot be registered
+                    pass
+            return TokenBucket(name, per_minute)
+
+        self.requests = bucket("rpm", rpm)
+        self.tokens = bucket("tpm", tpm)
+        self.waited_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.requests is not None or self.tokens is not None
+
+    def _try_acquire(self, estimated_tokens):
+        """Take one request and the estimated tokens, or return seconds to wait."""
+        if self.requests is not None:
+            wait = self.requests.try_acquire(1)
+            if wait:
+                return wait
+        if self.tokens is not None and estimated_tokens:
+            wait = self.tokens.try_acquire(estimated_tokens)
+            if wait:
+                # Give the request slot back until the tokens are there too
+                if self.requests is not None:
+                    self.requests.adjust(-1)
+                return wait
+        return 0.0
+
+    def acquire(self, estimated_tokens, timeout=None):
+        """Block until both buckets admit the request; raises TimeoutError past ``timeout``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError(f"Timeout waiting for {self.provider_name} rate limit")
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    async def aacquire(self, estimated_tokens, timeout=None):
+        """Async counterpart of acquire()."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, estimated_tokens)
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise TimeoutError(f"Timeout waiting for {self.provider_name} rate limit")
+            self.waited_seconds += wait
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated_tokens, result):
+        """Settle the TPM bucket once a request's real token usage is known."""
+        if self.tokens is None or not estimated_tokens:
+            return
+        actual = _usage_total_tokens(result.get("usage")) if result.get("success") else None
+        # Failed requests generally are not billed against TPM; refund them
+        self.tokens.adjust((actual or 0) - estimated_tokens)
+
+    def get_stats(self):
+        return {
+            "provider": self.provider_name,
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            "requests_available": self.requests.available() if self.requests else None,
+            "tokens_available": self.tokens.available() if self.tokens else None,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+_rate_limiters = {}  # provider_name -> ProviderRateLimiter
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider_name):
+    """Return the RPM/TPM limiter for a provider, or None when no limits are configured."""
+    with _rate_limiters_lock:
+        if provider_name not in _rate_limiters:
+            limiter = ProviderRateLimiter(
                 provider_name,
-                limit,
-                ttl=int(os.getenv("PROVIDER_SEMAPHORE_TTL", "300")),
+                rpm=_provider_setting("PROVIDER_RPM", provider_name, 0),
+                tpm=_provider_setting("PROVIDER_TPM", provider_name, 0),
+                redis_client=_shared_redis_client(),
             )
-            _provider_semaphores[provider_name] = sem
-            _provider_limits[provider_name] = limit
-            return sem
-        else:
-            # Fall through to in-process semaphore if redis init failed
-            pass
+            _rate_limiters[provider_name] = limiter if limiter.enabled else None
+        return _rate_limiters[provider_name]
+
+
+def get_rate_limit_stats():
+    """RPM/TPM bucket state for every provider with configured limits."""
+    with _rate_limiters_lock:
+        limiters = [limiter for limiter in _rate_limiters.values() if limiter is not None]
+    return [limiter.get_stats() for limiter in limiters]
+
+
+def _get_or_create_semaphore(provider_name):
+    """Lazily create a bounded semaphore for a provider with the configured limit.
+    Chooses Redis-backed semaphore if configured, otherwise falls back to in-process semaphore.
+    """
+    if provider_name in _provider_semaphores:
+        return _provider_semaphores[provider_name]
+
+    # With adaptive control the shared semaphore is only the hard ceiling
+    if _adaptive_enabled():
+        limit = _adaptive_bounds(provider_name)[2]
+    else:
+        limit = _get_provider_limit(provider_name)
+
+    # If Redis is requested/available, create a RedisSemaphore
+    client = _shared_redis_client()
+    if client:
+        sem = RedisSemaphore(
+            client,
+            provider_name,
+            limit,
+            lease_seconds=float(os.getenv("PROVIDER_SEMAPHORE_LEASE", "30")),
+        )
+        _provider_semaphores[provider_name] = sem
+        _provider_limits[provider_name] = limit
+        return sem
 
     # Fall back to in-process semaphore
     sem = threading.BoundedSemaphore(limit)
@@ -241,165 +836,1687 @@ def _get_or_create_semaphore(provider_name):
     return sem
 
 
-# Redis-backed semaphore implementation
+class WaitTimeHistogram:
+    """Cumulative histogram of semaphore wait times (Prometheus-style ``le`` buckets)."""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, timed_out=False):
+        with self._lock:
+            index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if timed_out:
+                self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(list(self.BUCKETS) + ["+Inf"], self.counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            return {
+                "buckets": buckets,
+                "count": self.count,
+                "sum_seconds": round(self.total, 6),
+                "timeouts": self.timeouts,
+            }
+
+
+_semaphore_wait_histograms = {}  # provider_name -> WaitTimeHistogram
+_semaphore_wait_lock = threading.Lock()
+
+
+def _observe_semaphore_wait(provider_name, seconds, timed_out=False):
+    metrics.SEMAPHORE_WAIT_SECONDS.labels(provider_name).observe(seconds)
+    with _semaphore_wait_lock:
+        histogram = _semaphore_wait_histograms.get(provider_name)
+        if histogram is None:
+            histogram = _semaphore_wait_histograms[provider_name] = WaitTimeHistogram()
+    histogram.observe(seconds, timed_out)
+
+
+def get_semaphore_stats():
+    """Per-provider shared semaphore type, limit, holders and wait-time histogram."""
+    with _semaphore_wait_lock:
+        histograms = dict(_semaphore_wait_histograms)
+    stats = []
+    for provider_name, sem in list(_provider_semaphores.items()):
+        entry = {
+            "provider": provider_name,
+            "backend": "redis" if isinstance(sem, RedisSemaphore) else "local",
+            "limit": _provider_limits.get(provider_name),
+            "wait_seconds": histograms[provider_name].snapshot() if provider_name in histograms else None,
+        }
+        if isinstance(sem, RedisSemaphore):
+            entry["holders"] = sem.holder_count()
+        stats.append(entry)
+    return stats
+
+
 class RedisSemaphore:
     """
-    A simple Redis-backed semaphore using an atomic Lua script.
-    Keys:
-      - counter key: stores current count
-    Notes:
-      - This semaphore is lightweight and per-key; it does not track holders individually.
-      - TTL is applied to the counter to avoid stale locks if a process dies without releasing,
-        but this means a semaphore count can reset after TTL seconds if all processes fail to release.
-      - This is suitable for limiting parallel requests across processes but not for strong leader-election.
+    Distributed counting semaphore with one lease per holder.
+
+    Holders are members of a sorted set scored by lease expiry (Redis server
+    time, ms). Acquiring first drops expired leases, so a crashed worker's slot
+    comes back once its lease lapses rather than when a shared counter resets.
+    Live holders are kept alive by a per-process heartbeat thread renewing
+    leases every third of the lease length.
+
+    Waiters block on BLPOP of a wake-up list that release() pushes to, bounded
+    by the time until the earliest lease expires, so there is no polling.
+    acquire() returns a lease id to pass back to release().
     """
 
     _ACQUIRE_LUA = (
-        "local current = tonumber(redis.call('get', KEYS[1]) or '0')\n"
-        "if current < tonumber(ARGV[1]) then\n"
-        "    current = redis.call('incr', KEYS[1])\n"
-        "    redis.call('expire', KEYS[1], ARGV[2])\n"
-        "    return 1\n"
-        "else\n"
-        "    return 0\n"
-        "end"
+        "local t = redis.call('time')\n"
+        "local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)\n"
+        "redis.call('zremrangebyscore', KEYS[1], '-inf', now)\n"
+        "if redis.call('zcard', KEYS[1]) < tonumber(ARGV[1]) then\n"
+        "    redis.call('zadd', KEYS[1], now + tonumber(ARGV[3]), ARGV[2])\n"
+        "    redis.call('pexpire', KEYS[1], tonumber(ARGV[3]) * 2)\n"
+        "    return -1\n"
+        "end\n"
+        "local first = redis.call('zrange', KEYS[1], 0, 0, 'WITHSCORES')\n"
+        "return tonumber(first[2]) - now"
     )
 
     _RELEASE_LUA = (
-        "local current = tonumber(redis.call('get', KEYS[1]) or '0')\n"
-        "if current > 0 then\n"
-        "    redis.call('decr', KEYS[1])\n"
-        "    return 1\n"
-        "else\n"
+        "local removed = redis.call('zrem', KEYS[1], ARGV[1])\n"
+        "redis.call('rpush', KEYS[2], '1')\n"
+        "redis.call('ltrim', KEYS[2], 0, tonumber(ARGV[2]) - 1)\n"
+        "redis.call('pexpire', KEYS[2], ARGV[3])\n"
+        "return removed"
+    )
+
+    _RENEW_LUA = (
+        "if not redis.call('zscore', KEYS[1], ARGV[1]) then\n"
         "    return 0\n"
-        "end"
+        "end\n"
+        "local t = redis.call('time')\n"
+        "local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)\n"
+        "redis.call('zadd', KEYS[1], 'XX', now + tonumber(ARGV[2]), ARGV[1])\n"
+        "redis.call('pexpire', KEYS[1], tonumber(ARGV[2]) * 2)\n"
+        "return 1"
     )
 
-    def __init__(self, client, name, limit, ttl=300):
+    _heartbeat_leases = {}  # lease_id -> RedisSemaphore, for every lease held by this process
+    _heartbeat_lock = threading.Lock()
+    _heartbeat_thread = None
+
+    def __init__(self, client, name, limit, lease_seconds=30):
         self.client = client
         self.name = name
         self.limit = int(limit)
-        self.ttl = int(ttl)
-        self.counter_key = f"semaphore:{self.name}:counter"
-        try:
-            self._acquire_script = client.register_script(self._ACQUIRE_LUA)
-            self._release_script = client.register_script(self._RELEASE_LUA)
-        except Exception:
-            # redis-py clients sometimes don't support register_script in certain configs;
-            # fall back to EVAL if necessary by storing None and using eval directly.
-            self._acquire_script = None
-            self._release_script = None
-
-    def acquire(self, timeout=300, sleep_interval=0.1):
-        """Try to acquire the semaphore within timeout seconds."""
-        import time
+        self.lease_ms = max(1000, int(float(lease_seconds) * 1000))
+        self.holders_key = f"semaphore:{self.name}:holders"
+        self.wake_key = f"semaphore:{self.name}:wake"
+        self._acquire_script = client.register_script(self._ACQUIRE_LUA)
+        self._release_script = client.register_script(self._RELEASE_LUA)
+        self._renew_script = client.register_script(self._RENEW_LUA)
+
+    def acquire(self, timeout=300):
+        """
+        Wait up to ``timeout`` seconds for a slot.
 
-        deadline = time.time() + timeout
-        while time.time() < deadline:
+        Returns the lease id, or None on timeout or Redis errors (callers treat
+        both as a failed acquire rather than hanging).
+        """
+        lease_id = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while True:
             try:
-                if self._acquire_script:
-                    res = self._acquire_script(keys=[self.counter_key], args=[self.limit, self.ttl])
-                else:
-                    res = self.client.eval(self._ACQUIRE_LUA, 1, self.counter_key, self.limit, self.ttl)
-                if int(res) == 1:
-                    return True
+                result = int(
+                    self._acquire_script(keys=[self.holders_key], args=[self.limit, lease_id, self.lease_ms])
+                )
             except Exception:
-                # On any redis error, break and fallback to failure to avoid hanging
-                return False
-            time.sleep(sleep_interval)
-        return False
+                return None
+            if result < 0:
+                self._track(lease_id)
+                return lease_id
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Sleep until a release wakes us, the oldest lease lapses, or we time out
+            block = min(remaining, max(result / 1000.0, 0.01))
+            try:
+                self.client.blpop([self.wake_key], timeout=block)
+            except Exception:
+                return None
 
-    def release(self):
-        """Release one slot in the semaphore."""
+    def release(self, lease_id):
+        """Drop a lease and wake one waiter."""
+        self._untrack(lease_id)
         try:
-            if self._release_script:
-                res = self._release_script(keys=[self.counter_key], args=[])
-            else:
-                res = self.client.eval(self._RELEASE_LUA, 1, self.counter_key)
+            res = self._release_script(
+                keys=[self.holders_key, self.wake_key], args=[lease_id, self.limit, self.lease_ms]
+            )
             return int(res) == 1
         except Exception:
-            # Suppress errors to avoid masking original exceptions
+            # Suppress errors to avoid masking original exceptions; the lease will lapse
+            return False
+
+    def renew(self, lease_id):
+        """Extend a held lease; returns False if it already lapsed."""
+        try:
+            return int(self._renew_script(keys=[self.holders_key], args=[lease_id, self.lease_ms])) == 1
+        except Exception:
             return False
 
+    def holder_count(self):
+        """Number of unexpired leases (approximate; expired ones are pruned on acquire)."""
+        try:
+            return int(self.client.zcard(self.holders_key))
+        except Exception:
+            return None
+
+    def _track(self, lease_id):
+        cls = type(self)
+        with cls._heartbeat_lock:
+            cls._heartbeat_leases[lease_id] = self
+            if cls._heartbeat_thread is None or not cls._heartbeat_thread.is_alive():
+                cls._heartbeat_thread = threading.Thread(
+                    target=cls._heartbeat_loop, name="redis-semaphore-heartbeat", daemon=True
+                )
+                cls._heartbeat_thread.start()
+
+    def _untrack(self, lease_id):
+        with type(self)._heartbeat_lock:
+            type(self)._heartbeat_leases.pop(lease_id, None)
+
+    @classmethod
+    def _heartbeat_loop(cls):
+        """Renew every lease this process holds; exits when none are left."""
+        while True:
+            with cls._heartbeat_lock:
+                leases = list(cls._heartbeat_leases.items())
+                if not leases:
+                    cls._heartbeat_thread = None
+                    return
+            interval = min(sem.lease_ms for _, sem in leases) / 3000.0
+            time.sleep(interval)
+            for lease_id, sem in leases:
+                with cls._heartbeat_lock:
+                    if lease_id not in cls._heartbeat_leases:
+                        continue
+                if not sem.renew(lease_id):
+                    logger.warning(f"Lease {lease_id} on semaphore {sem.name} lapsed before renewal")
+
+
+def _release_slot(sem, token):
+    """Hand back a slot taken from a threading, adaptive or Redis semaphore."""
+    if isinstance(sem, RedisSemaphore):
+        sem.release(token)
+    else:
+        sem.release()
+
 
 @contextmanager
-def provider_semaphore(provider_name):
+def provider_semaphore(provider_name, model=None, estimated_tokens=0):
     """
     Context manager that acquires/releases a semaphore for the given provider.
     Waits up to PROVIDER_SEMAPHORE_TIMEOUT seconds (default 300) to acquire; raises TimeoutError if not acquired.
     Uses Redis-backed semaphore when configured; otherwise uses an in-process threading semaphore.
+
+    Requests first wait for the provider's RPM/TPM buckets (charging
+    ``estimated_tokens``), then, with PROVIDER_ADAPTIVE_CONCURRENCY enabled,
+    for the (provider, model) AIMD limiter. Yields a slot whose record(result)
+    feeds both.
     """
     timeout = int(os.getenv("PROVIDER_SEMAPHORE_TIMEOUT", "300"))
-    sem = _get_or_create_semaphore(provider_name)
-
-    # If using RedisSemaphore, it exposes acquire/release methods.
-    acquired = False
+    rate_limiter = get_rate_limiter(provider_name)
+    if rate_limiter is not None:
+        rate_limiter.acquire(estimated_tokens, timeout=timeout)
+    limiter = get_adaptive_limiter(provider_name, model) if _adaptive_enabled() else None
+    limiter_acquired = False
+    slot = None
+
+    # RedisSemaphore.acquire returns a lease id; threading semaphores return True
+    acquired = None
     try:
-        if isinstance(sem, RedisSemaphore):
-            acquired = sem.acquire(timeout=timeout)
-            if not acquired:
-                raise TimeoutError(f"Timeout acquiring redis semaphore for provider {provider_name}")
-            yield
-        else:
-            acquired = sem.acquire(timeout=timeout)
-            if not acquired:
-                raise TimeoutError(f"Timeout acquiring local semaphore for provider {provider_name}")
-            yield
+        if limiter is not None:
+            limiter_acquired = limiter.acquire(timeout=timeout)
+            if not limiter_acquired:
+                raise TimeoutError(f"Timeout acquiring adaptive concurrency slot for provider {provider_name}")
+        sem = _get_or_create_semaphore(provider_name)
+        started = time.monotonic()
+        acquired = sem.acquire(timeout=timeout)
+        _observe_semaphore_wait(provider_name, time.monotonic() - started, timed_out=not acquired)
+        if not acquired:
+            backend = "redis" if isinstance(sem, RedisSemaphore) else "local"
+            raise TimeoutError(f"Timeout acquiring {backend} semaphore for provider {provider_name}")
+        slot = _ProviderSlot(limiter, rate_limiter, estimated_tokens, provider_name, model)
+        yield slot
     finally:
+        if slot is None and rate_limiter is not None:
+            # The request was never sent: refund the tokens charged up front
+            rate_limiter.reconcile(estimated_tokens, {"success": False})
+        if limiter_acquired:
+            limiter.release()
         if acquired:
             try:
-                if isinstance(sem, RedisSemaphore):
-                    sem.release()
-                else:
-                    sem.release()
+                _release_slot(sem, acquired)
             except Exception:
                 # Best-effort release; ignore to avoid masking original exceptions
                 pass
 
 
-class LLMProvider(ABC):
-    """Abstract Base Class for LLM Providers."""
+# Per-event-loop asyncio gates in front of the shared provider semaphores
+_async_provider_gates = weakref.WeakKeyDictionary()  # loop -> {provider_name: asyncio.Semaphore}
 
-    @abstractmethod
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model=None,
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        """
-        Abstract method to grade a document using the LLM provider.
-        Implementations should handle API calls, error handling, and response parsing.
 
-        Parameters:
-          - text: The document text to grade.
-          - prompt: The grading instructions / prompt.
-          - model: Optional provider-specific model identifier (e.g. 'gpt-4o', 'claude-4-opus-20250805').
-          - marking_scheme_content: Optional marking scheme text to include.
-          - temperature: Model temperature.
-          - max_tokens: Maximum tokens for the response.
-        """
+async def _acquire_in_thread(sem, timeout):
+    """
+    Block on a threading/Redis semaphore from a worker thread.
 
-    def test_connection(self, model=None, timeout=60):
-        """
-        Test API connectivity with a minimal request.
+    If the awaiting coroutine is cancelled, a slot the thread still manages to
+    take is handed back instead of leaking.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(sem.acquire, timeout=timeout))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        future.add_done_callback(
+            lambda f: _release_slot(sem, f.result())
+            if not f.cancelled() and f.exception() is None and f.result()
+            else None
+        )
+        raise
+
+
+@asynccontextmanager
+async def async_provider_semaphore(provider_name, model=None, estimated_tokens=0):
+    """
+    Async counterpart of provider_semaphore for the asyncio job runner.
+
+    Coroutines first queue on a per-event-loop asyncio.Semaphore sized to the
+    provider limit, so hundreds of waiting requests cost no threads. A coroutine
+    holding a local slot then takes the adaptive limiter (when enabled) and the
+    shared threading/Redis semaphore, which keeps the limit global across the
+    thread-pool runner, the async runner and other processes. RPM/TPM buckets
+    are awaited before any of these. Raises TimeoutError after
+    PROVIDER_SEMAPHORE_TIMEOUT seconds.
+    """
+    timeout = int(os.getenv("PROVIDER_SEMAPHORE_TIMEOUT", "300"))
+    rate_limiter = get_rate_limiter(provider_name)
+    if rate_limiter is not None:
+        await rate_limiter.aacquire(estimated_tokens, timeout=timeout)
+    adaptive = _adaptive_enabled()
+    loop = asyncio.get_running_loop()
+    gates = _async_provider_gates.setdefault(loop, {})
+    gate = gates.get(provider_name)
+    if gate is None:
+        size = _adaptive_bounds(provider_name)[2] if adaptive else _get_provider_limit(provider_name)
+        gate = gates[provider_name] = asyncio.Semaphore(max(1, size))
 
-        Attempts to make a minimal API call to verify the provider is accessible
-        and the API key is valid. Returns latency information on success.
+    try:
+        await asyncio.wait_for(gate.acquire(), timeout)
+    except BaseException as e:
+        if rate_limiter is not None:
+            # The request was never sent: refund the tokens charged up front
+            rate_limiter.reconcile(estimated_tokens, {"success": False})
+        if isinstance(e, asyncio.TimeoutError):
+            raise TimeoutError(f"Timeout acquiring async semaphore for provider {provider_name}")
+        raise
+
+    limiter = get_adaptive_limiter(provider_name, model) if adaptive else None
+    limiter_acquired = False
+    slot = None
+    sem = _get_or_create_semaphore(provider_name)
+    acquired = None
+    try:
+        if limiter is not None:
+            limiter_acquired = limiter.acquire(blocking=False) or await _acquire_in_thread(limiter, timeout)
+            if not limiter_acquired:
+                raise TimeoutError(f"Timeout acquiring adaptive concurrency slot for provider {provider_name}")
+        started = time.monotonic()
+        if not isinstance(sem, RedisSemaphore):
+            acquired = sem.acquire(blocking=False)
+        if not acquired:
+            acquired = await _acquire_in_thread(sem, timeout)
+        _observe_semaphore_wait(provider_name, time.monotonic() - started, timed_out=not acquired)
+        if not acquired:
+            raise TimeoutError(f"Timeout acquiring semaphore for provider {provider_name}")
+        slot = _ProviderSlot(limiter, rate_limiter, estimated_tokens, provider_name, model)
+        yield slot
+    finally:
+        if slot is None and rate_limiter is not None:
+            rate_limiter.reconcile(estimated_tokens, {"success": False})
+        if acquired:
+            try:
+                _release_slot(sem, acquired)
+            except Exception:
+                # Best-effort release; ignore to avoid masking original exceptions
+                pass
+        if limiter_acquired:
+            limiter.release()
+        gate.release()
 
-        Args:
-            model (str, optional): Provider-specific model to test
-            timeout (int): Request timeout in seconds
 
-        Returns:
-            dict: {
-                "success": bool,
-                "latency_ms": int (on success),
-                "message": str,
-                "error_type": str (on failure)
+# ============================================================================
+# RETRIES AND CIRCUIT BREAKERS
+# ============================================================================
+
+# Error types worth another attempt; authentication and unknown errors fail fast
+_RETRYABLE_ERRORS = {"rate_limit", "server_error", "timeout", "network"}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _attach_retry_after(result, headers):
+    """Copy a failed response's Retry-After (or retry-after-ms) header onto the result dict."""
+    if not headers or not isinstance(result, dict) or result.get("success"):
+        return result
+    try:
+        retry_after_ms, retry_after = headers.get("retry-after-ms"), headers.get("retry-after")
+    except AttributeError:
+        return result
+    if isinstance(retry_after_ms, str) and retry_after_ms:
+        retry_after = parse_retry_after(retry_after_ms)
+        retry_after = retry_after / 1000.0 if retry_after is not None else None
+    else:
+        retry_after = parse_retry_after(retry_after) if isinstance(retry_after, str) else None
+    if retry_after is not None:
+        result["retry_after"] = retry_after
+    return result
+
+
+def _exception_headers(exc):
+    """Response headers carried by SDK HTTP errors (anthropic/openai APIStatusError), if any."""
+    return getattr(getattr(exc, "response", None), "headers", None)
+
+
+class CircuitBreaker:
+    """
+    Per provider/model breaker over retryable failures.
+
+    Closed: requests flow. After ``threshold`` consecutive retryable failures
+    the breaker opens for ``cooldown`` seconds (or the provider's Retry-After,
+    if longer) and callers wait instead of sending requests. Once the cooldown
+    passes it goes half-open and lets a single probe through; the probe's
+    outcome closes or re-opens it.
+    """
+
+    def __init__(self, provider_name, model=None, threshold=5, cooldown=30.0):
+        self.provider_name = provider_name
+        self.model = model
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """
+        Seconds until a request may be sent; 0 means go now.
+
+        In half-open state the first caller to see 0 becomes the probe, and
+        everyone else waits for its outcome.
+        """
+        return self.admit()[0]
+
+    def admit(self):
+        """
+        Return (seconds to wait, whether this caller is the half-open probe).
+
+        A probe must end in record() or, if it leaves without a result
+        (an exception, a timeout, cancellation), in release_probe();
+        otherwise the breaker stays half-open with nobody allowed through.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return 0.0, False
+            now = time.monotonic()
+            if self.state == "open":
+                if now < self._open_until:
+                    return self._open_until - now, False
+                self.state = "half_open"
+            if self._probe_in_flight:
+                return min(1.0, self.cooldown), False
+            self._probe_in_flight = True
+            return 0.0, True
+
+    def release_probe(self):
+        """Let another caller probe after this probe left without a result."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, result, retry_after=None):
+        """Update state from a grading result dict."""
+        with self._lock:
+            self._probe_in_flight = False
+            if result.get("success"):
+                self.state = "closed"
+                self.consecutive_failures = 0
+                return
+            if classify_error(result.get("error")) not in _RETRYABLE_ERRORS:
+                return
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.threshold:
+                self.state = "open"
+                self.opened += 1
+                self._open_until = time.monotonic() + max(self.cooldown, retry_after or 0.0)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "provider": self.provider_name,
+                "model": self.model,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened": self.opened,
+                "retry_in": round(max(0.0, self._open_until - time.monotonic()), 3) if self.state == "open" else 0,
+            }
+
+
+_circuit_breakers = {}  # (provider_name, model) -> CircuitBreaker
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider_name, model=None):
+    """
+    Shared breaker for a provider/model, or None when disabled.
+
+    PROVIDER_BREAKER_THRESHOLD[_<PROVIDER>] (default 5, 0 disables) consecutive
+    retryable failures open it for PROVIDER_BREAKER_COOLDOWN[_<PROVIDER>]
+    seconds (default 30).
+    """
+    threshold = _provider_setting("PROVIDER_BREAKER_THRESHOLD", provider_name, 5, int)
+    if threshold <= 0:
+        return None
+    key = (provider_name, model or "")
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(key)
+        if breaker is None:
+            cooldown = _provider_setting("PROVIDER_BREAKER_COOLDOWN", provider_name, 30.0)
+            breaker = _circuit_breakers[key] = CircuitBreaker(provider_name, model, threshold, cooldown)
+        return breaker
+
+
+def get_circuit_breaker_stats():
+    """Snapshot of every circuit breaker created so far."""
+    with _circuit_breakers_lock:
+        breakers = list(_circuit_breakers.values())
+    return [breaker.get_stats() for breaker in breakers]
+
+
+class RetryPolicy:
+    """
+    How often and how long to retry one provider's failed grading calls.
+
+    Settings accept a _<PROVIDER> suffix: PROVIDER_RETRY_ATTEMPTS (total
+    attempts, default 3), PROVIDER_RETRY_BASE_DELAY (default 1s) and
+    PROVIDER_RETRY_MAX_DELAY (default 60s). Backoff is "full jitter" --
+    uniform in [0, min(max, base * 2**n)] -- unless the provider sent
+    Retry-After, which is honoured (up to the max delay).
+    """
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=60.0):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(0.0, float(max_delay))
+
+    @classmethod
+    def for_provider(cls, provider_name):
+        return cls(
+            attempts=_provider_setting("PROVIDER_RETRY_ATTEMPTS", provider_name, 3, int),
+            base_delay=_provider_setting("PROVIDER_RETRY_BASE_DELAY", provider_name, 1.0),
+            max_delay=_provider_setting("PROVIDER_RETRY_MAX_DELAY", provider_name, 60.0),
+        )
+
+    def should_retry(self, result, attempt):
+        """Whether a result from the given (1-based) attempt deserves another try."""
+        if result.get("success") or attempt >= self.attempts:
+            return False
+        return classify_error(result.get("error")) in _RETRYABLE_ERRORS
+
+    def delay(self, result, attempt):
+        """Seconds to sleep before the next attempt."""
+        retry_after = result.get("retry_after")
+        if retry_after is not None:
+            return min(self.max_delay, float(retry_after)) + random.uniform(0, self.base_delay / 4)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def _breaker_deadline_error(provider_name, model):
+    label = f"{provider_name} ({model})" if model else provider_name
+    return {
+        "success": False,
+        "error": f"Circuit breaker open for {label}: provider unavailable, timeout waiting to retry",
+        "provider": provider_name,
+    }
+
+
+def _cancelled_result(provider_name):
+    return {
+        "success": False,
+        "error": "Cancelled: a hedged request finished first",
+        "provider": provider_name,
+        "cancelled": True,
+    }
+
+
+def _pause(seconds, cancelled=None):
+    """Sleep, waking early if the ``cancelled`` event is set."""
+    if cancelled is None:
+        time.sleep(seconds)
+    else:
+        cancelled.wait(seconds)
+
+
+def grade_with_retries(llm_provider, provider_name, grade_kwargs, cancelled=None):
+    """
+    Grade under provider_semaphore with retries and the provider/model circuit breaker.
+
+    Each attempt takes its own semaphore slot, so backoff sleeps never hold
+    concurrency. While the breaker is open, callers wait (up to
+    PROVIDER_SEMAPHORE_TIMEOUT) rather than sending requests. Returns the last
+    result dict, with "attempts" set when more than one was made.
+
+    ``cancelled`` is an optional threading.Event; once set, no further attempt
+    is started (a request already in flight on this thread runs to completion).
+    """
+    model = grade_kwargs.get("model")
+    policy = RetryPolicy.for_provider(provider_name)
+    breaker = get_circuit_breaker(provider_name, model)
+    deadline = time.monotonic() + int(os.getenv("PROVIDER_SEMAPHORE_TIMEOUT", "300"))
+    estimated_tokens = estimate_request_tokens(grade_kwargs)
+    attempt = 0
+    while True:
+        probe = False
+        while breaker is not None:
+            # Checked before admit() so a cancelled caller never takes the probe
+            if cancelled is not None and cancelled.is_set():
+                return _cancelled_result(provider_name)
+            wait, probe = breaker.admit()
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                return _breaker_deadline_error(provider_name, model)
+            _pause(wait, cancelled)
+
+        if cancelled is not None and cancelled.is_set():
+            if probe:
+                breaker.release_probe()
+            return _cancelled_result(provider_name)
+        attempt += 1
+        try:
+            with provider_semaphore(provider_name, model, estimated_tokens) as slot:
+                result = llm_provider.grade_document(**grade_kwargs)
+                slot.record(result)
+        except BaseException:
+            if probe:
+                breaker.release_probe()
+            raise
+        if breaker is not None:
+            breaker.record(result, result.get("retry_after"))
+        if attempt > 1:
+            result["attempts"] = attempt
+        if not policy.should_retry(result, attempt):
+            return result
+        _pause(policy.delay(result, attempt), cancelled)
+
+
+async def agrade_with_retries(llm_provider, provider_name, grade_kwargs):
+    """Async counterpart of grade_with_retries; sleeps on the event loop and is cancelled like any task."""
+    model = grade_kwargs.get("model")
+    policy = RetryPolicy.for_provider(provider_name)
+    breaker = get_circuit_breaker(provider_name, model)
+    deadline = time.monotonic() + int(os.getenv("PROVIDER_SEMAPHORE_TIMEOUT", "300"))
+    estimated_tokens = estimate_request_tokens(grade_kwargs)
+    attempt = 0
+    while True:
+        probe = False
+        while breaker is not None:
+            wait, probe = breaker.admit()
+            if wait <= 0:
+                break
+            if time.monotonic() + wait > deadline:
+                return _breaker_deadline_error(provider_name, model)
+            await asyncio.sleep(wait)
+
+        attempt += 1
+        try:
+            async with async_provider_semaphore(provider_name, model, estimated_tokens) as slot:
+                result = await llm_provider.agrade_document(**grade_kwargs)
+                slot.record(result)
+        except BaseException:
+            # Includes CancelledError, e.g. the losing request of a hedge
+            if probe:
+                breaker.release_probe()
+            raise
+        if breaker is not None:
+            breaker.record(result, result.get("retry_after"))
+        if attempt > 1:
+            result["attempts"] = attempt
+        if not policy.should_retry(result, attempt):
+            return result
+        await asyncio.sleep(policy.delay(result, attempt))
+
+
+# ============================================================================
+# API KEY POOLS
+# ============================================================================
+
+# Hosted providers whose requests are spread over a pool of keys: the key in
+# <VAR>, those listed in <VAR>S (comma- or newline-separated, e.g.
+# OPENROUTER_API_KEYS) and any extra keys stored in the app config
+_API_KEY_ENV = {
+    "OpenRouter": "OPENROUTER_API_KEY",
+    "Claude": "CLAUDE_API_KEY",
+    "OpenAI": "OPENAI_API_KEY",
+    "Chutes": "CHUTES_API_KEY",
+    "NanoGPT": "NANOGPT_API_KEY",
+    "Z.AI": "Z_AI_API_KEY",
+    "Z.AI Coding Plan": "Z_AI_CODING_PLAN_API_KEY",
+}
+
+# Exhausted quota or credit, as opposed to a transient 429
+_QUOTA_ERROR = re.compile(
+    r"\b402\b|payment required|insufficient.?(quota|credits?|balance|funds)|exceeded your current quota|"
+    r"credit balance|out of credits|billing",
+    re.I,
+)
+
+
+def split_api_keys(value):
+    """Split a comma- or newline-separated list of API keys, dropping blanks and duplicates."""
+    return list(dict.fromkeys(key.strip() for key in re.split(r"[,\n]", value or "") if key.strip()))
+
+
+def _key_fingerprint(key):
+    """Short stable id for a key, safe to show in stats and logs."""
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+class _ApiKeyState:
+    """Outstanding requests and health of one key in an ApiKeyPool."""
+
+    def __init__(self, key):
+        self.key = key
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.cooldown_until = 0.0  # monotonic time the key rejoins the rotation
+        self.cooldown_reason = None
+        self.removed = None  # why the key left the rotation for good
+
+
+class ApiKeyPool:
+    """
+    The API keys configured for one provider, checked out per request.
+
+    Each request takes the key with the fewest requests outstanding (ties
+    rotate), so concurrent requests spread over the keys and their separate
+    rate limits. A key failing authentication leaves the rotation for the life
+    of the process, unless it is the last one left; a key reporting exhausted
+    quota or credit sits out API_KEY_QUOTA_COOLDOWN[_<PROVIDER>] seconds
+    (default 3600), and a rate-limited key sits out its Retry-After or
+    API_KEY_RATE_LIMIT_COOLDOWN[_<PROVIDER>] seconds (default 10). When every
+    key is cooling down, the one due back first is used rather than failing
+    the request outright.
+    """
+
+    def __init__(self, provider_name):
+        self.provider_name = provider_name
+        self._states = []
+        self._configured = ()
+        self._turn = 0
+        self._lock = threading.Lock()
+
+    def sync(self, keys):
+        """Make ``keys`` the pool's keys, keeping the state of those already in it."""
+        keys = tuple(dict.fromkeys(key for key in keys if key))
+        with self._lock:
+            if keys == self._configured:
+                return
+            current = {state.key: state for state in self._states}
+            self._states = [current.get(key) or _ApiKeyState(key) for key in keys]
+            self._configured = keys
+
+    def acquire(self):
+        """Check out the key for one request, or None when no key is usable."""
+        now = time.monotonic()
+        with self._lock:
+            live = [state for state in self._states if state.removed is None]
+            if not live:
+                return None
+            ready = [state for state in live if state.cooldown_until <= now]
+            if not ready:
+                ready = [min(live, key=lambda state: state.cooldown_until)]
+            start = self._turn % len(ready)
+            self._turn += 1
+            state = min(ready[start:] + ready[:start], key=lambda state: state.outstanding)
+            state.outstanding += 1
+            state.requests += 1
+            return state.key
+
+    def release(self, key, result=None):
+        """Return a key from acquire() and take it out of rotation if ``result`` says it is unusable."""
+        with self._lock:
+            state = next((state for state in self._states if state.key == key), None)
+            if state is None:
+                return
+            state.outstanding = max(0, state.outstanding - 1)
+            if not isinstance(result, dict) or result.get("success"):
+                return
+            error = result.get("error")
+            if _QUOTA_ERROR.search(str(error or "")):
+                reason = "quota"
+                cooldown = _provider_setting("API_KEY_QUOTA_COOLDOWN", self.provider_name, 3600.0)
+            else:
+                reason = classify_error(error)
+                if reason == "authentication":
+                    state.failures += 1
+                    if any(other.removed is None for other in self._states if other is not state):
+                        state.removed = reason
+                        print(
+                            f"Warning: {self.provider_name} API key {_key_fingerprint(key)} "
+                            f"failed authentication; removed from rotation"
+                        )
+                    return
+                if reason != "rate_limit":
+                    return
+                cooldown = result.get("retry_after") or _provider_setting(
+                    "API_KEY_RATE_LIMIT_COOLDOWN", self.provider_name, 10.0
+                )
+            state.failures += 1
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+            state.cooldown_reason = reason
+
+    def get_stats(self):
+        """Per-key load and health, identified by fingerprint rather than the key itself."""
+        now = time.monotonic()
+        with self._lock:
+            keys = []
+            for state in self._states:
+                if state.removed is not None:
+                    status, reason = "removed", state.removed
+                elif state.cooldown_until > now:
+                    status, reason = "cooling_down", state.cooldown_reason
+                else:
+                    status, reason = "active", None
+                keys.append(
+                    {
+                        "key": _key_fingerprint(state.key),
+                        "status": status,
+                        "reason": reason,
+                        "cooldown_seconds": round(max(0.0, state.cooldown_until - now), 1),
+                        "outstanding": state.outstanding,
+                        "requests": state.requests,
+                        "failures": state.failures,
+                    }
+                )
+        return {"provider": self.provider_name, "keys": keys}
+
+
+_api_key_pools = {}  # provider_name -> ApiKeyPool
+_extra_api_keys = {}  # provider_name -> extra keys stored in the app config
+_api_key_pools_lock = threading.Lock()
+
+
+def set_extra_api_keys(provider_name, keys):
+    """Add keys from the app config to a provider's pool (replacing those set before)."""
+    with _api_key_pools_lock:
+        _extra_api_keys[provider_name] = [key for key in keys or () if key]
+
+
+def configured_api_keys(provider_name):
+    """Every key configured for a provider, primary key first."""
+    env_var = _API_KEY_ENV.get(provider_name)
+    if env_var is None:
+        return []
+    keys = [os.getenv(env_var, "").strip()] + split_api_keys(os.getenv(f"{env_var}S"))
+    keys.extend(_extra_api_keys.get(provider_name, ()))
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def get_api_key_pool(provider_name):
+    """Return the key pool for a hosted provider, or None for providers without API keys."""
+    if provider_name not in _API_KEY_ENV:
+        return None
+    with _api_key_pools_lock:
+        pool = _api_key_pools.get(provider_name)
+        if pool is None:
+            pool = _api_key_pools[provider_name] = ApiKeyPool(provider_name)
+        return pool
+
+
+def acquire_api_key(provider_name):
+    """
+    Check out an API key for one request to a hosted provider.
+
+    Keys are re-read from the environment on every call, so a cleared or
+    changed key takes effect immediately. Returns None when no key is usable;
+    otherwise hand the key back through release_api_key() with the result.
+    """
+    pool = get_api_key_pool(provider_name)
+    if pool is None:
+        return None
+    pool.sync(configured_api_keys(provider_name))
+    return pool.acquire()
+
+
+def release_api_key(provider_name, key, result=None):
+    """Return a key from acquire_api_key(), reporting the request's result dict."""
+    pool = _api_key_pools.get(provider_name)
+    if pool is not None and key:
+        pool.release(key, result)
+
+
+def get_api_key_pool_stats():
+    """Key rotation state for every provider that has handed out a key."""
+    with _api_key_pools_lock:
+        pools = list(_api_key_pools.values())
+    return [pool.get_stats() for pool in pools]
+
+
+# ============================================================================
+# LOCAL MODEL WARM-UP
+# ============================================================================
+
+_local_model_holds = {}  # (provider_name, model) -> jobs keeping the model resident
+_local_model_lock = threading.Lock()
+
+
+def local_keep_alive_seconds():
+    """How long a local server should keep a held model loaded after each request."""
+    try:
+        return max(0, int(os.getenv("LOCAL_MODEL_KEEP_ALIVE", "1800")))
+    except ValueError:
+        return 1800
+
+
+def hold_local_model(provider_name, model):
+    """Register a job that needs a local model resident; True for the first holder."""
+    with _local_model_lock:
+        key = (provider_name, model)
+        _local_model_holds[key] = _local_model_holds.get(key, 0) + 1
+        return _local_model_holds[key] == 1
+
+
+def release_local_model(provider_name, model):
+    """Drop a job's hold on a local model; True when no job holds it any more."""
+    with _local_model_lock:
+        key = (provider_name, model)
+        remaining = _local_model_holds.get(key, 0) - 1
+        if remaining > 0:
+            _local_model_holds[key] = remaining
+            return False
+        _local_model_holds.pop(key, None)
+        return True
+
+
+def local_keep_alive(provider_name, model):
+    """Keep-alive (seconds) to send with a request, or None when no job holds the model."""
+    with _local_model_lock:
+        held = (provider_name, model) in _local_model_holds
+    return local_keep_alive_seconds() if held else None
+
+
+def _local_warmup_timeout():
+    try:
+        return float(os.getenv("LOCAL_MODEL_WARMUP_TIMEOUT", "300"))
+    except ValueError:
+        return 300.0
+
+
+# ============================================================================
+# LOCAL ENDPOINT POOLS
+# ============================================================================
+
+# Local provider -> (URL variable, default URL, health check path)
+_LOCAL_ENDPOINTS = {
+    "LM Studio": ("LM_STUDIO_URL", "http://localhost:1234/v1", "/models"),
+    "Ollama": ("OLLAMA_URL", "http://localhost:11434", "/api/tags"),
+}
+
+# Failures that point at the server rather than the request
+_ENDPOINT_ERRORS = {"network", "timeout", "server_error"}
+
+
+def local_endpoints(provider_name):
+    """Servers configured for a local provider; its URL variable may list several, comma-separated."""
+    env_var, default, _ = _LOCAL_ENDPOINTS[provider_name]
+    urls = [url.strip() for url in os.getenv(env_var, default).split(",") if url.strip()]
+    return list(dict.fromkeys(urls)) or [default]
+
+
+def _endpoint_setting(name, default):
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return float(default)
+
+
+class _EndpointState:
+    """Load and health of one server in a LocalEndpointPool."""
+
+    def __init__(self, url, limit):
+        self.url = url
+        self.limit = max(1, int(limit))
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_errors = 0
+        self.drained = None  # why the server is out of rotation, None while it takes requests
+
+
+class LocalEndpointPool:
+    """
+    The servers behind one local provider, with least-loaded routing.
+
+    Each request goes to the server with the lowest in-flight count relative
+    to its limit (_get_provider_limit with the server's URL); ties rotate.
+    Counts are per process, while the provider-wide semaphore (by default the
+    sum of the server limits) caps the total. A server is drained after
+    LOCAL_ENDPOINT_DRAIN_AFTER (default 3) consecutive connection, timeout or
+    5xx failures, or a failed health check, and rejoins once a health check
+    passes. Health checks run every LOCAL_ENDPOINT_HEALTH_INTERVAL seconds
+    (default 15, 0 disables) while more than one server is configured. The
+    last server in rotation is never drained, so its errors still surface.
+    """
+
+    def __init__(self, provider_name):
+        self.provider_name = provider_name
+        self._states = []
+        self._configured = ()
+        self._turn = 0
+        self._lock = threading.Lock()
+
+    def sync(self, urls):
+        """Make ``urls`` the pool's servers, keeping the state of those already in it."""
+        urls = tuple(urls)
+        with self._lock:
+            if urls == self._configured:
+                return
+            current = {state.url: state for state in self._states}
+            self._states = [
+                current.get(url) or _EndpointState(url, _get_provider_limit(self.provider_name, url)) for url in urls
+            ]
+            self._configured = urls
+
+    def __len__(self):
+        return len(self._states)
+
+    def acquire(self):
+        """Pick the least-loaded server in rotation for one request and count it in flight."""
+        with self._lock:
+            live = [state for state in self._states if state.drained is None] or list(self._states)
+            if not live:
+                return None
+            start = self._turn % len(live)
+            self._turn += 1
+            state = min(live[start:] + live[:start], key=lambda state: state.in_flight / state.limit)
+            state.in_flight += 1
+            state.requests += 1
+            return state.url
+
+    def release(self, url, result=None):
+        """Return a server from acquire(), draining it once it keeps failing."""
+        with self._lock:
+            state = next((state for state in self._states if state.url == url), None)
+            if state is None:
+                return
+            state.in_flight = max(0, state.in_flight - 1)
+            if not isinstance(result, dict):
+                return
+            if result.get("success"):
+                state.consecutive_errors = 0
+                return
+            error_type = classify_error(result.get("error"))
+            if error_type not in _ENDPOINT_ERRORS:
+                return
+            state.failures += 1
+            state.consecutive_errors += 1
+            if state.consecutive_errors >= _endpoint_setting("LOCAL_ENDPOINT_DRAIN_AFTER", 3):
+                self._drain(state, error_type)
+
+    def _drain(self, state, reason):
+        """Take a server out of rotation (lock held), unless it is the last one left."""
+        if state.drained is not None:
+            return
+        if not any(other.drained is None for other in self._states if other is not state):
+            return
+        state.drained = reason
+        print(f"Warning: draining {self.provider_name} server {state.url} ({reason})")
+
+    def _probe(self, url):
+        path = _LOCAL_ENDPOINTS[self.provider_name][2]
+        try:
+            response = _http_get(
+                self.provider_name,
+                f"{url}{path}",
+                headers={"Content-Type": "application/json"},
+                timeout=_endpoint_setting("LOCAL_ENDPOINT_HEALTH_TIMEOUT", 5),
+            )
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    def check_health(self):
+        """Probe every server: a healthy one rejoins the rotation, a failing one is drained."""
+        with self._lock:
+            states = list(self._states)
+        for state in states:
+            healthy = self._probe(state.url)
+            with self._lock:
+                if healthy:
+                    if state.drained is not None:
+                        print(f"{self.provider_name} server {state.url} is healthy again")
+                    state.drained = None
+                    state.consecutive_errors = 0
+                else:
+                    self._drain(state, "health_check")
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "provider": self.provider_name,
+                "endpoints": [
+                    {
+                        "url": state.url,
+                        "status": "drained" if state.drained else "active",
+                        "reason": state.drained,
+                        "limit": state.limit,
+                        "in_flight": state.in_flight,
+                        "requests": state.requests,
+                        "failures": state.failures,
+                    }
+                    for state in self._states
+                ],
+            }
+
+
+_local_endpoint_pools = {}  # provider_name -> LocalEndpointPool
+_local_endpoint_pools_lock = threading.Lock()
+_endpoint_health_thread = None
+
+
+def get_local_endpoint_pool(provider_name):
+    """Return the endpoint pool for a local provider, synced with its URL variable."""
+    if provider_name not in _LOCAL_ENDPOINTS:
+        return None
+    with _local_endpoint_pools_lock:
+        pool = _local_endpoint_pools.get(provider_name)
+        if pool is None:
+            pool = _local_endpoint_pools[provider_name] = LocalEndpointPool(provider_name)
+    pool.sync(local_endpoints(provider_name))
+    if len(pool) > 1:
+        _ensure_endpoint_health_checks()
+    return pool
+
+
+def acquire_local_endpoint(provider_name):
+    """
+    Pick the server for one request to a local provider.
+
+    The URL variable is re-read on every call. Hand the URL back through
+    release_local_endpoint() with the result once the request is done.
+    """
+    return get_local_endpoint_pool(provider_name).acquire()
+
+
+def release_local_endpoint(provider_name, url, result=None):
+    """Return a server from acquire_local_endpoint(), reporting the request's result dict."""
+    pool = _local_endpoint_pools.get(provider_name)
+    if pool is not None and url:
+        pool.release(url, result)
+
+
+def _ensure_endpoint_health_checks():
+    global _endpoint_health_thread
+    if _endpoint_setting("LOCAL_ENDPOINT_HEALTH_INTERVAL", 15) <= 0:
+        return
+    with _local_endpoint_pools_lock:
+        if _endpoint_health_thread is None or not _endpoint_health_thread.is_alive():
+            _endpoint_health_thread = threading.Thread(
+                target=_endpoint_health_loop, name="local-endpoint-health", daemon=True
+            )
+            _endpoint_health_thread.start()
+
+
+def _endpoint_health_loop():
+    while True:
+        interval = _endpoint_setting("LOCAL_ENDPOINT_HEALTH_INTERVAL", 15)
+        if interval <= 0:
+            return
+        time.sleep(interval)
+        with _local_endpoint_pools_lock:
+            pools = [pool for pool in _local_endpoint_pools.values() if len(pool) > 1]
+        for pool in pools:
+            try:
+                pool.check_health()
+            except Exception as e:
+                print(f"Warning: {pool.provider_name} health check failed: {e}")
+
+
+def get_local_endpoint_stats():
+    """Routing state for every local provider that has sent a request."""
+    with _local_endpoint_pools_lock:
+        pools = list(_local_endpoint_pools.values())
+    return [pool.get_stats() for pool in pools]
+
+
+def _on_every_endpoint(provider_name, fn):
+    """
+    Run ``fn(url)`` on each of a local provider's servers in parallel and fold the results.
+
+    With one server its result is returned as is. Otherwise the combined
+    result succeeds if any server did and keeps each server's under
+    "endpoints"; "resident" holds only if it holds everywhere, while
+    "was_resident" is False only if the model was loaded nowhere, so a later
+    unload never evicts a model some server already had.
+    """
+    urls = local_endpoints(provider_name)
+    if len(urls) == 1:
+        return fn(urls[0])
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        results = dict(zip(urls, executor.map(fn, urls)))
+    succeeded = [result for result in results.values() if result.get("success")]
+    if not succeeded:
+        errors = "; ".join(f"{url}: {result.get('error')}" for url, result in results.items())
+        return {"success": False, "error": errors, "provider": provider_name, "endpoints": results}
+
+    combined = dict(succeeded[0])
+    combined["endpoints"] = results
+    if "resident" in combined:
+        resident = [result.get("resident") for result in succeeded]
+        if False in resident:
+            combined["resident"] = False
+        elif None in resident:
+            combined["resident"] = None
+        else:
+            combined["resident"] = True
+    if "was_resident" in combined:
+        was_resident = [result.get("was_resident") for result in succeeded]
+        if True in was_resident:
+            combined["was_resident"] = True
+        elif None in was_resident:
+            combined["was_resident"] = None
+        else:
+            combined["was_resident"] = False
+    if "load_seconds" in combined:
+        combined["load_seconds"] = max(result.get("load_seconds") or 0 for result in succeeded)
+    return combined
+
+
+# ============================================================================
+# HTTP CONNECTION POOLING
+# ============================================================================
+
+
+class ProviderConnectionPool:
+    """
+    Thread-safe cache of keep-alive HTTP sessions and SDK clients for LLM providers.
+
+    Sessions are keyed by (provider, scheme://host, API key fingerprint) and SDK
+    clients by (provider, client class, API key fingerprint, base URL), so every
+    grading thread talking to the same endpoint with the same credentials reuses
+    the same TCP/TLS connections instead of paying a new handshake per request.
+    Entries that have not been used for ``idle_timeout`` seconds are closed.
+
+    Async clients (``httpx.AsyncClient``, ``AsyncAnthropic``...) are bound to the
+    event loop that created them, so they are cached per running loop and
+    released with ``aclose_loop`` when that loop's work is done.
+    """
+
+    def __init__(self, pool_size=16, idle_timeout=300):
+        self.pool_size = int(pool_size)
+        self.idle_timeout = float(idle_timeout)
+        self._lock = threading.Lock()
+        self._sessions = {}  # key -> {"session": Session, "last_used": float}
+        self._clients = {}  # key -> {"client": object, "last_used": float}
+        self._async_clients = {}  # loop -> {key: client}
+        self._last_eviction = time.time()
+        self._stats = {
+            "sessions_created": 0,
+            "session_reuses": 0,
+            "clients_created": 0,
+            "client_reuses": 0,
+            "async_clients_created": 0,
+            "async_client_reuses": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def _fingerprint(api_key):
+        """Return a short, non-reversible identifier for an API key."""
+        if not api_key:
+            return None
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _origin(url):
+        """Reduce a URL to scheme://host[:port] so paths share one session."""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get_session(self, provider_name, url, api_key=None):
+        """Return the shared keep-alive session for a provider endpoint."""
+        key = (provider_name, self._origin(url), self._fingerprint(api_key))
+        now = time.time()
+        with self._lock:
+            self._evict_idle_locked(now)
+            entry = self._sessions.get(key)
+            if entry is None:
+                entry = {"session": self._new_session(), "last_used": now}
+                self._sessions[key] = entry
+                self._stats["sessions_created"] += 1
+            else:
+                self._stats["session_reuses"] += 1
+            entry["last_used"] = now
+            return entry["session"]
+
+    def get_client(self, provider_name, client_cls, api_key=None, base_url=None, **client_kwargs):
+        """
+        Return a cached SDK client (e.g. ``Anthropic`` or ``OpenAI``).
+
+        The client class is part of the cache key so a different class (or a
+        patched one in tests) never receives a client built by another.
+        """
+        key = (provider_name, client_cls, self._fingerprint(api_key), base_url)
+        now = time.time()
+        with self._lock:
+            self._evict_idle_locked(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                self._stats["client_reuses"] += 1
+                entry["last_used"] = now
+                return entry["client"]
+
+        kwargs = dict(client_kwargs)
+        if api_key is not None:
+            kwargs["api_key"] = api_key
+        if base_url is not None:
+            kwargs["base_url"] = base_url
+        client = client_cls(**kwargs)
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = {"client": client, "last_used": now}
+                self._clients[key] = entry
+                self._stats["clients_created"] += 1
+            entry["last_used"] = now
+            return entry["client"]
+
+    def _new_async_session(self):
+        limits = httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=self.pool_size,
+            keepalive_expiry=self.idle_timeout or None,
+        )
+        return httpx.AsyncClient(limits=limits)
+
+    def get_async_session(self, provider_name, url, api_key=None):
+        """Return the keep-alive ``httpx.AsyncClient`` for a provider endpoint on the running loop."""
+        key = ("httpx", provider_name, self._origin(url), self._fingerprint(api_key))
+        return self._get_async(key, self._new_async_session)
+
+    def get_async_client(self, provider_name, client_cls, api_key=None, base_url=None, **client_kwargs):
+        """Async counterpart of ``get_client`` (e.g. ``AsyncAnthropic``), cached per event loop."""
+        kwargs = dict(client_kwargs)
+        if api_key is not None:
+            kwargs["api_key"] = api_key
+        if base_url is not None:
+            kwargs["base_url"] = base_url
+        key = (provider_name, client_cls, self._fingerprint(api_key), base_url)
+        return self._get_async(key, lambda: client_cls(**kwargs))
+
+    def _get_async(self, key, factory):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Loops closed without aclose_loop() can no longer use their clients
+            for stale in [lp for lp in self._async_clients if lp.is_closed()]:
+                del self._async_clients[stale]
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is not None:
+                self._stats["async_client_reuses"] += 1
+                return client
+            client = clients[key] = factory()
+            self._stats["async_clients_created"] += 1
+            return client
+
+    async def aclose_loop(self):
+        """Close every async client created on the running event loop."""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            close = getattr(client, "aclose", None) or getattr(client, "close", None)
+            if close is None and hasattr(client, "transport"):
+                close = getattr(client.transport, "close", None)
+            if not callable(close):
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                pass
+
+    def _evict_idle_locked(self, now):
+        """Close entries idle for longer than idle_timeout. Caller holds the lock."""
+        if self.idle_timeout <= 0 or now - self._last_eviction < min(self.idle_timeout, 30):
+            return
+        self._last_eviction = now
+        for store, attr in ((self._sessions, "session"), (self._clients, "client")):
+            for key in [k for k, e in store.items() if now - e["last_used"] > self.idle_timeout]:
+                self._close_quietly(store.pop(key)[attr])
+                self._stats["evictions"] += 1
+
+    @staticmethod
+    def _close_quietly(resource):
+        close = getattr(resource, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        """Close every pooled session and client."""
+        with self._lock:
+            for entry in self._sessions.values():
+                self._close_quietly(entry["session"])
+            for entry in self._clients.values():
+                self._close_quietly(entry["client"])
+            self._sessions.clear()
+            self._clients.clear()
+            # Async clients can only be closed on their own loop; just forget them
+            self._async_clients.clear()
+
+    def get_stats(self):
+        """
+        Return pool counters, including urllib3-level connection reuse.
+
+        ``connections_opened`` counts TCP connections actually established and
+        ``http_requests`` the requests sent over them; the difference is the
+        number of requests served by an already-open keep-alive connection.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["active_sessions"] = len(self._sessions)
+            stats["active_clients"] = len(self._clients)
+            stats["active_async_clients"] = sum(len(c) for c in self._async_clients.values())
+            connections_opened = 0
+            http_requests = 0
+            for entry in self._sessions.values():
+                for adapter in set(entry["session"].adapters.values()):
+                    pool_manager = getattr(adapter, "poolmanager", None)
+                    if pool_manager is None:
+                        continue
+                    for pool_key in list(pool_manager.pools.keys()):
+                        pool = pool_manager.pools.get(pool_key)
+                        connections_opened += getattr(pool, "num_connections", 0)
+                        http_requests += getattr(pool, "num_requests", 0)
+        stats["connections_opened"] = connections_opened
+        stats["http_requests"] = http_requests
+        stats["connections_reused"] = max(0, http_requests - connections_opened)
+        return stats
+
+
+_connection_pool = ProviderConnectionPool(
+    pool_size=int(os.getenv("LLM_HTTP_POOL_SIZE", "16")),
+    idle_timeout=float(os.getenv("LLM_HTTP_POOL_IDLE_TIMEOUT", "300")),
+)
+
+
+def get_connection_pool():
+    """Return the process-wide provider connection pool."""
+    return _connection_pool
+
+
+def get_connection_pool_stats():
+    """Return connection reuse counters for the provider connection pool."""
+    return _connection_pool.get_stats()
+
+
+def _http_post(provider_name, url, api_key=None, **kwargs):
+    """POST through the pooled keep-alive session for this provider endpoint."""
+    return _connection_pool.get_session(provider_name, url, api_key).post(url, **kwargs)
+
+
+def _http_get(provider_name, url, api_key=None, **kwargs):
+    """GET through the pooled keep-alive session for this provider endpoint."""
+    return _connection_pool.get_session(provider_name, url, api_key).get(url, **kwargs)
+
+
+async def _ahttp_post(provider_name, url, api_key=None, **kwargs):
+    """
+    POST through the pooled ``httpx.AsyncClient`` for this provider endpoint.
+
+    httpx errors are re-raised as the equivalent ``requests`` exceptions so the
+    sync and async paths share one error mapping per provider.
+    """
+    client = _connection_pool.get_async_session(provider_name, url, api_key)
+    try:
+        return await client.post(url, **kwargs)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.RequestException(str(e)) from e
+
+
+_gemini_lock = threading.Lock()
+_gemini_configured = None  # (configure function, key fingerprint) last applied
+
+
+def _configure_gemini(api_key):
+    """
+    Configure the Gemini SDK only when the key changes.
+
+    ``genai.configure`` rebuilds the SDK's global client, so calling it on
+    every request throws away the underlying connection each time.
+    """
+    global _gemini_configured
+    marker = (genai.configure, ProviderConnectionPool._fingerprint(api_key))
+    with _gemini_lock:
+        if _gemini_configured != marker:
+            genai.configure(api_key=api_key)
+            _gemini_configured = marker
+
+
+def _new_gemini_async_client(api_key=None):
+    """
+    Build a Gemini async transport for the running event loop.
+
+    The SDK caches one async client per process, bound to whichever loop first
+    used it, so the async runner builds its own through the pool instead.
+    """
+    from google.generativeai import client as genai_client
+
+    _configure_gemini(api_key)
+    return genai_client._client_manager.make_client("generative_async")
+
+
+GRADER_SYSTEM_PROMPT = (
+    "You are a professional document grader. Provide detailed, constructive feedback "
+    "based on the provided marking scheme and criteria."
+)
+
+
+def _grading_prefix(prompt, marking_scheme_content=None):
+    """
+    Grading instructions and optional marking scheme, without the document.
+
+    This is identical for every submission in a job and always precedes the
+    document text, so provider-side prompt caches can reuse it.
+    """
+    if marking_scheme_content:
+        return (
+            f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}"
+            "\n\nPlease use the above marking scheme to grade the following document:\n"
+        )
+    return f"{prompt}\n\nDocument to grade:\n"
+
+
+def _build_grading_prompt(text, prompt, marking_scheme_content=None):
+    """Combine grading instructions, optional marking scheme and document text."""
+    return _grading_prefix(prompt, marking_scheme_content) + text
+
+
+def _cached_content_blocks(text, prompt, marking_scheme_content=None):
+    """
+    Anthropic-style content blocks with a cache breakpoint after the job prefix.
+
+    The system prompt and grading prefix are cached; only the document varies.
+    """
+    blocks = [
+        {
+            "type": "text",
+            "text": _grading_prefix(prompt, marking_scheme_content),
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    if text:
+        blocks.append({"type": "text", "text": text})
+    return blocks
+
+
+def _chat_messages(text, prompt, marking_scheme_content=None, cache_hint=False):
+    """
+    OpenAI-style system + user messages for a grading request.
+
+    With ``cache_hint`` the user message is split into content blocks carrying
+    an explicit cache breakpoint (for Anthropic models behind OpenRouter);
+    otherwise it is a single string whose stable prefix suits automatic caching.
+    """
+    if cache_hint:
+        user_content = _cached_content_blocks(text, prompt, marking_scheme_content)
+    else:
+        user_content = _build_grading_prompt(text, prompt, marking_scheme_content)
+    return [
+        {"role": "system", "content": GRADER_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content},
+    ]
+
+
+def _with_cached_tokens(usage):
+    """
+    Add a provider-neutral ``cached_tokens`` count to a usage dict.
+
+    Reads OpenAI-style ``prompt_tokens_details.cached_tokens`` and Anthropic
+    ``cache_read_input_tokens``; returns ``usage`` unchanged when it is empty.
+    """
+    if not usage:
+        return usage
+    details = usage.get("prompt_tokens_details") or {}
+    cached = usage.get("cache_read_input_tokens") or details.get("cached_tokens") or 0
+    return {**usage, "cached_tokens": cached}
+
+
+class LLMProvider(ABC):
+    """Abstract Base Class for LLM Providers."""
+
+    provider_name = None
+    default_model = None
+
+    @abstractmethod
+    def grade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        """
+        Abstract method to grade a document using the LLM provider.
+        Implementations should handle API calls, error handling, and response parsing.
+
+        Parameters:
+          - text: The document text to grade.
+          - prompt: The grading instructions / prompt.
+          - model: Optional provider-specific model identifier (e.g. 'gpt-4o', 'claude-4-opus-20250805').
+          - marking_scheme_content: Optional marking scheme text to include.
+          - temperature: Model temperature.
+          - max_tokens: Maximum tokens for the response.
+        """
+
+    async def agrade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        """
+        Coroutine version of grade_document used by the asyncio job runner.
+
+        Built-in providers override this with a non-blocking implementation; the
+        default runs grade_document in a worker thread so other subclasses still
+        work under the async runner. Returns the same result dict.
+        """
+        kwargs = {
+            "marking_scheme_content": marking_scheme_content,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if model is not None:
+            kwargs["model"] = model
+        return await asyncio.to_thread(self.grade_document, text, prompt, **kwargs)
+
+    def _failure(self, error):
+        """Standard failure result for this provider."""
+        return {"success": False, "error": error, "provider": self.provider_name}
+
+    def test_connection(self, model=None, timeout=60):
+        """
+        Test API connectivity with a minimal request.
+
+        Attempts to make a minimal API call to verify the provider is accessible
+        and the API key is valid. Returns latency information on success.
+
+        Args:
+            model (str, optional): Provider-specific model to test
+            timeout (int): Request timeout in seconds
+
+        Returns:
+            dict: {
+                "success": bool,
+                "latency_ms": int (on success),
+                "message": str,
+                "error_type": str (on failure)
             }
 
         Raises:
@@ -478,6 +2595,23 @@ class LLMProvider(ABC):
                     self.__class__.__name__
                 )
 
+    def warm_up(self, model=None, keep_alive=None):
+        """
+        Load a model before a job starts so its first requests do not stall.
+
+        Only local servers (Ollama, LM Studio) need this; hosted providers
+        report that nothing was done.
+
+        Returns:
+            dict: {"success": bool, "warmed": bool, "resident": bool or None,
+                   "was_resident": bool or None, "load_seconds": float}
+        """
+        return {"success": True, "warmed": False, "resident": None, "was_resident": None}
+
+    def release(self, model=None, unload=False):
+        """Hand a warmed model back to the server's normal idle handling (unload it if asked)."""
+        return {"success": True, "unloaded": False}
+
     def _get_default_model(self):
         """
         Get the default model for this provider.
@@ -487,13 +2621,106 @@ class LLMProvider(ABC):
         Returns:
             str: Default model identifier
         """
-        # Default implementation - subclasses should override
-        return None
+        return self.default_model
+
 
+class HTTPLLMProvider(LLMProvider):
+    """
+    Base for providers that talk plain HTTP/JSON.
+
+    Subclasses describe a request in _build_request() and interpret the reply in
+    _parse_response(); grade_document sends it over the pooled requests session
+    and agrade_document over the pooled httpx client, so both paths share the
+    same payloads, parsing and error messages.
+    """
+
+    @abstractmethod
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        """
+        Return {"url", "api_key", "headers", "json", "timeout"}, or a failure dict.
 
-class OpenRouterLLMProvider(LLMProvider):
+        A key taken with acquire_api_key() goes in "api_key" and a local
+        server taken with acquire_local_endpoint() in "base_url"; both are
+        released once the request finishes.
+        """
+
+    @abstractmethod
+    def _parse_response(self, response, model):
+        """Turn an HTTP response (requests or httpx) into a result dict."""
+
+    def _handle_exception(self, exc, request):
+        """Map an exception raised while grading to a failure dict."""
+        return self._failure(f"{self.provider_name} API error: {str(exc)}")
+
+    def grade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        model = model or self.default_model
+        request = None
+        try:
+            request = self._build_request(text, prompt, model, marking_scheme_content, temperature, max_tokens)
+            if "url" not in request:
+                return request
+            response = _http_post(
+                self.provider_name,
+                request["url"],
+                request.get("api_key"),
+                headers=request["headers"],
+                json=request["json"],
+                timeout=request["timeout"],
+            )
+            result = _attach_retry_after(self._parse_response(response, model), response.headers)
+        except Exception as e:
+            result = self._handle_exception(e, request)
+        if request is not None:
+            release_api_key(self.provider_name, request.get("api_key"), result)
+            release_local_endpoint(self.provider_name, request.get("base_url"), result)
+        return result
+
+    async def agrade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        model = model or self.default_model
+        request = None
+        try:
+            request = self._build_request(text, prompt, model, marking_scheme_content, temperature, max_tokens)
+            if "url" not in request:
+                return request
+            response = await _ahttp_post(
+                self.provider_name,
+                request["url"],
+                request.get("api_key"),
+                headers=request["headers"],
+                json=request["json"],
+                timeout=request["timeout"],
+            )
+            result = _attach_retry_after(self._parse_response(response, model), response.headers)
+        except Exception as e:
+            result = self._handle_exception(e, request)
+        if request is not None:
+            release_api_key(self.provider_name, request.get("api_key"), result)
+            release_local_endpoint(self.provider_name, request.get("base_url"), result)
+        return result
+
+
+class OpenRouterLLMProvider(HTTPLLMProvider):
     """LLM Provider for OpenRouter API."""
 
+    provider_name = "OpenRouter"
+    default_model = "anthropic/claude-opus-4-1"
+
     def get_available_models(self):
         """Fetch available models from OpenRouter API."""
         try:
@@ -506,7 +2733,9 @@ class OpenRouterLLMProvider(LLMProvider):
                 "Content-Type": "application/json",
             }
 
-            response = requests.get("https://openrouter.ai/api/v1/models", headers=headers, timeout=30)
+            response = _http_get(
+                "OpenRouter", "https://openrouter.ai/api/v1/models", openrouter_key, headers=headers, timeout=30
+            )
 
             if response.status_code == 200:
                 models_data = response.json()
@@ -515,124 +2744,86 @@ class OpenRouterLLMProvider(LLMProvider):
                     models.append(
                         {
                             "id": model["id"],
-                            "name": model.get("name", model["id"]),
-                            "description": model.get("description", ""),
-                            "pricing": model.get("pricing", {}),
-                            "context_length": model.get("context_length", 0),
-                            "provider": model.get("provider", ""),
-                        }
-                    )
-                return {"success": True, "models": models}
-            else:
-                return {"success": False, "error": f"API error: {response.status_code}"}
-
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="anthropic/claude-opus-4-1",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        try:
-            # Re-check environment each call to satisfy tests that clear env
-            openrouter_key = os.getenv("OPENROUTER_API_KEY")
-            if not openrouter_key:
-                return {
-                    "success": False,
-                    "error": "OpenRouter API authentication failed. " "Please check your API key configuration.",
-                    "provider": "OpenRouter",
-                }
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = (
-                    f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}"
-                    f"\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-                )
+                            "name": model.get("name", model["id"]),
+                            "description": model.get("description", ""),
+                            "pricing": model.get("pricing", {}),
+                            "context_length": model.get("context_length", 0),
+                            "provider": model.get("provider", ""),
+                        }
+                    )
+                return {"success": True, "models": models}
             else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+                return {"success": False, "error": f"API error: {response.status_code}"}
 
-            # Use requests library for OpenRouter API to avoid OpenAI SDK compatibility issues
-            headers = {
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        # Keys are re-read from the environment on each call (tests clear env)
+        openrouter_key = acquire_api_key("OpenRouter")
+        if not openrouter_key:
+            return self._failure("OpenRouter API authentication failed. " "Please check your API key configuration.")
+
+        # Use plain HTTP for OpenRouter API to avoid OpenAI SDK compatibility issues
+        return {
+            "url": "https://openrouter.ai/api/v1/chat/completions",
+            "api_key": openrouter_key,
+            "headers": {
                 "Authorization": f"Bearer {openrouter_key}",
                 "Content-Type": "application/json",
-            }
-
-            payload = {
+            },
+            "json": {
                 "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                    },
-                    {"role": "user", "content": enhanced_prompt},
-                ],
+                "messages": _chat_messages(
+                    text,
+                    prompt,
+                    marking_scheme_content,
+                    # OpenRouter forwards cache_control to Anthropic; other
+                    # upstreams cache stable prefixes automatically
+                    cache_hint=str(model).startswith("anthropic/"),
+                ),
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-            }
+            },
+            "timeout": 120,
+        }
 
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=120,
-            )
+    def _parse_response(self, response, model):
+        # Handle non-200 responses explicitly so we can return helpful error
+        # messages (e.g. include response body for 4xx/5xx).
+        if response.status_code != 200:
+            # Attempt to decode body for debugging; fall back to raw text.
+            try:
+                body = response.json()
+            except Exception:
+                body = response.text
+            return self._failure(f"OpenRouter API error: {response.status_code} - {body}")
 
-            # Handle success and non-200 responses explicitly so we can return
-            # helpful error messages (e.g. include response body for 4xx/5xx).
-            if response.status_code == 200:
-                result = response.json()
-                grade_text = result["choices"][0]["message"]["content"]
-                usage = result.get("usage")
-            else:
-                # Attempt to decode body for debugging; fall back to raw text.
-                try:
-                    body = response.json()
-                except Exception:
-                    body = response.text
-                return {
-                    "success": False,
-                    "error": f"OpenRouter API error: {response.status_code} - {body}",
-                    "provider": "OpenRouter",
-                }
+        result = response.json()
+        return {
+            "success": True,
+            "grade": result["choices"][0]["message"]["content"],
+            "model": model,
+            "provider": "OpenRouter",
+            "usage": _with_cached_tokens(result.get("usage")),
+        }
 
-            return {
-                "success": True,
-                "grade": grade_text,
-                "model": model,
-                "provider": "OpenRouter",
-                "usage": usage,
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "OpenRouter API authentication failed. Please check your API key.",
-                    "provider": "OpenRouter",
-                }
-            elif "rate" in error_msg.lower() and "limit" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "OpenRouter API rate limit exceeded. Please try again later.",
-                    "provider": "OpenRouter",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with OpenRouter API: {error_msg}",
-                    "provider": "OpenRouter",
-                }
+    def _handle_exception(self, exc, request):
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower():
+            return self._failure("OpenRouter API authentication failed. Please check your API key.")
+        elif "rate" in error_msg.lower() and "limit" in error_msg.lower():
+            return self._failure("OpenRouter API rate limit exceeded. Please try again later.")
+        else:
+            return self._failure(f"Unexpected error with OpenRouter API: {error_msg}")
 
 
 class ClaudeLLMProvider(LLMProvider):
     """LLM Provider for Claude API."""
 
+    provider_name = "Claude"
+    default_model = "claude-4-opus-20250805"
+
     def get_available_models(self):
         """Fetch available models from Claude API."""
         try:
@@ -640,7 +2831,7 @@ class ClaudeLLMProvider(LLMProvider):
             if not claude_key:
                 return {"success": False, "error": "API key not configured"}
 
-            anthropic = Anthropic(api_key=claude_key)
+            anthropic = _connection_pool.get_client("Claude", Anthropic, api_key=claude_key, max_retries=0)
             models = anthropic.models.list()
 
             model_list = []
@@ -659,93 +2850,118 @@ class ClaudeLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _message_kwargs(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": GRADER_SYSTEM_PROMPT,
+            "messages": [{"role": "user", "content": _cached_content_blocks(text, prompt, marking_scheme_content)}],
+        }
+
+    def _parse_response(self, response, model):
+        return {
+            "success": True,
+            "grade": response.content[0].text,
+            "model": model,
+            "provider": "Claude",
+            "usage": _with_cached_tokens(response.usage.model_dump()) if response.usage else None,
+        }
+
+    def _handle_exception(self, exc):
+        error_msg = str(exc)
+        if "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
+            return self._failure("Claude API authentication failed. Please check your API key.")
+        elif "rate" in error_msg.lower() or "limit" in error_msg.lower():
+            return self._failure("Claude API rate limit exceeded. Please try again later.")
+        elif "timeout" in error_msg.lower():
+            return self._failure("Claude API request timed out. Please try again.")
+        else:
+            return self._failure(f"Claude API error: {error_msg}")
+
     def grade_document(
         self,
         text,
         prompt,
-        model="claude-4-opus-20250805",
+        model=None,
         marking_scheme_content=None,
         temperature=0.3,
         max_tokens=2000,
     ):
-        # Re-check environment each call to satisfy tests that clear env
-        claude_key = os.getenv("CLAUDE_API_KEY")
+        model = model or self.default_model
+        # Keys are re-read from the environment on each call (tests clear env)
+        claude_key = acquire_api_key("Claude")
         if not claude_key:
-            return {
-                "success": False,
-                "error": "Claude API not configured or failed to initialize",
-                "provider": "Claude",
-            }
+            return self._failure("Claude API not configured or failed to initialize")
 
-        # Create client when key is present
+        # Reuse the pooled client for this key when present
         try:
-            anthropic = Anthropic(api_key=claude_key)
+            anthropic = _connection_pool.get_client("Claude", Anthropic, api_key=claude_key, max_retries=0)
         except Exception:
-            return {
-                "success": False,
-                "error": "Claude API not configured or failed to initialize",
-                "provider": "Claude",
-            }
+            release_api_key("Claude", claude_key)
+            return self._failure("Claude API not configured or failed to initialize")
 
         try:
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
-
             response = anthropic.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                system="You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                messages=[{"role": "user", "content": enhanced_prompt}],
+                **self._message_kwargs(text, prompt, model, marking_scheme_content, temperature, max_tokens)
             )
+            result = self._parse_response(response, model)
+        except Exception as e:
+            result = _attach_retry_after(self._handle_exception(e), _exception_headers(e))
+        release_api_key("Claude", claude_key, result)
+        return result
 
-            return {
-                "success": True,
-                "grade": response.content[0].text,
-                "model": model,
-                "provider": "Claude",
-                "usage": response.usage.model_dump() if response.usage else None,
-            }
+    async def agrade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        model = model or self.default_model
+        claude_key = acquire_api_key("Claude")
+        if not claude_key:
+            return self._failure("Claude API not configured or failed to initialize")
+
+        try:
+            anthropic = _connection_pool.get_async_client("Claude", AsyncAnthropic, api_key=claude_key, max_retries=0)
+        except Exception:
+            release_api_key("Claude", claude_key)
+            return self._failure("Claude API not configured or failed to initialize")
+
+        try:
+            response = await anthropic.messages.create(
+                **self._message_kwargs(text, prompt, model, marking_scheme_content, temperature, max_tokens)
+            )
+            result = self._parse_response(response, model)
         except Exception as e:
-            error_msg = str(e)
-            if "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Claude API authentication failed. Please check your API key.",
-                    "provider": "Claude",
-                }
-            elif "rate" in error_msg.lower() or "limit" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Claude API rate limit exceeded. Please try again later.",
-                    "provider": "Claude",
-                }
-            elif "timeout" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Claude API request timed out. Please try again.",
-                    "provider": "Claude",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Claude API error: {error_msg}",
-                    "provider": "Claude",
-                }
+            result = _attach_retry_after(self._handle_exception(e), _exception_headers(e))
+        release_api_key("Claude", claude_key, result)
+        return result
 
 
-class LMStudioLLMProvider(LLMProvider):
+class LMStudioLLMProvider(HTTPLLMProvider):
     """LLM Provider for LM Studio API."""
 
+    provider_name = "LM Studio"
+    default_model = "local-model"
+
     def get_available_models(self):
-        """Fetch available models from LM Studio API."""
+        """Fetch available models from LM Studio API (from the first server that answers)."""
+        result = None
+        for lm_studio_url in local_endpoints("LM Studio"):
+            result = self._list_models(lm_studio_url)
+            if result["success"]:
+                break
+        return result
+
+    def _list_models(self, lm_studio_url):
         try:
-            lm_studio_url = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
-
-            response = requests.get(f"{lm_studio_url}/models", headers={"Content-Type": "application/json"}, timeout=30)
+            response = _http_get(
+                "LM Studio", f"{lm_studio_url}/models", headers={"Content-Type": "application/json"}, timeout=30
+            )
 
             if response.status_code == 200:
                 models_data = response.json()
@@ -766,99 +2982,136 @@ class LMStudioLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="local-model",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        # Get URL from environment variable, don't use cached module-level variable for testing
-        lm_studio_url = os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
-
+    def _is_resident(self, lm_studio_url, model):
+        """Whether LM Studio reports the model loaded; None when it cannot tell."""
+        # The native REST API lives beside the OpenAI-compatible /v1 routes
+        rest_url = lm_studio_url.rstrip("/")
+        if rest_url.endswith("/v1"):
+            rest_url = rest_url[: -len("/v1")]
         try:
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+            response = _http_get(
+                "LM Studio", f"{rest_url}/api/v0/models", headers={"Content-Type": "application/json"}, timeout=10
+            )
+            if response.status_code != 200:
+                return None  # LM Studio before 0.3.6 has no REST API
+            loaded = [m.get("id") for m in response.json().get("data", []) if m.get("state") == "loaded"]
+        except Exception:
+            return None
+        if model == self.default_model:
+            return bool(loaded)  # "local-model" is whichever model is loaded
+        return model in loaded
+
+    def warm_up(self, model=None, keep_alive=None):
+        """
+        Load the model with a one-token request whose TTL keeps it loaded.
+
+        LM Studio cannot unload a model over HTTP, so release() leaves it to
+        the TTL: once the job stops sending requests the model idles out.
+        With several servers the model is loaded on each of them.
+        """
+        model = model or self.default_model
+        keep_alive = local_keep_alive_seconds() if keep_alive is None else keep_alive
+        return _on_every_endpoint("LM Studio", lambda url: self._warm_up_endpoint(url, model, keep_alive))
 
-            response = requests.post(
+    def _warm_up_endpoint(self, lm_studio_url, model, keep_alive):
+        started = time.monotonic()
+        try:
+            was_resident = self._is_resident(lm_studio_url, model)
+            response = _http_post(
+                "LM Studio",
                 f"{lm_studio_url}/chat/completions",
+                headers={"Content-Type": "application/json"},
                 json={
                     "model": model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                        },
-                        {"role": "user", "content": enhanced_prompt},
-                    ],
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
+                    "messages": [{"role": "user", "content": "Hi"}],
+                    "max_tokens": 1,
+                    "ttl": keep_alive,
                 },
-                headers={"Content-Type": "application/json"},
-                timeout=120,
+                timeout=_local_warmup_timeout(),
             )
-
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "grade": result["choices"][0]["message"]["content"],
-                    "model": model,
-                    "provider": "LM Studio",
-                    "usage": result.get("usage"),
-                }
-            elif response.status_code == 404:
-                return {
-                    "success": False,
-                    "error": "LM Studio endpoint not found. Please check if LM Studio is running and the URL is correct.",
-                    "provider": "LM Studio",
-                }
-            elif response.status_code == 500:
-                return {
-                    "success": False,
-                    "error": "LM Studio internal server error. Please check LM Studio logs.",
-                    "provider": "LM Studio",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"LM Studio API error: {response.status_code} - {response.text}",
-                    "provider": "LM Studio",
-                }
-        except requests.exceptions.ConnectionError:
+            if response.status_code != 200:
+                return self._failure(f"LM Studio could not load {model}: {response.status_code} - {response.text}")
             return {
-                "success": False,
-                "error": f"Could not connect to LM Studio at {lm_studio_url}. Please check if LM Studio is running.",
-                "provider": "LM Studio",
-            }
-        except requests.exceptions.Timeout:
-            return {
-                "success": False,
-                "error": "LM Studio request timed out. Please try again.",
-                "provider": "LM Studio",
+                "success": True,
+                "warmed": True,
+                "model": model,
+                "resident": self._is_resident(lm_studio_url, model),
+                "was_resident": was_resident,
+                "load_seconds": round(time.monotonic() - started, 3),
             }
         except Exception as e:
+            return self._handle_exception(e, {"base_url": lm_studio_url})
+
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        payload = {
+            "model": model,
+            "messages": _chat_messages(text, prompt, marking_scheme_content),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        keep_alive = local_keep_alive("LM Studio", model)
+        if keep_alive is not None:
+            payload["ttl"] = keep_alive  # idle TTL, renewed by every request of a warmed job
+        # The least-loaded server; LM_STUDIO_URL is re-read on every call
+        lm_studio_url = acquire_local_endpoint("LM Studio")
+        return {
+            "url": f"{lm_studio_url}/chat/completions",
+            "base_url": lm_studio_url,
+            "headers": {"Content-Type": "application/json"},
+            "json": payload,
+            "timeout": 120,
+        }
+
+    def _parse_response(self, response, model):
+        if response.status_code == 200:
+            result = response.json()
             return {
-                "success": False,
-                "error": f"LM Studio API error: {str(e)}",
+                "success": True,
+                "grade": result["choices"][0]["message"]["content"],
+                "model": model,
                 "provider": "LM Studio",
+                "usage": result.get("usage"),
             }
+        elif response.status_code == 404:
+            return self._failure(
+                "LM Studio endpoint not found. Please check if LM Studio is running and the URL is correct."
+            )
+        elif response.status_code == 500:
+            return self._failure("LM Studio internal server error. Please check LM Studio logs.")
+        else:
+            return self._failure(f"LM Studio API error: {response.status_code} - {response.text}")
+
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            lm_studio_url = (request or {}).get("base_url") or os.getenv("LM_STUDIO_URL", "http://localhost:1234/v1")
+            return self._failure(
+                f"Could not connect to LM Studio at {lm_studio_url}. Please check if LM Studio is running."
+            )
+        if isinstance(exc, requests.exceptions.Timeout):
+            return self._failure("LM Studio request timed out. Please try again.")
+        return self._failure(f"LM Studio API error: {str(exc)}")
 
 
-class OllamaLLMProvider(LLMProvider):
+class OllamaLLMProvider(HTTPLLMProvider):
     """LLM Provider for Ollama API."""
 
+    provider_name = "Ollama"
+    default_model = "llama2"
+
     def get_available_models(self):
-        """Fetch available models from Ollama API."""
+        """Fetch available models from Ollama API (from the first server that answers)."""
+        result = None
+        for ollama_url in local_endpoints("Ollama"):
+            result = self._list_models(ollama_url)
+            if result["success"]:
+                break
+        return result
+
+    def _list_models(self, ollama_url):
         try:
-            ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-
-            response = requests.get(f"{ollama_url}/api/tags", headers={"Content-Type": "application/json"}, timeout=30)
+            response = _http_get(
+                "Ollama", f"{ollama_url}/api/tags", headers={"Content-Type": "application/json"}, timeout=30
+            )
 
             if response.status_code == 200:
                 models_data = response.json()
@@ -879,130 +3132,171 @@ class OllamaLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="llama2",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-
+    def _is_resident(self, ollama_url, model):
+        """Whether Ollama reports the model loaded (GET /api/ps); None when it cannot tell."""
         try:
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+            response = _http_get(
+                "Ollama", f"{ollama_url}/api/ps", headers={"Content-Type": "application/json"}, timeout=10
+            )
+            if response.status_code != 200:
+                return None
+            names = set()
+            for loaded in response.json().get("models", []):
+                names.update((loaded.get("name"), loaded.get("model")))
+        except Exception:
+            return None
+        return model in names or f"{model}:latest" in names
+
+    def warm_up(self, model=None, keep_alive=None):
+        """Load the model on every server with an empty prompt and keep it loaded for ``keep_alive`` seconds."""
+        model = model or self.default_model
+        keep_alive = local_keep_alive_seconds() if keep_alive is None else keep_alive
+        return _on_every_endpoint("Ollama", lambda url: self._warm_up_endpoint(url, model, keep_alive))
 
-            # Ollama doesn't directly support system messages in the /api/generate endpoint for all models
-            # We can prepend the system message to the user prompt for a similar effect
-            full_prompt = (
-                "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.\n\n"
-                + enhanced_prompt
+    def _warm_up_endpoint(self, ollama_url, model, keep_alive):
+        started = time.monotonic()
+        try:
+            was_resident = self._is_resident(ollama_url, model)
+            # An empty prompt loads the model without generating anything
+            response = _http_post(
+                "Ollama",
+                f"{ollama_url}/api/generate",
+                headers={"Content-Type": "application/json"},
+                json={"model": model, "prompt": "", "stream": False, "keep_alive": keep_alive},
+                timeout=_local_warmup_timeout(),
             )
+            if response.status_code != 200:
+                return self._failure(f"Ollama could not load {model}: {response.status_code} - {response.text}")
+            return {
+                "success": True,
+                "warmed": True,
+                "model": model,
+                "resident": self._is_resident(ollama_url, model),
+                "was_resident": was_resident,
+                "load_seconds": round(time.monotonic() - started, 3),
+            }
+        except Exception as e:
+            return self._handle_exception(e, {"base_url": ollama_url})
 
-            response = requests.post(
+    def release(self, model=None, unload=False):
+        """Unload the model (keep_alive 0), or restore each server's default idle timer."""
+        model = model or self.default_model
+        return _on_every_endpoint("Ollama", lambda url: self._release_endpoint(url, model, unload))
+
+    def _release_endpoint(self, ollama_url, model, unload):
+        payload = {"model": model, "prompt": "", "stream": False}
+        if unload:
+            payload["keep_alive"] = 0
+        try:
+            response = _http_post(
+                "Ollama",
                 f"{ollama_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "temperature": temperature,
-                    "options": {"num_predict": max_tokens},  # Ollama uses num_predict for max_tokens
-                },
                 headers={"Content-Type": "application/json"},
-                timeout=120,
+                json=payload,
+                timeout=30,
             )
+        except Exception as e:
+            return self._handle_exception(e, {"base_url": ollama_url})
+        if response.status_code != 200:
+            return self._failure(f"Ollama could not release {model}: {response.status_code} - {response.text}")
+        return {"success": True, "unloaded": unload}
+
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        # Ollama doesn't directly support system messages in the /api/generate endpoint for all models
+        # We can prepend the system message to the user prompt for a similar effect
+        full_prompt = GRADER_SYSTEM_PROMPT + "\n\n" + _build_grading_prompt(text, prompt, marking_scheme_content)
+        payload = {
+            "model": model,
+            "prompt": full_prompt,
+            "stream": False,
+            "temperature": temperature,
+            "options": {"num_predict": max_tokens},  # Ollama uses num_predict for max_tokens
+        }
+        keep_alive = local_keep_alive("Ollama", model)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive  # renewed by every request of a warmed job
 
-            if response.status_code == 200:
-                result = response.json()
-                # Ollama may return the output under different keys depending on model/version.
-                # Support common shapes used in tests and local responses:
-                # - {'response': 'Grade: A', 'prompt_eval_count': X, 'eval_count': Y}
-                # - {'choices': [{'message': {'content': '...'}}], ...}
-                # - {'text': '...'}
-                grade_text = None
-                if isinstance(result, dict):
-                    grade_text = result.get("response") or result.get("text")
-                    # choices -> message -> content
-                    if (
-                        not grade_text
-                        and "choices" in result
-                        and isinstance(result["choices"], list)
-                        and len(result["choices"]) > 0
-                    ):
-                        try:
-                            grade_text = result["choices"][0]["message"]["content"]
-                        except Exception:
-                            # defensive: try other nested locations
-                            try:
-                                grade_text = result["choices"][0].get("text")
-                            except Exception:
-                                grade_text = None
-                # Fallback to stringifying result if nothing found
-                if not grade_text:
+        # The least-loaded server; OLLAMA_URL is re-read on every call
+        ollama_url = acquire_local_endpoint("Ollama")
+        return {
+            "url": f"{ollama_url}/api/generate",
+            "base_url": ollama_url,
+            "headers": {"Content-Type": "application/json"},
+            "json": payload,
+            "timeout": 120,
+        }
+
+    def _parse_response(self, response, model):
+        if response.status_code == 200:
+            result = response.json()
+            # Ollama may return the output under different keys depending on model/version.
+            # Support common shapes used in tests and local responses:
+            # - {'response': 'Grade: A', 'prompt_eval_count': X, 'eval_count': Y}
+            # - {'choices': [{'message': {'content': '...'}}], ...}
+            # - {'text': '...'}
+            grade_text = None
+            if isinstance(result, dict):
+                grade_text = result.get("response") or result.get("text")
+                # choices -> message -> content
+                if (
+                    not grade_text
+                    and "choices" in result
+                    and isinstance(result["choices"], list)
+                    and len(result["choices"]) > 0
+                ):
                     try:
-                        grade_text = str(result)
+                        grade_text = result["choices"][0]["message"]["content"]
                     except Exception:
-                        grade_text = ""
+                        # defensive: try other nested locations
+                        try:
+                            grade_text = result["choices"][0].get("text")
+                        except Exception:
+                            grade_text = None
+            # Fallback to stringifying result if nothing found
+            if not grade_text:
+                try:
+                    grade_text = str(result)
+                except Exception:
+                    grade_text = ""
 
-                prompt_count = result.get("prompt_eval_count", 0) if isinstance(result, dict) else 0
-                eval_count = result.get("eval_count", 0) if isinstance(result, dict) else 0
+            prompt_count = result.get("prompt_eval_count", 0) if isinstance(result, dict) else 0
+            eval_count = result.get("eval_count", 0) if isinstance(result, dict) else 0
 
-                return {
-                    "success": True,
-                    "grade": grade_text,
-                    "model": model,
-                    "provider": "Ollama",
-                    "usage": {
-                        "prompt_tokens": prompt_count,
-                        "completion_tokens": eval_count,
-                        "total_tokens": (prompt_count or 0) + (eval_count or 0),
-                    },
-                }
-            elif response.status_code == 404:
-                return {
-                    "success": False,
-                    "error": "Ollama endpoint not found. Please check if Ollama is running and the URL is correct.",
-                    "provider": "Ollama",
-                }
-            elif response.status_code == 500:
-                return {
-                    "success": False,
-                    "error": "Ollama internal server error. Please check Ollama logs.",
-                    "provider": "Ollama",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Ollama API error: {response.status_code} - {response.text}",
-                    "provider": "Ollama",
-                }
-        except requests.exceptions.ConnectionError:
-            return {
-                "success": False,
-                "error": f"Could not connect to Ollama at {ollama_url}. Please check if Ollama is running.",
-                "provider": "Ollama",
-            }
-        except requests.exceptions.Timeout:
-            return {
-                "success": False,
-                "error": "Ollama request timed out. Please try again.",
-                "provider": "Ollama",
-            }
-        except Exception as e:
             return {
-                "success": False,
-                "error": f"Ollama API error: {str(e)}",
+                "success": True,
+                "grade": grade_text,
+                "model": model,
                 "provider": "Ollama",
+                "usage": {
+                    "prompt_tokens": prompt_count,
+                    "completion_tokens": eval_count,
+                    "total_tokens": (prompt_count or 0) + (eval_count or 0),
+                },
             }
+        elif response.status_code == 404:
+            return self._failure(
+                "Ollama endpoint not found. Please check if Ollama is running and the URL is correct."
+            )
+        elif response.status_code == 500:
+            return self._failure("Ollama internal server error. Please check Ollama logs.")
+        else:
+            return self._failure(f"Ollama API error: {response.status_code} - {response.text}")
+
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            ollama_url = (request or {}).get("base_url") or os.getenv("OLLAMA_URL", "http://localhost:11434")
+            return self._failure(f"Could not connect to Ollama at {ollama_url}. Please check if Ollama is running.")
+        if isinstance(exc, requests.exceptions.Timeout):
+            return self._failure("Ollama request timed out. Please try again.")
+        return self._failure(f"Ollama API error: {str(exc)}")
 
 
 class GeminiLLMProvider(LLMProvider):
     """LLM Provider for Google Gemini API."""
 
+    provider_name = "Gemini"
+    default_model = "gemini-2.5-pro"
+
     def get_available_models(self):
         """Fetch available models from Gemini API."""
         try:
@@ -1010,7 +3304,7 @@ class GeminiLLMProvider(LLMProvider):
             if not gemini_key:
                 return {"success": False, "error": "API key not configured"}
 
-            genai.configure(api_key=gemini_key)
+            _configure_gemini(gemini_key)
 
             # List available models
             models = []
@@ -1029,97 +3323,116 @@ class GeminiLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _prepare(self, model):
+        """Return (GenerativeModel, api key), or (None, failure dict) when unconfigured."""
+        # Re-check environment each call to satisfy tests that clear env
+        gemini_key = os.getenv("GEMINI_API_KEY")
+        if not gemini_key:
+            return None, self._failure("Gemini API authentication failed. Please check your API key configuration.")
+
+        # Configure Gemini (no-op when already configured for this key)
+        _configure_gemini(gemini_key)
+        gemini_model = genai.GenerativeModel(model_name=model, system_instruction=GRADER_SYSTEM_PROMPT)
+        return gemini_model, gemini_key
+
+    def _parse_response(self, response, model):
+        return {
+            "success": True,
+            "grade": response.text,
+            "model": model,
+            "provider": "Gemini",
+            "usage": {
+                "prompt_tokens": (response.usage_metadata.prompt_token_count if response.usage_metadata else None),
+                "completion_tokens": (
+                    response.usage_metadata.candidates_token_count if response.usage_metadata else None
+                ),
+                "total_tokens": (response.usage_metadata.total_token_count if response.usage_metadata else None),
+                "cached_tokens": (
+                    getattr(response.usage_metadata, "cached_content_token_count", 0) or 0
+                    if response.usage_metadata
+                    else None
+                ),
+            },
+        }
+
+    def _handle_exception(self, exc):
+        error_msg = str(exc)
+        if (
+            "authentication" in error_msg.lower()
+            or "api_key" in error_msg.lower()
+            or "permission" in error_msg.lower()
+        ):
+            return self._failure("Gemini API authentication failed. Please check your API key.")
+        elif "quota" in error_msg.lower() or "rate" in error_msg.lower() or "limit" in error_msg.lower():
+            return self._failure("Gemini API rate limit exceeded. Please try again later.")
+        elif "timeout" in error_msg.lower():
+            return self._failure("Gemini API request timed out. Please try again.")
+        else:
+            return self._failure(f"Gemini API error: {error_msg}")
+
     def grade_document(
         self,
         text,
         prompt,
-        model="gemini-2.5-pro",
+        model=None,
         marking_scheme_content=None,
         temperature=0.3,
         max_tokens=2000,
     ):
+        model = model or self.default_model
         try:
-            # Re-check environment each call to satisfy tests that clear env
-            gemini_key = os.getenv("GEMINI_API_KEY")
-            if not gemini_key:
-                return {
-                    "success": False,
-                    "error": "Gemini API authentication failed. Please check your API key configuration.",
-                    "provider": "Gemini",
-                }
-
-            # Configure Gemini
-            genai.configure(api_key=gemini_key)
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+            gemini_model, gemini_key = self._prepare(model)
+            if gemini_model is None:
+                return gemini_key
 
-            # Create the model
-            gemini_model = genai.GenerativeModel(
-                model_name=model,
-                system_instruction="You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-            )
-
-            # Generate response
             response = gemini_model.generate_content(
-                enhanced_prompt,
+                _build_grading_prompt(text, prompt, marking_scheme_content),
                 generation_config=genai.types.GenerationConfig(
                     temperature=temperature,
                     max_output_tokens=max_tokens,
                 ),
             )
+            return self._parse_response(response, model)
+        except Exception as e:
+            return _attach_retry_after(self._handle_exception(e), _exception_headers(e))
 
-            return {
-                "success": True,
-                "grade": response.text,
-                "model": model,
-                "provider": "Gemini",
-                "usage": {
-                    "prompt_tokens": (response.usage_metadata.prompt_token_count if response.usage_metadata else None),
-                    "completion_tokens": (
-                        response.usage_metadata.candidates_token_count if response.usage_metadata else None
-                    ),
-                    "total_tokens": (response.usage_metadata.total_token_count if response.usage_metadata else None),
-                },
-            }
+    async def agrade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        model = model or self.default_model
+        try:
+            gemini_model, gemini_key = self._prepare(model)
+            if gemini_model is None:
+                return gemini_key
+
+            # Use a transport bound to this event loop rather than the SDK's process-wide one
+            gemini_model._async_client = _connection_pool.get_async_client(
+                "Gemini", _new_gemini_async_client, api_key=gemini_key
+            )
+            response = await gemini_model.generate_content_async(
+                _build_grading_prompt(text, prompt, marking_scheme_content),
+                generation_config=genai.types.GenerationConfig(
+                    temperature=temperature,
+                    max_output_tokens=max_tokens,
+                ),
+            )
+            return self._parse_response(response, model)
         except Exception as e:
-            error_msg = str(e)
-            if (
-                "authentication" in error_msg.lower()
-                or "api_key" in error_msg.lower()
-                or "permission" in error_msg.lower()
-            ):
-                return {
-                    "success": False,
-                    "error": "Gemini API authentication failed. Please check your API key.",
-                    "provider": "Gemini",
-                }
-            elif "quota" in error_msg.lower() or "rate" in error_msg.lower() or "limit" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Gemini API rate limit exceeded. Please try again later.",
-                    "provider": "Gemini",
-                }
-            elif "timeout" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Gemini API request timed out. Please try again.",
-                    "provider": "Gemini",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Gemini API error: {error_msg}",
-                    "provider": "Gemini",
-                }
+            return _attach_retry_after(self._handle_exception(e), _exception_headers(e))
 
 
 class OpenAILLMProvider(LLMProvider):
     """LLM Provider for OpenAI API (direct, not through OpenRouter)."""
 
+    provider_name = "OpenAI"
+    default_model = "gpt-5"
+
     def get_available_models(self):
         """Fetch available models from OpenAI API."""
         try:
@@ -1127,7 +3440,7 @@ class OpenAILLMProvider(LLMProvider):
             if not openai_key:
                 return {"success": False, "error": "API key not configured"}
 
-            client = OpenAI(api_key=openai_key)
+            client = _connection_pool.get_client("OpenAI", OpenAI, api_key=openai_key, max_retries=0)
             models = client.models.list()
 
             model_list = []
@@ -1138,95 +3451,101 @@ class OpenAILLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def _completion_kwargs(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        return {
+            "model": model,
+            "messages": _chat_messages(text, prompt, marking_scheme_content),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+
+    def _parse_response(self, response, model):
+        return {
+            "success": True,
+            "grade": response.choices[0].message.content,
+            "model": model,
+            "provider": "OpenAI",
+            "usage": {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens,
+                "cached_tokens": getattr(
+                    getattr(response.usage, "prompt_tokens_details", None), "cached_tokens", 0
+                )
+                or 0,
+            },
+        }
+
+    def _handle_exception(self, exc):
+        if isinstance(exc, openai.AuthenticationError):
+            return self._failure("OpenAI API authentication failed. Please check your API key.")
+        if isinstance(exc, openai.RateLimitError):
+            return self._failure("OpenAI API rate limit exceeded. Please try again later.")
+        if isinstance(exc, openai.APIError):
+            return self._failure(f"OpenAI API error: {str(exc)}")
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower():
+            return self._failure("OpenAI API authentication failed. Please check your API key.")
+        else:
+            return self._failure(f"Unexpected error with OpenAI API: {error_msg}")
+
     def grade_document(
         self,
         text,
         prompt,
-        model="gpt-5",
+        model=None,
         marking_scheme_content=None,
         temperature=0.3,
         max_tokens=2000,
     ):
+        model = model or self.default_model
+        # Keys are re-read from the environment on each call (tests clear env)
+        openai_key = acquire_api_key("OpenAI")
+        if not openai_key:
+            return self._failure("OpenAI API authentication failed. Please check your API key configuration.")
         try:
-            # Re-check environment each call to satisfy tests that clear env
-            openai_key = os.getenv("OPENAI_API_KEY")
-            if not openai_key:
-                return {
-                    "success": False,
-                    "error": "OpenAI API authentication failed. Please check your API key configuration.",
-                    "provider": "OpenAI",
-                }
-
-            # Create OpenAI client with new SDK
-            client = OpenAI(api_key=openai_key)
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
-
+            # Reuse the pooled OpenAI client for this key
+            client = _connection_pool.get_client("OpenAI", OpenAI, api_key=openai_key, max_retries=0)
             response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                    },
-                    {"role": "user", "content": enhanced_prompt},
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens,
+                **self._completion_kwargs(text, prompt, model, marking_scheme_content, temperature, max_tokens)
             )
+            result = self._parse_response(response, model)
+        except Exception as e:
+            result = _attach_retry_after(self._handle_exception(e), _exception_headers(e))
+        release_api_key("OpenAI", openai_key, result)
+        return result
 
-            return {
-                "success": True,
-                "grade": response.choices[0].message.content,
-                "model": model,
-                "provider": "OpenAI",
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens,
-                },
-            }
-        except openai.AuthenticationError:
-            return {
-                "success": False,
-                "error": "OpenAI API authentication failed. Please check your API key.",
-                "provider": "OpenAI",
-            }
-        except openai.RateLimitError:
-            return {
-                "success": False,
-                "error": "OpenAI API rate limit exceeded. Please try again later.",
-                "provider": "OpenAI",
-            }
-        except openai.APIError as e:
-            return {
-                "success": False,
-                "error": f"OpenAI API error: {str(e)}",
-                "provider": "OpenAI",
-            }
+    async def agrade_document(
+        self,
+        text,
+        prompt,
+        model=None,
+        marking_scheme_content=None,
+        temperature=0.3,
+        max_tokens=2000,
+    ):
+        model = model or self.default_model
+        openai_key = acquire_api_key("OpenAI")
+        if not openai_key:
+            return self._failure("OpenAI API authentication failed. Please check your API key configuration.")
+        try:
+            client = _connection_pool.get_async_client("OpenAI", AsyncOpenAI, api_key=openai_key, max_retries=0)
+            response = await client.chat.completions.create(
+                **self._completion_kwargs(text, prompt, model, marking_scheme_content, temperature, max_tokens)
+            )
+            result = self._parse_response(response, model)
         except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "OpenAI API authentication failed. Please check your API key.",
-                    "provider": "OpenAI",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with OpenAI API: {error_msg}",
-                    "provider": "OpenAI",
-                }
+            result = _attach_retry_after(self._handle_exception(e), _exception_headers(e))
+        release_api_key("OpenAI", openai_key, result)
+        return result
 
 
-class ZAICodingPlanLLMProvider(LLMProvider):
+class ZAICodingPlanLLMProvider(HTTPLLMProvider):
     """LLM Provider for Z.AI Coding Plan subscription using Anthropic-compatible endpoint."""
 
+    provider_name = "Z.AI Coding Plan"
+    default_model = "glm-4.6"
+
     def get_available_models(self):
         """Return available models for Z.AI Coding Plan."""
         # Z.AI Coding Plan models (limited selection for coding tools)
@@ -1252,107 +3571,76 @@ class ZAICodingPlanLLMProvider(LLMProvider):
         ]
         return {"success": True, "models": models}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="glm-4.6",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
         """
-        Grade document using Z.AI Coding Plan via Anthropic-compatible endpoint.
+        Build a request for Z.AI Coding Plan via its Anthropic-compatible endpoint.
 
         Note: This uses Z.AI's Coding Plan subscription which works through
         an Anthropic API-compatible endpoint. Requires active Coding Plan subscription.
         """
-        try:
-            zai_key = os.getenv("Z_AI_CODING_PLAN_API_KEY")
-            if not zai_key:
-                return {
-                    "success": False,
-                    "error": "Z.AI Coding Plan API authentication failed. Please check your API key configuration. Note: This requires an active Z.AI Coding Plan subscription.",
-                    "provider": "Z.AI Coding Plan",
-                }
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+        zai_key = acquire_api_key("Z.AI Coding Plan")
+        if not zai_key:
+            return self._failure(
+                "Z.AI Coding Plan API authentication failed. Please check your API key configuration. "
+                "Note: This requires an active Z.AI Coding Plan subscription."
+            )
 
-            headers = {
+        enhanced_prompt = _build_grading_prompt(text, prompt, marking_scheme_content)
+        return {
+            "url": "https://api.z.ai/api/anthropic/v1/messages",
+            "api_key": zai_key,
+            "headers": {
                 "x-api-key": zai_key,
                 "Content-Type": "application/json",
                 "anthropic-version": "2023-06-01",
-            }
-
+            },
             # Use Anthropic-compatible message format
-            payload = {
+            "json": {
                 "model": model,
                 "max_tokens": max_tokens,
                 "temperature": temperature,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": f"You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.\n\n{enhanced_prompt}",
-                    }
-                ],
-            }
-
-            response = requests.post(
-                "https://api.z.ai/api/anthropic/v1/messages", headers=headers, json=payload, timeout=60
-            )
+                "messages": [{"role": "user", "content": f"{GRADER_SYSTEM_PROMPT}\n\n{enhanced_prompt}"}],
+            },
+            "timeout": 60,
+        }
 
-            if response.status_code == 200:
-                data = response.json()
-                content = data.get("content", [{}])[0].get("text", "")
+    def _parse_response(self, response, model):
+        if response.status_code != 200:
+            return self._failure(f"Z.AI Coding Plan API error: {response.status_code} - {response.text}")
 
-                return {
-                    "success": True,
-                    "grade": content,
-                    "model": model,
-                    "provider": "Z.AI Coding Plan",
-                    "usage": {
-                        "prompt_tokens": data.get("usage", {}).get("input_tokens", 0),
-                        "completion_tokens": data.get("usage", {}).get("output_tokens", 0),
-                        "total_tokens": data.get("usage", {}).get("input_tokens", 0)
-                        + data.get("usage", {}).get("output_tokens", 0),
-                    },
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Z.AI Coding Plan API error: {response.status_code} - {response.text}",
-                    "provider": "Z.AI Coding Plan",
-                }
+        data = response.json()
+        content = data.get("content", [{}])[0].get("text", "")
+        return {
+            "success": True,
+            "grade": content,
+            "model": model,
+            "provider": "Z.AI Coding Plan",
+            "usage": {
+                "prompt_tokens": data.get("usage", {}).get("input_tokens", 0),
+                "completion_tokens": data.get("usage", {}).get("output_tokens", 0),
+                "total_tokens": data.get("usage", {}).get("input_tokens", 0)
+                + data.get("usage", {}).get("output_tokens", 0),
+            },
+        }
 
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"Z.AI Coding Plan API connection error: {str(e)}",
-                "provider": "Z.AI Coding Plan",
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower() or "unauthorized" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Z.AI Coding Plan API authentication failed. Please check your API key and subscription status.",
-                    "provider": "Z.AI Coding Plan",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with Z.AI Coding Plan API: {error_msg}",
-                    "provider": "Z.AI Coding Plan",
-                }
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.RequestException):
+            return self._failure(f"Z.AI Coding Plan API connection error: {str(exc)}")
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower() or "unauthorized" in error_msg.lower():
+            return self._failure(
+                "Z.AI Coding Plan API authentication failed. Please check your API key and subscription status."
+            )
+        else:
+            return self._failure(f"Unexpected error with Z.AI Coding Plan API: {error_msg}")
 
 
-class ChutesLLMProvider(LLMProvider):
+class ChutesLLMProvider(HTTPLLMProvider):
     """LLM Provider for Chutes AI platform."""
 
+    provider_name = "Chutes"
+    default_model = "microsoft/DialoGPT-medium"
+
     def get_available_models(self):
         """Fetch available models from Chutes AI API."""
         try:
@@ -1365,7 +3653,7 @@ class ChutesLLMProvider(LLMProvider):
                 "Content-Type": "application/json",
             }
 
-            response = requests.get("https://api.chutes.ai/v1/models", headers=headers, timeout=30)
+            response = _http_get("Chutes", "https://api.chutes.ai/v1/models", chutes_key, headers=headers, timeout=30)
 
             if response.status_code == 200:
                 models_data = response.json()
@@ -1387,97 +3675,60 @@ class ChutesLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="microsoft/DialoGPT-medium",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        try:
-            chutes_key = os.getenv("CHUTES_API_KEY")
-            if not chutes_key:
-                return {
-                    "success": False,
-                    "error": "Chutes AI API authentication failed. Please check your API key configuration.",
-                    "provider": "Chutes",
-                }
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        chutes_key = acquire_api_key("Chutes")
+        if not chutes_key:
+            return self._failure("Chutes AI API authentication failed. Please check your API key configuration.")
 
-            headers = {
+        return {
+            "url": "https://api.chutes.ai/v1/chat/completions",
+            "api_key": chutes_key,
+            "headers": {
                 "Authorization": f"Bearer {chutes_key}",
                 "Content-Type": "application/json",
-            }
-
-            payload = {
+            },
+            "json": {
                 "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                    },
-                    {"role": "user", "content": enhanced_prompt},
-                ],
+                "messages": _chat_messages(text, prompt, marking_scheme_content),
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-            }
+            },
+            "timeout": 60,
+        }
 
-            response = requests.post(
-                "https://api.chutes.ai/v1/chat/completions", headers=headers, json=payload, timeout=60
-            )
+    def _parse_response(self, response, model):
+        if response.status_code != 200:
+            return self._failure(f"Chutes AI API error: {response.status_code} - {response.text}")
 
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "success": True,
-                    "grade": data["choices"][0]["message"]["content"],
-                    "model": model,
-                    "provider": "Chutes",
-                    "usage": {
-                        "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
-                        "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
-                        "total_tokens": data.get("usage", {}).get("total_tokens", 0),
-                    },
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Chutes AI API error: {response.status_code} - {response.text}",
-                    "provider": "Chutes",
-                }
+        data = response.json()
+        return {
+            "success": True,
+            "grade": data["choices"][0]["message"]["content"],
+            "model": model,
+            "provider": "Chutes",
+            "usage": {
+                "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
+                "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
+                "total_tokens": data.get("usage", {}).get("total_tokens", 0),
+            },
+        }
 
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"Chutes AI API connection error: {str(e)}",
-                "provider": "Chutes",
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Chutes AI API authentication failed. Please check your API key.",
-                    "provider": "Chutes",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with Chutes AI API: {error_msg}",
-                    "provider": "Chutes",
-                }
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.RequestException):
+            return self._failure(f"Chutes AI API connection error: {str(exc)}")
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower():
+            return self._failure("Chutes AI API authentication failed. Please check your API key.")
+        else:
+            return self._failure(f"Unexpected error with Chutes AI API: {error_msg}")
 
 
-class ZAILLMProvider(LLMProvider):
+class ZAILLMProvider(HTTPLLMProvider):
     """LLM Provider for Z.AI platform."""
 
+    provider_name = "Z.AI"
+    default_model = "glm-4.6"
+
     def get_available_models(self):
         """Return available models for Z.AI platform."""
         # Z.AI API models (not Coding Plan - those are for coding tools only)
@@ -1529,106 +3780,75 @@ class ZAILLMProvider(LLMProvider):
         ]
         return {"success": True, "models": models}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="glm-4.6",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
         """
-        Grade document using Z.AI API (not Coding Plan).
+        Build a request for the Z.AI API (not Coding Plan).
 
         Note: This uses Z.AI's normal API which is billed separately per call.
         The Z.AI Coding Plan is only for use within coding tools like Claude Code
         and cannot be accessed via API calls.
         """
-        try:
-            zai_key = os.getenv("Z_AI_API_KEY")
-            if not zai_key:
-                return {
-                    "success": False,
-                    "error": "Z.AI API authentication failed. Please check your API key configuration. Note: This uses Z.AI's normal API, not the Coding Plan.",
-                    "provider": "Z.AI",
-                }
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+        zai_key = acquire_api_key("Z.AI")
+        if not zai_key:
+            return self._failure(
+                "Z.AI API authentication failed. Please check your API key configuration. "
+                "Note: This uses Z.AI's normal API, not the Coding Plan."
+            )
 
-            headers = {
+        return {
+            "url": "https://api.z.ai/api/paas/v4/chat/completions",
+            "api_key": zai_key,
+            "headers": {
                 "Authorization": f"Bearer {zai_key}",
                 "Content-Type": "application/json",
                 "Accept-Language": "en-US,en",
-            }
-
-            payload = {
+            },
+            "json": {
                 "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                    },
-                    {"role": "user", "content": enhanced_prompt},
-                ],
+                "messages": _chat_messages(text, prompt, marking_scheme_content),
                 "temperature": temperature,
                 "max_tokens": max_tokens,
                 "stream": False,
-            }
+            },
+            "timeout": 60,
+        }
 
-            response = requests.post(
-                "https://api.z.ai/api/paas/v4/chat/completions", headers=headers, json=payload, timeout=60
-            )
+    def _parse_response(self, response, model):
+        if response.status_code != 200:
+            return self._failure(f"Z.AI API error: {response.status_code} - {response.text}")
 
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "success": True,
-                    "grade": data["choices"][0]["message"]["content"],
-                    "model": model,
-                    "provider": "Z.AI",
-                    "usage": {
-                        "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
-                        "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
-                        "total_tokens": data.get("usage", {}).get("total_tokens", 0),
-                    },
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Z.AI API error: {response.status_code} - {response.text}",
-                    "provider": "Z.AI",
-                }
+        data = response.json()
+        return {
+            "success": True,
+            "grade": data["choices"][0]["message"]["content"],
+            "model": model,
+            "provider": "Z.AI",
+            "usage": {
+                "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
+                "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
+                "total_tokens": data.get("usage", {}).get("total_tokens", 0),
+            },
+        }
 
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"Z.AI API connection error: {str(e)}",
-                "provider": "Z.AI",
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "Z.AI API authentication failed. Please check your API key. Note: This uses Z.AI's normal API, not the Coding Plan.",
-                    "provider": "Z.AI",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with Z.AI API: {error_msg}",
-                    "provider": "Z.AI",
-                }
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.RequestException):
+            return self._failure(f"Z.AI API connection error: {str(exc)}")
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower():
+            return self._failure(
+                "Z.AI API authentication failed. Please check your API key. "
+                "Note: This uses Z.AI's normal API, not the Coding Plan."
+            )
+        else:
+            return self._failure(f"Unexpected error with Z.AI API: {error_msg}")
 
 
-class NanoGPTLLMProvider(LLMProvider):
+class NanoGPTLLMProvider(HTTPLLMProvider):
     """LLM Provider for NanoGPT platform."""
 
+    provider_name = "NanoGPT"
+    default_model = "chatgpt-4o-latest"
+
     def get_available_models(self):
         """Fetch available models from NanoGPT API."""
         try:
@@ -1641,7 +3861,7 @@ class NanoGPTLLMProvider(LLMProvider):
                 "Content-Type": "application/json",
             }
 
-            response = requests.get("https://nano-gpt.com/api/v1/models", headers=headers, timeout=30)
+            response = _http_get("NanoGPT", "https://nano-gpt.com/api/v1/models", nano_key, headers=headers, timeout=30)
 
             if response.status_code == 200:
                 models_data = response.json()
@@ -1663,92 +3883,52 @@ class NanoGPTLLMProvider(LLMProvider):
         except Exception as e:
             return {"success": False, "error": str(e)}
 
-    def grade_document(
-        self,
-        text,
-        prompt,
-        model="chatgpt-4o-latest",
-        marking_scheme_content=None,
-        temperature=0.3,
-        max_tokens=2000,
-    ):
-        try:
-            nano_key = os.getenv("NANOGPT_API_KEY")
-            if not nano_key:
-                return {
-                    "success": False,
-                    "error": "NanoGPT API authentication failed. Please check your API key configuration.",
-                    "provider": "NanoGPT",
-                }
-
-            # Prepare the grading prompt with marking scheme if provided
-            if marking_scheme_content:
-                enhanced_prompt = f"{prompt}\n\nMarking Scheme:\n{marking_scheme_content}\n\nPlease use the above marking scheme to grade the following document:\n{text}"
-            else:
-                enhanced_prompt = f"{prompt}\n\nDocument to grade:\n{text}"
+    def _build_request(self, text, prompt, model, marking_scheme_content, temperature, max_tokens):
+        nano_key = acquire_api_key("NanoGPT")
+        if not nano_key:
+            return self._failure("NanoGPT API authentication failed. Please check your API key configuration.")
 
-            headers = {
+        return {
+            "url": "https://nano-gpt.com/api/v1/chat/completions",
+            "api_key": nano_key,
+            "headers": {
                 "Authorization": f"Bearer {nano_key}",
                 "Content-Type": "application/json",
-            }
-
-            payload = {
+            },
+            "json": {
                 "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a professional document grader. Provide detailed, constructive feedback based on the provided marking scheme and criteria.",
-                    },
-                    {"role": "user", "content": enhanced_prompt},
-                ],
+                "messages": _chat_messages(text, prompt, marking_scheme_content),
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-            }
+            },
+            "timeout": 60,
+        }
 
-            response = requests.post(
-                "https://nano-gpt.com/api/v1/chat/completions", headers=headers, json=payload, timeout=60
-            )
+    def _parse_response(self, response, model):
+        if response.status_code != 200:
+            return self._failure(f"NanoGPT API error: {response.status_code} - {response.text}")
 
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "success": True,
-                    "grade": data["choices"][0]["message"]["content"],
-                    "model": model,
-                    "provider": "NanoGPT",
-                    "usage": {
-                        "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
-                        "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
-                        "total_tokens": data.get("usage", {}).get("total_tokens", 0),
-                    },
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"NanoGPT API error: {response.status_code} - {response.text}",
-                    "provider": "NanoGPT",
-                }
+        data = response.json()
+        return {
+            "success": True,
+            "grade": data["choices"][0]["message"]["content"],
+            "model": model,
+            "provider": "NanoGPT",
+            "usage": {
+                "prompt_tokens": data.get("usage", {}).get("prompt_tokens", 0),
+                "completion_tokens": data.get("usage", {}).get("completion_tokens", 0),
+                "total_tokens": data.get("usage", {}).get("total_tokens", 0),
+            },
+        }
 
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": f"NanoGPT API connection error: {str(e)}",
-                "provider": "NanoGPT",
-            }
-        except Exception as e:
-            error_msg = str(e)
-            if "auth" in error_msg.lower() or "key" in error_msg.lower():
-                return {
-                    "success": False,
-                    "error": "NanoGPT API authentication failed. Please check your API key.",
-                    "provider": "NanoGPT",
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unexpected error with NanoGPT API: {error_msg}",
-                    "provider": "NanoGPT",
-                }
+    def _handle_exception(self, exc, request):
+        if isinstance(exc, requests.exceptions.RequestException):
+            return self._failure(f"NanoGPT API connection error: {str(exc)}")
+        error_msg = str(exc)
+        if "auth" in error_msg.lower() or "key" in error_msg.lower():
+            return self._failure("NanoGPT API authentication failed. Please check your API key.")
+        else:
+            return self._failure(f"Unexpected error with NanoGPT API: {error_msg}")
 
 
 def get_llm_provider(provider_name):
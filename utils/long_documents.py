@@ -0,0 +1,208 @@
+"""
+Map-reduce grading for submissions longer than a model's context window.
+
+A document that would not fit alongside the grading prompt is split into
+sections on paragraph (then sentence) boundaries. Each section is assessed on
+its own ("map"), and the section assessments are combined into the final grade
+by one more request ("reduce"). Token counts use the same four-characters-per
+token estimate as the rate limiter, with a safety margin.
+
+Context lengths come from the provider's get_available_models() listing,
+cached per provider, and can be overridden with JOB_CONTEXT_LENGTH[_<PROVIDER>].
+"""
+
+import re
+import threading
+import time
+
+from utils.llm_providers import GRADER_SYSTEM_PROMPT, _provider_setting, get_llm_provider
+
+CHARS_PER_TOKEN = 4
+
+# Share of the context window we plan to use; the estimate is rough
+_CONTEXT_SAFETY = 0.85
+
+_SECTION_INSTRUCTIONS = (
+    "\n\nThe document is too long to grade in one pass, so you are shown one section of it. "
+    "Assess only this section against the instructions above: note its strengths, weaknesses "
+    "and any marks it earns. Do not give a final overall grade."
+)
+
+_REDUCE_INSTRUCTIONS = (
+    "\n\nThe document was too long to grade in one pass, so each section was assessed "
+    "separately. Using the section assessments below, produce the single final grade and "
+    "feedback for the whole document exactly as the instructions above ask."
+)
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_catalog = {}  # provider_name -> (fetched_at, {model_id: context_length})
+_catalog_lock = threading.Lock()
+_CATALOG_TTL = 3600
+_CATALOG_RETRY_TTL = 300  # after a failed listing
+
+
+def estimate_tokens(text):
+    """Rough token count for text (four characters per token)."""
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def _catalog_context_lengths(provider_name):
+    """{model id: context length} from the provider's model listing, cached."""
+    now = time.time()
+    with _catalog_lock:
+        cached = _catalog.get(provider_name)
+        if cached and now - cached[0] < (_CATALOG_TTL if cached[1] else _CATALOG_RETRY_TTL):
+            return cached[1]
+
+    lengths = {}
+    try:
+        listing = get_llm_provider(provider_name).get_available_models()
+        if listing.get("success"):
+            for model in listing.get("models", []):
+                if model.get("context_length"):
+                    lengths[model["id"]] = int(model["context_length"])
+    except Exception:
+        lengths = {}
+
+    with _catalog_lock:
+        _catalog[provider_name] = (now, lengths)
+    return lengths
+
+
+def get_context_length(provider_name, model=None):
+    """Context window (tokens) of a provider's model, or None when unknown."""
+    override = _provider_setting("JOB_CONTEXT_LENGTH", provider_name, 0, int)
+    if override > 0:
+        return override
+    try:
+        model = model or get_llm_provider(provider_name).default_model
+    except ValueError:
+        return None
+    return _catalog_context_lengths(provider_name).get(model)
+
+
+def split_text(text, max_tokens):
+    """
+    Split text into sections of at most ``max_tokens`` estimated tokens.
+
+    Paragraphs are packed greedily; a paragraph that is too long on its own is
+    split into sentences, and an over-long sentence is cut by length.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    sections, current = [], ""
+    for piece in pieces:
+        candidate = f"{current}\n\n{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            sections.append(current)
+            current = piece
+    if current:
+        sections.append(current)
+    return sections
+
+
+def plan_sections(provider_name, grade_kwargs):
+    """
+    Return section grade_kwargs for a map-reduce pass, or None when the document fits.
+
+    Documents under JOB_CHUNK_MIN_TOKENS (default 8000) estimated tokens are
+    never split, so ordinary essays do not trigger a model listing lookup.
+    """
+    text = grade_kwargs.get("text") or ""
+    text_tokens = estimate_tokens(text)
+    if text_tokens < _provider_setting("JOB_CHUNK_MIN_TOKENS", provider_name, 8000, int):
+        return None
+    context_length = get_context_length(provider_name, grade_kwargs.get("model"))
+    if not context_length:
+        return None
+
+    max_tokens = int(grade_kwargs.get("max_tokens") or 2000)
+    overhead = estimate_tokens(
+        GRADER_SYSTEM_PROMPT
+        + (grade_kwargs.get("prompt") or "")
+        + (grade_kwargs.get("marking_scheme_content") or "")
+        + _SECTION_INSTRUCTIONS
+    )
+    budget = int(context_length * _CONTEXT_SAFETY) - overhead - max_tokens
+    if text_tokens <= budget:
+        return None
+    if budget < 500:
+        raise ValueError(
+            f"Grading prompt leaves no room for the document in the {context_length}-token context window"
+        )
+
+    sections = split_text(text, budget)
+    # Keep section answers short enough that all of them fit in the reduce request
+    section_max_tokens = max(200, min(max_tokens, (budget - max_tokens) // len(sections)))
+    return [
+        {
+            **grade_kwargs,
+            "prompt": (grade_kwargs.get("prompt") or "") + _SECTION_INSTRUCTIONS,
+            "text": f"[Section {index + 1} of {len(sections)}]\n\n{section}",
+            "max_tokens": section_max_tokens,
+        }
+        for index, section in enumerate(sections)
+    ]
+
+
+def reduce_kwargs(grade_kwargs, section_results):
+    """grade_kwargs for the request that combines section assessments into the final grade."""
+    parts = []
+    for index, result in enumerate(section_results):
+        body = result["grade"] if result.get("success") else f"(not assessed: {result.get('error')})"
+        parts.append(f"## Section {index + 1} of {len(section_results)}\n\n{body}")
+    return {
+        **grade_kwargs,
+        "prompt": (grade_kwargs.get("prompt") or "") + _REDUCE_INSTRUCTIONS,
+        "text": "\n\n".join(parts),
+    }
+
+
+def _sum_usage(usages):
+    totals = {}
+    for usage in usages:
+        for key, value in (usage or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+    return totals or None
+
+
+def combine_results(final_result, section_kwargs, section_results):
+    """
+    Attach per-section results to the reduce result.
+
+    The returned dict is the reduce request's result with usage summed over
+    every request and a "chunks" list describing each section.
+    """
+    result = dict(final_result)
+    result["usage"] = _sum_usage([r.get("usage") for r in section_results] + [final_result.get("usage")])
+    result["chunks"] = [
+        {
+            "index": index,
+            "estimated_tokens": estimate_tokens(kwargs["text"]),
+            "success": bool(section.get("success")),
+            "grade": section.get("grade"),
+            "error": section.get("error"),
+            "usage": section.get("usage"),
+        }
+        for index, (kwargs, section) in enumerate(zip(section_kwargs, section_results))
+    ]
+    return result
@@ -0,0 +1,195 @@
+"""
+Prometheus metrics for the grading pipeline, served at /metrics.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set up in gunicorn.conf.py) and /metrics merges them, so a scrape of any
+worker sees the whole server. Without that variable the in-process registry
+is served. When prometheus_client is not installed every metric is a no-op
+and /metrics reports that it is unavailable.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+    class _NoOpMetric:
+        """Stands in for a metric when prometheus_client is not installed."""
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def labels(self, *args, **kwargs):
+            return self
+
+        def inc(self, amount=1):
+            pass
+
+        def dec(self, amount=1):
+            pass
+
+        def observe(self, amount):
+            pass
+
+    Counter = Gauge = Histogram = _NoOpMetric
+
+
+_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, float("inf"))
+_FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "grading_provider_request_seconds",
+    "Duration of LLM provider grading requests",
+    ["provider", "model", "outcome"],
+    buckets=_LATENCY_BUCKETS,
+)
+PROVIDER_TOKENS = Counter(
+    "grading_provider_tokens",
+    "Tokens reported by LLM providers",
+    ["provider", "model", "direction"],
+)
+SEMAPHORE_WAIT_SECONDS = Histogram(
+    "grading_provider_semaphore_wait_seconds",
+    "Time spent waiting for a provider concurrency slot",
+    ["provider"],
+    buckets=_FAST_BUCKETS[:-1] + (30, 60, 120, 300, float("inf")),
+)
+TASK_QUEUE_DEPTH = Gauge(
+    "grading_task_queue_depth",
+    "Tasks in the desktop task queue",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+SUBMISSIONS = Counter(
+    "grading_submissions",
+    "Submissions that finished processing",
+    ["status"],
+)
+SUBMISSION_RECOVERIES = Counter(
+    "grading_submission_recoveries",
+    "Submissions whose grading lease expired, by whether they were requeued or failed",
+    ["outcome"],
+)
+TEXT_EXTRACTION_SECONDS = Histogram(
+    "grading_text_extraction_seconds",
+    "Time to extract text from a submission",
+    ["file_type"],
+    buckets=_FAST_BUCKETS,
+)
+COALESCED_REQUESTS = Counter(
+    "grading_coalesced_requests",
+    "Grading requests answered by an identical request already in flight",
+    ["scope"],
+)
+DB_COMMIT_SECONDS = Histogram(
+    "grading_db_commit_seconds",
+    "Duration of database commits, including the flush",
+    buckets=_FAST_BUCKETS,
+)
+
+_INPUT_TOKEN_KEYS = ("prompt_tokens", "input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+_OUTPUT_TOKEN_KEYS = ("completion_tokens", "output_tokens")
+
+
+def _token_sum(usage, keys):
+    return sum(int(usage[key]) for key in keys if isinstance(usage.get(key), (int, float)))
+
+
+def observe_provider_request(provider_name, model, seconds, result):
+    """Record one provider request: its latency and, when reported, its token usage."""
+    model = model or "default"
+    outcome = "success" if result.get("success") else "error"
+    PROVIDER_REQUEST_SECONDS.labels(provider_name, model, outcome).observe(seconds)
+    usage = result.get("usage")
+    if isinstance(usage, dict):
+        input_tokens = _token_sum(usage, _INPUT_TOKEN_KEYS)
+        output_tokens = _token_sum(usage, _OUTPUT_TOKEN_KEYS)
+        if input_tokens:
+            PROVIDER_TOKENS.labels(provider_name, model, "input").inc(input_tokens)
+        if output_tokens:
+            PROVIDER_TOKENS.labels(provider_name, model, "output").inc(output_tokens)
+
+
+def track_task_state(old_state, new_state):
+    """Move a desktop task between the pending/running depth gauges."""
+    if old_state in ("pending", "running"):
+        TASK_QUEUE_DEPTH.labels(old_state).dec()
+    if new_state in ("pending", "running"):
+        TASK_QUEUE_DEPTH.labels(new_state).inc()
+
+
+@contextmanager
+def time_text_extraction(file_type):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TEXT_EXTRACTION_SECONDS.labels(file_type or "unknown").observe(time.perf_counter() - started)
+
+
+_COMMIT_STARTED = "metrics_commit_started"
+_sessions_instrumented = False
+
+
+def instrument_sessions():
+    """Time every SQLAlchemy session commit (call once at startup)."""
+    global _sessions_instrumented
+    if _sessions_instrumented or not PROMETHEUS_AVAILABLE:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info[_COMMIT_STARTED] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop(_COMMIT_STARTED, None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    @event.listens_for(Session, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop(_COMMIT_STARTED, None)
+
+    _sessions_instrumented = True
+
+
+def render_metrics():
+    """
+    Return (body, content type) in the Prometheus text format.
+
+    Raises:
+        RuntimeError: when prometheus_client is not installed
+    """
+    if not PROMETHEUS_AVAILABLE:
+        raise RuntimeError("prometheus_client is not installed")
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges from the shared metrics directory."""
+    if PROMETHEUS_AVAILABLE and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,30 @@
+"""
+Small helpers shared by the services, the task queue and the grading worker.
+"""
+
+import os
+from datetime import timezone
+
+
+def env_float(name, default):
+    """Float value of environment variable ``name``; ``default`` when unset or invalid."""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return float(default)
+
+
+def as_utc(value):
+    """SQLite returns naive datetimes; treat them as UTC."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def current_app_or_none():
+    """The Flask app of the active application context, or None outside one."""
+    from flask import current_app, has_app_context
+
+    if not has_app_context():
+        return None
+    return current_app._get_current_object()
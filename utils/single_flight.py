@@ -0,0 +1,264 @@
+"""
+Single-flight de-duplication of identical concurrent requests.
+
+Concurrent calls with the same key share one execution: the first caller
+(the leader) runs the function and every other caller (a follower) gets a
+copy of the leader's result marked ``coalesced: True``. Within a process this
+works across threads and event loops. With a Redis client, the leader holds a
+``SET NX`` lock and publishes its result under the lock's token, so
+followers in other processes wait for it instead of sending the same request.
+
+A leader that produces no shareable result (it raised, was cancelled, or
+returned a result marked ``cancelled``) hands the call back: its followers
+retry, and one of them becomes the new leader.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from utils import metrics
+from utils.llm_providers import _shared_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def _shareable(result):
+    return isinstance(result, dict) and not result.get("cancelled")
+
+
+def _coalesced(result):
+    copy = dict(result)
+    copy["coalesced"] = True
+    return copy
+
+
+def _lease_seconds():
+    try:
+        return max(1.0, float(os.getenv("SINGLE_FLIGHT_LEASE", "600")))
+    except ValueError:
+        return 600.0
+
+
+class _Flight:
+    """One in-flight call in this process."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None  # None when the leader produced nothing shareable
+        self.async_waiters = []  # (loop, future) of coroutines following this flight
+
+
+class RedisFlights:
+    """
+    Cross-process leader election and result hand-off in Redis.
+
+    ``singleflight:<ns>:<key>:lock`` holds the leader's token for up to
+    SINGLE_FLIGHT_LEASE seconds (default 600) so a crashed leader is replaced
+    once it lapses. The result is stored under ``...:result:<token>`` for a
+    minute and a wake-up list lets followers block on BLPOP instead of polling;
+    each woken follower pushes the token back for the next one. Redis errors
+    make callers run the request themselves.
+    """
+
+    _RELEASE_LUA = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then\n"
+        "    return redis.call('del', KEYS[1])\n"
+        "end\n"
+        "return 0"
+    )
+    RESULT_TTL_MS = 60000
+
+    def __init__(self, client, namespace):
+        self.client = client
+        self.namespace = namespace
+        self._release = client.register_script(self._RELEASE_LUA)
+
+    def _key(self, key, *parts):
+        return ":".join(("singleflight", self.namespace, key) + parts)
+
+    def try_lead(self, key):
+        """Return (token, True) when this caller leads, else (leader's token or None, False)."""
+        token = uuid.uuid4().hex
+        try:
+            if self.client.set(self._key(key, "lock"), token, nx=True, px=int(_lease_seconds() * 1000)):
+                return token, True
+            return self.client.get(self._key(key, "lock")), False
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, not coalescing across workers: {e}")
+            return None, True
+
+    def publish(self, key, token, result):
+        """Hand a leader's result to waiting followers and drop the lock."""
+        if token is None:
+            return
+        try:
+            if _shareable(result):
+                self.client.set(
+                    self._key(key, "result", token), json.dumps(result, default=str), px=self.RESULT_TTL_MS
+                )
+            self._release(keys=[self._key(key, "lock")], args=[token])
+            wake = self._key(key, "wake", token)
+            self.client.rpush(wake, "1")
+            self.client.pexpire(wake, self.RESULT_TTL_MS)
+        except Exception as e:
+            logger.warning(f"Could not publish single-flight result: {e}")
+
+    def wait(self, key, token, deadline):
+        """
+        Block until the leader holding ``token`` publishes.
+
+        Returns the leader's result, or None once the lock is gone or changed
+        hands without a result, or the deadline passes.
+        """
+        lock, wake, result_key = self._key(key, "lock"), self._key(key, "wake", token), self._key(key, "result", token)
+        try:
+            while True:
+                stored = self.client.get(result_key)
+                if stored is not None:
+                    return json.loads(stored)
+                if self.client.get(lock) != token:
+                    # The leader finished (or lapsed) between our reads; look once more
+                    stored = self.client.get(result_key)
+                    return json.loads(stored) if stored is not None else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if self.client.blpop([wake], timeout=max(1, min(5, int(remaining)))):
+                    self.client.rpush(wake, "1")  # pass the wake-up on to the next follower
+        except Exception as e:
+            logger.warning(f"Single-flight wait failed: {e}")
+            return None
+
+
+class SingleFlight:
+    """Registry of in-flight calls; see the module docstring."""
+
+    def __init__(self, namespace, redis_client_factory=_shared_redis_client):
+        self.namespace = namespace
+        self._redis_client_factory = redis_client_factory
+        self._redis_flights = None
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _remote(self):
+        client = self._redis_client_factory() if self._redis_client_factory else None
+        if client is None:
+            return None
+        if self._redis_flights is None or self._redis_flights.client is not client:
+            self._redis_flights = RedisFlights(client, self.namespace)
+        return self._redis_flights
+
+    def _join(self, key):
+        """Return (flight, True) for a new leader, or (existing flight, False)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _finish(self, key, flight, result):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.result = result if _shareable(result) else None
+            flight.done.set()
+            waiters, flight.async_waiters = flight.async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _follow_async(self, flight):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if flight.done.is_set():
+                future.set_result(None)
+            else:
+                flight.async_waiters.append((loop, future))
+        return future
+
+    def do(self, key, fn):
+        """Run ``fn()`` unless an identical call is in flight; then share its result."""
+        while True:
+            flight, leading = self._join(key)
+            if leading:
+                result = None
+                try:
+                    result = self._lead(key, fn)
+                    return result
+                finally:
+                    self._finish(key, flight, result)
+            flight.done.wait()
+            if flight.result is not None:
+                metrics.COALESCED_REQUESTS.labels("process").inc()
+                return _coalesced(flight.result)
+
+    async def ado(self, key, coro_fn):
+        """Coroutine counterpart of do(); ``coro_fn()`` returns an awaitable."""
+        while True:
+            flight, leading = self._join(key)
+            if leading:
+                result = None
+                try:
+                    result = await self._alead(key, coro_fn)
+                    return result
+                finally:
+                    self._finish(key, flight, result)
+            await self._follow_async(flight)
+            if flight.result is not None:
+                metrics.COALESCED_REQUESTS.labels("process").inc()
+                return _coalesced(flight.result)
+
+    def _lead(self, key, fn):
+        remote = self._remote()
+        if remote is None:
+            return fn()
+        deadline = time.monotonic() + _lease_seconds()
+        while True:
+            token, leading = remote.try_lead(key)
+            if leading:
+                result = None
+                try:
+                    result = fn()
+                    return result
+                finally:
+                    remote.publish(key, token, result)
+            if token is not None:
+                result = remote.wait(key, token, deadline)
+                if result is not None and _shareable(result):
+                    metrics.COALESCED_REQUESTS.labels("redis").inc()
+                    return _coalesced(result)
+            if time.monotonic() >= deadline:
+                return fn()
+
+    async def _alead(self, key, coro_fn):
+        remote = self._remote()
+        if remote is None:
+            return await coro_fn()
+        deadline = time.monotonic() + _lease_seconds()
+        while True:
+            token, leading = await asyncio.to_thread(remote.try_lead, key)
+            if leading:
+                result = None
+                try:
+                    result = await coro_fn()
+                    return result
+                finally:
+                    await asyncio.to_thread(remote.publish, key, token, result)
+            if token is not None:
+                result = await asyncio.to_thread(remote.wait, key, token, deadline)
+                if result is not None and _shareable(result):
+                    metrics.COALESCED_REQUESTS.labels("redis").inc()
+                    return _coalesced(result)
+            if time.monotonic() >= deadline:
+                return await coro_fn()
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
@@ -9,6 +9,8 @@ Please use services.document_parser instead.
 import PyPDF2
 from docx import Document
 
+from utils.metrics import time_text_extraction
+
 
 def extract_text_from_docx(file_path):
     """Extract text from a Word document."""
@@ -83,11 +85,12 @@ def extract_marking_scheme_content(file_path, file_type):
 
 def extract_text_by_file_type(file_path, file_type):
     """Extract text from a file based on its type."""
-    if file_type == "docx":
-        return extract_text_from_docx(file_path)
-    elif file_type == "pdf":
-        return extract_text_from_pdf(file_path)
-    elif file_type == "txt":
-        return extract_text_from_txt(file_path)
-    else:
-        return f"Unsupported file type: {file_type}"
+    with time_text_extraction(file_type):
+        if file_type == "docx":
+            return extract_text_from_docx(file_path)
+        elif file_type == "pdf":
+            return extract_text_from_pdf(file_path)
+        elif file_type == "txt":
+            return extract_text_from_txt(file_path)
+        else:
+            return f"Unsupported file type: {file_type}"
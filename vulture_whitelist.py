@@ -14,6 +14,7 @@ from tasks import (
     cleanup_completed_batches,
     cleanup_old_files,
     clear_test_app,
+    evict_llm_response_cache,
     pause_batch_processing,
     process_batch,
     process_batch_with_priority,
@@ -61,6 +62,7 @@ _used_callables = [
     update_batch_progress,
     cleanup_completed_batches,
     cleanup_old_files,
+    evict_llm_response_cache,
     process_image_ocr,
     assess_image_quality,
     process_submission_task,